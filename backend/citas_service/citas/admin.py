@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Cita, Horario
+from .models import Cita, Horario, HorarioExcepcion
 
 
 @admin.register(Cita)
@@ -17,3 +17,11 @@ class HorarioAdmin(admin.ModelAdmin):
     search_fields = ('peluquero_id',)
     ordering = ('peluquero_id', 'dia_semana', 'hora_inicio')
 
+
+
+@admin.register(HorarioExcepcion)
+class HorarioExcepcionAdmin(admin.ModelAdmin):
+    list_display = ('id', 'peluquero_id', 'tipo', 'desde', 'hasta', 'hora_inicio', 'hora_fin', 'motivo')
+    list_filter = ('tipo',)
+    search_fields = ('peluquero_id', 'motivo')
+    ordering = ('-desde',)
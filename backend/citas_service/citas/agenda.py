@@ -0,0 +1,129 @@
+"""
+Conflictos de agenda y bloqueo por (peluquero, fecha).
+
+Toda escritura que ocupa una franja (alta, reagendado, series, reasignación)
+sigue el mismo camino dentro de una transacción:
+
+1. `bloquear()` las agendas (peluquero, fecha) de destino,
+2. `conflictos()` contra las citas activas, excluyendo las que se mueven,
+3. escribir las citas.
+
+Así dos peticiones concurrentes hacia la misma franja se serializan y la
+segunda ve la cita de la primera. Antes, fuera de la transacción, la franja
+debe caber en el horario efectivo del peluquero (`fuera_de_horario()`). En PostgreSQL el bloqueo es un
+pg_advisory_xact_lock por (peluquero, fecha), que se libera con la
+transacción; se toman ordenados para que dos escrituras con varias agendas no
+se interbloqueen. En SQLite las transacciones ya empiezan con BEGIN IMMEDIATE
+(comun/database.py) y se serializan enteras.
+"""
+from collections import defaultdict
+
+from django.db import connection
+
+from . import horarios, metricas
+from .models import Cita, EstadoCita
+
+ESTADOS_ACTIVOS = (EstadoCita.PENDIENTE, EstadoCita.CONFIRMADA)
+
+# Mismos motivos que registra metricas.conflicto()
+MENSAJES = {
+    'solape_peluquero': 'El peluquero ya tiene una cita en ese horario',
+    'mascota_mismo_dia': 'La mascota ya tiene una cita con este peluquero para este día',
+    'fecha_pasada': 'No se pueden crear citas en fechas pasadas',
+    'fuera_de_horario': 'La hora solicitada no está dentro del horario laboral del peluquero',
+    'pasa_medianoche': 'El servicio terminaría después de medianoche',
+    'sin_hora_fin': 'La cita no tiene servicio: debe indicar hora_fin',
+}
+# Campo del serializador al que se asocia cada motivo
+CAMPOS = {'solape_peluquero': 'hora_inicio', 'mascota_mismo_dia': 'fecha', 'fecha_pasada': 'fecha',
+          'fuera_de_horario': 'hora_inicio', 'pasa_medianoche': 'hora_inicio', 'sin_hora_fin': 'hora_fin'}
+
+
+def bloquear(agendas):
+    """
+    Bloquea hasta el final de la transacción las agendas [(peluquero_id, fecha)].
+    Debe llamarse dentro de transaction.atomic().
+    """
+    if connection.vendor != 'postgresql':
+        return
+    with connection.cursor() as cursor:
+        for peluquero_id, fecha in sorted(set(agendas)):
+            cursor.execute('SELECT pg_advisory_xact_lock(%s, %s)', [peluquero_id, fecha.toordinal()])
+
+
+def conflictos(franjas, excluir=()):
+    """
+    Comprueba franjas contra la agenda con una consulta por peluquero.
+
+    franjas: lista de dicts con fecha, hora_inicio, hora_fin, peluquero_id y
+    mascota_id. Las citas con id en `excluir` no cuentan (las que se están
+    moviendo). Retorna {índice de la franja: motivo} con los motivos de MENSAJES.
+    """
+    por_peluquero = defaultdict(list)
+    for indice, franja in enumerate(franjas):
+        por_peluquero[franja['peluquero_id']].append(indice)
+
+    rechazadas = {}
+    for peluquero_id, indices in por_peluquero.items():
+        ocupadas = defaultdict(list)
+        citas = (
+            Cita.objects.filter(
+                peluquero_id=peluquero_id,
+                fecha__in={franjas[i]['fecha'] for i in indices},
+                estado__in=ESTADOS_ACTIVOS,
+            )
+            .exclude(pk__in=excluir)
+            .values_list('fecha', 'hora_inicio', 'hora_fin', 'mascota_id')
+        )
+        for fecha, hora_inicio, hora_fin, mascota_id in citas:
+            ocupadas[fecha].append((hora_inicio, hora_fin, mascota_id))
+        for i in indices:
+            franja = franjas[i]
+            del_dia = ocupadas[franja['fecha']]
+            if any(franja['hora_inicio'] < fin and inicio < franja['hora_fin'] for inicio, fin, _ in del_dia):
+                rechazadas[i] = 'solape_peluquero'
+            elif any(mascota_id == franja['mascota_id'] for _, _, mascota_id in del_dia):
+                rechazadas[i] = 'mascota_mismo_dia'
+            else:
+                # Las franjas aceptadas también ocupan la agenda para las siguientes
+                del_dia.append((franja['hora_inicio'], franja['hora_fin'], franja['mascota_id']))
+    return rechazadas
+
+
+def fuera_de_horario(franjas):
+    """
+    Franjas (dicts con fecha, hora_inicio, hora_fin y peluquero_id) que no caben
+    en el horario efectivo de su peluquero ese día: {índice: 'fuera_de_horario'}.
+    Sin consultas si los horarios ya están en la copia local del proceso.
+    """
+    if not franjas:
+        return {}
+    fechas = [franja['fecha'] for franja in franjas]
+    horario = horarios.efectivo(min(fechas), max(fechas), {franja['peluquero_id'] for franja in franjas})
+    return {
+        i: 'fuera_de_horario' for i, franja in enumerate(franjas)
+        if not horarios.contiene(
+            horario[(franja['peluquero_id'], franja['fecha'])],
+            horarios.minutos(franja['hora_inicio']), horarios.minutos(franja['hora_fin']),
+        )
+    }
+
+
+def conflicto(peluquero_id, fecha, hora_inicio, hora_fin, mascota_id, excluir=None):
+    """Motivo de conflicto de una sola franja (None si está libre)."""
+    franja = {'fecha': fecha, 'hora_inicio': hora_inicio, 'hora_fin': hora_fin,
+              'peluquero_id': peluquero_id, 'mascota_id': mascota_id}
+    return conflictos([franja], excluir=[excluir] if excluir else ()).get(0)
+
+
+def reservar(peluquero_id, fecha, hora_inicio, hora_fin, mascota_id, excluir=None):
+    """
+    Bloquea la agenda (peluquero, fecha) y comprueba la franja. Retorna el
+    motivo del conflicto (ya contado en las métricas) o None si está libre.
+    Debe llamarse dentro de la transacción que escribe la cita.
+    """
+    bloquear([(peluquero_id, fecha)])
+    motivo = conflicto(peluquero_id, fecha, hora_inicio, hora_fin, mascota_id, excluir=excluir)
+    if motivo:
+        metricas.conflicto(motivo)
+    return motivo
@@ -0,0 +1,183 @@
+"""
+Analítica de ocupación por peluquero (mapa hora x día de la semana).
+
+Las columnas necesarias de Cita y Horario se cargan una sola vez y se
+convierten en arreglos NumPy densos con resolución de 15 minutos:
+
+    ocupacion[p, d, s]  -> citas que cubren el slot s del día d (sumado en el rango)
+    capacidad[p, d, s]  -> veces que el slot s del día d es laborable en el rango
+
+Las franjas se marcan con un arreglo de diferencias (+1 al inicio, -1 al fin)
+acumulado con cumsum, así el coste no depende de la duración de cada cita.
+"""
+from datetime import date, timedelta
+
+import numpy as np
+
+from .models import Cita, EstadoCita, Horario
+
+MINUTOS_SLOT = 15
+SLOTS_DIA = 24 * 60 // MINUTOS_SLOT
+SLOTS_HORA = 60 // MINUTOS_SLOT
+DIAS_SEMANA = 7
+NOMBRES_DIAS = ['Lunes', 'Martes', 'Miércoles', 'Jueves', 'Viernes', 'Sábado', 'Domingo']
+
+# Una cita cancelada libera su franja; NO_ASISTIO sí la ocupó
+ESTADOS_OCUPAN = [
+    EstadoCita.PENDIENTE,
+    EstadoCita.CONFIRMADA,
+    EstadoCita.FINALIZADA,
+    EstadoCita.NO_ASISTIO,
+]
+
+
+def _minutos(hora):
+    return hora.hour * 60 + hora.minute
+
+
+def cargar_datos(desde, hasta, peluquero_id=None):
+    """
+    Lee de la BD solo las columnas necesarias (dos consultas).
+    Retorna dos dicts de arreglos: citas (peluquero, dia_ordinal, inicio, fin en minutos)
+    y horarios (peluquero, dia_semana, inicio, fin en minutos).
+    """
+    citas = Cita.objects.filter(fecha__gte=desde, fecha__lte=hasta, estado__in=ESTADOS_OCUPAN)
+    horarios = Horario.objects.filter(activo=True)
+    if peluquero_id is not None:
+        citas = citas.filter(peluquero_id=peluquero_id)
+        horarios = horarios.filter(peluquero_id=peluquero_id)
+
+    filas_citas = list(citas.order_by().values_list('peluquero_id', 'fecha', 'hora_inicio', 'hora_fin'))
+    filas_horarios = list(horarios.order_by().values_list('peluquero_id', 'dia_semana', 'hora_inicio', 'hora_fin'))
+
+    datos_citas = {
+        'peluquero': np.fromiter((f[0] for f in filas_citas), dtype=np.int64, count=len(filas_citas)),
+        'dia': np.fromiter((f[1].toordinal() for f in filas_citas), dtype=np.int64, count=len(filas_citas)),
+        'inicio': np.fromiter((_minutos(f[2]) for f in filas_citas), dtype=np.int64, count=len(filas_citas)),
+        'fin': np.fromiter((_minutos(f[3]) for f in filas_citas), dtype=np.int64, count=len(filas_citas)),
+    }
+    datos_horarios = {
+        'peluquero': np.fromiter((f[0] for f in filas_horarios), dtype=np.int64, count=len(filas_horarios)),
+        'dia_semana': np.fromiter((f[1] for f in filas_horarios), dtype=np.int64, count=len(filas_horarios)),
+        'inicio': np.fromiter((_minutos(f[2]) for f in filas_horarios), dtype=np.int64, count=len(filas_horarios)),
+        'fin': np.fromiter((_minutos(f[3]) for f in filas_horarios), dtype=np.int64, count=len(filas_horarios)),
+    }
+    return datos_citas, datos_horarios
+
+
+def ocurrencias_dia_semana(desde, hasta):
+    """Cuántas veces aparece cada día de la semana (0=Lunes) en [desde, hasta]."""
+    total_dias = (hasta - desde).days + 1
+    if total_dias <= 0:
+        return np.zeros(DIAS_SEMANA, dtype=np.int64)
+    dias = (desde.weekday() + np.arange(total_dias)) % DIAS_SEMANA
+    return np.bincount(dias, minlength=DIAS_SEMANA)
+
+
+def _marcar_franjas(indices, dias, inicio, fin, forma):
+    """
+    Construye un arreglo (P, 7, SLOTS_DIA) sumando +1 en cada slot cubierto por
+    cada franja [inicio, fin) en minutos. Una franja cubre un slot si lo toca.
+    """
+    slot_inicio = np.clip(inicio // MINUTOS_SLOT, 0, SLOTS_DIA)
+    slot_fin = np.clip(-(-fin // MINUTOS_SLOT), 0, SLOTS_DIA)  # techo
+    validas = slot_fin > slot_inicio
+
+    diferencias = np.zeros(forma[:2] + (SLOTS_DIA + 1,), dtype=np.int64)
+    np.add.at(diferencias, (indices[validas], dias[validas], slot_inicio[validas]), 1)
+    np.add.at(diferencias, (indices[validas], dias[validas], slot_fin[validas]), -1)
+    return np.cumsum(diferencias, axis=-1)[..., :SLOTS_DIA]
+
+
+def calcular_matrices(datos_citas, datos_horarios, desde, hasta):
+    """
+    Núcleo vectorizado (sin acceso a BD).
+    Retorna (peluqueros, ocupacion, capacidad) con ocupacion/capacidad de forma
+    (P, 7, SLOTS_DIA) expresados en slot-días acumulados en el rango.
+    """
+    peluqueros, inversa = np.unique(
+        np.concatenate([datos_citas['peluquero'], datos_horarios['peluquero']]),
+        return_inverse=True,
+    )
+    n_citas = len(datos_citas['peluquero'])
+    idx_citas, idx_horarios = inversa[:n_citas], inversa[n_citas:]
+    forma = (len(peluqueros), DIAS_SEMANA, SLOTS_DIA)
+
+    # date.toordinal(): el ordinal 1 (0001-01-01) fue lunes
+    dia_semana_citas = (datos_citas['dia'] - 1) % DIAS_SEMANA
+    ocupacion = _marcar_franjas(idx_citas, dia_semana_citas, datos_citas['inicio'], datos_citas['fin'], forma)
+
+    # Turnos solapados no duplican capacidad: un slot laborable cuenta una vez por día
+    laborable = _marcar_franjas(
+        idx_horarios, datos_horarios['dia_semana'], datos_horarios['inicio'], datos_horarios['fin'], forma
+    ) > 0
+    capacidad = laborable * ocurrencias_dia_semana(desde, hasta)[None, :, None]
+    return peluqueros, ocupacion, capacidad
+
+
+def _utilizacion(ocupado, capacidad):
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(capacidad > 0, ocupado / capacidad, np.nan)
+
+
+def resumir(peluqueros, ocupacion, capacidad, picos=5):
+    """
+    Reduce las matrices a un mapa hora x día por peluquero con utilización,
+    ventanas pico y capacidad ociosa (todo en horas).
+    """
+    # Solo la ocupación dentro del horario laboral consume capacidad
+    ocupado = np.minimum(ocupacion, capacidad)
+    ocupado_horas = ocupado.reshape(ocupado.shape[:2] + (24, SLOTS_HORA)).sum(axis=-1)
+    capacidad_horas = capacidad.reshape(capacidad.shape[:2] + (24, SLOTS_HORA)).sum(axis=-1)
+    mapa = _utilizacion(ocupado_horas, capacidad_horas)
+
+    factor = MINUTOS_SLOT / 60
+    total_capacidad = capacidad.sum(axis=(1, 2)) * factor
+    total_ocupado = ocupado.sum(axis=(1, 2)) * factor
+    fuera_horario = (ocupacion - ocupado).sum(axis=(1, 2)) * factor
+
+    # Orden descendente por utilización; las celdas sin capacidad (NaN) quedan al final
+    orden = np.argsort(np.nan_to_num(-mapa.reshape(len(peluqueros), -1), nan=np.inf), axis=1, kind='stable')
+
+    resultado = []
+    for i, peluquero_id in enumerate(peluqueros):
+        ventanas = []
+        for celda in orden[i, :picos]:
+            dia, hora = divmod(int(celda), 24)
+            if np.isnan(mapa[i, dia, hora]):
+                break
+            ventanas.append({
+                "dia_semana": dia,
+                "dia": NOMBRES_DIAS[dia],
+                "hora": hora,
+                "utilizacion": round(float(mapa[i, dia, hora]), 4),
+            })
+        resultado.append({
+            "peluquero_id": int(peluquero_id),
+            "horas_capacidad": round(float(total_capacidad[i]), 2),
+            "horas_ocupadas": round(float(total_ocupado[i]), 2),
+            "horas_ociosas": round(float(total_capacidad[i] - total_ocupado[i]), 2),
+            "horas_fuera_de_horario": round(float(fuera_horario[i]), 2),
+            "utilizacion": round(float(total_ocupado[i] / total_capacidad[i]), 4) if total_capacidad[i] else None,
+            "picos": ventanas,
+            # mapa[dia][hora]; None donde el peluquero no trabaja
+            "mapa": [
+                [None if np.isnan(valor) else round(float(valor), 4) for valor in fila]
+                for fila in mapa[i]
+            ],
+        })
+    return resultado
+
+
+def mapa_ocupacion(desde=None, hasta=None, peluquero_id=None, picos=5):
+    """Punto de entrada: por defecto analiza los últimos 365 días hasta hoy."""
+    hasta = hasta or date.today()
+    desde = desde or hasta - timedelta(days=364)
+    datos_citas, datos_horarios = cargar_datos(desde, hasta, peluquero_id)
+    peluqueros, ocupacion, capacidad = calcular_matrices(datos_citas, datos_horarios, desde, hasta)
+    return {
+        "desde": desde,
+        "hasta": hasta,
+        "minutos_slot": MINUTOS_SLOT,
+        "peluqueros": resumir(peluqueros, ocupacion, capacidad, picos=picos),
+    }
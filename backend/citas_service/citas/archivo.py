@@ -0,0 +1,114 @@
+"""
+Archivo de citas antiguas (particionado caliente/frío).
+
+Las citas cerradas (FINALIZADA/CANCELADA/NO_ASISTIO) con más de DIAS_RETENCION
+días no vuelven a modificarse, pero siguen pesando en cada consulta sobre Cita
+(listados, auto-finalizado, validación de solapes). `archivar()` las mueve por
+lotes a CitaHistorica:
+
+- cada lote es una transacción: copia las filas y borra las originales, así que
+  el proceso puede interrumpirse y relanzarse en cualquier momento;
+- el borrado no cuenta como baja de negocio: no resta de ResumenCita ni genera
+  eventos (ver signals.cita_eliminada), las estadísticas siguen incluyendo el historial.
+
+La lectura del historial es opcional y explícita (`?historial=true` en
+mis_citas y en el feed de calendario).
+"""
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import timedelta
+
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .models import Cita, CitaHistorica, EstadoCita
+
+DIAS_RETENCION = 365
+TAMANO_LOTE = 1000
+ESTADOS_ARCHIVABLES = [EstadoCita.FINALIZADA, EstadoCita.CANCELADA, EstadoCita.NO_ASISTIO]
+CAMPOS = (
+    'id', 'mascota_id', 'servicio_id', 'peluquero_id', 'fecha', 'hora_inicio', 'hora_fin',
+    'estado', 'notas', 'creada_en', 'actualizada_en',
+)
+
+_archivando = ContextVar('citas_archivando', default=False)
+
+
+def archivando():
+    """True mientras se borran de Cita filas que ya se copiaron al archivo."""
+    return _archivando.get()
+
+
+@contextmanager
+def _modo_archivo():
+    token = _archivando.set(True)
+    try:
+        yield
+    finally:
+        _archivando.reset(token)
+
+
+def fecha_corte(dias=DIAS_RETENCION):
+    return timezone.localdate() - timedelta(days=dias)
+
+
+def archivables(corte):
+    """Citas cerradas anteriores a `corte`."""
+    return Cita.objects.filter(fecha__lt=corte, estado__in=ESTADOS_ARCHIVABLES)
+
+
+def archivar_lote(corte, tamano=TAMANO_LOTE):
+    """Mueve un lote (en orden de id) al archivo. Retorna cuántas citas movió."""
+    with transaction.atomic():
+        candidatas = archivables(corte).order_by('id')
+        if connection.features.has_select_for_update_skip_locked:
+            candidatas = candidatas.select_for_update(skip_locked=True)
+        filas = list(candidatas.values(*CAMPOS)[:tamano])
+        if not filas:
+            return 0
+        ids = [datos['id'] for datos in filas]
+        # ignore_conflicts: relanzar tras un fallo nunca duplica filas del archivo
+        CitaHistorica.objects.bulk_create(
+            [CitaHistorica(**datos) for datos in filas], batch_size=500, ignore_conflicts=True
+        )
+        with _modo_archivo():
+            Cita.objects.filter(id__in=ids).delete()
+    return len(filas)
+
+
+def archivar(dias=DIAS_RETENCION, tamano=TAMANO_LOTE, max_lotes=None):
+    """Archiva lote a lote hasta agotar las candidatas (o `max_lotes`). Retorna totales."""
+    corte = fecha_corte(dias)
+    inicio = time.perf_counter()
+    archivadas = lotes = 0
+    while max_lotes is None or lotes < max_lotes:
+        movidas = archivar_lote(corte, tamano)
+        if not movidas:
+            break
+        archivadas += movidas
+        lotes += 1
+    duracion = time.perf_counter() - inicio
+    return {
+        'corte': corte,
+        'archivadas': archivadas,
+        'lotes': lotes,
+        'pendientes': archivables(corte).count(),
+        'segundos': round(duracion, 3),
+        'citas_por_segundo': round(archivadas / duracion, 1) if duracion > 0 else 0.0,
+    }
+
+
+def historial_de_usuario(usuario):
+    """Citas archivadas visibles para el usuario (mismo criterio que mis_citas)."""
+    rol = getattr(usuario, 'rol', None)
+    if rol == 'CLIENTE':
+        return CitaHistorica.objects.filter(mascota__dueno_id=usuario.id)
+    if rol == 'PELUQUERO':
+        return CitaHistorica.objects.filter(peluquero_id=usuario.id)
+    return CitaHistorica.objects.none()
+
+
+def pide_historial(request):
+    """Interpreta ?historial=true|1|si."""
+    return request.GET.get('historial', '').lower() in ('1', 'true', 'si', 'sí')
@@ -2,10 +2,24 @@
 Autenticación personalizada para microservicios.
 Extrae información del usuario desde el token JWT sin necesidad de base de datos.
 """
+import threading
+import time
+from collections import OrderedDict
+
 from rest_framework_simplejwt.authentication import JWTAuthentication
 from rest_framework_simplejwt.exceptions import InvalidToken
 from django.contrib.auth.models import AnonymousUser
 
+from . import metricas
+
+# Tokens ya validados (firma y claims) por proceso, hasta su expiración.
+# Un cliente repite el mismo token en cada petición mientras dura su sesión.
+# No hace falta compartirla entre workers: el resultado solo depende del token
+# (nada los revoca antes de expirar) y cada worker lo calcula igual.
+MAX_TOKENS_EN_CACHE = 1024
+_tokens_validados = OrderedDict()
+_lock_tokens = threading.Lock()
+
 
 class JWTUser:
     """
@@ -34,6 +48,30 @@ class MicroserviceJWTAuthentication(JWTAuthentication):
     Autenticación JWT personalizada para microservicios.
     Crea un usuario virtual desde el payload del token sin consultar la BD.
     """
+
+    def get_validated_token(self, raw_token):
+        """Como JWTAuthentication, pero reutiliza la validación de un token ya visto y no expirado."""
+        clave = raw_token if isinstance(raw_token, bytes) else raw_token.encode()
+        with _lock_tokens:
+            entrada = _tokens_validados.get(clave)
+            if entrada is not None:
+                if entrada[1] > time.time():
+                    _tokens_validados.move_to_end(clave)
+                else:
+                    del _tokens_validados[clave]
+                    entrada = None
+        metricas.cache('token', entrada is not None)
+        if entrada is not None:
+            return entrada[0]
+
+        validado = super().get_validated_token(raw_token)
+        expira = validado.get('exp')
+        if expira:
+            with _lock_tokens:
+                _tokens_validados[clave] = (validado, expira)
+                if len(_tokens_validados) > MAX_TOKENS_EN_CACHE:
+                    _tokens_validados.popitem(last=False)
+        return validado
     
     def get_user(self, validated_token):
         """
@@ -52,3 +90,26 @@ class MicroserviceJWTAuthentication(JWTAuthentication):
             
         except Exception as e:
             raise InvalidToken(f'Error al obtener usuario del token: {str(e)}')
+
+
+def autenticar_peticion(request, token_en_query=False):
+    """
+    Autentica una HttpRequest de Django (vistas fuera de DRF, p. ej. las asíncronas).
+    No consulta la BD, por lo que puede llamarse directamente desde código async.
+    Retorna (usuario, error): usuario es None si no hay credenciales o no son válidas;
+    error solo se informa cuando se enviaron credenciales inválidas.
+    Con token_en_query también acepta ?token=<jwt> (EventSource no permite cabeceras).
+    """
+    from rest_framework.exceptions import AuthenticationFailed
+
+    autenticacion = MicroserviceJWTAuthentication()
+    try:
+        resultado = autenticacion.authenticate(request)
+        if resultado is not None:
+            return resultado[0], None
+        token = request.GET.get('token') if token_en_query else None
+        if token:
+            return autenticacion.get_user(autenticacion.get_validated_token(token)), None
+    except AuthenticationFailed:
+        return None, "Token inválido o expirado"
+    return None, None
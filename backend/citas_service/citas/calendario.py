@@ -0,0 +1,216 @@
+"""
+Feed iCalendar (.ics) de solo lectura para peluqueros y clientes.
+
+El feed se identifica con un token firmado (no requiere JWT) para que las
+aplicaciones de calendario puedan suscribirse directamente a la URL. El valor
+firmado lleva el secreto aleatorio del propietario (TokenCalendario):
+`rotar_token()` lo renueva y las URL anteriores dejan de ser válidas.
+La versión del feed se deriva de MAX(actualizada_en) y COUNT(*) de las citas
+relevantes y de la última modificación de sus mascotas y servicios (el feed
+muestra sus nombres): con ella se construye el ETag/Last-Modified y la clave de
+caché, de modo que el feed renderizado se reutiliza hasta que algo cambia.
+Con ?historial=true el feed incluye también las citas archivadas (CitaHistorica).
+"""
+import hashlib
+import secrets
+from datetime import timezone as dt_timezone
+
+from django.core import signing
+from django.core.cache import cache
+from django.db.models import Count, Max
+
+from . import metricas
+from .models import Cita, CitaHistorica, EstadoCita, TokenCalendario
+
+SALT_CALENDARIO = 'citas.calendario'
+TIPO_PELUQUERO = 'p'
+TIPO_CLIENTE = 'c'
+CACHE_TIMEOUT = 60 * 60 * 24
+
+ESTADOS_ICAL = {
+    EstadoCita.PENDIENTE: 'TENTATIVE',
+    EstadoCita.CONFIRMADA: 'CONFIRMED',
+    EstadoCita.FINALIZADA: 'CONFIRMED',
+    EstadoCita.CANCELADA: 'CANCELLED',
+    EstadoCita.NO_ASISTIO: 'CANCELLED',
+}
+
+
+def _firmar(tipo, propietario_id, secreto):
+    return signing.Signer(salt=SALT_CALENDARIO).sign(f"{tipo}{propietario_id}.{secreto}")
+
+
+def generar_token(tipo, propietario_id):
+    """Genera el token firmado que identifica un feed (tipo 'p' o 'c' + id + secreto del propietario)."""
+    registro, _ = TokenCalendario.objects.get_or_create(
+        tipo=tipo, propietario_id=propietario_id, defaults={'secreto': secrets.token_hex(16)}
+    )
+    return _firmar(tipo, propietario_id, registro.secreto)
+
+
+def rotar_token(tipo, propietario_id):
+    """Renueva el secreto del propietario (los tokens anteriores dejan de valer) y retorna el token nuevo."""
+    secreto = secrets.token_hex(16)
+    TokenCalendario.objects.update_or_create(
+        tipo=tipo, propietario_id=propietario_id, defaults={'secreto': secreto}
+    )
+    return _firmar(tipo, propietario_id, secreto)
+
+
+def leer_token(token):
+    """Devuelve (tipo, id) a partir del token o None si la firma no es válida o el secreto fue rotado."""
+    try:
+        valor = signing.Signer(salt=SALT_CALENDARIO).unsign(token)
+    except signing.BadSignature:
+        return None
+    propietario, _, secreto = valor.partition('.')
+    tipo, propietario_id = propietario[:1], propietario[1:]
+    if tipo not in (TIPO_PELUQUERO, TIPO_CLIENTE) or not propietario_id.isdigit() or not secreto:
+        return None
+    vigente = TokenCalendario.objects.filter(tipo=tipo, propietario_id=propietario_id).values_list(
+        'secreto', flat=True
+    ).first()
+    if vigente is None or not secrets.compare_digest(vigente, secreto):
+        return None
+    return tipo, int(propietario_id)
+
+
+def citas_del_feed(tipo, propietario_id, modelo=Cita):
+    """Queryset de citas (o de citas archivadas con modelo=CitaHistorica) que pertenecen al feed."""
+    if tipo == TIPO_PELUQUERO:
+        return modelo.objects.filter(peluquero_id=propietario_id)
+    return modelo.objects.filter(mascota__dueno_id=propietario_id)
+
+
+def _modelos(historial):
+    return (CitaHistorica, Cita) if historial else (Cita,)
+
+
+def version_feed(tipo, propietario_id, historial=False):
+    """
+    Calcula la versión del feed con una consulta agregada por tabla.
+    Retorna (etag, ultima_modificacion); ultima_modificacion es None si no hay citas.
+    El COUNT permite detectar borrados, que no alteran MAX(actualizada_en).
+    Renombrar una mascota o un servicio del feed también cambia la versión.
+    """
+    ultima, total = None, 0
+    for modelo in _modelos(historial):
+        datos = citas_del_feed(tipo, propietario_id, modelo).aggregate(
+            cita=Max('actualizada_en'),
+            mascota=Max('mascota__actualizada_en'),
+            servicio=Max('servicio__actualizado_en'),
+            total=Count('id'),
+        )
+        for marca in (datos['cita'], datos['mascota'], datos['servicio']):
+            if marca and (ultima is None or marca > ultima):
+                ultima = marca
+        total += datos['total']
+    marca = ultima.isoformat() if ultima else '-'
+    alcance = 'h' if historial else ''
+    digest = hashlib.sha1(f"{tipo}{propietario_id}{alcance}:{marca}:{total}".encode()).hexdigest()
+    return f'"{digest}"', ultima
+
+
+def clave_cache(tipo, propietario_id, etag):
+    version = etag.strip('"')
+    return f"citas:ical:{tipo}{propietario_id}:{version}"
+
+
+def _escapar(texto):
+    """Escapa texto según RFC 5545 (sección 3.3.11)."""
+    return (
+        str(texto)
+        .replace('\\', '\\\\')
+        .replace(';', '\\;')
+        .replace(',', '\\,')
+        .replace('\r\n', '\\n')
+        .replace('\n', '\\n')
+    )
+
+
+def _plegar(linea):
+    """Pliega líneas a 75 octetos como exige RFC 5545."""
+    datos = linea.encode('utf-8')
+    if len(datos) <= 75:
+        return linea + '\r\n'
+    partes = []
+    limite = 75
+    while datos:
+        corte = min(limite, len(datos))
+        # No cortar en medio de un carácter UTF-8 multibyte
+        while corte < len(datos) and (datos[corte] & 0xC0) == 0x80:
+            corte -= 1
+        partes.append(datos[:corte].decode('utf-8'))
+        datos = datos[corte:]
+        limite = 74  # las líneas de continuación empiezan con un espacio
+    return '\r\n '.join(partes) + '\r\n'
+
+
+def _fecha_hora(fecha, hora):
+    return f"{fecha:%Y%m%d}T{hora:%H%M%S}"
+
+
+def _utc(valor):
+    return valor.astimezone(dt_timezone.utc).strftime('%Y%m%dT%H%M%SZ')
+
+
+def renderizar_feed(tipo, propietario_id, historial=False):
+    """
+    Generador de líneas del calendario.
+    Recorre las citas con iterator() y values() para no materializar
+    instancias del modelo ni mantener todo el resultado en memoria.
+    """
+    nombre = 'Agenda peluquero' if tipo == TIPO_PELUQUERO else 'Mis citas'
+    yield _plegar('BEGIN:VCALENDAR')
+    yield _plegar('VERSION:2.0')
+    yield _plegar('PRODID:-//PelusaSPA//citas_service//ES')
+    yield _plegar('CALSCALE:GREGORIAN')
+    yield _plegar('METHOD:PUBLISH')
+    yield _plegar(f'X-WR-CALNAME:{_escapar(nombre)}')
+
+    consultas = [
+        citas_del_feed(tipo, propietario_id, modelo).order_by('fecha', 'hora_inicio').values(
+            'id', 'fecha', 'hora_inicio', 'hora_fin', 'estado', 'notas',
+            'peluquero_id', 'actualizada_en', 'mascota__nombre', 'servicio__nombre',
+        )
+        for modelo in _modelos(historial)
+    ]
+    for cita in (fila for filas in consultas for fila in filas.iterator(chunk_size=500)):
+        servicio = cita['servicio__nombre'] or 'Cita'
+        resumen = f"{servicio} - {cita['mascota__nombre']}"
+        yield _plegar('BEGIN:VEVENT')
+        yield _plegar(f"UID:cita-{cita['id']}@citas_service")
+        yield _plegar(f"DTSTAMP:{_utc(cita['actualizada_en'])}")
+        yield _plegar(f"LAST-MODIFIED:{_utc(cita['actualizada_en'])}")
+        yield _plegar(f"DTSTART:{_fecha_hora(cita['fecha'], cita['hora_inicio'])}")
+        yield _plegar(f"DTEND:{_fecha_hora(cita['fecha'], cita['hora_fin'])}")
+        yield _plegar(f"SUMMARY:{_escapar(resumen)}")
+        if cita['notas']:
+            yield _plegar(f"DESCRIPTION:{_escapar(cita['notas'])}")
+        yield _plegar(f"STATUS:{ESTADOS_ICAL.get(cita['estado'], 'TENTATIVE')}")
+        yield _plegar('END:VEVENT')
+
+    yield _plegar('END:VCALENDAR')
+
+
+def feed_con_cache(tipo, propietario_id, etag, historial=False):
+    """
+    Devuelve el feed renderizado desde la caché o un generador que lo
+    transmite y lo guarda al terminar.
+    La clave incluye la versión, por lo que cualquier cambio en las citas
+    del feed produce automáticamente una entrada nueva.
+    """
+    clave = clave_cache(tipo, propietario_id, etag)
+    contenido = cache.get(clave)
+    metricas.cache('feed', contenido is not None)
+    if contenido is not None:
+        return [contenido]
+
+    def transmitir():
+        partes = []
+        for linea in renderizar_feed(tipo, propietario_id, historial):
+            partes.append(linea)
+            yield linea
+        cache.set(clave, ''.join(partes), CACHE_TIMEOUT)
+
+    return transmitir()
@@ -0,0 +1,40 @@
+"""
+Comprobaciones de `manage.py check` (y del arranque) para varios procesos.
+
+Con WEB_CONCURRENCY > 1 (workers de gunicorn) el estado en memoria de un
+proceso no lo ven los demás: el bus de eventos SSE y la caché de Django deben
+ser compartidos. La caché de tokens JWT validados (citas/authentication.py) sí
+puede ser de cada proceso: validar un token solo depende de su firma y su
+expiración.
+"""
+import os
+
+from django.conf import settings
+from django.core.checks import Warning, register
+
+from . import eventos
+
+
+def _procesos():
+    return int(os.environ.get('WEB_CONCURRENCY', 1))
+
+
+@register()
+def estado_compartido(app_configs, **kwargs):
+    if _procesos() <= 1:
+        return []
+    avisos = []
+    if eventos.config()['BACKEND'] == 'citas.eventos.MemoriaBackend':
+        avisos.append(Warning(
+            'El bus de eventos SSE es de cada proceso: un worker no ve los eventos del otro.',
+            hint='CITAS_EVENTOS_BACKEND=citas.eventos.RedisBackend y CITAS_EVENTOS_REDIS_URL.',
+            id='citas.W001',
+        ))
+    if not getattr(settings, 'CACHE_URL', None):
+        avisos.append(Warning(
+            'La caché de Django es de cada proceso: el feed iCal no se comparte entre workers '
+            'y el horario efectivo se lee siempre de la BD.',
+            hint='CACHE_URL=redis://host:6379/0.',
+            id='citas.W002',
+        ))
+    return avisos
@@ -0,0 +1,301 @@
+"""
+Pub/sub de eventos de citas para el stream SSE del peluquero.
+
+Cada cambio de una cita (alta, edición, transición de estado, baja) se publica
+tras el commit en el canal de su peluquero. Cada canal guarda un registro acotado
+de los últimos eventos para reanudar con Last-Event-ID; si el cliente pide un id
+que ya salió del registro recibe un evento "reset" y debe recargar la agenda.
+
+Backends:
+- memoria (por defecto): un proceso; los suscriptores son asyncio.Queue.
+- redis: Redis Streams (XADD con MAXLEN / XREAD BLOCK), compartido entre workers.
+  Requiere el paquete `redis` y CITAS_EVENTOS['REDIS_URL'].
+"""
+import asyncio
+import json
+import logging
+import threading
+from collections import deque
+from dataclasses import dataclass, field
+
+from django.conf import settings
+from django.db import transaction
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+TIPO_CREADA = 'cita_creada'
+TIPO_ACTUALIZADA = 'cita_actualizada'
+TIPO_ESTADO = 'cita_estado'
+TIPO_ELIMINADA = 'cita_eliminada'
+TIPO_RESET = 'reset'
+
+CONFIG_POR_DEFECTO = {
+    'BACKEND': 'citas.eventos.MemoriaBackend',
+    'REDIS_URL': None,
+    'CAPACIDAD_REGISTRO': 500,
+    'CAPACIDAD_COLA': 100,
+    'HEARTBEAT_SEGUNDOS': 15,
+}
+
+
+def config():
+    return {**CONFIG_POR_DEFECTO, **getattr(settings, 'CITAS_EVENTOS', {})}
+
+
+@dataclass
+class Evento:
+    id: str
+    tipo: str
+    datos: dict = field(default_factory=dict)
+
+    def sse(self):
+        """Serializa el evento en formato text/event-stream."""
+        return f"id: {self.id}\nevent: {self.tipo}\ndata: {json.dumps(self.datos, default=str)}\n\n"
+
+
+class _Canal:
+    """Registro acotado de eventos de un peluquero y sus suscriptores."""
+
+    def __init__(self, capacidad):
+        self.registro = deque(maxlen=capacidad)
+        # Id del último evento expulsado del registro (0 si no se ha expulsado ninguno)
+        self.descartado = 0
+        self.suscriptores = set()
+
+
+class MemoriaBackend:
+    """Bus en memoria del proceso. Los ids son enteros crecientes globales."""
+
+    def __init__(self, capacidad_registro, capacidad_cola, **kwargs):
+        self._lock = threading.Lock()
+        self._ultimo_id = 0
+        self._capacidad_registro = capacidad_registro
+        self._capacidad_cola = capacidad_cola
+        self._canales = {}
+
+    def _canal(self, peluquero_id):
+        canal = self._canales.get(peluquero_id)
+        if canal is None:
+            canal = self._canales[peluquero_id] = _Canal(self._capacidad_registro)
+        return canal
+
+    def publicar(self, peluquero_id, tipo, datos):
+        with self._lock:
+            self._ultimo_id += 1
+            evento = Evento(str(self._ultimo_id), tipo, datos)
+            canal = self._canal(peluquero_id)
+            if len(canal.registro) == canal.registro.maxlen:
+                canal.descartado = int(canal.registro[0].id)
+            canal.registro.append(evento)
+            suscriptores = list(canal.suscriptores)
+        for loop, cola in suscriptores:
+            loop.call_soon_threadsafe(self._entregar, cola, evento)
+        return evento
+
+    @staticmethod
+    def _entregar(cola, evento):
+        try:
+            cola.put_nowait(evento)
+        except asyncio.QueueFull:
+            # Cliente demasiado lento: se descarta lo pendiente y se le pide recargar
+            while not cola.empty():
+                cola.get_nowait()
+            cola.put_nowait(Evento(evento.id, TIPO_RESET, {"motivo": "cola_llena"}))
+
+    def _pendientes(self, canal, ultimo_id):
+        """Eventos del registro posteriores a ultimo_id (o un reset si se perdieron)."""
+        try:
+            ultimo = int(ultimo_id)
+        except (TypeError, ValueError):
+            return [Evento(str(self._ultimo_id), TIPO_RESET, {"motivo": "id_invalido"})]
+        if ultimo < canal.descartado or ultimo > self._ultimo_id:
+            # Eventos expulsados del registro o id de otra instancia/reinicio del proceso
+            return [Evento(str(self._ultimo_id), TIPO_RESET, {"motivo": "fuera_de_registro"})]
+        return [evento for evento in canal.registro if int(evento.id) > ultimo]
+
+    async def suscribir(self, peluquero_id, ultimo_id=None, heartbeat=15):
+        """
+        Registra al suscriptor de inmediato (para no perder lo que se publique
+        mientras se envía la respuesta) y retorna un generador asíncrono de eventos.
+        El generador cede None cada `heartbeat` segundos sin eventos para que la
+        vista envíe un comentario keep-alive.
+        """
+        cola = asyncio.Queue(maxsize=self._capacidad_cola)
+        suscriptor = (asyncio.get_running_loop(), cola)
+        with self._lock:
+            canal = self._canal(peluquero_id)
+            canal.suscriptores.add(suscriptor)
+            pendientes = self._pendientes(canal, ultimo_id) if ultimo_id is not None else []
+            ultimo_entregado = self._ultimo_id
+        return self._escuchar(canal, suscriptor, pendientes, ultimo_entregado, heartbeat)
+
+    async def _escuchar(self, canal, suscriptor, pendientes, ultimo_entregado, heartbeat):
+        _, cola = suscriptor
+        try:
+            for evento in pendientes:
+                yield evento
+            while True:
+                try:
+                    evento = await asyncio.wait_for(cola.get(), timeout=heartbeat)
+                except asyncio.TimeoutError:
+                    yield None
+                    continue
+                # Lo publicado antes de suscribirse ya salió en pendientes
+                if evento.tipo != TIPO_RESET and int(evento.id) <= ultimo_entregado:
+                    continue
+                yield evento
+        finally:
+            with self._lock:
+                canal.suscriptores.discard(suscriptor)
+
+
+class RedisBackend:
+    """Bus compartido entre procesos usando un Redis Stream por peluquero."""
+
+    def __init__(self, capacidad_registro, redis_url=None, **kwargs):
+        try:
+            import redis
+            import redis.asyncio as redis_async
+        except ImportError as exc:
+            raise ImportError("RedisBackend requiere el paquete 'redis' (pip install redis)") from exc
+        if not redis_url:
+            raise ValueError("RedisBackend requiere CITAS_EVENTOS['REDIS_URL']")
+        self._redis_url = redis_url
+        self._redis_async = redis_async
+        self._cliente = redis.Redis.from_url(redis_url, decode_responses=True)
+        self._capacidad_registro = capacidad_registro
+
+    @staticmethod
+    def _clave(peluquero_id):
+        return f"citas:eventos:{peluquero_id}"
+
+    def publicar(self, peluquero_id, tipo, datos):
+        evento_id = self._cliente.xadd(
+            self._clave(peluquero_id),
+            {'tipo': tipo, 'datos': json.dumps(datos, default=str)},
+            maxlen=self._capacidad_registro,
+            approximate=True,
+        )
+        return Evento(evento_id, tipo, datos)
+
+    @staticmethod
+    def _evento(evento_id, campos):
+        return Evento(evento_id, campos['tipo'], json.loads(campos['datos']))
+
+    async def suscribir(self, peluquero_id, ultimo_id=None, heartbeat=15):
+        """Fija la posición de lectura en el stream y retorna el generador de eventos."""
+        cliente = self._redis_async.Redis.from_url(self._redis_url, decode_responses=True)
+        clave = self._clave(peluquero_id)
+        iniciales = []
+        ultimo = await cliente.xrevrange(clave, count=1)
+        # Id concreto (no '$') para no perder eventos publicados entre dos XREAD
+        desde = ultimo[0][0] if ultimo else '0-0'
+        if ultimo_id is not None:
+            primero = await cliente.xrange(clave, count=1)
+            if primero and self._anterior(ultimo_id, primero[0][0]):
+                iniciales.append(Evento(desde, TIPO_RESET, {"motivo": "fuera_de_registro"}))
+            else:
+                desde = ultimo_id
+        return self._escuchar(cliente, clave, desde, iniciales, heartbeat)
+
+    async def _escuchar(self, cliente, clave, desde, iniciales, heartbeat):
+        try:
+            for evento in iniciales:
+                yield evento
+            while True:
+                respuesta = await cliente.xread({clave: desde}, block=int(heartbeat * 1000), count=100)
+                if not respuesta:
+                    yield None
+                    continue
+                for evento_id, campos in respuesta[0][1]:
+                    desde = evento_id
+                    yield self._evento(evento_id, campos)
+        finally:
+            await cliente.aclose()
+
+    @staticmethod
+    def _anterior(ultimo_id, primero_id):
+        """True si ultimo_id es anterior al primer id conservado (pudieron perderse eventos)."""
+        try:
+            ultimo = tuple(int(parte) for parte in ultimo_id.split('-', 1))
+        except ValueError:
+            return True
+        primero = tuple(int(parte) for parte in primero_id.split('-', 1))
+        return ultimo < primero
+
+
+_bus = None
+_bus_lock = threading.Lock()
+
+
+def bus():
+    """Instancia única del backend configurado."""
+    global _bus
+    if _bus is None:
+        with _bus_lock:
+            if _bus is None:
+                opciones = config()
+                _bus = import_string(opciones['BACKEND'])(
+                    capacidad_registro=opciones['CAPACIDAD_REGISTRO'],
+                    capacidad_cola=opciones['CAPACIDAD_COLA'],
+                    redis_url=opciones['REDIS_URL'],
+                )
+    return _bus
+
+
+def _datos(fila, estado_anterior=None):
+    datos = {
+        "id": fila['id'],
+        "fecha": fila['fecha'].isoformat(),
+        "hora_inicio": fila['hora_inicio'].strftime('%H:%M'),
+        "hora_fin": fila['hora_fin'].strftime('%H:%M'),
+        "estado": fila['estado'],
+        "servicio_id": fila['servicio_id'],
+    }
+    if estado_anterior is not None:
+        datos['estado_anterior'] = estado_anterior
+    return datos
+
+
+def eventos_de_cambio(anterior, actual):
+    """
+    Traduce un cambio de cita (filas con resumenes.CAMPOS, None en alta/baja)
+    a una lista de (peluquero_id, tipo, datos).
+    """
+    if anterior is None and actual is None:
+        return []
+    if anterior is None:
+        return [(actual['peluquero_id'], TIPO_CREADA, _datos(actual))]
+    if actual is None:
+        return [(anterior['peluquero_id'], TIPO_ELIMINADA, _datos(anterior))]
+
+    if anterior['peluquero_id'] != actual['peluquero_id']:
+        # Reasignada: desaparece de una agenda y aparece en la otra
+        return [
+            (anterior['peluquero_id'], TIPO_ELIMINADA, _datos(anterior)),
+            (actual['peluquero_id'], TIPO_CREADA, _datos(actual)),
+        ]
+    if anterior['estado'] != actual['estado']:
+        return [(actual['peluquero_id'], TIPO_ESTADO, _datos(actual, anterior['estado']))]
+    return [(actual['peluquero_id'], TIPO_ACTUALIZADA, _datos(actual))]
+
+
+def publicar(eventos):
+    """
+    Publica los eventos en el bus. Un fallo del bus (Redis caído) se registra y
+    no se propaga: el cambio de la cita ya está confirmado y el stream SSE es
+    secundario (los clientes recargan la agenda con el evento reset).
+    """
+    try:
+        backend = bus()
+        for peluquero_id, tipo, datos in eventos:
+            backend.publicar(peluquero_id, tipo, datos)
+    except Exception:
+        logger.exception("No se pudieron publicar %s eventos de citas", len(eventos))
+
+
+def publicar_al_confirmar(eventos):
+    """Publica los eventos solo si la transacción en curso hace commit."""
+    if eventos:
+        transaction.on_commit(lambda: publicar(eventos))
@@ -0,0 +1,295 @@
+"""
+Horario efectivo de los peluqueros.
+
+Horario es la plantilla semanal; HorarioExcepcion la corrige en rangos de
+fechas con cierres (de día completo o de una franja) y turnos extra.
+`efectivo()` resuelve el horario de cada día de un rango con dos consultas como
+máximo, sea cual sea el rango: las semanas compiladas que no están en caché y
+las excepciones que lo tocan. Sobre cada día de la plantilla se suman los turnos
+extra y después se restan los cierres (un cierre prevalece sobre un turno extra).
+
+Semana compilada: tupla de 7 tuplas (lunes a domingo) de intervalos
+(inicio, fin) en minutos, ordenados y sin solapes. HorarioSerializer rechaza
+los turnos solapados del mismo día y los contiguos se fusionan al compilar.
+Cada escritura de Horario la recalcula y la guarda en HorarioCompilado, en la
+misma transacción (recompilar(), desde citas/signals.py), así las lecturas
+cargan una fila por peluquero en lugar de sus turnos. Además se guarda en la
+caché de Django por peluquero, que se invalida con cada recompilación. Las
+escrituras en bloque (bulk_create, QuerySet.update) no disparan señales: tras
+ellas hay que llamar a recompilar() (o manage.py compilar_horarios), o a
+invalidar() si solo cambiaron excepciones.
+
+Cada proceso guarda además en memoria las semanas que ya leyó y las
+excepciones vigentes (las que terminan hoy o después), así comprobar una
+franja futura (al agendar, ver CitaCreateSerializer) no hace consultas.
+Esa copia local se descarta cuando cambia la generación guardada en la caché
+de Django, que invalidar() renueva con cada cambio de Horario o de
+HorarioExcepcion (ver citas/signals.py). Con varios procesos, la caché de
+Django debe ser compartida (CACHE_URL en settings) para que la invalidación
+llegue a todos; si no lo es, CITAS_HORARIOS['CACHE'] es False y semanas y
+excepciones se leen siempre de la BD.
+"""
+import uuid
+from datetime import time, timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from . import metricas
+from .models import Horario, HorarioCompilado, HorarioExcepcion, TipoExcepcion
+
+CACHE_TIMEOUT = 24 * 60 * 60
+DIAS_SEMANA = 7
+SEMANA_VACIA = ((),) * DIAS_SEMANA
+GENERACION = 'horario-generacion'
+
+
+def minutos(hora):
+    return hora.hour * 60 + hora.minute
+
+
+def hora(minutos):
+    return time(minutos // 60, minutos % 60)
+
+
+def fusionar(intervalos):
+    """Ordena los intervalos y fusiona los solapados o contiguos."""
+    fusionados = []
+    for inicio, fin in sorted(intervalos):
+        if fusionados and inicio <= fusionados[-1][1]:
+            fusionados[-1] = (fusionados[-1][0], max(fusionados[-1][1], fin))
+        else:
+            fusionados.append((inicio, fin))
+    return tuple(fusionados)
+
+
+def restar(intervalos, inicio, fin):
+    """Intervalos sin la franja [inicio, fin)."""
+    resultado = []
+    for a, b in intervalos:
+        if b <= inicio or fin <= a:
+            resultado.append((a, b))
+            continue
+        if a < inicio:
+            resultado.append((a, inicio))
+        if fin < b:
+            resultado.append((fin, b))
+    return tuple(resultado)
+
+
+def contiene(intervalos, inicio, fin):
+    """La franja [inicio, fin) en minutos cabe entera en uno de los intervalos."""
+    return any(a <= inicio and fin <= b for a, b in intervalos)
+
+
+def compilar(filas, peluquero_ids=()):
+    """
+    Semanas compiladas a partir de filas (peluquero_id, dia_semana, hora_inicio, hora_fin).
+    Los peluqueros de `peluquero_ids` sin filas reciben la semana vacía.
+    """
+    dias = {peluquero_id: [[] for _ in range(DIAS_SEMANA)] for peluquero_id in peluquero_ids}
+    for peluquero_id, dia_semana, hora_inicio, hora_fin in filas:
+        dias.setdefault(peluquero_id, [[] for _ in range(DIAS_SEMANA)])
+        dias[peluquero_id][dia_semana].append((minutos(hora_inicio), minutos(hora_fin)))
+    return {peluquero_id: tuple(fusionar(dia) for dia in semana) for peluquero_id, semana in dias.items()}
+
+
+def _clave(peluquero_id):
+    return f'horario-semana:{peluquero_id}'
+
+
+def _desde_json(dias):
+    if len(dias) != DIAS_SEMANA:
+        return SEMANA_VACIA
+    return tuple(tuple((inicio, fin) for inicio, fin in dia) for dia in dias)
+
+
+def _leer(peluquero_ids=None):
+    """Semanas guardadas en HorarioCompilado; los peluqueros sin fila tienen la semana vacía."""
+    filas = HorarioCompilado.objects.all()
+    if peluquero_ids is not None:
+        filas = filas.filter(peluquero_id__in=peluquero_ids)
+    compiladas = dict.fromkeys(peluquero_ids or (), SEMANA_VACIA)
+    for peluquero_id, dias in filas.values_list('peluquero_id', 'dias'):
+        compiladas[peluquero_id] = _desde_json(dias)
+    return compiladas
+
+
+class _CopiaLocal:
+    """Semanas y excepciones vigentes leídas por este proceso en una generación."""
+
+    def __init__(self, generacion):
+        self.generacion = generacion
+        self.semanas = {}
+        self.excepciones = None
+
+
+_copia = _CopiaLocal(None)
+
+
+def _cache_activa():
+    return settings.CITAS_HORARIOS['CACHE']
+
+
+def _local():
+    """Copia local del proceso; se vacía si otro proceso (o este) cambió horarios desde que se llenó."""
+    global _copia
+    if not _cache_activa():
+        return _CopiaLocal(None)
+    generacion = cache.get(GENERACION)
+    if generacion is None:
+        cache.add(GENERACION, uuid.uuid4().hex, None)
+        generacion = cache.get(GENERACION)
+        if generacion is None:
+            # Caché que no guarda nada (DummyCache): sin generación no se puede invalidar la copia
+            return _CopiaLocal(None)
+    if _copia.generacion != generacion:
+        _copia = _CopiaLocal(generacion)
+    return _copia
+
+
+def recompilar(*peluquero_ids):
+    """
+    Recalcula desde sus Horario activos y guarda la semana compilada de los
+    peluqueros dados (si no se indica ninguno, de todos los que tienen horario
+    o semana guardada). Retorna cuántas semanas guardó.
+    """
+    filas = Horario.objects.filter(activo=True)
+    if peluquero_ids:
+        filas = filas.filter(peluquero_id__in=peluquero_ids)
+    else:
+        peluquero_ids = HorarioCompilado.objects.values_list('peluquero_id', flat=True)
+    compiladas = compilar(
+        filas.order_by().values_list('peluquero_id', 'dia_semana', 'hora_inicio', 'hora_fin'), peluquero_ids
+    )
+    ahora = timezone.now()
+    with transaction.atomic():
+        existentes = {
+            semana.peluquero_id: semana
+            for semana in HorarioCompilado.objects.filter(peluquero_id__in=compiladas).select_for_update()
+        }
+        nuevas = []
+        for peluquero_id, semana in compiladas.items():
+            dias = [[list(intervalo) for intervalo in dia] for dia in semana]
+            if peluquero_id in existentes:
+                existentes[peluquero_id].dias = dias
+                existentes[peluquero_id].actualizado_en = ahora
+            else:
+                nuevas.append(HorarioCompilado(peluquero_id=peluquero_id, dias=dias))
+        HorarioCompilado.objects.bulk_update(existentes.values(), ['dias', 'actualizado_en'])
+        HorarioCompilado.objects.bulk_create(nuevas)
+    invalidar(*compiladas)
+    return len(compiladas)
+
+
+def semanas(peluquero_ids=None):
+    """
+    Semana compilada de cada peluquero: {peluquero_id: semana}.
+    Con peluquero_ids=None, la de todos los que tienen semana guardada (se leen
+    de la BD y se refrescan las cachés); si no, se buscan en la copia local del
+    proceso, después en la caché de Django y las que faltan se leen en una sola
+    consulta.
+    """
+    if not _cache_activa():
+        return _leer(peluquero_ids)
+    local = _local()
+    if peluquero_ids is None:
+        compiladas = _leer()
+        cache.set_many({_clave(p): semana for p, semana in compiladas.items()}, CACHE_TIMEOUT)
+        local.semanas.update(compiladas)
+        return compiladas
+
+    pedidos = set(peluquero_ids)
+    compiladas = {p: local.semanas[p] for p in pedidos if p in local.semanas}
+    claves = {_clave(p): p for p in pedidos - compiladas.keys()}
+    if claves:
+        compiladas.update({claves[clave]: semana for clave, semana in cache.get_many(claves).items()})
+    faltan = [p for p in pedidos if p not in compiladas]
+    metricas.cache('horario', not faltan)
+    if faltan:
+        leidas = _leer(faltan)
+        cache.set_many({_clave(p): semana for p, semana in leidas.items()}, CACHE_TIMEOUT)
+        compiladas.update(leidas)
+    local.semanas.update(compiladas)
+    return compiladas
+
+
+def invalidar(*peluquero_ids):
+    """Borra de la caché las semanas dadas y descarta la copia local de todos los procesos."""
+    cache.delete_many([_clave(p) for p in peluquero_ids])
+    cache.set(GENERACION, uuid.uuid4().hex, None)
+
+
+def _filas_excepciones(filas):
+    return list(filas.order_by().values_list('peluquero_id', 'tipo', 'desde', 'hasta', 'hora_inicio', 'hora_fin'))
+
+
+def excepciones(desde, hasta, peluquero_ids=None):
+    """
+    Filas (peluquero_id, tipo, desde, hasta, hora_inicio, hora_fin) de las excepciones que tocan el rango.
+    Los rangos que empiezan hoy o después se filtran en memoria sobre las
+    excepciones vigentes de la copia local (una consulta por generación).
+    """
+    if desde < timezone.localdate():
+        filas = HorarioExcepcion.objects.filter(desde__lte=hasta, hasta__gte=desde)
+        if peluquero_ids is not None:
+            filas = filas.filter(Q(peluquero_id__in=peluquero_ids) | Q(peluquero_id__isnull=True))
+        return _filas_excepciones(filas)
+
+    local = _local()
+    if local.excepciones is None:
+        # Incluye todas las que pueden tocar un rango que empiece hoy o más tarde
+        local.excepciones = _filas_excepciones(HorarioExcepcion.objects.filter(hasta__gte=timezone.localdate()))
+    return [
+        fila for fila in local.excepciones
+        if fila[2] <= hasta and desde <= fila[3]
+        and (peluquero_ids is None or fila[0] is None or fila[0] in peluquero_ids)
+    ]
+
+
+def efectivo(desde, hasta, peluquero_ids=None):
+    """
+    Horario efectivo de cada día de [desde, hasta]: {(peluquero_id, fecha): intervalos}.
+    Con peluquero_ids=None incluye a todos los peluqueros con semana compilada
+    o con un turno extra en el rango.
+    """
+    compiladas = semanas(peluquero_ids)
+    filas = excepciones(desde, hasta, peluquero_ids)
+    if peluquero_ids is None:
+        peluqueros = set(compiladas) | {
+            fila[0] for fila in filas if fila[0] is not None and fila[1] == TipoExcepcion.TURNO_EXTRA
+        }
+    else:
+        peluqueros = set(peluquero_ids)
+
+    dias = [desde + timedelta(days=i) for i in range((hasta - desde).days + 1)]
+    horario = {
+        (peluquero_id, dia): compiladas.get(peluquero_id, SEMANA_VACIA)[dia.weekday()]
+        for peluquero_id in peluqueros
+        for dia in dias
+    }
+    # Primero los turnos extra y después los cierres
+    for peluquero_id, tipo, e_desde, e_hasta, hora_inicio, hora_fin in sorted(
+        filas, key=lambda fila: fila[1] == TipoExcepcion.CIERRE
+    ):
+        afectados = peluqueros if peluquero_id is None else peluqueros & {peluquero_id}
+        dia = max(desde, e_desde)
+        while dia <= min(hasta, e_hasta):
+            for afectado in afectados:
+                clave = (afectado, dia)
+                if tipo == TipoExcepcion.TURNO_EXTRA:
+                    horario[clave] = fusionar(horario[clave] + ((minutos(hora_inicio), minutos(hora_fin)),))
+                elif hora_inicio is None:
+                    horario[clave] = ()
+                else:
+                    horario[clave] = restar(horario[clave], minutos(hora_inicio), minutos(hora_fin))
+            dia += timedelta(days=1)
+    return horario
+
+
+def del_dia(peluquero_id, fecha):
+    """Intervalos (inicio, fin) en minutos en los que trabaja el peluquero esa fecha."""
+    return efectivo(fecha, fecha, [peluquero_id])[(peluquero_id, fecha)]
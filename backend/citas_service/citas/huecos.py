@@ -0,0 +1,91 @@
+"""
+Huecos para agendar una cita de un servicio.
+
+La cita de un servicio dura su duracion_minutos más su margen_minutos
+(preparación o limpieza): al agendar, hora_fin se calcula con `hora_fin()` y
+no la elige el cliente. Un hueco es un inicio, en minutos, en el que esa
+duración cabe en un tramo libre del día: el horario efectivo del peluquero
+(ver citas/horarios.py) menos sus citas activas. Los inicios candidatos son
+los múltiplos de PASO_MINUTOS y los bordes de cada tramo (justo al terminar la
+cita anterior o empezar el turno, y pegado a la cita siguiente o al fin del
+turno).
+
+`huecos()` los ordena según el modo:
+
+- primero: cronológico.
+- compacto: primero los que menos fragmentan el día. Un hueco parte su tramo
+  en un resto anterior y otro posterior; se prefieren los que dejan menos
+  minutos en restos más cortos que MINIMO_UTIL_MINUTOS (ya no caben citas en
+  ellos), después los que dejan menos restos y, por último, los tramos más
+  ajustados. Así las citas se pegan a las existentes y a los bordes del turno
+  y los tramos largos quedan enteros para los servicios largos.
+
+El modo por defecto es CITAS_HUECOS['MODO'] (settings).
+"""
+from django.conf import settings
+
+from . import horarios
+
+PASO_MINUTOS = 15
+# Duración mínima de una cita sin servicio (ver serializers.validar_franja)
+MINIMO_UTIL_MINUTOS = 30
+MINUTOS_DIA = 24 * 60
+
+PRIMERO = 'primero'
+COMPACTO = 'compacto'
+MODOS = (PRIMERO, COMPACTO)
+
+
+def modo_por_defecto():
+    return settings.CITAS_HUECOS['MODO']
+
+
+def duracion(servicio):
+    """Minutos de agenda que ocupa una cita del servicio."""
+    return servicio.duracion_minutos + servicio.margen_minutos
+
+
+def hora_fin(servicio, hora_inicio):
+    """hora_fin de una cita del servicio que empieza a hora_inicio (None si pasaría de medianoche)."""
+    fin = horarios.minutos(hora_inicio) + duracion(servicio)
+    return horarios.hora(fin) if fin < MINUTOS_DIA else None
+
+
+def libres(intervalos, ocupadas):
+    """Tramos (inicio, fin) de los intervalos que no solapan ninguna franja ocupada."""
+    for inicio, fin in ocupadas:
+        intervalos = horarios.restar(intervalos, inicio, fin)
+    return intervalos
+
+
+def _fragmentacion(tramo, inicio, minutos, minimo):
+    a, b = tramo
+    restos = [resto for resto in (inicio - a, b - inicio - minutos) if resto]
+    return sum(resto for resto in restos if resto < minimo), len(restos), b - a
+
+
+def huecos(intervalos, ocupadas, minutos, modo=PRIMERO, desde=0, paso=PASO_MINUTOS, minimo=MINIMO_UTIL_MINUTOS):
+    """
+    Inicios (en minutos) donde cabe una cita de `minutos` minutos, ordenados según el modo.
+
+    intervalos: horario efectivo del día; ocupadas: franjas (inicio, fin) en
+    minutos de las citas activas; desde: primer minuto admisible (la hora
+    actual si el día es hoy).
+    """
+    candidatos = []
+    for a, b in libres(intervalos, ocupadas):
+        # Lo anterior a `desde` ya pasó: el tramo útil empieza ahí
+        a = max(a, desde)
+        if b - a < minutos:
+            continue
+        inicios = set(range(-(-a // paso) * paso, b - minutos + 1, paso))
+        inicios.add(b - minutos)
+        if a != desde or a % paso == 0:
+            inicios.add(a)
+        candidatos.extend(((a, b), inicio) for inicio in inicios)
+
+    if modo == COMPACTO:
+        candidatos.sort(key=lambda candidato: (_fragmentacion(*candidato, minutos, minimo), candidato[1]))
+    else:
+        candidatos.sort(key=lambda candidato: candidato[1])
+    return [inicio for _, inicio in candidatos]
@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand
+
+from citas import archivo
+from citas.models import Cita, CitaHistorica
+
+
+class Command(BaseCommand):
+    help = (
+        'Mueve a CitaHistorica las citas FINALIZADA/CANCELADA/NO_ASISTIO antiguas. '
+        'Trabaja por lotes transaccionales: puede interrumpirse y relanzarse.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dias', type=int, default=archivo.DIAS_RETENCION,
+                            help='Archivar citas con más de N días de antigüedad')
+        parser.add_argument('--lote', type=int, default=archivo.TAMANO_LOTE, help='Citas por lote')
+        parser.add_argument('--max-lotes', type=int, help='Detenerse tras N lotes (para ventanas de mantenimiento)')
+        parser.add_argument('--simular', action='store_true', help='Solo contar las citas archivables')
+
+    def handle(self, *args, **options):
+        corte = archivo.fecha_corte(options['dias'])
+        if options['simular']:
+            self.stdout.write(
+                f'Citas archivables anteriores a {corte}: {archivo.archivables(corte).count()} '
+                f'(tabla Cita: {Cita.objects.count()}, archivo: {CitaHistorica.objects.count()})'
+            )
+            return
+
+        resultado = archivo.archivar(options['dias'], options['lote'], options['max_lotes'])
+        self.stdout.write(
+            f"Corte: {resultado['corte']}  Archivadas: {resultado['archivadas']}  Lotes: {resultado['lotes']}  "
+            f"{resultado['citas_por_segundo']} citas/s"
+        )
+        estilo = self.style.WARNING if resultado['pendientes'] else self.style.SUCCESS
+        self.stdout.write(estilo(f"Pendientes de archivar: {resultado['pendientes']}"))
@@ -0,0 +1,102 @@
+import random
+import statistics
+
+from django.core.management.base import BaseCommand, CommandError
+
+from citas import huecos
+
+# Además de los modos de huecos.huecos(): el cliente elige cualquier franja libre,
+# como cuando la agenda solo mostraba el horario y las citas ocupadas
+ALEATORIO = 'aleatorio'
+MODOS = (ALEATORIO,) + huecos.MODOS
+
+
+def _intervalos(texto):
+    """'09:00-13:00,15:00-19:00' -> ((540, 780), (900, 1140))."""
+    intervalos = []
+    for tramo in texto.split(','):
+        inicio, fin = (int(h) * 60 + int(m) for h, m in (hora.split(':') for hora in tramo.split('-')))
+        intervalos.append((inicio, fin))
+    return tuple(sorted(intervalos))
+
+
+class Command(BaseCommand):
+    help = (
+        'Simula la agenda de un peluquero durante N días con la misma demanda (servicios de distinta duración '
+        'y margen) y compara la ocupación según cómo se ofrecen los huecos (ver citas/huecos.py). '
+        'No usa la BD.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dias', type=int, default=500)
+        parser.add_argument('--horario', default='09:00-13:00,15:00-19:00',
+                            help='Turnos del día, HH:MM-HH:MM separados por comas')
+        parser.add_argument('--servicios', default='30,45,60,90', help='Duraciones de los servicios en minutos')
+        parser.add_argument('--margen', type=int, default=10, help='Margen de cada servicio en minutos')
+        parser.add_argument('--demanda', type=float, default=1.3,
+                            help='Minutos pedidos al día en proporción a los minutos de horario')
+        parser.add_argument('--opciones', type=int, default=3,
+                            help='Huecos que mira el cliente (los primeros del orden ofrecido); elige uno al azar')
+        parser.add_argument('--modos', default=','.join(MODOS))
+        parser.add_argument('--semilla', type=int, default=1)
+
+    def handle(self, *args, **options):
+        modos = [modo.strip() for modo in options['modos'].split(',') if modo.strip()]
+        desconocidos = set(modos) - set(MODOS)
+        if desconocidos:
+            raise CommandError(f"Modos desconocidos: {', '.join(sorted(desconocidos))}")
+        intervalos = _intervalos(options['horario'])
+        duraciones = [int(d) + options['margen'] for d in options['servicios'].split(',')]
+        laborables = sum(fin - inicio for inicio, fin in intervalos)
+
+        # La misma demanda para todos los modos: (duración) por petición, en orden de llegada
+        demanda = random.Random(options['semilla'])
+        dias = []
+        for _ in range(options['dias']):
+            pedidos, total = [], 0
+            while total < laborables * options['demanda']:
+                pedidos.append(demanda.choice(duraciones))
+                total += pedidos[-1]
+            dias.append(pedidos)
+
+        self.stdout.write(
+            f"Días: {len(dias)}  Horario: {options['horario']} ({laborables} min)  "
+            f"Servicios (con margen): {duraciones}  Demanda: {options['demanda']:.0%}"
+        )
+        self.stdout.write(f"{'modo':>10} {'ocupación':>10} {'rechazadas':>11} {'restos <30':>11} {'citas/día':>10}")
+        resultados = {}
+        for modo in modos:
+            orden = huecos.COMPACTO if modo == huecos.COMPACTO else huecos.PRIMERO
+            eleccion = random.Random(options['semilla'])
+            ocupacion, rechazadas, restos, citas = [], 0, [], 0
+            for pedidos in dias:
+                ocupadas = []
+                for minutos in pedidos:
+                    inicios = huecos.huecos(intervalos, ocupadas, minutos, modo=orden)
+                    if not inicios:
+                        rechazadas += 1
+                        continue
+                    if modo == ALEATORIO:
+                        eleccion.shuffle(inicios)
+                    inicio = eleccion.choice(inicios[:options['opciones']])
+                    ocupadas.append((inicio, inicio + minutos))
+                    citas += 1
+                ocupacion.append(sum(fin - inicio for inicio, fin in ocupadas) / laborables)
+                restos.append(sum(
+                    fin - inicio for inicio, fin in huecos.libres(intervalos, ocupadas)
+                    if fin - inicio < huecos.MINIMO_UTIL_MINUTOS
+                ))
+            resultados[modo] = statistics.mean(ocupacion)
+            pedidas = sum(len(pedidos) for pedidos in dias)
+            self.stdout.write(
+                f"{modo:>10} {statistics.mean(ocupacion):>10.1%} {rechazadas / pedidas:>11.1%} "
+                f"{statistics.mean(restos):>7.1f} min {citas / len(dias):>10.1f}"
+            )
+
+        if huecos.COMPACTO in resultados:
+            compacto = resultados[huecos.COMPACTO]
+            for modo, ocupacion in resultados.items():
+                if modo != huecos.COMPACTO:
+                    self.stdout.write(self.style.SUCCESS(
+                        f"compacto frente a {modo}: ocupación {(compacto - ocupacion) * 100:+.1f} puntos"
+                    ))
@@ -0,0 +1,190 @@
+import copy
+import logging
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.test import Client, override_settings
+from rest_framework_simplejwt.tokens import AccessToken
+
+from citas.models import Cita, Mascota
+from citas.views import CitaViewSet
+from comun import bitacora
+
+from .benchmark_reservas import DUENO_BENCHMARK, PELUQUERO_BASE, franjas, limpiar_horarios, sembrar_horarios
+
+MODOS = ('heredado', 'sincrono', 'cola')
+
+
+def _perform_create_heredado(original):
+    """El perform_create anterior: ~15 print() por reserva, con el __dict__ del usuario."""
+
+    def perform_create(self, serializer):
+        usuario = self.request.user
+        print("=" * 60)
+        print("🔍 DEBUG - perform_create CitaViewSet")
+        print(f"📨 Request user: {usuario}")
+        print(f"🔐 Is authenticated: {usuario.is_authenticated}")
+        print(f"👤 User type: {type(usuario)}")
+        print(f"📋 Has 'rol' attr: {hasattr(usuario, 'rol')}")
+        print(f"🎭 Rol value: '{usuario.rol}'")
+        print(f"📦 User attrs: {usuario.__dict__}")
+        print("=" * 60)
+        print("✅ Validación de rol exitosa - Usuario es CLIENTE")
+        logging.getLogger('citas.serializers').info(
+            f"CitaCreateSerializer.validate() - attrs received: {serializer.validated_data}"
+        )
+        return original(self, serializer)
+
+    return perform_create
+
+
+def _drenar(fifo, retardo):
+    """
+    Lector del otro extremo del pipe de consola (como el recolector de logs de Docker).
+    Con `retardo` (segundos por bloque de 4 KB) simula un consumidor lento: el pipe se
+    llena y las escrituras síncronas se bloquean.
+    """
+    while True:
+        with open(fifo, 'rb', buffering=0) as extremo:
+            while extremo.read(4096):
+                if retardo:
+                    time.sleep(retardo)
+
+
+class Command(BaseCommand):
+    help = (
+        'Mide la latencia de POST /api/citas/ (pila completa de middlewares y vista) con tres '
+        'configuraciones de logging: heredado (print() y log INFO de attrs, handlers síncronos), '
+        'sincrono (JSON estructurado, handlers síncronos) y cola (JSON con ColaHandler). '
+        'La consola y print() escriben en un pipe que se drena en segundo plano (como el stdout '
+        'de un contenedor); los ficheros de log van a un directorio temporal.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--reservas', type=int, default=300, help='Reservas por modo')
+        parser.add_argument('--modos', default=','.join(MODOS), help='Modos separados por comas')
+        parser.add_argument('--peluqueros', type=int, default=10)
+        parser.add_argument('--rondas', type=int, default=5,
+                            help='Los modos se alternan por rondas para repartir el ruido de la máquina')
+        parser.add_argument('--retardo-consola', type=float, default=0.0,
+                            help='ms que tarda el lector de la consola por cada 4 KB (consumidor de logs lento)')
+        parser.add_argument('--calentamiento', type=int, default=10,
+                            help='Reservas iniciales de cada ronda que no se miden')
+
+    def handle(self, *args, **options):
+        modos = [modo.strip() for modo in options['modos'].split(',') if modo.strip()]
+        desconocidos = set(modos) - set(MODOS)
+        if desconocidos:
+            raise CommandError(f"Modos desconocidos: {', '.join(sorted(desconocidos))}")
+
+        token = AccessToken()
+        token['user_id'] = DUENO_BENCHMARK
+        token['rol'] = 'CLIENTE'
+        cliente = Client(HTTP_AUTHORIZATION=f'Bearer {token}')
+        por_ronda = -(-options['reservas'] // options['rondas'])
+        n = por_ronda + options['calentamiento']
+        ranuras = list(franjas(-(-n // (options['peluqueros'] * 24)), options['peluqueros']))[:n]
+
+        self.stdout.write(f"{'modo':>10} {'reservas':>9} {'media ms':>9} {'p50 ms':>8} {'p95 ms':>8} {'reservas/s':>11}")
+        resultados = {modo: [] for modo in modos}
+        sembrar_horarios(options['peluqueros'])
+        with tempfile.TemporaryDirectory() as directorio, override_settings(TRAZAS={'ACTIVO': False}):
+            consola = os.path.join(directorio, 'consola')
+            os.mkfifo(consola)
+            threading.Thread(target=_drenar, args=(consola, options['retardo_consola'] / 1000), daemon=True).start()
+            try:
+                for _ in range(options['rondas']):
+                    for modo in modos:
+                        latencias = self._medir(modo, cliente, ranuras, directorio, consola)
+                        resultados[modo].extend(latencias[options['calentamiento']:])
+            finally:
+                bitacora.configurar(settings.LOGGING)
+                limpiar_horarios()
+
+        for modo, latencias in resultados.items():
+            latencias.sort()
+            self.stdout.write(
+                f"{modo:>10} {len(latencias):>9} {statistics.mean(latencias) * 1000:>9.2f} "
+                f"{statistics.median(latencias) * 1000:>8.2f} "
+                f"{latencias[int(len(latencias) * 0.95) - 1] * 1000:>8.2f} "
+                f"{len(latencias) / sum(latencias):>11.1f}"
+            )
+
+        if 'heredado' in resultados and len(resultados) > 1:
+            base = resultados['heredado']
+            for modo, latencias in resultados.items():
+                if modo != 'heredado':
+                    self.stdout.write(self.style.SUCCESS(
+                        f"{modo} frente a heredado: media {self._reduccion(base, latencias, statistics.mean)}, "
+                        f"p50 {self._reduccion(base, latencias, statistics.median)}, "
+                        f"p95 {self._reduccion(base, latencias, lambda v: v[int(len(v) * 0.95) - 1])}"
+                    ))
+        if bitacora.descartados():
+            self.stdout.write(self.style.WARNING(f"Registros descartados por cola llena: {bitacora.descartados()}"))
+
+    @staticmethod
+    def _reduccion(base, latencias, medida):
+        return f"{(medida(latencias) / medida(base) - 1) * 100:+.1f}%"
+
+    def _medir(self, modo, cliente, ranuras, directorio, consola):
+        config = copy.deepcopy(settings.LOGGING)
+        # Consola al pipe y ficheros al directorio temporal, para no inundar la terminal
+        for nombre, handler in config['handlers'].items():
+            destino = consola if handler['class'] == 'logging.StreamHandler' else os.path.join(directorio, f'{modo}-{nombre}.log')
+            config['handlers'][nombre] = {**handler, 'class': 'logging.FileHandler', 'filename': destino}
+            config['handlers'][nombre].pop('stream', None)
+        if modo == 'heredado':
+            for handler in config['handlers'].values():
+                handler.pop('formatter', None)
+            config['loggers']['citas']['level'] = 'DEBUG'
+        self._configurar_logging(config, cola=(modo == 'cola'))
+
+        Mascota.objects.bulk_create(
+            [Mascota(dueno_id=DUENO_BENCHMARK, nombre=f'Benchmark {i}', raza='-', edad=1) for i in range(len(ranuras))],
+            batch_size=500,
+        )
+        mascotas = list(Mascota.objects.filter(dueno_id=DUENO_BENCHMARK).order_by('id').values_list('id', flat=True))
+
+        original = CitaViewSet.perform_create
+        stdout = sys.stdout
+        latencias = []
+        # print() con buffer por línea, como stdout de un contenedor con PYTHONUNBUFFERED
+        with open(consola, 'w', buffering=1) as salida:
+            if modo == 'heredado':
+                CitaViewSet.perform_create = _perform_create_heredado(original)
+                sys.stdout = salida
+            try:
+                for mascota_id, (peluquero_id, fecha, inicio, fin) in zip(mascotas, ranuras):
+                    t0 = time.perf_counter()
+                    respuesta = cliente.post('/api/citas/', {
+                        'mascota': mascota_id, 'peluquero_id': peluquero_id, 'fecha': fecha.isoformat(),
+                        'hora_inicio': inicio.strftime('%H:%M'), 'hora_fin': fin.strftime('%H:%M'),
+                    }, content_type='application/json')
+                    latencias.append(time.perf_counter() - t0)
+                    if respuesta.status_code != 201:
+                        raise CommandError(f'Reserva rechazada ({respuesta.status_code}): {respuesta.content[:200]}')
+            finally:
+                CitaViewSet.perform_create = original
+                sys.stdout = stdout
+                bitacora.vaciar()
+                Cita.objects.filter(peluquero_id__gte=PELUQUERO_BASE, mascota__dueno_id=DUENO_BENCHMARK).delete()
+                Mascota.objects.filter(dueno_id=DUENO_BENCHMARK).delete()
+        return latencias
+
+    @staticmethod
+    def _configurar_logging(config, cola):
+        anterior = os.environ.get('LOG_COLA')
+        os.environ['LOG_COLA'] = 'true' if cola else 'false'
+        try:
+            bitacora.configurar(config)
+        finally:
+            if anterior is None:
+                os.environ.pop('LOG_COLA')
+            else:
+                os.environ['LOG_COLA'] = anterior
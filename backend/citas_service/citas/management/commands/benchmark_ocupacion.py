@@ -0,0 +1,101 @@
+import time
+from datetime import date, timedelta
+
+import numpy as np
+from django.core.management.base import BaseCommand
+
+from citas import analitica
+
+
+def ocupacion_naive(datos_citas, datos_horarios, desde, hasta):
+    """Referencia: recorre cada cita y cada slot con bucles de Python."""
+    ocupacion = {}
+    for peluquero, dia, inicio, fin in zip(
+        datos_citas['peluquero'].tolist(), datos_citas['dia'].tolist(),
+        datos_citas['inicio'].tolist(), datos_citas['fin'].tolist(),
+    ):
+        dia_semana = date.fromordinal(dia).weekday()
+        slot = inicio // analitica.MINUTOS_SLOT
+        while slot * analitica.MINUTOS_SLOT < fin and slot < analitica.SLOTS_DIA:
+            clave = (peluquero, dia_semana, slot)
+            ocupacion[clave] = ocupacion.get(clave, 0) + 1
+            slot += 1
+
+    laborable = set()
+    for peluquero, dia_semana, inicio, fin in zip(
+        datos_horarios['peluquero'].tolist(), datos_horarios['dia_semana'].tolist(),
+        datos_horarios['inicio'].tolist(), datos_horarios['fin'].tolist(),
+    ):
+        slot = inicio // analitica.MINUTOS_SLOT
+        while slot * analitica.MINUTOS_SLOT < fin and slot < analitica.SLOTS_DIA:
+            laborable.add((peluquero, dia_semana, slot))
+            slot += 1
+
+    ocurrencias = [0] * analitica.DIAS_SEMANA
+    dia = desde
+    while dia <= hasta:
+        ocurrencias[dia.weekday()] += 1
+        dia += timedelta(days=1)
+
+    ocupado = capacidad = 0
+    for clave in laborable:
+        cap = ocurrencias[clave[1]]
+        capacidad += cap
+        ocupado += min(ocupacion.get(clave, 0), cap)
+    return ocupado, capacidad
+
+
+class Command(BaseCommand):
+    help = 'Compara el cálculo vectorizado de ocupación (NumPy) contra un bucle de Python por fila'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--citas', type=int, default=200_000, help='Número de citas sintéticas')
+        parser.add_argument('--peluqueros', type=int, default=50, help='Número de peluqueros')
+        parser.add_argument('--semilla', type=int, default=42)
+
+    def handle(self, *args, **options):
+        rng = np.random.default_rng(options['semilla'])
+        n_citas = options['citas']
+        n_peluqueros = options['peluqueros']
+        hasta = date.today()
+        desde = hasta - timedelta(days=364)
+
+        # Citas de 30 a 120 minutos entre las 08:00 y las 19:00
+        inicio = rng.integers(8 * 4, 19 * 4, n_citas) * analitica.MINUTOS_SLOT
+        datos_citas = {
+            'peluquero': rng.integers(1, n_peluqueros + 1, n_citas),
+            'dia': desde.toordinal() + rng.integers(0, 365, n_citas),
+            'inicio': inicio,
+            'fin': inicio + rng.integers(2, 9, n_citas) * analitica.MINUTOS_SLOT,
+        }
+        # Dos turnos de lunes a sábado por peluquero
+        peluqueros = np.repeat(np.arange(1, n_peluqueros + 1), 12)
+        datos_horarios = {
+            'peluquero': peluqueros,
+            'dia_semana': np.tile(np.repeat(np.arange(6), 2), n_peluqueros),
+            'inicio': np.tile([9 * 60, 15 * 60], 6 * n_peluqueros),
+            'fin': np.tile([13 * 60, 19 * 60], 6 * n_peluqueros),
+        }
+
+        t0 = time.perf_counter()
+        _, ocupacion, capacidad = analitica.calcular_matrices(datos_citas, datos_horarios, desde, hasta)
+        resumen = analitica.resumir(np.unique(peluqueros), ocupacion, capacidad)
+        t_vectorizado = time.perf_counter() - t0
+
+        t0 = time.perf_counter()
+        ocupado_ref, capacidad_ref = ocupacion_naive(datos_citas, datos_horarios, desde, hasta)
+        t_naive = time.perf_counter() - t0
+
+        ocupado = int(np.minimum(ocupacion, capacidad).sum())
+        coincide = ocupado == ocupado_ref and int(capacidad.sum()) == capacidad_ref
+
+        self.stdout.write(f'Citas: {n_citas}  Peluqueros: {n_peluqueros}  Rango: {desde} a {hasta}')
+        self.stdout.write(f'NumPy (matrices + resumen de {len(resumen)} peluqueros): {t_vectorizado * 1000:.1f} ms')
+        self.stdout.write(f'Bucle Python por fila:                  {t_naive * 1000:.1f} ms')
+        self.stdout.write(f'Aceleración: x{t_naive / t_vectorizado:.1f}')
+        if coincide:
+            self.stdout.write(self.style.SUCCESS('Resultados idénticos en slots ocupados y capacidad'))
+        else:
+            self.stdout.write(self.style.ERROR(
+                f'Diferencia: ocupado {ocupado} vs {ocupado_ref}, capacidad {int(capacidad.sum())} vs {capacidad_ref}'
+            ))
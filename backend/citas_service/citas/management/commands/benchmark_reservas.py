@@ -0,0 +1,159 @@
+import statistics
+import threading
+import time
+from datetime import date, time as dt_time, timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import OperationalError, connection, transaction
+from rest_framework.exceptions import ValidationError
+
+from citas import horarios
+from citas.models import Cita, Horario, HorarioCompilado, Mascota
+from citas.serializers import CitaCreateSerializer
+
+# Ids fuera del rango real para poder limpiar lo creado por el benchmark
+PELUQUERO_BASE = 900_000
+DUENO_BENCHMARK = 900_000
+
+
+def franjas(dias, peluqueros):
+    """Todas las franjas de 30 minutos entre 08:00 y 20:00 de los próximos `dias` días."""
+    inicio = date.today() + timedelta(days=1)
+    for d in range(dias):
+        fecha = inicio + timedelta(days=d)
+        for p in range(peluqueros):
+            for minuto in range(8 * 60, 20 * 60, 30):
+                yield (
+                    PELUQUERO_BASE + p,
+                    fecha,
+                    dt_time(minuto // 60, minuto % 60),
+                    dt_time((minuto + 30) // 60, (minuto + 30) % 60),
+                )
+
+
+def sembrar_horarios(peluqueros):
+    """Horario de 08:00 a 20:00 todos los días para los peluqueros del benchmark: cubre todas las franjas()."""
+    limpiar_horarios()
+    Horario.objects.bulk_create(
+        Horario(peluquero_id=PELUQUERO_BASE + p, dia_semana=dia, hora_inicio=dt_time(8, 0), hora_fin=dt_time(20, 0))
+        for p in range(peluqueros)
+        for dia in range(horarios.DIAS_SEMANA)
+    )
+    horarios.recompilar(*(PELUQUERO_BASE + p for p in range(peluqueros)))
+
+
+def limpiar_horarios():
+    Horario.objects.filter(peluquero_id__gte=PELUQUERO_BASE).delete()
+    HorarioCompilado.objects.filter(peluquero_id__gte=PELUQUERO_BASE).delete()
+    horarios.invalidar()
+
+
+class Command(BaseCommand):
+    help = (
+        'Mide el rendimiento de reservas concurrentes (validación + INSERT) contra la BD '
+        'configurada en DATABASE_URL. Ejecutar una vez con SQLite y otra con PostgreSQL para comparar.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hilos', type=int, default=8, help='Clientes concurrentes')
+        parser.add_argument('--reservas', type=int, default=2000, help='Reservas totales a intentar')
+        parser.add_argument('--peluqueros', type=int, default=10)
+        parser.add_argument(
+            '--colision', type=float, default=0.1,
+            help='Fracción de reservas que repiten una franja ya pedida (genera conflictos)',
+        )
+        parser.add_argument('--conservar', action='store_true', help='No borrar los datos creados')
+
+    def handle(self, *args, **options):
+        hilos = options['hilos']
+        total = options['reservas']
+        n_peluqueros = options['peluqueros']
+
+        unicas = int(total * (1 - options['colision']))
+        por_dia = n_peluqueros * 24
+        disponibles = list(franjas(-(-unicas // por_dia), n_peluqueros))[:unicas]
+        # Las repetidas se intercalan para que compitan con la original
+        pedidos = list(range(len(disponibles)))
+        for i in range(total - unicas):
+            pedidos.insert((i * 7) % len(pedidos), i % len(disponibles))
+
+        sembrar_horarios(n_peluqueros)
+        # Una mascota por franja: la regla de una cita por mascota y peluquero al día
+        # no debe convertir en conflicto lo que solo es otra franja
+        Mascota.objects.bulk_create(
+            [Mascota(dueno_id=DUENO_BENCHMARK, nombre=f'Benchmark {i}', raza='-', edad=1) for i in range(len(disponibles))],
+            batch_size=500,
+        )
+        mascotas = list(Mascota.objects.filter(dueno_id=DUENO_BENCHMARK).order_by('id').values_list('id', flat=True))
+        siguiente = iter(range(len(pedidos)))
+        lock = threading.Lock()
+        resultados = {'creadas': 0, 'conflictos': 0, 'errores': 0}
+        latencias = []
+
+        def cliente():
+            propias = []
+            try:
+                while True:
+                    with lock:
+                        indice = next(siguiente, None)
+                    if indice is None:
+                        break
+                    franja = pedidos[indice]
+                    peluquero_id, fecha, hora_inicio, hora_fin = disponibles[franja]
+                    t0 = time.perf_counter()
+                    clave = 'creadas'
+                    try:
+                        with transaction.atomic():
+                            serializer = CitaCreateSerializer(data={
+                                'mascota': mascotas[franja], 'peluquero_id': peluquero_id, 'fecha': fecha,
+                                'hora_inicio': hora_inicio, 'hora_fin': hora_fin,
+                            })
+                            if serializer.is_valid():
+                                serializer.save()
+                            else:
+                                clave = 'conflictos'
+                    except ValidationError:
+                        # Conflicto detectado en create(), con la agenda bloqueada
+                        clave = 'conflictos'
+                    except OperationalError:
+                        # SQLite: "database is locked" al agotar el busy timeout
+                        clave = 'errores'
+                    propias.append(time.perf_counter() - t0)
+                    with lock:
+                        resultados[clave] += 1
+            finally:
+                with lock:
+                    latencias.extend(propias)
+                connection.close()
+
+        trabajadores = [threading.Thread(target=cliente) for _ in range(hilos)]
+        inicio = time.perf_counter()
+        for trabajador in trabajadores:
+            trabajador.start()
+        for trabajador in trabajadores:
+            trabajador.join()
+        duracion = time.perf_counter() - inicio
+
+        citas = Cita.objects.filter(peluquero_id__gte=PELUQUERO_BASE, mascota__dueno_id=DUENO_BENCHMARK)
+        # Reservas dobles que la validación (leer y luego insertar) no detectó
+        dobles = citas.count() - len(set(citas.values_list('peluquero_id', 'fecha', 'hora_inicio')))
+
+        latencias.sort()
+        p95 = latencias[int(len(latencias) * 0.95) - 1] if latencias else 0.0
+        self.stdout.write(f"Motor: {connection.vendor}  Hilos: {hilos}  Reservas intentadas: {len(pedidos)}")
+        self.stdout.write(
+            f"Creadas: {resultados['creadas']}  Conflictos: {resultados['conflictos']}  "
+            f"Errores de bloqueo: {resultados['errores']}  Reservas dobles: {dobles}"
+        )
+        self.stdout.write(f"Duración: {duracion:.2f} s  Rendimiento: {len(pedidos) / duracion:.1f} reservas/s")
+        if latencias:
+            self.stdout.write(
+                f"Latencia: mediana {statistics.median(latencias) * 1000:.1f} ms  p95 {p95 * 1000:.1f} ms"
+            )
+
+        if not options['conservar']:
+            citas.delete()
+            Mascota.objects.filter(dueno_id=DUENO_BENCHMARK).delete()
+            limpiar_horarios()
+        estilo = self.style.SUCCESS if not resultados['errores'] and not dobles else self.style.WARNING
+        self.stdout.write(estilo('Benchmark terminado'))
@@ -0,0 +1,89 @@
+import statistics
+import time
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from citas import horarios
+from citas.models import HorarioExcepcion, Mascota
+from citas.serializers import CitaCreateSerializer
+
+from .benchmark_reservas import DUENO_BENCHMARK, PELUQUERO_BASE, franjas, limpiar_horarios, sembrar_horarios
+
+MODOS = ('sin_cache', 'en_memoria')
+
+
+class Command(BaseCommand):
+    help = (
+        'Mide la latencia de CitaCreateSerializer.is_valid(), que comprueba el horario efectivo del peluquero: '
+        'sin_cache lee semana y excepciones de la BD en cada validación; en_memoria usa la copia local del '
+        'proceso (ver citas/horarios.py).'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--validaciones', type=int, default=2000, help='Validaciones por modo')
+        parser.add_argument('--peluqueros', type=int, default=10)
+        parser.add_argument('--dias', type=int, default=14, help='Días distintos entre los que se reparten las franjas')
+        parser.add_argument('--excepciones', type=int, default=50,
+                            help='Cierres vigentes de los peluqueros del benchmark, después de los días medidos')
+
+    def handle(self, *args, **options):
+        n_peluqueros = options['peluqueros']
+        ranuras = list(franjas(options['dias'], n_peluqueros))
+        sembrar_horarios(n_peluqueros)
+        # Cierres que no afectan a las franjas medidas pero sí a lo que hay que leer y filtrar
+        posterior = date.today() + timedelta(days=options['dias'] + 1)
+        HorarioExcepcion.objects.bulk_create(
+            HorarioExcepcion(peluquero_id=PELUQUERO_BASE + i % n_peluqueros, desde=posterior + timedelta(days=i),
+                             hasta=posterior + timedelta(days=i), motivo='Benchmark')
+            for i in range(options['excepciones'])
+        )
+        mascota = Mascota.objects.create(dueno_id=DUENO_BENCHMARK, nombre='Benchmark', raza='-', edad=1)
+        peluqueros = [PELUQUERO_BASE + p for p in range(n_peluqueros)]
+
+        self.stdout.write(f"{'modo':>10} {'validaciones':>12} {'consultas':>9} {'media ms':>9} {'p50 ms':>8} {'p95 ms':>8}")
+        resultados = {}
+        try:
+            for modo in MODOS:
+                horarios.invalidar(*peluqueros)
+                latencias, consultas = self._medir(modo, mascota, ranuras, options['validaciones'], peluqueros)
+                resultados[modo] = latencias
+                latencias.sort()
+                self.stdout.write(
+                    f"{modo:>10} {len(latencias):>12} {consultas / len(latencias):>9.2f} "
+                    f"{statistics.mean(latencias) * 1000:>9.3f} {statistics.median(latencias) * 1000:>8.3f} "
+                    f"{latencias[int(len(latencias) * 0.95) - 1] * 1000:>8.3f}"
+                )
+        finally:
+            mascota.delete()
+            HorarioExcepcion.objects.filter(peluquero_id__gte=PELUQUERO_BASE).delete()
+            limpiar_horarios()
+
+        base, memoria = statistics.median(resultados['sin_cache']), statistics.median(resultados['en_memoria'])
+        self.stdout.write(self.style.SUCCESS(
+            f"en_memoria frente a sin_cache: p50 {(1 - memoria / base) * 100:.0f}% menos"
+        ))
+
+    @staticmethod
+    def _medir(modo, mascota, ranuras, validaciones, peluqueros):
+        """Latencias de cada validación y consultas totales (la mascota se lee siempre: una por validación)."""
+        latencias = []
+        consultas = 0
+        for i in range(validaciones):
+            peluquero_id, fecha, hora_inicio, hora_fin = ranuras[i % len(ranuras)]
+            if modo == 'sin_cache':
+                horarios.invalidar(*peluqueros)
+            serializer = CitaCreateSerializer(data={
+                'mascota': mascota.id, 'peluquero_id': peluquero_id, 'fecha': fecha,
+                'hora_inicio': hora_inicio, 'hora_fin': hora_fin,
+            })
+            with CaptureQueriesContext(connection) as capturadas:
+                t0 = time.perf_counter()
+                valida = serializer.is_valid()
+                latencias.append(time.perf_counter() - t0)
+            consultas += len(capturadas)
+            if not valida:
+                raise CommandError(f'Franja rechazada: {serializer.errors}')
+        return latencias, consultas
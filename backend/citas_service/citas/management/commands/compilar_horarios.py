@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from citas import horarios
+
+
+class Command(BaseCommand):
+    help = 'Recalcula las semanas compiladas (HorarioCompilado) desde los Horario activos (backfill)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('peluqueros', nargs='*', type=int, help='IDs de peluquero (por defecto, todos)')
+
+    def handle(self, *args, **options):
+        total = horarios.recompilar(*options['peluqueros'])
+        self.stdout.write(self.style.SUCCESS(f'Semanas compiladas: {total}'))
@@ -0,0 +1,50 @@
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from citas import outbox
+from citas.models import EventoOutbox
+
+
+class Command(BaseCommand):
+    help = 'Despacha los eventos pendientes del outbox de citas a los manejadores configurados'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lote', type=int, help='Eventos por lote (por defecto CITAS_OUTBOX["TAMANO_LOTE"])')
+        parser.add_argument('--max-intentos', type=int, help='Intentos antes de dejar un evento como agotado')
+        parser.add_argument('--continuo', action='store_true', help='No terminar: sondear el outbox cada --intervalo segundos')
+        parser.add_argument('--intervalo', type=float, default=1.0, help='Segundos entre pasadas en modo continuo')
+        parser.add_argument('--metricas', action='store_true', help='Solo mostrar métricas del outbox')
+        parser.add_argument('--purgar-dias', type=int, help='Eliminar eventos despachados hace más de N días')
+
+    def handle(self, *args, **options):
+        if options['metricas']:
+            self._mostrar_metricas(options['max_intentos'])
+            return
+
+        if options['purgar_dias'] is not None:
+            limite = timezone.now() - timedelta(days=options['purgar_dias'])
+            eliminados, _ = EventoOutbox.objects.filter(despachado_en__lt=limite).delete()
+            self.stdout.write(f'Eventos despachados eliminados: {eliminados}')
+
+        while True:
+            resultado = outbox.despachar(tamano=options['lote'], max_intentos=options['max_intentos'])
+            if resultado['despachados'] or resultado['fallidos'] or not options['continuo']:
+                self.stdout.write(
+                    f"Despachados: {resultado['despachados']}  Fallidos: {resultado['fallidos']}  "
+                    f"Lotes: {resultado['lotes']}  {resultado['eventos_por_segundo']} eventos/s"
+                )
+                self._mostrar_metricas(options['max_intentos'])
+            if not options['continuo']:
+                break
+            time.sleep(options['intervalo'])
+
+    def _mostrar_metricas(self, max_intentos):
+        datos = outbox.metricas(max_intentos)
+        estilo = self.style.WARNING if datos['agotados'] else self.style.SUCCESS
+        self.stdout.write(estilo(
+            f"Pendientes: {datos['pendientes']}  Agotados: {datos['agotados']}  "
+            f"Retraso: {datos['retraso_segundos']}s  Despachados último minuto: {datos['despachados_ultimo_minuto']}"
+        ))
@@ -0,0 +1,48 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from citas import recordatorios
+
+
+class Command(BaseCommand):
+    help = 'Envía los recordatorios de citas vencidos usando el backend configurado'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lote', type=int, help='Recordatorios por lote (por defecto CITAS_RECORDATORIOS["TAMANO_LOTE"])')
+        parser.add_argument('--continuo', action='store_true', help='No terminar: revisar la cola cada --intervalo segundos')
+        parser.add_argument('--intervalo', type=float, default=30.0, help='Segundos entre pasadas en modo continuo')
+        parser.add_argument('--metricas', action='store_true', help='Solo mostrar métricas de la cola')
+        parser.add_argument('--reconstruir', action='store_true', help='Programar recordatorios de citas futuras que no tengan (backfill)')
+
+    def handle(self, *args, **options):
+        if options['metricas']:
+            self._mostrar_metricas()
+            return
+
+        if options['reconstruir']:
+            creados = recordatorios.reconstruir()
+            self.stdout.write(f'Recordatorios programados: {creados}')
+
+        entrega = recordatorios.backend()
+        while True:
+            resultado = recordatorios.procesar(tamano=options['lote'], entrega=entrega)
+            if resultado['reclamados'] or not options['continuo']:
+                self.stdout.write(
+                    f"Enviados: {resultado['enviados']}  Omitidos: {resultado['omitidos']}  "
+                    f"Fallidos: {resultado['fallidos']}  Lotes: {resultado['lotes']}  "
+                    f"{resultado['enviados_por_segundo']} enviados/s"
+                )
+                self._mostrar_metricas()
+            if not options['continuo']:
+                break
+            time.sleep(options['intervalo'])
+
+    def _mostrar_metricas(self):
+        datos = recordatorios.metricas()
+        estilo = self.style.WARNING if datos['fallidos'] or datos['vencidos'] else self.style.SUCCESS
+        self.stdout.write(estilo(
+            f"Vencidos pendientes: {datos['vencidos']}  Retraso: {datos['retraso_segundos']}s  "
+            f"Próximas 24h: {datos['proximas_24h']}  Enviados última hora: {datos['enviados_ultima_hora']}  "
+            f"Fallidos: {datos['fallidos']}"
+        ))
@@ -0,0 +1,63 @@
+import json
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+
+from citas import analitica
+
+
+class Command(BaseCommand):
+    help = 'Muestra el mapa de ocupación hora x día de la semana de cada peluquero'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--desde', help='Fecha inicial YYYY-MM-DD (por defecto hace 365 días)')
+        parser.add_argument('--hasta', help='Fecha final YYYY-MM-DD (por defecto hoy)')
+        parser.add_argument('--peluquero', type=int, help='ID del peluquero (opcional)')
+        parser.add_argument('--json', action='store_true', help='Emitir el resultado completo en JSON')
+
+    def handle(self, *args, **options):
+        try:
+            desde = self._fecha(options['desde'])
+            hasta = self._fecha(options['hasta'])
+        except ValueError:
+            raise CommandError('Formato de fecha inválido (usar YYYY-MM-DD)')
+
+        resultado = analitica.mapa_ocupacion(desde=desde, hasta=hasta, peluquero_id=options['peluquero'])
+
+        if options['json']:
+            self.stdout.write(json.dumps(resultado, default=str, ensure_ascii=False, indent=2))
+            return
+
+        self.stdout.write(f"Ocupación del {resultado['desde']} al {resultado['hasta']}")
+        for peluquero in resultado['peluqueros']:
+            self.stdout.write('')
+            self.stdout.write(self.style.SUCCESS(
+                f"Peluquero {peluquero['peluquero_id']}: "
+                f"{peluquero['horas_ocupadas']}h ocupadas de {peluquero['horas_capacidad']}h "
+                f"(utilización {self._porcentaje(peluquero['utilizacion'])}, "
+                f"ociosas {peluquero['horas_ociosas']}h)"
+            ))
+            horas = [
+                hora for hora in range(24)
+                if any(fila[hora] is not None for fila in peluquero['mapa'])
+            ]
+            if not horas:
+                self.stdout.write('  Sin horario laboral configurado')
+                continue
+            self.stdout.write('      ' + ''.join(f'{hora:>5}' for hora in horas))
+            for dia, fila in enumerate(peluquero['mapa']):
+                celdas = ''.join(f'{self._porcentaje(fila[hora], ancho=5)}' for hora in horas)
+                self.stdout.write(f'  {analitica.NOMBRES_DIAS[dia][:3]} {celdas}')
+            for pico in peluquero['picos']:
+                self.stdout.write(
+                    f"  Pico: {pico['dia']} {pico['hora']:02d}:00 -> {self._porcentaje(pico['utilizacion'])}"
+                )
+
+    @staticmethod
+    def _fecha(valor):
+        return datetime.strptime(valor, '%Y-%m-%d').date() if valor else None
+
+    @staticmethod
+    def _porcentaje(valor, ancho=0):
+        texto = '-' if valor is None else f'{valor * 100:.0f}%'
+        return f'{texto:>{ancho}}' if ancho else texto
@@ -0,0 +1,172 @@
+import asyncio
+import time
+from urllib.parse import urlsplit
+
+from django.core.management.base import BaseCommand, CommandError
+
+
+def percentil(valores, p):
+    if not valores:
+        return 0.0
+    return valores[min(len(valores) - 1, int(len(valores) * p / 100))]
+
+
+async def _leer_respuesta(lector):
+    """Lee una respuesta HTTP/1.1 (Content-Length o chunked). Retorna (status, cuerpo, cabeceras)."""
+    linea_estado = await lector.readline()
+    if not linea_estado:
+        raise ConnectionError('conexión cerrada por el servidor')
+    estado = int(linea_estado.split()[1])
+    cabeceras = {}
+    while True:
+        linea = await lector.readline()
+        if linea in (b'\r\n', b'\n', b''):
+            break
+        nombre, _, valor = linea.decode('latin-1').partition(':')
+        cabeceras[nombre.strip().lower()] = valor.strip()
+
+    if cabeceras.get('transfer-encoding', '').lower() == 'chunked':
+        partes = []
+        while True:
+            tamano = int((await lector.readline()).split(b';')[0], 16)
+            if tamano == 0:
+                await lector.readline()
+                break
+            partes.append((await lector.readexactly(tamano + 2))[:-2])
+        return estado, b''.join(partes), cabeceras
+    longitud = int(cabeceras.get('content-length', 0))
+    cuerpo = await lector.readexactly(longitud) if longitud else b''
+    return estado, cuerpo, cabeceras
+
+
+class Command(BaseCommand):
+    help = (
+        'Prueba de carga HTTP contra un servidor en marcha: abre N conexiones keep-alive concurrentes '
+        'y mide rendimiento, latencias y errores. Sirve para comparar el despliegue ASGI '
+        '(gunicorn + uvicorn) con el WSGI (gthread) usando las mismas rutas. Con --streams mantiene '
+        'además N streams SSE abiertos durante cada etapa, como harían las agendas de los peluqueros.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', default='http://127.0.0.1:8002', help='Base del servicio')
+        parser.add_argument('--ruta', action='append',
+                            help='Ruta a pedir (repetible); se reparten entre las conexiones. '
+                                 'Por defecto /api/servicios/')
+        parser.add_argument('--token', help='JWT para la cabecera Authorization')
+        parser.add_argument('--conexiones', default='10,50,200',
+                            help='Conexiones concurrentes por etapa, separadas por comas')
+        parser.add_argument('--duracion', type=float, default=10.0, help='Segundos por etapa')
+        parser.add_argument('--timeout', type=float, default=10.0, help='Timeout por petición en segundos')
+        parser.add_argument('--streams', type=int, default=0,
+                            help='Streams SSE abiertos en paralelo durante cada etapa (requiere --token de peluquero)')
+        parser.add_argument('--ruta-stream', default='/api/citas/eventos/', help='Ruta del stream SSE')
+
+    def handle(self, *args, **options):
+        destino = urlsplit(options['url'])
+        if destino.scheme != 'http' or not destino.hostname:
+            raise CommandError('--url debe ser http://host[:puerto]')
+        try:
+            etapas = [int(valor) for valor in options['conexiones'].split(',') if valor.strip()]
+        except ValueError:
+            raise CommandError('--conexiones debe ser una lista de enteros')
+
+        rutas = options['ruta'] or ['/api/servicios/']
+        self.stdout.write(f"Destino: {options['url']}  Rutas: {', '.join(rutas)}  {options['duracion']}s por etapa")
+        if options['streams']:
+            self.stdout.write(f"Streams SSE abiertos por etapa: {options['streams']} en {options['ruta_stream']}")
+        self.stdout.write(f"{'conexiones':>10} {'peticiones':>10} {'req/s':>9} {'p50 ms':>8} {'p95 ms':>8} "
+                          f"{'p99 ms':>8} {'errores':>8} {'activas':>8} {'streams':>8}")
+        for conexiones in etapas:
+            resultado = asyncio.run(self._etapa(destino, rutas, options['token'], conexiones,
+                                                options['duracion'], options['timeout'],
+                                                options['streams'], options['ruta_stream']))
+            latencias = sorted(resultado['latencias'])
+            estilo = self.style.WARNING if resultado['errores'] else self.style.SUCCESS
+            self.stdout.write(estilo(
+                f"{conexiones:>10} {len(latencias):>10} {len(latencias) / options['duracion']:>9.1f} "
+                f"{percentil(latencias, 50) * 1000:>8.1f} {percentil(latencias, 95) * 1000:>8.1f} "
+                f"{percentil(latencias, 99) * 1000:>8.1f} {resultado['errores']:>8} {resultado['max_activas']:>8} "
+                f"{resultado['streams']:>8}"
+            ))
+            if resultado['muestra_error']:
+                self.stdout.write(f"  primer error: {resultado['muestra_error']}")
+
+    async def _etapa(self, destino, rutas, token, conexiones, duracion, timeout, streams=0, ruta_stream=None):
+        resultado = {
+            'latencias': [], 'errores': 0, 'activas': 0, 'max_activas': 0, 'muestra_error': None, 'streams': 0,
+        }
+        fin = time.perf_counter() + duracion
+        host, puerto = destino.hostname, destino.port or 80
+        cabeceras = f"Host: {destino.netloc}\r\nAccept: application/json\r\nConnection: keep-alive\r\n"
+        if token:
+            cabeceras += f"Authorization: Bearer {token}\r\n"
+
+        def error(exc):
+            resultado['errores'] += 1
+            if resultado['muestra_error'] is None:
+                resultado['muestra_error'] = repr(exc)
+
+        async def cliente(indice):
+            lector = escritor = None
+            peticion = indice
+            try:
+                while time.perf_counter() < fin:
+                    try:
+                        if escritor is None:
+                            lector, escritor = await asyncio.wait_for(asyncio.open_connection(host, puerto), timeout)
+                            resultado['activas'] += 1
+                            resultado['max_activas'] = max(resultado['max_activas'], resultado['activas'])
+                        ruta = rutas[peticion % len(rutas)]
+                        peticion += 1
+                        inicio = time.perf_counter()
+                        escritor.write(f"GET {ruta} HTTP/1.1\r\n{cabeceras}\r\n".encode())
+                        await escritor.drain()
+                        estado, _, recibidas = await asyncio.wait_for(_leer_respuesta(lector), timeout)
+                        if estado >= 400:
+                            error(f'HTTP {estado} en {ruta}')
+                        else:
+                            resultado['latencias'].append(time.perf_counter() - inicio)
+                        if recibidas.get('connection', '').lower() == 'close':
+                            escritor.close()
+                            escritor = None
+                            resultado['activas'] -= 1
+                    except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError, ConnectionError, ValueError) as exc:
+                        error(exc)
+                        if escritor is not None:
+                            escritor.close()
+                            escritor = None
+                            resultado['activas'] -= 1
+                        await asyncio.sleep(0.05)
+            finally:
+                if escritor is not None:
+                    escritor.close()
+                    resultado['activas'] -= 1
+
+        async def stream():
+            """Abre un stream SSE y lo mantiene hasta el final de la etapa; cuenta los que reciben datos."""
+            escritor = None
+            try:
+                lector, escritor = await asyncio.wait_for(asyncio.open_connection(host, puerto), timeout)
+                escritor.write(f"GET {ruta_stream} HTTP/1.1\r\n{cabeceras}Accept: text/event-stream\r\n\r\n".encode())
+                await escritor.drain()
+                linea_estado = await asyncio.wait_for(lector.readline(), timeout)
+                if b' 200 ' not in linea_estado:
+                    raise ConnectionError(linea_estado.decode('latin-1').strip() or 'sin respuesta')
+                resultado['streams'] += 1
+                restante = fin - time.perf_counter()
+                if restante > 0:
+                    # Consumir keep-alives hasta el final de la etapa
+                    await asyncio.wait_for(lector.read(-1), restante)
+            except asyncio.TimeoutError:
+                pass
+            except (OSError, ConnectionError) as exc:
+                error(exc)
+            finally:
+                if escritor is not None:
+                    escritor.close()
+
+        await asyncio.gather(
+            *(cliente(i) for i in range(conexiones)),
+            *(stream() for _ in range(streams)),
+        )
+        return resultado
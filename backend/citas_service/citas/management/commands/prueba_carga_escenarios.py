@@ -0,0 +1,246 @@
+import asyncio
+import json
+import random
+import time
+from datetime import date, datetime, timedelta
+from urllib.parse import urlsplit
+
+from django.core.management.base import BaseCommand, CommandError
+
+from .prueba_carga import _leer_respuesta, percentil
+from .sembrar_datos import ID_BASE
+
+# Operaciones en el orden en que se listan en el informe
+OPERACIONES = ('login', 'mascotas', 'disponibilidad', 'reserva', 'mis_citas', 'agenda', 'confirmar', 'cancelar')
+
+
+class _Conexion:
+    """Conexión HTTP/1.1 keep-alive con un servicio; se reabre si el servidor la cierra."""
+
+    def __init__(self, url, timeout):
+        self.destino = urlsplit(url)
+        self.timeout = timeout
+        self.lector = self.escritor = None
+
+    async def pedir(self, metodo, ruta, token=None, datos=None):
+        """Retorna (status, JSON del cuerpo o None)."""
+        if self.escritor is None:
+            self.lector, self.escritor = await asyncio.wait_for(
+                asyncio.open_connection(self.destino.hostname, self.destino.port or 80), self.timeout
+            )
+        cuerpo = json.dumps(datos).encode() if datos is not None else b''
+        cabeceras = (f"{metodo} {ruta} HTTP/1.1\r\nHost: {self.destino.netloc}\r\n"
+                     f"Accept: application/json\r\nConnection: keep-alive\r\n")
+        if token:
+            cabeceras += f"Authorization: Bearer {token}\r\n"
+        if datos is not None:
+            cabeceras += f"Content-Type: application/json\r\nContent-Length: {len(cuerpo)}\r\n"
+        try:
+            self.escritor.write(cabeceras.encode() + b'\r\n' + cuerpo)
+            await self.escritor.drain()
+            estado, respuesta, recibidas = await asyncio.wait_for(_leer_respuesta(self.lector), self.timeout)
+        except BaseException:
+            self.cerrar()
+            raise
+        if recibidas.get('connection', '').lower() == 'close':
+            self.cerrar()
+        if respuesta and recibidas.get('content-type', '').startswith('application/json'):
+            return estado, json.loads(respuesta)
+        return estado, None
+
+    def cerrar(self):
+        if self.escritor is not None:
+            self.escritor.close()
+            self.escritor = None
+
+
+def _hueco_libre(disponibilidad, minutos):
+    """Primer hueco de `minutos` dentro del horario laboral sin citas ocupadas ("HH:MM", "HH:MM") o None."""
+    def en_minutos(hora):
+        horas, mins = hora.split(':')[:2]
+        return int(horas) * 60 + int(mins)
+
+    ocupadas = [(en_minutos(c['hora_inicio']), en_minutos(c['hora_fin'])) for c in disponibilidad['citas_ocupadas']]
+    for horario in disponibilidad['horarios_laborales']:
+        inicio, fin = en_minutos(horario['hora_inicio']), en_minutos(horario['hora_fin'])
+        while inicio + minutos <= fin:
+            solape = next((o for o in ocupadas if inicio < o[1] and o[0] < inicio + minutos), None)
+            if solape is None:
+                fin_cita = inicio + minutos
+                return f'{inicio // 60:02d}:{inicio % 60:02d}', f'{fin_cita // 60:02d}:{fin_cita % 60:02d}'
+            inicio = solape[1]
+    return None
+
+
+class Command(BaseCommand):
+    help = (
+        'Prueba de carga por escenarios contra la pila en marcha (usuario_service + citas_service, o Kong). '
+        'Clientes virtuales: login, mascotas, disponibilidad, reserva y mis_citas; peluqueros virtuales: '
+        'login, agenda del día y confirmación/cancelación de citas pendientes. Cada usuario virtual rehace '
+        'el login cada --acciones-por-sesion iteraciones con otro usuario. Usa los usuarios de '
+        '`sembrar_datos` (mismos --id-base, --peluqueros, --clientes, --prefijo y --clave). '
+        'Informa peticiones/s y percentiles de latencia por operación.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url-usuarios', default='http://127.0.0.1:8001', help='Base de usuario_service (o Kong)')
+        parser.add_argument('--url-citas', default='http://127.0.0.1:8002', help='Base de citas_service (o Kong)')
+        parser.add_argument('--usuarios-virtuales', type=int, default=50, help='Usuarios concurrentes')
+        parser.add_argument('--fraccion-peluqueros', type=float, default=0.2,
+                            help='Fracción de usuarios virtuales que actúan como peluqueros')
+        parser.add_argument('--duracion', type=float, default=30.0, help='Segundos de prueba')
+        parser.add_argument('--acciones-por-sesion', type=int, default=10)
+        parser.add_argument('--timeout', type=float, default=10.0, help='Timeout por petición en segundos')
+        parser.add_argument('--peluqueros', type=int, default=50)
+        parser.add_argument('--clientes', type=int, default=100_000)
+        parser.add_argument('--id-base', type=int, default=ID_BASE)
+        parser.add_argument('--prefijo', default='carga')
+        parser.add_argument('--clave', default='carga123')
+        parser.add_argument('--semilla', type=int, default=1)
+
+    def handle(self, *args, **options):
+        for opcion in ('url_usuarios', 'url_citas'):
+            destino = urlsplit(options[opcion])
+            if destino.scheme != 'http' or not destino.hostname:
+                raise CommandError(f"--{opcion.replace('_', '-')} debe ser http://host[:puerto]")
+        if options['usuarios_virtuales'] < 1:
+            raise CommandError('--usuarios-virtuales debe ser al menos 1')
+
+        n_peluqueros = min(options['peluqueros'], round(options['usuarios_virtuales'] * options['fraccion_peluqueros']))
+        n_clientes = options['usuarios_virtuales'] - n_peluqueros
+        self.stdout.write(
+            f"Usuarios: {options['url_usuarios']}  Citas: {options['url_citas']}  {options['duracion']}s, "
+            f"{n_clientes} clientes y {n_peluqueros} peluqueros virtuales"
+        )
+        resultado = asyncio.run(self._prueba(options, n_clientes, n_peluqueros))
+
+        duracion = resultado['duracion']
+        self.stdout.write(f"{'operación':>15} {'peticiones':>10} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} "
+                          f"{'p99 ms':>8} {'errores':>8} {'rechazos':>9}")
+        todas = []
+        for operacion in OPERACIONES:
+            latencias = sorted(resultado['latencias'][operacion])
+            errores = resultado['errores'][operacion]
+            if not latencias and not errores:
+                continue
+            todas.extend(latencias)
+            estilo = self.style.WARNING if errores else self.style.SUCCESS
+            self.stdout.write(estilo(
+                f"{operacion:>15} {len(latencias):>10} {len(latencias) / duracion:>8.1f} "
+                f"{percentil(latencias, 50) * 1000:>8.1f} {percentil(latencias, 95) * 1000:>8.1f} "
+                f"{percentil(latencias, 99) * 1000:>8.1f} {errores:>8} {resultado['rechazos'][operacion]:>9}"
+            ))
+        todas.sort()
+        self.stdout.write(
+            f"{'total':>15} {len(todas):>10} {len(todas) / duracion:>8.1f} {percentil(todas, 50) * 1000:>8.1f} "
+            f"{percentil(todas, 95) * 1000:>8.1f} {percentil(todas, 99) * 1000:>8.1f} "
+            f"{sum(resultado['errores'].values()):>8} {sum(resultado['rechazos'].values()):>9}"
+        )
+        if resultado['muestra_error']:
+            self.stdout.write(f"  primer error: {resultado['muestra_error']}")
+
+    async def _prueba(self, options, n_clientes, n_peluqueros):
+        resultado = {
+            'latencias': {operacion: [] for operacion in OPERACIONES},
+            'errores': dict.fromkeys(OPERACIONES, 0),
+            'rechazos': dict.fromkeys(OPERACIONES, 0),
+            'muestra_error': None,
+        }
+        inicio = time.perf_counter()
+        fin = inicio + options['duracion']
+        timeout = options['timeout']
+        aleatorio = random.Random(options['semilla'])
+        peluqueros = range(options['id_base'], options['id_base'] + options['peluqueros'])
+
+        def error(operacion, detalle):
+            resultado['errores'][operacion] += 1
+            if resultado['muestra_error'] is None:
+                resultado['muestra_error'] = f'{operacion}: {detalle}'
+
+        async def medir(operacion, conexion, metodo, ruta, token=None, datos=None, rechazo=None):
+            """Hace la petición y la anota; retorna el JSON si el status es 2xx, None en otro caso."""
+            t0 = time.perf_counter()
+            try:
+                estado, cuerpo = await conexion.pedir(metodo, ruta, token, datos)
+            except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError, ConnectionError, ValueError) as exc:
+                error(operacion, repr(exc))
+                await asyncio.sleep(0.05)
+                return None
+            resultado['latencias'][operacion].append(time.perf_counter() - t0)
+            if 200 <= estado < 300:
+                return cuerpo if cuerpo is not None else {}
+            if estado == rechazo:
+                # Regla de negocio (franja tomada por otro usuario virtual): no es un error del servicio
+                resultado['rechazos'][operacion] += 1
+            else:
+                error(operacion, f'HTTP {estado} en {ruta}: {str(cuerpo)[:200]}')
+            return None
+
+        async def login(conexion, usuario):
+            datos = await medir('login', conexion, 'POST', '/api/auth/login/',
+                                datos={'usuario': usuario, 'clave': options['clave']})
+            return datos['tokens']['access'] if datos else None
+
+        async def cliente():
+            usuarios = _Conexion(options['url_usuarios'], timeout)
+            citas = _Conexion(options['url_citas'], timeout)
+            try:
+                while time.perf_counter() < fin:
+                    token = await login(usuarios, f"{options['prefijo']}.cliente{aleatorio.randrange(options['clientes'])}")
+                    mascotas = token and await medir('mascotas', citas, 'GET', '/api/mascotas/', token)
+                    if not mascotas:
+                        await asyncio.sleep(0.05)
+                        continue
+                    for _ in range(options['acciones_por_sesion']):
+                        if time.perf_counter() >= fin:
+                            break
+                        peluquero_id = aleatorio.choice(peluqueros)
+                        fecha = (date.today() + timedelta(days=aleatorio.randint(1, 14))).isoformat()
+                        disponibilidad = await medir(
+                            'disponibilidad', citas, 'GET',
+                            f'/api/citas/disponibilidad/?peluquero_id={peluquero_id}&fecha={fecha}', token,
+                        )
+                        hueco = disponibilidad and _hueco_libre(disponibilidad, aleatorio.choice((30, 60)))
+                        if hueco:
+                            await medir('reserva', citas, 'POST', '/api/citas/', token, {
+                                'mascota': aleatorio.choice(mascotas)['id'], 'peluquero_id': peluquero_id,
+                                'fecha': fecha, 'hora_inicio': hueco[0], 'hora_fin': hueco[1],
+                            }, rechazo=400)
+                        await medir('mis_citas', citas, 'GET', '/api/citas/mis_citas/', token)
+            finally:
+                usuarios.cerrar()
+                citas.cerrar()
+
+        async def peluquero(indice):
+            usuarios = _Conexion(options['url_usuarios'], timeout)
+            citas = _Conexion(options['url_citas'], timeout)
+            try:
+                while time.perf_counter() < fin:
+                    numero = (indice + aleatorio.randrange(options['peluqueros'])) % options['peluqueros']
+                    token = await login(usuarios, f"{options['prefijo']}.peluquero{numero}")
+                    if not token:
+                        await asyncio.sleep(0.05)
+                        continue
+                    for _ in range(options['acciones_por_sesion']):
+                        if time.perf_counter() >= fin:
+                            break
+                        fecha = (date.today() + timedelta(days=aleatorio.randint(0, 7))).isoformat()
+                        agenda = await medir('agenda', citas, 'GET', f'/api/citas/dia/?fecha={fecha}', token) or []
+                        ahora = datetime.now().strftime('%H:%M:%S')
+                        pendientes = [
+                            cita for cita in agenda
+                            if cita['estado'] == 'PENDIENTE' and (cita['fecha'] > date.today().isoformat()
+                                                                 or cita['hora_inicio'] > ahora)
+                        ]
+                        if pendientes:
+                            cita = aleatorio.choice(pendientes)
+                            # Otro peluquero virtual con la misma sesión puede haberla cambiado antes: 400
+                            accion = 'cancelar' if aleatorio.random() < 0.1 else 'confirmar'
+                            await medir(accion, citas, 'POST', f"/api/citas/{cita['id']}/{accion}/", token, {}, rechazo=400)
+            finally:
+                usuarios.cerrar()
+                citas.cerrar()
+
+        await asyncio.gather(*(cliente() for _ in range(n_clientes)), *(peluquero(i) for i in range(n_peluqueros)))
+        resultado['duracion'] = time.perf_counter() - inicio
+        return resultado
@@ -0,0 +1,27 @@
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+
+from citas import resumenes
+
+
+class Command(BaseCommand):
+    help = 'Reconstruye la tabla ResumenCita a partir de las citas existentes (backfill)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--desde', help='Fecha inicial YYYY-MM-DD (opcional)')
+        parser.add_argument('--hasta', help='Fecha final YYYY-MM-DD (opcional)')
+
+    def handle(self, *args, **options):
+        try:
+            desde = self._fecha(options['desde'])
+            hasta = self._fecha(options['hasta'])
+        except ValueError:
+            raise CommandError('Formato de fecha inválido (usar YYYY-MM-DD)')
+
+        total = resumenes.recalcular(desde=desde, hasta=hasta)
+        self.stdout.write(self.style.SUCCESS(f'Resúmenes recalculados: {total} filas'))
+
+    @staticmethod
+    def _fecha(valor):
+        return datetime.strptime(valor, '%Y-%m-%d').date() if valor else None
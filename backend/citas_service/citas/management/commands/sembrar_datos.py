@@ -0,0 +1,226 @@
+import random
+import time
+from datetime import time as dt_time, timedelta
+from decimal import Decimal
+from itertools import islice
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from citas import horarios, recordatorios, resumenes
+from citas.models import Cita, EstadoCita, Horario, Mascota, Servicio
+
+# Mismo valor por defecto que `sembrar_datos` de usuario_service: los ids de
+# peluqueros y clientes de ambos servicios coinciden y se puede hacer login con ellos
+ID_BASE = 100_000
+
+# (nombre, duración en minutos, precio, peso en la demanda)
+SERVICIOS = [
+    ('Baño', 45, '15.00', 30),
+    ('Corte', 60, '20.00', 25),
+    ('Baño y corte', 90, '30.00', 25),
+    ('Corte de uñas', 30, '8.00', 12),
+    ('Deslanado', 120, '40.00', 8),
+]
+
+# Plantillas semanales de Horario: (días de la semana, hora de inicio, hora de fin)
+PLANTILLAS_HORARIO = {
+    'mañana': [(range(0, 6), dt_time(8, 0), dt_time(14, 0))],
+    'tarde': [(range(0, 6), dt_time(13, 0), dt_time(20, 0))],
+    'partido': [
+        (range(0, 5), dt_time(9, 0), dt_time(13, 0)),
+        (range(0, 5), dt_time(15, 0), dt_time(19, 0)),
+        (range(5, 6), dt_time(9, 0), dt_time(14, 0)),
+    ],
+}
+
+NOMBRES = ['Luna', 'Max', 'Rocky', 'Kira', 'Toby', 'Coco', 'Nala', 'Bruno', 'Lola', 'Simba',
+           'Milo', 'Maya', 'Thor', 'Canela', 'Chispa', 'Oso', 'Nieve', 'Lucas', 'Mia', 'Zeus']
+RAZAS = ['Mestizo', 'Caniche', 'Yorkshire', 'Golden Retriever', 'Labrador', 'Schnauzer', 'Bichón Maltés',
+         'Pastor Alemán', 'Shih Tzu', 'Chihuahua', 'Cocker Spaniel', 'Persa', 'Siamés']
+
+# Distribución de estados: las citas pasadas ya están cerradas, las futuras siguen abiertas
+ESTADOS_PASADOS = [(EstadoCita.FINALIZADA, 80), (EstadoCita.CANCELADA, 12), (EstadoCita.NO_ASISTIO, 8)]
+ESTADOS_FUTUROS = [(EstadoCita.CONFIRMADA, 55), (EstadoCita.PENDIENTE, 38), (EstadoCita.CANCELADA, 7)]
+
+# Fracción de la jornada ocupada en días pasados; en el futuro decrece con la distancia
+OCUPACION = 0.8
+
+
+def _hora(minutos):
+    return dt_time(minutos // 60, minutos % 60)
+
+
+class Command(BaseCommand):
+    help = (
+        'Genera datos sintéticos con volúmenes de producción (servicios, plantillas de Horario, '
+        'mascotas y citas con una distribución realista de estados) mediante inserciones masivas. '
+        'Los ids de peluqueros y clientes coinciden con los que crea `sembrar_datos` en usuario_service '
+        '(mismo --id-base, --peluqueros y --clientes). Las citas llenan hacia atrás la agenda de cada '
+        'peluquero desde --dias-futuros sin solapes, así que el histórico se alarga lo necesario para '
+        'alcanzar --citas. Al terminar recalcula resúmenes y recordatorios (bulk_create no pasa por Cita.save).'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--peluqueros', type=int, default=50)
+        parser.add_argument('--clientes', type=int, default=100_000)
+        parser.add_argument('--mascotas', type=int, default=300_000)
+        parser.add_argument('--citas', type=int, default=2_000_000)
+        parser.add_argument('--dias-futuros', type=int, default=60, help='Días de agenda abierta a partir de hoy')
+        parser.add_argument('--id-base', type=int, default=ID_BASE,
+                            help='Id del primer peluquero; los clientes van a continuación')
+        parser.add_argument('--semilla', type=int, default=42)
+        parser.add_argument('--lote', type=int, default=5000, help='Filas por INSERT')
+
+    def handle(self, *args, **options):
+        if options['peluqueros'] < 1 or options['clientes'] < 1:
+            raise CommandError('Se necesita al menos un peluquero y un cliente')
+        if options['mascotas'] < options['clientes']:
+            raise CommandError('--mascotas debe ser al menos --clientes (una mascota por cliente)')
+
+        base = options['id_base']
+        peluqueros = list(range(base, base + options['peluqueros']))
+        clientes = range(base + options['peluqueros'], base + options['peluqueros'] + options['clientes'])
+        if (Horario.objects.filter(peluquero_id__in=peluqueros).exists()
+                or Mascota.objects.filter(dueno_id__gte=clientes.start, dueno_id__lt=clientes.stop).exists()):
+            raise CommandError(
+                f'Ya hay datos para los ids {base}..{clientes.stop - 1}: '
+                'vacía la BD (manage.py flush) o usa otro --id-base'
+            )
+
+        aleatorio = random.Random(options['semilla'])
+        lote = options['lote']
+        inicio = time.perf_counter()
+
+        servicios = self._servicios()
+        self.stdout.write(f'Servicios: {len(servicios)}')
+
+        n_horarios = self._horarios(peluqueros, aleatorio)
+        self.stdout.write(f'Horarios: {n_horarios} ({len(peluqueros)} peluqueros)')
+
+        mascotas = self._mascotas(clientes, options['mascotas'], aleatorio, lote)
+        self.stdout.write(f'Mascotas: {len(mascotas)} ({len(clientes)} clientes)')
+
+        t0 = time.perf_counter()
+        citas = self._citas(peluqueros, mascotas, servicios, options['citas'], options['dias_futuros'], aleatorio)
+        total = 0
+        while True:
+            bloque = list(islice(citas, lote))
+            if not bloque:
+                break
+            Cita.objects.bulk_create(bloque, batch_size=lote)
+            total += len(bloque)
+            if total % (lote * 40) < lote:
+                self.stdout.write(f'  {total} citas ({total / (time.perf_counter() - t0):.0f} filas/s)')
+        primera = Cita.objects.filter(peluquero_id__in=peluqueros).order_by('fecha').values_list('fecha', flat=True).first()
+        self.stdout.write(f'Citas: {total} desde {primera} en {time.perf_counter() - t0:.1f}s')
+
+        t0 = time.perf_counter()
+        filas = resumenes.recalcular()
+        nuevos = recordatorios.reconstruir()
+        self.stdout.write(f'Resúmenes: {filas} filas, recordatorios: {nuevos} ({time.perf_counter() - t0:.1f}s)')
+        self.stdout.write(self.style.SUCCESS(f'Datos generados en {time.perf_counter() - inicio:.1f}s'))
+
+    @staticmethod
+    def _servicios():
+        servicios = []
+        for nombre, duracion, precio, peso in SERVICIOS:
+            servicio, _ = Servicio.objects.get_or_create(
+                nombre=nombre,
+                defaults={'duracion_minutos': duracion, 'precio': Decimal(precio), 'descripcion': nombre},
+            )
+            if servicio.activo:
+                servicios.append((servicio.id, servicio.duracion_minutos, peso))
+        if not servicios:
+            raise CommandError('No hay servicios activos')
+        return servicios
+
+    @staticmethod
+    def _horarios(peluqueros, aleatorio):
+        plantillas = list(PLANTILLAS_HORARIO.values())
+        filas = [
+            Horario(peluquero_id=peluquero_id, dia_semana=dia, hora_inicio=hora_inicio, hora_fin=hora_fin)
+            for peluquero_id in peluqueros
+            for dias, hora_inicio, hora_fin in aleatorio.choice(plantillas)
+            for dia in dias
+        ]
+        Horario.objects.bulk_create(filas, batch_size=1000)
+        # bulk_create no dispara las señales que mantienen HorarioCompilado
+        horarios.recompilar(*peluqueros)
+        return len(filas)
+
+    @staticmethod
+    def _mascotas(clientes, total, aleatorio, lote):
+        """Una mascota por cliente y el resto repartidas al azar. Retorna los ids creados."""
+        def filas():
+            for i in range(total):
+                dueno_id = clientes[i] if i < len(clientes) else aleatorio.choice(clientes)
+                yield Mascota(dueno_id=dueno_id, nombre=aleatorio.choice(NOMBRES),
+                              raza=aleatorio.choice(RAZAS), edad=aleatorio.randint(1, 15))
+
+        ids = []
+        generador = filas()
+        while True:
+            bloque = list(islice(generador, lote))
+            if not bloque:
+                return ids
+            ids.extend(mascota.id for mascota in Mascota.objects.bulk_create(bloque, batch_size=lote))
+
+    @staticmethod
+    def _citas(peluqueros, mascotas, servicios, total, dias_futuros, aleatorio):
+        """
+        Genera `total` citas día a día hacia atrás desde hoy + dias_futuros. En cada
+        bloque de Horario las citas se encadenan sin solapes; los huecos libres
+        avanzan 30 minutos. Las futuras activas no repiten mascota, peluquero y día.
+        """
+        ids_servicio = [servicio_id for servicio_id, _, _ in servicios]
+        duraciones = {servicio_id: duracion for servicio_id, duracion, _ in servicios}
+        pesos = [peso for _, _, peso in servicios]
+        estados_pasados, pesos_pasados = zip(*ESTADOS_PASADOS)
+        estados_futuros, pesos_futuros = zip(*ESTADOS_FUTUROS)
+
+        bloques = {}
+        for peluquero_id, dia, hora_inicio, hora_fin in Horario.objects.filter(
+                peluquero_id__in=peluqueros, activo=True).values_list('peluquero_id', 'dia_semana', 'hora_inicio', 'hora_fin'):
+            bloques.setdefault((peluquero_id, dia), []).append(
+                (hora_inicio.hour * 60 + hora_inicio.minute, hora_fin.hour * 60 + hora_fin.minute)
+            )
+        if not bloques:
+            return
+
+        hoy = timezone.localdate()
+        ocupadas = set()
+        generadas = 0
+        dias = dias_futuros
+        while generadas < total:
+            fecha = hoy + timedelta(days=dias)
+            futura = dias >= 0
+            # La agenda se llena a medida que se acerca la fecha
+            ocupacion = OCUPACION * max(0.15, 1 - dias / dias_futuros) if futura and dias_futuros else OCUPACION
+            for peluquero_id in peluqueros:
+                for desde, hasta in bloques.get((peluquero_id, fecha.weekday()), ()):
+                    minuto = desde
+                    while generadas < total:
+                        servicio_id = aleatorio.choices(ids_servicio, pesos)[0]
+                        fin = minuto + duraciones[servicio_id]
+                        if fin > hasta:
+                            break
+                        if aleatorio.random() >= ocupacion:
+                            minuto += 30
+                            continue
+                        if futura:
+                            estado = aleatorio.choices(estados_futuros, pesos_futuros)[0]
+                        else:
+                            estado = aleatorio.choices(estados_pasados, pesos_pasados)[0]
+                        mascota_id = aleatorio.choice(mascotas)
+                        if futura and estado != EstadoCita.CANCELADA:
+                            while (mascota_id, peluquero_id, fecha) in ocupadas:
+                                mascota_id = aleatorio.choice(mascotas)
+                            ocupadas.add((mascota_id, peluquero_id, fecha))
+                        yield Cita(
+                            mascota_id=mascota_id, servicio_id=servicio_id, peluquero_id=peluquero_id,
+                            fecha=fecha, hora_inicio=_hora(minuto), hora_fin=_hora(fin), estado=estado,
+                        )
+                        generadas += 1
+                        minuto = fin
+            dias -= 1
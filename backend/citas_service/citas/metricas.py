@@ -0,0 +1,34 @@
+"""
+Métricas de negocio del servicio de citas (se exponen en /metrics junto a las
+comunes de comun/metricas.py).
+"""
+from prometheus_client import Counter
+from prometheus_client.core import GaugeMetricFamily
+
+RESERVAS_RECHAZADAS = Counter(
+    'citas_reservas_rechazadas', 'Reservas rechazadas por conflicto en CitaCreateSerializer.validate', ['motivo'],
+)
+CACHE = Counter(
+    'citas_cache', 'Consultas a cachés del servicio (token: JWT validados, feed: calendario iCal, horario: semanas compiladas)',
+    ['cache', 'resultado'],
+)
+
+
+def conflicto(motivo):
+    RESERVAS_RECHAZADAS.labels(motivo).inc()
+
+
+def cache(nombre, acierto):
+    CACHE.labels(nombre, 'acierto' if acierto else 'fallo').inc()
+
+
+class CitasPendientesCollector:
+    """Citas PENDIENTE actuales; se cuentan en la BD en cada scrape (no se suman entre workers)."""
+
+    def collect(self):
+        from .models import Cita, EstadoCita
+
+        yield GaugeMetricFamily(
+            'citas_pendientes', 'Citas en estado PENDIENTE',
+            value=Cita.objects.filter(estado=EstadoCita.PENDIENTE).count(),
+        )
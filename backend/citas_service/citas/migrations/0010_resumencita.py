@@ -0,0 +1,39 @@
+# Generated by Django 5.0.2 on 2026-10-19 17:48
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('citas', '0009_alter_cita_estado'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ResumenCita',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fecha', models.DateField()),
+                ('peluquero_id', models.IntegerField(help_text='ID del peluquero desde usuario_service')),
+                ('estado', models.CharField(choices=[('PENDIENTE', 'Pendiente'), ('CONFIRMADA', 'Confirmada'), ('CANCELADA', 'Cancelada'), ('FINALIZADA', 'Finalizada'), ('NO_ASISTIO', 'No Asistió')], max_length=20)),
+                ('cantidad', models.IntegerField(default=0, help_text='Número de citas')),
+                ('minutos', models.IntegerField(default=0, help_text='Suma de la duración de las citas en minutos')),
+                ('servicio', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='resumenes', to='citas.servicio')),
+            ],
+            options={
+                'verbose_name': 'Resumen de citas',
+                'verbose_name_plural': 'Resúmenes de citas',
+                'ordering': ['fecha', 'peluquero_id'],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='resumencita',
+            constraint=models.UniqueConstraint(fields=('fecha', 'peluquero_id', 'servicio', 'estado'), name='resumen_cita_clave_unica'),
+        ),
+        migrations.AddConstraint(
+            model_name='resumencita',
+            constraint=models.UniqueConstraint(condition=models.Q(('servicio__isnull', True)), fields=('fecha', 'peluquero_id', 'estado'), name='resumen_cita_sin_servicio_unica'),
+        ),
+    ]
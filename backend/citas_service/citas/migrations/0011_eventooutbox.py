@@ -0,0 +1,33 @@
+# Generated by Django 5.0.2 on 2026-10-19 17:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('citas', '0010_resumencita'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EventoOutbox',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tipo', models.CharField(max_length=40)),
+                ('cita_id', models.BigIntegerField(help_text='ID de la cita (sin FK: el evento sobrevive al borrado)')),
+                ('peluquero_id', models.IntegerField()),
+                ('datos', models.JSONField(default=dict)),
+                ('creado_en', models.DateTimeField(auto_now_add=True)),
+                ('despachado_en', models.DateTimeField(blank=True, null=True)),
+                ('intentos', models.PositiveIntegerField(default=0)),
+                ('ultimo_error', models.TextField(blank=True)),
+            ],
+            options={
+                'verbose_name': 'Evento outbox',
+                'verbose_name_plural': 'Eventos outbox',
+                'ordering': ['id'],
+                'indexes': [models.Index(condition=models.Q(('despachado_en__isnull', True)), fields=['id'], name='outbox_pendientes_idx')],
+            },
+        ),
+    ]
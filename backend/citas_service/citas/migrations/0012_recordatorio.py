@@ -0,0 +1,36 @@
+# Generated by Django 5.0.2 on 2026-10-19 17:54
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('citas', '0011_eventooutbox'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Recordatorio',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tipo', models.CharField(help_text='Anticipación del recordatorio, p. ej. 24H o 2H', max_length=10)),
+                ('vence_en', models.DateTimeField()),
+                ('estado', models.CharField(choices=[('PENDIENTE', 'Pendiente'), ('ENVIADO', 'Enviado'), ('OMITIDO', 'Omitido'), ('CANCELADO', 'Cancelado'), ('FALLIDO', 'Fallido')], default='PENDIENTE', max_length=20)),
+                ('intentos', models.PositiveIntegerField(default=0)),
+                ('reclamado_por', models.CharField(blank=True, max_length=32)),
+                ('bloqueado_hasta', models.DateTimeField(blank=True, null=True)),
+                ('enviado_en', models.DateTimeField(blank=True, null=True)),
+                ('ultimo_error', models.TextField(blank=True)),
+                ('creado_en', models.DateTimeField(auto_now_add=True)),
+                ('cita', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='recordatorios', to='citas.cita')),
+            ],
+            options={
+                'verbose_name': 'Recordatorio',
+                'verbose_name_plural': 'Recordatorios',
+                'ordering': ['vence_en'],
+                'indexes': [models.Index(condition=models.Q(('estado', 'PENDIENTE')), fields=['vence_en'], name='recordatorio_vencimiento_idx')],
+            },
+        ),
+    ]
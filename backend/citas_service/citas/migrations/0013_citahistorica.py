@@ -0,0 +1,37 @@
+# Generated by Django 5.2.7 on 2026-10-19 18:03
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('citas', '0012_recordatorio'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CitaHistorica',
+            fields=[
+                ('id', models.BigIntegerField(help_text='Mismo id que tenía en Cita', primary_key=True, serialize=False)),
+                ('peluquero_id', models.IntegerField()),
+                ('fecha', models.DateField()),
+                ('hora_inicio', models.TimeField()),
+                ('hora_fin', models.TimeField()),
+                ('estado', models.CharField(choices=[('PENDIENTE', 'Pendiente'), ('CONFIRMADA', 'Confirmada'), ('CANCELADA', 'Cancelada'), ('FINALIZADA', 'Finalizada'), ('NO_ASISTIO', 'No Asistió')], max_length=20)),
+                ('notas', models.TextField(blank=True)),
+                ('creada_en', models.DateTimeField()),
+                ('actualizada_en', models.DateTimeField()),
+                ('archivada_en', models.DateTimeField(auto_now_add=True)),
+                ('mascota', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='citas_historicas', to='citas.mascota')),
+                ('servicio', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='citas_historicas', to='citas.servicio')),
+            ],
+            options={
+                'verbose_name': 'Cita histórica',
+                'verbose_name_plural': 'Citas históricas',
+                'ordering': ['-fecha', '-hora_inicio'],
+                'indexes': [models.Index(fields=['mascota', 'fecha'], name='cita_hist_mascota_fecha_idx'), models.Index(fields=['peluquero_id', 'fecha'], name='cita_hist_peluquero_fecha_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.7 on 2026-10-19 18:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('citas', '0013_citahistorica'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cita',
+            name='serie',
+            field=models.UUIDField(blank=True, db_index=True, help_text='Serie recurrente a la que pertenece la cita (ver citas/series.py)', null=True),
+        ),
+    ]
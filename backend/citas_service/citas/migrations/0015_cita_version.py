@@ -0,0 +1,18 @@
+# Generated by Django 5.2.7 on 2026-10-19 18:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('citas', '0014_cita_serie'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cita',
+            name='version',
+            field=models.PositiveIntegerField(default=1, help_text='Se incrementa con cada escritura (control de concurrencia optimista, ETag)'),
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.2.7 on 2026-10-19 18:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('citas', '0015_cita_version'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='HorarioExcepcion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('peluquero_id', models.IntegerField(blank=True, help_text='ID del peluquero desde usuario_service (vacío: todos)', null=True)),
+                ('tipo', models.CharField(choices=[('CIERRE', 'Cierre'), ('TURNO_EXTRA', 'Turno extra')], default='CIERRE', max_length=20)),
+                ('desde', models.DateField()),
+                ('hasta', models.DateField()),
+                ('hora_inicio', models.TimeField(blank=True, help_text='Vacía en los cierres de día completo', null=True)),
+                ('hora_fin', models.TimeField(blank=True, null=True)),
+                ('motivo', models.CharField(blank=True, max_length=200)),
+                ('creada_en', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'verbose_name': 'Excepción de horario',
+                'verbose_name_plural': 'Excepciones de horario',
+                'ordering': ['desde', 'peluquero_id'],
+                'indexes': [models.Index(fields=['hasta', 'desde'], name='horario_excepcion_rango_idx')],
+                'constraints': [models.CheckConstraint(condition=models.Q(('hasta__gte', models.F('desde'))), name='horario_excepcion_rango_valido'), models.CheckConstraint(condition=models.Q(models.Q(('hora_fin__isnull', True), ('hora_inicio__isnull', True)), models.Q(('hora_fin__gt', models.F('hora_inicio')), ('hora_fin__isnull', False), ('hora_inicio__isnull', False)), _connector='OR'), name='horario_excepcion_franja_valida')],
+            },
+        ),
+    ]
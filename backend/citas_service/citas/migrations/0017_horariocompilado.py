@@ -0,0 +1,52 @@
+# Generated by Django 5.2.7 on 2026-10-19 18:57
+
+from django.db import migrations, models
+
+
+def compilar_existentes(apps, schema_editor):
+    """Semana compilada de cada peluquero con horarios, con la misma fusión que citas/horarios.py."""
+    Horario = apps.get_model('citas', 'Horario')
+    HorarioCompilado = apps.get_model('citas', 'HorarioCompilado')
+    semanas = {}
+    for peluquero_id, dia_semana, hora_inicio, hora_fin in Horario.objects.filter(activo=True).values_list(
+        'peluquero_id', 'dia_semana', 'hora_inicio', 'hora_fin'
+    ):
+        semana = semanas.setdefault(peluquero_id, [[] for _ in range(7)])
+        semana[dia_semana].append((hora_inicio.hour * 60 + hora_inicio.minute, hora_fin.hour * 60 + hora_fin.minute))
+    for semana in semanas.values():
+        for i, dia in enumerate(semana):
+            fusionados = []
+            for inicio, fin in sorted(dia):
+                if fusionados and inicio <= fusionados[-1][1]:
+                    fusionados[-1][1] = max(fusionados[-1][1], fin)
+                else:
+                    fusionados.append([inicio, fin])
+            semana[i] = fusionados
+    HorarioCompilado.objects.bulk_create(
+        HorarioCompilado(peluquero_id=peluquero_id, dias=semana) for peluquero_id, semana in semanas.items()
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('citas', '0016_horarioexcepcion'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='HorarioCompilado',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('peluquero_id', models.IntegerField(help_text='ID del peluquero desde usuario_service', unique=True)),
+                ('dias', models.JSONField(default=list, help_text='7 listas (lunes a domingo) de [inicio, fin] en minutos')),
+                ('actualizado_en', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Horario compilado',
+                'verbose_name_plural': 'Horarios compilados',
+                'ordering': ['peluquero_id'],
+            },
+        ),
+        migrations.RunPython(compilar_existentes, migrations.RunPython.noop),
+    ]
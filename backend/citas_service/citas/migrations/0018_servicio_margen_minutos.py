@@ -0,0 +1,18 @@
+# Generated by Django 5.2.7 on 2026-10-19 19:07
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('citas', '0017_horariocompilado'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='servicio',
+            name='margen_minutos',
+            field=models.PositiveIntegerField(default=0, help_text='Minutos de preparación o limpieza tras el servicio; la cita los reserva en la agenda'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.7 on 2026-10-19 19:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('citas', '0018_servicio_margen_minutos'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='eventooutbox',
+            name='bloqueado_hasta',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='eventooutbox',
+            name='reclamado_por',
+            field=models.CharField(blank=True, max_length=32),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.7 on 2026-10-19 19:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('citas', '0019_eventooutbox_lease'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TokenCalendario',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tipo', models.CharField(help_text="'p' peluquero o 'c' cliente", max_length=1)),
+                ('propietario_id', models.IntegerField(help_text='ID del peluquero o del cliente desde usuario_service')),
+                ('secreto', models.CharField(max_length=32)),
+                ('rotado_en', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Token de calendario',
+                'verbose_name_plural': 'Tokens de calendario',
+                'constraints': [models.UniqueConstraint(fields=('tipo', 'propietario_id'), name='token_calendario_propietario_unico')],
+            },
+        ),
+    ]
@@ -1,4 +1,5 @@
-from django.db import models
+from django.db import models, transaction
+from django.db.models import F, Q
 from django.core.exceptions import ValidationError
 from datetime import datetime, time
 
@@ -19,6 +20,10 @@ class Servicio(models.Model):
     nombre = models.CharField(max_length=100, unique=True)
     descripcion = models.TextField(blank=True)
     duracion_minutos = models.IntegerField(help_text="Duración en minutos")
+    margen_minutos = models.PositiveIntegerField(
+        default=0,
+        help_text="Minutos de preparación o limpieza tras el servicio; la cita los reserva en la agenda",
+    )
     precio = models.DecimalField(max_digits=10, decimal_places=2, help_text="Precio en EUR")
     imagen_url = models.URLField(blank=True, null=True, help_text="URL de la imagen del servicio (puede ser URL de nube como Google Drive, Cloudinary, etc.)")
     activo = models.BooleanField(default=True)
@@ -99,11 +104,129 @@ class Horario(models.Model):
             raise ValidationError("El día de la semana debe estar entre 0 (Lunes) y 6 (Domingo)")
 
 
+class HorarioCompilado(models.Model):
+    """
+    Semana de un peluquero compilada desde sus Horario activos (ver
+    citas/horarios.py): por cada día, intervalos [inicio, fin] en minutos,
+    ordenados y con los turnos contiguos fusionados. Se recalcula en cada
+    escritura de Horario y es lo que leen la disponibilidad y las reservas.
+    """
+    peluquero_id = models.IntegerField(unique=True, help_text="ID del peluquero desde usuario_service")
+    dias = models.JSONField(default=list, help_text="7 listas (lunes a domingo) de [inicio, fin] en minutos")
+    actualizado_en = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = "Horario compilado"
+        verbose_name_plural = "Horarios compilados"
+        ordering = ['peluquero_id']
+
+    def __str__(self):
+        return f"Semana compilada del peluquero {self.peluquero_id}"
+
+
+class TipoExcepcion(models.TextChoices):
+    CIERRE = 'CIERRE', 'Cierre'
+    TURNO_EXTRA = 'TURNO_EXTRA', 'Turno extra'
+
+
+class HorarioExcepcion(models.Model):
+    """
+    Excepción al horario semanal en un rango de fechas (ver citas/horarios.py):
+    un cierre (festivo, vacaciones) de día completo o de una franja, o un turno
+    extra. Sin peluquero_id aplica a todos los peluqueros (cierre del local).
+    """
+    peluquero_id = models.IntegerField(
+        null=True, blank=True, help_text="ID del peluquero desde usuario_service (vacío: todos)"
+    )
+    tipo = models.CharField(max_length=20, choices=TipoExcepcion.choices, default=TipoExcepcion.CIERRE)
+    desde = models.DateField()
+    hasta = models.DateField()
+    hora_inicio = models.TimeField(null=True, blank=True, help_text="Vacía en los cierres de día completo")
+    hora_fin = models.TimeField(null=True, blank=True)
+    motivo = models.CharField(max_length=200, blank=True)
+    creada_en = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = "Excepción de horario"
+        verbose_name_plural = "Excepciones de horario"
+        ordering = ['desde', 'peluquero_id']
+        indexes = [
+            models.Index(fields=['hasta', 'desde'], name='horario_excepcion_rango_idx'),
+        ]
+        constraints = [
+            models.CheckConstraint(condition=Q(hasta__gte=F('desde')), name='horario_excepcion_rango_valido'),
+            models.CheckConstraint(
+                condition=Q(hora_inicio__isnull=True, hora_fin__isnull=True)
+                | Q(hora_inicio__isnull=False, hora_fin__isnull=False, hora_fin__gt=F('hora_inicio')),
+                name='horario_excepcion_franja_valida',
+            ),
+        ]
+
+    def __str__(self):
+        peluquero = f"Peluquero {self.peluquero_id}" if self.peluquero_id else "Todos"
+        franja = f" {self.hora_inicio}-{self.hora_fin}" if self.hora_inicio else ""
+        return f"{self.get_tipo_display()} {peluquero} {self.desde} a {self.hasta}{franja}"
+
+    def clean(self):
+        if self.hasta < self.desde:
+            raise ValidationError("La fecha de fin debe ser igual o posterior a la de inicio")
+        if (self.hora_inicio is None) != (self.hora_fin is None):
+            raise ValidationError("Indica hora de inicio y de fin, o ninguna para el día completo")
+        if self.hora_inicio is not None and self.hora_inicio >= self.hora_fin:
+            raise ValidationError("La hora de fin debe ser posterior a la hora de inicio")
+        if self.tipo == TipoExcepcion.TURNO_EXTRA and self.hora_inicio is None:
+            raise ValidationError("Un turno extra necesita hora de inicio y de fin")
+
+
+class CitaQuerySet(models.QuerySet):
+
+    def vencidas(self, ahora):
+        """Citas PENDIENTE/CONFIRMADA cuya hora_fin ya pasó respecto a `ahora`."""
+        return self.filter(
+            Q(fecha__lt=ahora.date()) | Q(fecha=ahora.date(), hora_fin__lt=ahora.time()),
+            estado__in=[EstadoCita.PENDIENTE, EstadoCita.CONFIRMADA],
+        )
+
+    def finalizar_vencidas(self, ahora):
+        """
+        Marca como FINALIZADA en bloque las citas vencidas.
+        Retorna el número de citas finalizadas.
+        """
+        return len(self.vencidas(ahora).transicionar(EstadoCita.FINALIZADA, ahora))
+
+    def transicionar(self, estado_nuevo, ahora):
+        """
+        Pasa en bloque a estado_nuevo las citas del queryset (sin validar la
+        transición: el filtro del queryset debe dejar solo las permitidas).
+        Lee primero las filas afectadas para actualizar ResumenCita, cancelar sus
+        recordatorios y escribir sus eventos en EventoOutbox en la misma transacción.
+        Retorna las filas afectadas (resumenes.CAMPOS) con su estado anterior.
+        """
+        from . import resumenes, transiciones
+
+        with transaction.atomic():
+            filas = list(self.select_for_update().values(*resumenes.CAMPOS))
+            for i in range(0, len(filas), resumenes.TAMANO_LOTE):
+                ids = [datos['id'] for datos in filas[i:i + resumenes.TAMANO_LOTE]]
+                self.model.objects.filter(pk__in=ids).update(
+                    estado=estado_nuevo, actualizada_en=ahora, version=F('version') + 1
+                )
+            transiciones.registrar(filas, estado_nuevo)
+        return filas
+
+
+class CitaModificada(Exception):
+    """La cita cambió de versión desde que se leyó (otra escritura se adelantó)."""
+
+
 class Cita(models.Model):
     """
     Cita entre la mascota de un cliente y un peluquero.
     Se valida contra la disponibilidad del Horario del peluquero.
     """
+    # Campos que determinan la fila de ResumenCita a la que aporta la cita
+    CAMPOS_RESUMEN = {'fecha', 'peluquero_id', 'servicio', 'estado', 'hora_inicio', 'hora_fin'}
+
     mascota = models.ForeignKey(Mascota, on_delete=models.CASCADE, related_name='citas')
     servicio = models.ForeignKey(Servicio, on_delete=models.CASCADE, related_name='citas', null=True, blank=True)
     peluquero_id = models.IntegerField(help_text="ID del peluquero desde usuario_service")
@@ -118,8 +241,17 @@ class Cita(models.Model):
     
     # Campos adicionales opcionales
     notas = models.TextField(blank=True, help_text="Notas o comentarios del cliente")
+    serie = models.UUIDField(
+        null=True, blank=True, db_index=True,
+        help_text="Serie recurrente a la que pertenece la cita (ver citas/series.py)"
+    )
+    version = models.PositiveIntegerField(
+        default=1, help_text="Se incrementa con cada escritura (control de concurrencia optimista, ETag)"
+    )
     creada_en = models.DateTimeField(auto_now_add=True)
     actualizada_en = models.DateTimeField(auto_now=True)
+
+    objects = CitaQuerySet.as_manager()
     
     class Meta:
         verbose_name = "Cita"
@@ -129,6 +261,51 @@ class Cita(models.Model):
     def __str__(self):
         return f"Cita #{self.id} - Mascota {self.mascota.nombre} con Peluquero {self.peluquero_id} el {self.fecha}"
     
+    def save(self, *args, **kwargs):
+        """
+        Guarda la cita y, en la misma transacción, mantiene ResumenCita, la cola
+        de Recordatorio y escribe el evento del cambio en EventoOutbox. En actualizaciones se lee la fila
+        vigente para restar su aporte anterior; los guardados que no tocan campos
+        del resumen no tienen coste extra.
+        Tras el commit publica el cambio en el bus de eventos (stream SSE).
+        Las actualizaciones incrementan `version` y solo se aplican si la fila
+        sigue en la versión leída (ver _do_update).
+        """
+        from . import eventos, outbox, recordatorios, resumenes
+
+        update_fields = kwargs.get('update_fields')
+        if not self._state.adding:
+            if update_fields is not None:
+                kwargs['update_fields'] = update_fields = {*update_fields, 'version'}
+            self.version += 1
+        if update_fields is not None and not self.CAMPOS_RESUMEN.intersection(update_fields):
+            return super().save(*args, **kwargs)
+
+        with transaction.atomic():
+            anterior = None if self._state.adding else resumenes.fila_actual(self.pk)
+            super().save(*args, **kwargs)
+            actual = resumenes.fila(self)
+            resumenes.registrar_cambio(anterior, actual)
+            recordatorios.sincronizar(anterior, actual)
+            cambios = eventos.eventos_de_cambio(anterior, actual)
+            outbox.registrar(cambios)
+            eventos.publicar_al_confirmar(cambios)
+
+    def _do_update(self, base_qs, using, pk_val, values, update_fields, forced_update):
+        """
+        UPDATE ... WHERE id = %s AND version = <versión leída> (compare-and-swap).
+        Si no se actualiza ninguna fila pero la cita existe, otra escritura la
+        cambió desde que se leyó: se lanza CitaModificada en lugar de pisarla.
+        """
+        leida = self.version - 1
+        actualizada = super()._do_update(
+            base_qs.filter(version=leida), using, pk_val, values, update_fields, forced_update
+        )
+        if not actualizada and base_qs.filter(pk=pk_val).exists():
+            self.version = leida
+            raise CitaModificada()
+        return actualizada
+
     @property
     def cliente_id(self):
         """Retorna el ID del cliente asociado a la mascota.
@@ -162,43 +339,224 @@ class Cita(models.Model):
     
     def cancelar(self):
         """Cancela la cita."""
-        if self.estado == EstadoCita.CANCELADA:
-            raise ValidationError("La cita ya está cancelada")
-        self.estado = EstadoCita.CANCELADA
-        self.save(update_fields=['estado', 'actualizada_en'])
+        self._transicionar(EstadoCita.CANCELADA)
     
     def confirmar(self):
         """Confirma la cita (solo peluquero)."""
-        if self.estado == EstadoCita.CONFIRMADA:
-            raise ValidationError("La cita ya está confirmada")
-        if self.estado == EstadoCita.CANCELADA:
-            raise ValidationError("No se puede confirmar una cita cancelada")
-        self.estado = EstadoCita.CONFIRMADA
-        self.save(update_fields=['estado', 'actualizada_en'])
+        self._transicionar(EstadoCita.CONFIRMADA)
 
     def finalizar(self):
         """Finaliza la cita (cuando ya ocurrió)."""
-        if self.estado == EstadoCita.CANCELADA:
-            raise ValidationError("No se puede finalizar una cita cancelada")
-        if self.estado == EstadoCita.FINALIZADA:
-            raise ValidationError("La cita ya está finalizada")
-        # Solo se puede finalizar si está confirmada o pendiente y ya pasó su hora_fin
-        from django.utils import timezone
-        ahora = timezone.now()
-        fecha_hora_fin = datetime.combine(self.fecha, self.hora_fin)
-        if fecha_hora_fin > ahora:
-            raise ValidationError("La cita aún no ha concluido, no se puede finalizar")
-        if self.estado not in [EstadoCita.CONFIRMADA, EstadoCita.PENDIENTE]:
-            raise ValidationError("Estado inválido para finalizar")
-        self.estado = EstadoCita.FINALIZADA
-        self.save(update_fields=['estado', 'actualizada_en'])
+        self._transicionar(EstadoCita.FINALIZADA)
     
     def marcar_no_asistio(self):
         """Marca que el cliente no asistió a la cita."""
-        if self.estado in [EstadoCita.CANCELADA, EstadoCita.NO_ASISTIO]:
-            raise ValidationError(f"La cita ya está en estado {self.estado}")
-        if self.estado == EstadoCita.FINALIZADA:
-            raise ValidationError("No se puede marcar como no asistió una cita finalizada")
-        self.estado = EstadoCita.NO_ASISTIO
+        self._transicionar(EstadoCita.NO_ASISTIO)
+
+    def _transicionar(self, estado_nuevo):
+        from django.utils import timezone
+        error = self.error_de_transicion(self.estado, estado_nuevo, self.fecha, self.hora_fin, timezone.now())
+        if error:
+            raise ValidationError(error)
+        self.estado = estado_nuevo
         self.save(update_fields=['estado', 'actualizada_en'])
 
+    @staticmethod
+    def error_de_transicion(estado, estado_nuevo, fecha, hora_fin, ahora):
+        """
+        Motivo por el que una cita en `estado` no puede pasar a `estado_nuevo`
+        (None si puede). Reglas de cancelar/confirmar/finalizar/marcar_no_asistio,
+        compartidas con las transiciones en bloque (citas/transiciones.py).
+        """
+        from django.utils import timezone
+        if estado_nuevo == EstadoCita.CANCELADA:
+            if estado == EstadoCita.CANCELADA:
+                return "La cita ya está cancelada"
+        elif estado_nuevo == EstadoCita.CONFIRMADA:
+            if estado == EstadoCita.CONFIRMADA:
+                return "La cita ya está confirmada"
+            if estado == EstadoCita.CANCELADA:
+                return "No se puede confirmar una cita cancelada"
+        elif estado_nuevo == EstadoCita.FINALIZADA:
+            if estado == EstadoCita.CANCELADA:
+                return "No se puede finalizar una cita cancelada"
+            if estado == EstadoCita.FINALIZADA:
+                return "La cita ya está finalizada"
+            # Solo se puede finalizar si está confirmada o pendiente y ya pasó su hora_fin
+            if timezone.make_aware(datetime.combine(fecha, hora_fin)) > ahora:
+                return "La cita aún no ha concluido, no se puede finalizar"
+            if estado not in [EstadoCita.CONFIRMADA, EstadoCita.PENDIENTE]:
+                return "Estado inválido para finalizar"
+        elif estado_nuevo == EstadoCita.NO_ASISTIO:
+            if estado in [EstadoCita.CANCELADA, EstadoCita.NO_ASISTIO]:
+                return f"La cita ya está en estado {estado}"
+            if estado == EstadoCita.FINALIZADA:
+                return "No se puede marcar como no asistió una cita finalizada"
+        else:
+            return "Estado inválido"
+        return None
+
+
+
+class ResumenCita(models.Model):
+    """
+    Acumulado de citas por (fecha, peluquero, servicio, estado).
+    Se mantiene de forma incremental desde Cita.save() y las transiciones masivas
+    (ver citas/resumenes.py) para que las estadísticas no recorran la tabla de citas.
+    Los ingresos se calculan al leer con Servicio.precio.
+    """
+    fecha = models.DateField()
+    peluquero_id = models.IntegerField(help_text="ID del peluquero desde usuario_service")
+    servicio = models.ForeignKey(Servicio, on_delete=models.CASCADE, related_name='resumenes', null=True, blank=True)
+    estado = models.CharField(max_length=20, choices=EstadoCita.choices)
+    cantidad = models.IntegerField(default=0, help_text="Número de citas")
+    minutos = models.IntegerField(default=0, help_text="Suma de la duración de las citas en minutos")
+
+    class Meta:
+        verbose_name = "Resumen de citas"
+        verbose_name_plural = "Resúmenes de citas"
+        ordering = ['fecha', 'peluquero_id']
+        constraints = [
+            models.UniqueConstraint(
+                fields=['fecha', 'peluquero_id', 'servicio', 'estado'],
+                name='resumen_cita_clave_unica',
+            ),
+            # NULL no participa en la unicidad: las citas sin servicio necesitan su propia restricción
+            models.UniqueConstraint(
+                fields=['fecha', 'peluquero_id', 'estado'],
+                condition=Q(servicio__isnull=True),
+                name='resumen_cita_sin_servicio_unica',
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.fecha} - Peluquero {self.peluquero_id} - {self.estado}: {self.cantidad}"
+
+
+class EventoOutbox(models.Model):
+    """
+    Evento de cambio de una cita escrito en la misma transacción que el cambio
+    (patrón transactional outbox). El contenido del evento nunca se modifica;
+    solo se registra su despacho (ver citas/outbox.py y manage.py despachar_outbox).
+    """
+    tipo = models.CharField(max_length=40)
+    cita_id = models.BigIntegerField(help_text="ID de la cita (sin FK: el evento sobrevive al borrado)")
+    peluquero_id = models.IntegerField()
+    datos = models.JSONField(default=dict)
+    creado_en = models.DateTimeField(auto_now_add=True)
+    despachado_en = models.DateTimeField(null=True, blank=True)
+    intentos = models.PositiveIntegerField(default=0)
+    ultimo_error = models.TextField(blank=True)
+    # Reclamo por un despachador (lease que caduca, como en Recordatorio)
+    reclamado_por = models.CharField(max_length=32, blank=True)
+    bloqueado_hasta = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        verbose_name = "Evento outbox"
+        verbose_name_plural = "Eventos outbox"
+        ordering = ['id']
+        indexes = [
+            # Solo los pendientes interesan al despachador
+            models.Index(fields=['id'], condition=Q(despachado_en__isnull=True), name='outbox_pendientes_idx'),
+        ]
+
+    def __str__(self):
+        return f"Evento #{self.id} {self.tipo} cita {self.cita_id}"
+
+
+class EstadoRecordatorio(models.TextChoices):
+    PENDIENTE = 'PENDIENTE', 'Pendiente'
+    ENVIADO = 'ENVIADO', 'Enviado'
+    OMITIDO = 'OMITIDO', 'Omitido'
+    CANCELADO = 'CANCELADO', 'Cancelado'
+    FALLIDO = 'FALLIDO', 'Fallido'
+
+
+class Recordatorio(models.Model):
+    """
+    Recordatorio programado de una cita (cola ordenada por vence_en).
+    Se crea al agendar/reagendar y se cancela al cancelar o cerrar la cita
+    (ver citas/recordatorios.py). Solo se envía si la cita está CONFIRMADA al vencer.
+    """
+    cita = models.ForeignKey(Cita, on_delete=models.CASCADE, related_name='recordatorios')
+    tipo = models.CharField(max_length=10, help_text="Anticipación del recordatorio, p. ej. 24H o 2H")
+    vence_en = models.DateTimeField()
+    estado = models.CharField(max_length=20, choices=EstadoRecordatorio.choices, default=EstadoRecordatorio.PENDIENTE)
+    intentos = models.PositiveIntegerField(default=0)
+    # Reclamo por un worker: emula FOR UPDATE SKIP LOCKED con un lease que caduca
+    reclamado_por = models.CharField(max_length=32, blank=True)
+    bloqueado_hasta = models.DateTimeField(null=True, blank=True)
+    enviado_en = models.DateTimeField(null=True, blank=True)
+    ultimo_error = models.TextField(blank=True)
+    creado_en = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = "Recordatorio"
+        verbose_name_plural = "Recordatorios"
+        ordering = ['vence_en']
+        indexes = [
+            models.Index(
+                fields=['vence_en'],
+                condition=Q(estado='PENDIENTE'),
+                name='recordatorio_vencimiento_idx',
+            ),
+        ]
+
+    def __str__(self):
+        return f"Recordatorio {self.tipo} cita #{self.cita_id} ({self.estado})"
+
+
+class CitaHistorica(models.Model):
+    """
+    Archivo de citas cerradas (FINALIZADA/CANCELADA/NO_ASISTIO) antiguas.
+    `manage.py archivar_citas` las mueve aquí desde Cita conservando su id, de
+    modo que la tabla Cita solo contiene las citas vivas y las recientes.
+    Es de solo lectura: las citas archivadas ya no cambian de estado.
+    Su aporte a ResumenCita se mantiene (las estadísticas incluyen el historial).
+    """
+    id = models.BigIntegerField(primary_key=True, help_text="Mismo id que tenía en Cita")
+    mascota = models.ForeignKey(Mascota, on_delete=models.CASCADE, related_name='citas_historicas')
+    servicio = models.ForeignKey(Servicio, on_delete=models.CASCADE, related_name='citas_historicas', null=True, blank=True)
+    peluquero_id = models.IntegerField()
+    fecha = models.DateField()
+    hora_inicio = models.TimeField()
+    hora_fin = models.TimeField()
+    estado = models.CharField(max_length=20, choices=EstadoCita.choices)
+    notas = models.TextField(blank=True)
+    creada_en = models.DateTimeField()
+    actualizada_en = models.DateTimeField()
+    archivada_en = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = "Cita histórica"
+        verbose_name_plural = "Citas históricas"
+        ordering = ['-fecha', '-hora_inicio']
+        indexes = [
+            models.Index(fields=['mascota', 'fecha'], name='cita_hist_mascota_fecha_idx'),
+            models.Index(fields=['peluquero_id', 'fecha'], name='cita_hist_peluquero_fecha_idx'),
+        ]
+
+    def __str__(self):
+        return f"Cita histórica #{self.id} - Peluquero {self.peluquero_id} el {self.fecha}"
+
+
+class TokenCalendario(models.Model):
+    """
+    Secreto aleatorio del feed iCalendar de un peluquero o cliente.
+    Forma parte del valor firmado del token (ver citas/calendario.py): rotarlo
+    invalida todas las URL del feed entregadas hasta entonces.
+    """
+    tipo = models.CharField(max_length=1, help_text="'p' peluquero o 'c' cliente")
+    propietario_id = models.IntegerField(help_text="ID del peluquero o del cliente desde usuario_service")
+    secreto = models.CharField(max_length=32)
+    rotado_en = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = "Token de calendario"
+        verbose_name_plural = "Tokens de calendario"
+        constraints = [
+            models.UniqueConstraint(fields=['tipo', 'propietario_id'], name='token_calendario_propietario_unico'),
+        ]
+
+    def __str__(self):
+        return f"Token de calendario {self.tipo}{self.propietario_id}"
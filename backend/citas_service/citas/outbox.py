@@ -0,0 +1,192 @@
+"""
+Transactional outbox de cambios de citas.
+
+`registrar()` inserta los eventos dentro de la transacción que modifica las
+citas, así un evento existe si y solo si el cambio hizo commit.
+`despachar_lote()` reclama un lote de eventos pendientes con un lease
+(reclamado_por/bloqueado_hasta, como citas/recordatorios.py; FOR UPDATE SKIP
+LOCKED donde la BD lo soporta) y lo entrega a los manejadores configurados
+fuera de la transacción del reclamo. Si algún manejador falla con el lote, se
+entrega evento a evento: solo los que vuelven a fallar suman un intento y se
+reintentan en la siguiente pasada. Un despachador caído libera sus eventos
+cuando caduca el lease. La entrega es "al menos una vez" y los manejadores
+deben ser idempotentes (pueden usar evento.id para deduplicar).
+
+Manejadores: settings.CITAS_OUTBOX['MANEJADORES'], lista de rutas a funciones
+que reciben la lista de EventoOutbox del lote.
+"""
+import logging
+import time
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Count, F, Min, Q
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .models import EventoOutbox
+
+logger = logging.getLogger(__name__)
+
+CONFIG_POR_DEFECTO = {
+    'MANEJADORES': ['citas.outbox.registrar_en_log'],
+    'TAMANO_LOTE': 100,
+    'LEASE_SEGUNDOS': 60,
+    'MAX_INTENTOS': 10,
+}
+TAMANO_INSERCION = 500
+
+
+def config():
+    return {**CONFIG_POR_DEFECTO, **getattr(settings, 'CITAS_OUTBOX', {})}
+
+
+def registrar(cambios):
+    """
+    Inserta en el outbox los cambios (peluquero_id, tipo, datos) producidos por
+    citas/eventos.eventos_de_cambio(). Debe llamarse dentro de la transacción del cambio.
+    """
+    if not cambios:
+        return
+    EventoOutbox.objects.bulk_create(
+        [
+            EventoOutbox(tipo=tipo, cita_id=datos['id'], peluquero_id=peluquero_id, datos=datos)
+            for peluquero_id, tipo, datos in cambios
+        ],
+        batch_size=TAMANO_INSERCION,
+    )
+
+
+def manejadores():
+    return [import_string(ruta) for ruta in config()['MANEJADORES']]
+
+
+def registrar_en_log(eventos):
+    """Manejador local por defecto: deja constancia de cada evento en el log."""
+    for evento in eventos:
+        logger.info("outbox #%s %s cita=%s peluquero=%s", evento.id, evento.tipo, evento.cita_id, evento.peluquero_id)
+
+
+def pendientes(max_intentos=None):
+    max_intentos = max_intentos or config()['MAX_INTENTOS']
+    return EventoOutbox.objects.filter(despachado_en__isnull=True, intentos__lt=max_intentos)
+
+
+def reclamables(ahora, max_intentos=None):
+    """Pendientes sin lease vigente."""
+    return pendientes(max_intentos).filter(Q(bloqueado_hasta__isnull=True) | Q(bloqueado_hasta__lt=ahora))
+
+
+def reclamar(tamano, lease_segundos, max_intentos=None):
+    """
+    Reclama hasta `tamano` eventos pendientes en orden de id para este despachador.
+    Retorna (token, lista de EventoOutbox).
+    """
+    ahora = timezone.now()
+    token = uuid.uuid4().hex
+    with transaction.atomic():
+        candidatos = reclamables(ahora, max_intentos).order_by('id')
+        if connection.features.has_select_for_update_skip_locked:
+            candidatos = candidatos.select_for_update(skip_locked=True)
+        ids = list(candidatos.values_list('id', flat=True)[:tamano])
+        if not ids:
+            return token, []
+        # UPDATE condicional: si otro despachador se adelantó, su lease hace que la fila no coincida
+        reclamables(ahora, max_intentos).filter(id__in=ids).update(
+            reclamado_por=token, bloqueado_hasta=ahora + timedelta(seconds=lease_segundos)
+        )
+    return token, list(EventoOutbox.objects.filter(id__in=ids, reclamado_por=token).order_by('id'))
+
+
+def entregar(lote, lista_manejadores):
+    """
+    Entrega el lote a los manejadores. Si alguno falla, lo entrega evento a
+    evento para aislar los que fallan. Retorna {evento_id: excepción}.
+    """
+    try:
+        for manejador in lista_manejadores:
+            manejador(lote)
+        return {}
+    except Exception:
+        logger.exception("Fallo al despachar eventos outbox %s-%s; se entregan uno a uno", lote[0].id, lote[-1].id)
+
+    errores = {}
+    for evento in lote:
+        try:
+            for manejador in lista_manejadores:
+                manejador([evento])
+        except Exception as exc:
+            logger.exception("Fallo al despachar el evento outbox %s", evento.id)
+            errores[evento.id] = exc
+    return errores
+
+
+def despachar_lote(tamano=None, max_intentos=None):
+    """
+    Despacha un lote de eventos pendientes en orden de id.
+    Retorna (despachados, fallidos) del lote.
+    """
+    opciones = config()
+    token, lote = reclamar(tamano or opciones['TAMANO_LOTE'], opciones['LEASE_SEGUNDOS'], max_intentos)
+    if not lote:
+        return 0, 0
+
+    errores = entregar(lote, manejadores())
+    for evento_id, exc in errores.items():
+        EventoOutbox.objects.filter(id=evento_id, reclamado_por=token).update(
+            intentos=F('intentos') + 1, ultimo_error=repr(exc)[:2000], bloqueado_hasta=None
+        )
+    despachados = [evento.id for evento in lote if evento.id not in errores]
+    if despachados:
+        EventoOutbox.objects.filter(id__in=despachados, reclamado_por=token).update(
+            despachado_en=timezone.now(), intentos=F('intentos') + 1, ultimo_error='', bloqueado_hasta=None
+        )
+    return len(despachados), len(errores)
+
+
+def metricas(max_intentos=None):
+    """
+    Estado del outbox: pendientes, agotados (superaron MAX_INTENTOS), retraso del
+    evento pendiente más antiguo y eventos despachados en el último minuto.
+    """
+    max_intentos = max_intentos or config()['MAX_INTENTOS']
+    ahora = timezone.now()
+    hace_un_minuto = ahora - timedelta(minutes=1)
+    datos = EventoOutbox.objects.aggregate(
+        pendientes=Count('id', filter=Q(despachado_en__isnull=True, intentos__lt=max_intentos)),
+        agotados=Count('id', filter=Q(despachado_en__isnull=True, intentos__gte=max_intentos)),
+        mas_antiguo=Min('creado_en', filter=Q(despachado_en__isnull=True, intentos__lt=max_intentos)),
+        despachados_ultimo_minuto=Count('id', filter=Q(despachado_en__gte=hace_un_minuto)),
+    )
+    mas_antiguo = datos.pop('mas_antiguo')
+    datos['retraso_segundos'] = round((ahora - mas_antiguo).total_seconds(), 3) if mas_antiguo else 0.0
+    return datos
+
+
+def despachar(tamano=None, max_intentos=None, limite=None):
+    """
+    Drena el outbox lote a lote hasta vaciarlo (o hasta `limite` eventos).
+    Retorna un dict con totales y rendimiento (eventos/segundo).
+    """
+    inicio = time.perf_counter()
+    despachados = fallidos = lotes = 0
+    while limite is None or despachados < limite:
+        ok, error = despachar_lote(tamano, max_intentos)
+        if not ok and not error:
+            break
+        despachados += ok
+        fallidos += error
+        lotes += 1
+        if error:
+            # No insistir con el mismo lote en esta pasada
+            break
+    duracion = time.perf_counter() - inicio
+    return {
+        'despachados': despachados,
+        'fallidos': fallidos,
+        'lotes': lotes,
+        'segundos': round(duracion, 3),
+        'eventos_por_segundo': round(despachados / duracion, 1) if duracion > 0 else 0.0,
+    }
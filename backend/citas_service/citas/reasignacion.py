@@ -0,0 +1,213 @@
+"""
+Reasignación de las citas de un peluquero ausente.
+
+Dado un peluquero y un rango de fechas, cada cita PENDIENTE/CONFIRMADA suya
+se reubica, en orden cronológico:
+
+1. con otro peluquero que trabaje ese día a esa misma hora (su horario
+   efectivo, ver citas/horarios.py) y esté libre; si hay varios, el de menos
+   minutos asignados ese día por el plan;
+2. si no, en el primer hueco libre de la misma duración desde la fecha de la
+   cita y hasta HORIZONTE_DIAS días después, con cualquier peluquero (el
+   ausente solo fuera del rango de la ausencia);
+3. si tampoco, queda sin hueco y no se modifica.
+
+Horario efectivo y citas activas se cargan una sola vez (cuatro consultas) en
+una `Ocupacion` en memoria; cada asignación ocupa su franja, así el plan completo no
+hace consultas por cita ni por día. Se respetan las mismas reglas que al
+agendar: sin solape con otras citas del peluquero y una mascota no repite
+peluquero el mismo día.
+
+El plan se puede previsualizar o aplicar. Al aplicar se recalcula dentro de
+una transacción, con las citas afectadas bloqueadas; después se bloquean las
+agendas de destino y se comprueban con agenda.conflictos() (una reserva
+concurrente entre el cálculo y el bloqueo aborta la operación) y se escribe
+con bulk_update.
+"""
+from collections import Counter, defaultdict
+from datetime import timedelta
+
+from django.db import transaction
+from django.utils import timezone
+
+from . import agenda, horarios, resumenes, transiciones
+from .models import Cita, EstadoCita
+
+ESTADOS_ACTIVOS = (EstadoCita.PENDIENTE, EstadoCita.CONFIRMADA)
+HORIZONTE_DIAS = 14
+PASO_MINUTOS = 15
+
+OTRO_PELUQUERO = 'otro_peluquero'
+PRIMER_HUECO = 'primer_hueco'
+SIN_HUECO = 'sin_hueco'
+
+
+class ReasignacionConcurrente(Exception):
+    """Otra reserva ocupó una franja del plan mientras se aplicaba."""
+
+
+class Ocupacion:
+    """
+    Franjas en minutos por (peluquero, fecha): horario efectivo (horarios.efectivo()),
+    ocupación y mascotas con cita.
+    """
+
+    def __init__(self, horario, citas):
+        self.horario = horario
+        self.peluqueros = sorted({peluquero_id for peluquero_id, _ in horario})
+        self.ocupadas = defaultdict(list)
+        self.mascotas = defaultdict(set)
+        self.carga = Counter()
+        for peluquero_id, fecha, hora_inicio, hora_fin, mascota_id in citas:
+            self.ocupar(peluquero_id, fecha, horarios.minutos(hora_inicio), horarios.minutos(hora_fin), mascota_id)
+
+    def ocupar(self, peluquero_id, fecha, inicio, fin, mascota_id):
+        self.ocupadas[(peluquero_id, fecha)].append((inicio, fin))
+        self.mascotas[(peluquero_id, fecha)].add(mascota_id)
+        self.carga[(peluquero_id, fecha)] += fin - inicio
+
+    def libre(self, peluquero_id, fecha, inicio, fin, mascota_id):
+        """La franja está dentro de su horario, sin solapes y sin otra cita de la mascota ese día."""
+        clave = (peluquero_id, fecha)
+        return (
+            mascota_id not in self.mascotas[clave]
+            and horarios.contiene(self.horario.get(clave, ()), inicio, fin)
+            and not any(inicio < o_fin and o_inicio < fin for o_inicio, o_fin in self.ocupadas[clave])
+        )
+
+    def primer_hueco(self, peluquero_id, fecha, duracion, mascota_id, desde_minuto=0):
+        """Primer inicio (múltiplo de PASO_MINUTOS) libre ese día para `duracion` minutos, o None."""
+        clave = (peluquero_id, fecha)
+        if mascota_id in self.mascotas[clave]:
+            return None
+        ocupadas = sorted(self.ocupadas[clave])
+        for h_inicio, h_fin in self.horario.get(clave, ()):
+            inicio = max(h_inicio, desde_minuto)
+            inicio = -(-inicio // PASO_MINUTOS) * PASO_MINUTOS
+            while inicio + duracion <= h_fin:
+                choque = next((o_fin for o_inicio, o_fin in ocupadas if inicio < o_fin and o_inicio < inicio + duracion), None)
+                if choque is None:
+                    return inicio
+                # Saltar al final de la cita con la que choca
+                inicio = -(-choque // PASO_MINUTOS) * PASO_MINUTOS
+        return None
+
+
+def _destino(ocupacion, cita, ausente, desde, hasta, ahora):
+    """(tipo, peluquero_id, fecha, inicio, fin) para una cita afectada."""
+    inicio, fin = horarios.minutos(cita['hora_inicio']), horarios.minutos(cita['hora_fin'])
+    hoy = ahora.date()
+    futura = (cita['fecha'], inicio) > (hoy, horarios.minutos(ahora.time()))
+    candidatos = [
+        peluquero_id for peluquero_id in ocupacion.peluqueros
+        if futura and peluquero_id != ausente
+        and ocupacion.libre(peluquero_id, cita['fecha'], inicio, fin, cita['mascota_id'])
+    ]
+    if candidatos:
+        peluquero_id = min(candidatos, key=lambda p: (ocupacion.carga[(p, cita['fecha'])], p))
+        return OTRO_PELUQUERO, peluquero_id, cita['fecha'], inicio, fin
+
+    duracion = fin - inicio
+    fecha = max(cita['fecha'], hoy)
+    for _ in range(HORIZONTE_DIAS + 1):
+        desde_minuto = horarios.minutos(ahora.time()) if fecha == hoy else 0
+        huecos = []
+        for peluquero_id in ocupacion.peluqueros:
+            if peluquero_id == ausente and desde <= fecha <= hasta:
+                continue
+            hueco = ocupacion.primer_hueco(peluquero_id, fecha, duracion, cita['mascota_id'], desde_minuto)
+            if hueco is not None:
+                huecos.append((hueco, ocupacion.carga[(peluquero_id, fecha)], peluquero_id))
+        if huecos:
+            hueco, _, peluquero_id = min(huecos)
+            return PRIMER_HUECO, peluquero_id, fecha, hueco, hueco + duracion
+        fecha += timedelta(days=1)
+    return SIN_HUECO, None, None, None, None
+
+
+def _franja(peluquero_id, fecha, hora_inicio, hora_fin):
+    return {"peluquero_id": peluquero_id, "fecha": fecha, "hora_inicio": hora_inicio, "hora_fin": hora_fin}
+
+
+def planificar(peluquero_id, desde, hasta, citas=None, ahora=None):
+    """
+    Plan de reasignación de las citas activas de `peluquero_id` en [desde, hasta].
+    `citas` permite pasar las filas afectadas ya leídas (y bloqueadas).
+    Retorna una lista, en orden cronológico, de dicts con cita_id, tipo, origen y
+    destino (None si no hay hueco).
+    """
+    ahora = timezone.localtime(ahora or timezone.now())
+    if citas is None:
+        citas = list(
+            Cita.objects.filter(peluquero_id=peluquero_id, fecha__range=(desde, hasta), estado__in=ESTADOS_ACTIVOS)
+            .order_by('fecha', 'hora_inicio').values(*resumenes.CAMPOS, 'mascota_id')
+        )
+    horizonte = hasta + timedelta(days=HORIZONTE_DIAS)
+    ocupadas = (
+        Cita.objects.filter(fecha__range=(desde, horizonte), estado__in=ESTADOS_ACTIVOS)
+        .exclude(pk__in=[cita['id'] for cita in citas])
+        .values_list('peluquero_id', 'fecha', 'hora_inicio', 'hora_fin', 'mascota_id')
+    )
+    ocupacion = Ocupacion(horarios.efectivo(desde, horizonte), ocupadas)
+
+    plan = []
+    for cita in citas:
+        tipo, destino_id, fecha, inicio, fin = _destino(ocupacion, cita, peluquero_id, desde, hasta, ahora)
+        destino = None
+        if tipo != SIN_HUECO:
+            ocupacion.ocupar(destino_id, fecha, inicio, fin, cita['mascota_id'])
+            destino = _franja(destino_id, fecha, horarios.hora(inicio), horarios.hora(fin))
+        plan.append({
+            "cita_id": cita['id'],
+            "mascota_id": cita['mascota_id'],
+            "estado": cita['estado'],
+            "tipo": tipo,
+            "origen": _franja(cita['peluquero_id'], cita['fecha'], cita['hora_inicio'], cita['hora_fin']),
+            "destino": destino,
+        })
+    return plan
+
+
+def aplicar(peluquero_id, desde, hasta):
+    """
+    Recalcula el plan con las citas afectadas bloqueadas y lo aplica en una
+    transacción. Las citas sin hueco no se modifican. Retorna el plan aplicado.
+    Lanza ReasignacionConcurrente si una franja de destino se ocupó entretanto.
+    """
+    with transaction.atomic():
+        citas = list(
+            Cita.objects.filter(peluquero_id=peluquero_id, fecha__range=(desde, hasta), estado__in=ESTADOS_ACTIVOS)
+            .select_for_update().order_by('fecha', 'hora_inicio')
+        )
+        anteriores = {cita.id: {**resumenes.fila(cita), 'mascota_id': cita.mascota_id} for cita in citas}
+        plan = planificar(peluquero_id, desde, hasta, citas=list(anteriores.values()))
+
+        destinos = [paso for paso in plan if paso['destino'] is not None]
+        agenda.bloquear((paso['destino']['peluquero_id'], paso['destino']['fecha']) for paso in destinos)
+        if agenda.conflictos(
+            [{**paso['destino'], 'mascota_id': paso['mascota_id']} for paso in destinos],
+            excluir=list(anteriores),
+        ):
+            raise ReasignacionConcurrente()
+
+        ahora = timezone.now()
+        movidas = []
+        for cita, paso in zip(citas, plan):
+            if paso['destino'] is None:
+                continue
+            cita.peluquero_id = paso['destino']['peluquero_id']
+            cita.fecha = paso['destino']['fecha']
+            cita.hora_inicio = paso['destino']['hora_inicio']
+            cita.hora_fin = paso['destino']['hora_fin']
+            cita.actualizada_en = ahora
+            cita.version += 1
+            movidas.append(cita)
+        Cita.objects.bulk_update(
+            movidas, ['peluquero_id', 'fecha', 'hora_inicio', 'hora_fin', 'actualizada_en', 'version'],
+            batch_size=resumenes.TAMANO_LOTE,
+        )
+        transiciones.registrar_cambios([
+            ({campo: anteriores[cita.id][campo] for campo in resumenes.CAMPOS}, resumenes.fila(cita))
+            for cita in movidas
+        ])
+    return plan
@@ -0,0 +1,290 @@
+"""
+Recordatorios de citas (24h y 2h antes por defecto).
+
+La cola es la tabla Recordatorio, indexada por vence_en solo para las filas
+PENDIENTE, de modo que el worker lee únicamente lo que ya venció en lugar de
+recorrer las citas. `sincronizar()` mantiene la cola desde Cita.save():
+- alta o cambio de fecha/hora: se reprograman los recordatorios pendientes
+- CANCELADA / FINALIZADA / NO_ASISTIO: se cancelan los pendientes
+
+El worker (`procesar_lote`) reclama filas con FOR UPDATE SKIP LOCKED donde la
+BD lo soporta y, en SQLite, con un UPDATE condicional sobre un lease
+(reclamado_por/bloqueado_hasta): dos workers nunca envían la misma fila y un
+worker caído libera sus filas cuando caduca el lease.
+"""
+import json
+import logging
+import sys
+import time
+import uuid
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Count, F, Min, Q
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .models import Cita, EstadoCita, EstadoRecordatorio, Recordatorio
+
+logger = logging.getLogger(__name__)
+
+CONFIG_POR_DEFECTO = {
+    'BACKEND': 'citas.recordatorios.ConsolaBackend',
+    'ARCHIVO': 'recordatorios.log',
+    # tipo -> minutos de anticipación
+    'ANTICIPACIONES': {'24H': 24 * 60, '2H': 2 * 60},
+    'TAMANO_LOTE': 100,
+    'LEASE_SEGUNDOS': 60,
+    'MAX_INTENTOS': 5,
+}
+
+ESTADOS_CERRADOS = {EstadoCita.CANCELADA, EstadoCita.FINALIZADA, EstadoCita.NO_ASISTIO}
+
+
+def config():
+    return {**CONFIG_POR_DEFECTO, **getattr(settings, 'CITAS_RECORDATORIOS', {})}
+
+
+# --- Backends de entrega ---------------------------------------------------
+
+class ConsolaBackend:
+    """Escribe cada recordatorio en stdout (desarrollo local)."""
+
+    def __init__(self, **opciones):
+        self.salida = opciones.get('salida') or sys.stdout
+
+    def enviar(self, mensaje):
+        self.salida.write(
+            f"[recordatorio {mensaje['tipo']}] Cliente {mensaje['cliente_id']}: "
+            f"{mensaje['mascota']} tiene cita el {mensaje['fecha']} a las {mensaje['hora_inicio']}\n"
+        )
+
+
+class ArchivoBackend:
+    """Añade cada recordatorio como una línea JSON al archivo configurado."""
+
+    def __init__(self, **opciones):
+        self.ruta = opciones.get('ARCHIVO') or CONFIG_POR_DEFECTO['ARCHIVO']
+
+    def enviar(self, mensaje):
+        with open(self.ruta, 'a', encoding='utf-8') as archivo:
+            archivo.write(json.dumps(mensaje, default=str, ensure_ascii=False) + '\n')
+
+
+def backend():
+    opciones = config()
+    return import_string(opciones['BACKEND'])(**opciones)
+
+
+# --- Mantenimiento de la cola ----------------------------------------------
+
+def inicio_cita(fecha, hora_inicio):
+    """Fecha/hora de inicio de la cita como datetime aware en la zona del proyecto."""
+    return timezone.make_aware(datetime.combine(fecha, hora_inicio))
+
+
+def _nuevos(cita_ids_y_inicios, ahora):
+    anticipaciones = config()['ANTICIPACIONES']
+    return [
+        Recordatorio(cita_id=cita_id, tipo=tipo, vence_en=inicio - timedelta(minutes=minutos))
+        for cita_id, inicio in cita_ids_y_inicios
+        for tipo, minutos in anticipaciones.items()
+        # Un recordatorio que ya venció al agendar no se programa
+        if inicio - timedelta(minutes=minutos) > ahora
+    ]
+
+
+def sincronizar(anterior, actual):
+    """
+    Ajusta la cola para un cambio de cita (filas con resumenes.CAMPOS; None en alta/baja).
+    Debe llamarse dentro de la transacción del cambio.
+    """
+    if actual is None:
+        return  # el borrado en cascada elimina sus recordatorios
+    pendientes = Recordatorio.objects.filter(cita_id=actual['id'], estado=EstadoRecordatorio.PENDIENTE)
+
+    if actual['estado'] in ESTADOS_CERRADOS:
+        if anterior is None or anterior['estado'] not in ESTADOS_CERRADOS:
+            pendientes.update(estado=EstadoRecordatorio.CANCELADO)
+        return
+
+    movida = anterior is not None and (
+        (anterior['fecha'], anterior['hora_inicio']) != (actual['fecha'], actual['hora_inicio'])
+    )
+    reabierta = anterior is not None and anterior['estado'] in ESTADOS_CERRADOS
+    if anterior is None or movida or reabierta:
+        if anterior is not None:
+            pendientes.update(estado=EstadoRecordatorio.CANCELADO)
+        Recordatorio.objects.bulk_create(
+            _nuevos([(actual['id'], inicio_cita(actual['fecha'], actual['hora_inicio']))], timezone.now())
+        )
+
+
+def programar(filas):
+    """
+    Programa en bloque los recordatorios de citas nuevas o movidas (filas con
+    resumenes.CAMPOS). En las movidas, llamar antes a cancelar_de_citas().
+    """
+    Recordatorio.objects.bulk_create(
+        _nuevos(((datos['id'], inicio_cita(datos['fecha'], datos['hora_inicio'])) for datos in filas), timezone.now()),
+        batch_size=500,
+    )
+
+
+def cancelar_de_citas(cita_ids):
+    """Cancela en bloque los recordatorios pendientes de las citas dadas."""
+    for i in range(0, len(cita_ids), 500):
+        Recordatorio.objects.filter(
+            cita_id__in=cita_ids[i:i + 500], estado=EstadoRecordatorio.PENDIENTE
+        ).update(estado=EstadoRecordatorio.CANCELADO)
+
+
+def reconstruir(desde=None):
+    """
+    Backfill: programa recordatorios para las citas futuras PENDIENTE/CONFIRMADA
+    que no tengan ninguno pendiente. Retorna el número de recordatorios creados.
+    """
+    ahora = timezone.now()
+    desde = desde or timezone.localdate()
+    citas = (
+        Cita.objects.filter(fecha__gte=desde, estado__in=[EstadoCita.PENDIENTE, EstadoCita.CONFIRMADA])
+        .exclude(recordatorios__estado=EstadoRecordatorio.PENDIENTE)
+        .values_list('id', 'fecha', 'hora_inicio')
+    )
+    nuevos = _nuevos(
+        ((cita_id, inicio_cita(fecha, hora)) for cita_id, fecha, hora in citas.iterator(chunk_size=2000)),
+        ahora,
+    )
+    Recordatorio.objects.bulk_create(nuevos, batch_size=500)
+    return len(nuevos)
+
+
+# --- Worker ----------------------------------------------------------------
+
+def vencidos(ahora):
+    """Pendientes ya vencidos y sin lease vigente (usa el índice parcial por vence_en)."""
+    return Recordatorio.objects.filter(
+        Q(bloqueado_hasta__isnull=True) | Q(bloqueado_hasta__lt=ahora),
+        estado=EstadoRecordatorio.PENDIENTE,
+        vence_en__lte=ahora,
+    )
+
+
+def reclamar(tamano, lease_segundos, ahora=None):
+    """
+    Reclama hasta `tamano` recordatorios vencidos para este worker.
+    Retorna (token, lista de Recordatorio con la cita y mascota cargadas).
+    """
+    ahora = ahora or timezone.now()
+    token = uuid.uuid4().hex
+    with transaction.atomic():
+        candidatos = vencidos(ahora).order_by('vence_en')
+        if connection.features.has_select_for_update_skip_locked:
+            candidatos = candidatos.select_for_update(skip_locked=True)
+        ids = list(candidatos.values_list('id', flat=True)[:tamano])
+        if not ids:
+            return token, []
+        # UPDATE condicional: si otro worker se adelantó, su lease hace que la fila no coincida
+        vencidos(ahora).filter(id__in=ids).update(
+            reclamado_por=token, bloqueado_hasta=ahora + timedelta(seconds=lease_segundos)
+        )
+    reclamados = list(
+        Recordatorio.objects.filter(id__in=ids, reclamado_por=token, estado=EstadoRecordatorio.PENDIENTE)
+        .select_related('cita', 'cita__mascota')
+        .order_by('vence_en')
+    )
+    return token, reclamados
+
+
+def mensaje(recordatorio):
+    cita = recordatorio.cita
+    return {
+        'recordatorio_id': recordatorio.id,
+        'tipo': recordatorio.tipo,
+        'cita_id': cita.id,
+        'cliente_id': cita.mascota.dueno_id,
+        'mascota': cita.mascota.nombre,
+        'peluquero_id': cita.peluquero_id,
+        'fecha': cita.fecha.isoformat(),
+        'hora_inicio': cita.hora_inicio.strftime('%H:%M'),
+    }
+
+
+def procesar_lote(tamano=None, entrega=None):
+    """
+    Reclama y entrega un lote. Retorna un dict con enviados, omitidos y fallidos.
+    Los recordatorios de citas no CONFIRMADAS al vencer se omiten.
+    """
+    opciones = config()
+    entrega = entrega or backend()
+    token, lote = reclamar(tamano or opciones['TAMANO_LOTE'], opciones['LEASE_SEGUNDOS'])
+    resultado = {'reclamados': len(lote), 'enviados': 0, 'omitidos': 0, 'fallidos': 0}
+    enviados, omitidos = [], []
+
+    for recordatorio in lote:
+        if recordatorio.cita.estado != EstadoCita.CONFIRMADA:
+            omitidos.append(recordatorio.id)
+            continue
+        try:
+            entrega.enviar(mensaje(recordatorio))
+            enviados.append(recordatorio.id)
+        except Exception as exc:
+            logger.exception("Fallo al enviar recordatorio %s", recordatorio.id)
+            resultado['fallidos'] += 1
+            # Reintento con espera creciente; al agotar intentos queda FALLIDO
+            intentos = recordatorio.intentos + 1
+            Recordatorio.objects.filter(id=recordatorio.id, reclamado_por=token).update(
+                intentos=intentos,
+                ultimo_error=repr(exc)[:2000],
+                bloqueado_hasta=timezone.now() + timedelta(seconds=30 * 2 ** intentos),
+                estado=EstadoRecordatorio.FALLIDO if intentos >= opciones['MAX_INTENTOS'] else EstadoRecordatorio.PENDIENTE,
+            )
+
+    ahora = timezone.now()
+    if enviados:
+        Recordatorio.objects.filter(id__in=enviados, reclamado_por=token).update(
+            estado=EstadoRecordatorio.ENVIADO, enviado_en=ahora, intentos=F('intentos') + 1, bloqueado_hasta=None
+        )
+    if omitidos:
+        Recordatorio.objects.filter(id__in=omitidos, reclamado_por=token).update(
+            estado=EstadoRecordatorio.OMITIDO, bloqueado_hasta=None
+        )
+    resultado['enviados'] = len(enviados)
+    resultado['omitidos'] = len(omitidos)
+    return resultado
+
+
+def procesar(tamano=None, entrega=None):
+    """Procesa lotes hasta que no queden vencidos. Retorna totales y rendimiento."""
+    inicio = time.perf_counter()
+    totales = {'reclamados': 0, 'enviados': 0, 'omitidos': 0, 'fallidos': 0, 'lotes': 0}
+    entrega = entrega or backend()
+    while True:
+        resultado = procesar_lote(tamano, entrega)
+        if not resultado['reclamados']:
+            break
+        totales['lotes'] += 1
+        for clave in ('reclamados', 'enviados', 'omitidos', 'fallidos'):
+            totales[clave] += resultado[clave]
+    duracion = time.perf_counter() - inicio
+    totales['segundos'] = round(duracion, 3)
+    totales['enviados_por_segundo'] = round(totales['enviados'] / duracion, 1) if duracion > 0 else 0.0
+    return totales
+
+
+def metricas():
+    """Vencidos pendientes, retraso del más antiguo, próximos 24h y totales por estado."""
+    ahora = timezone.now()
+    datos = Recordatorio.objects.aggregate(
+        vencidos=Count('id', filter=Q(estado=EstadoRecordatorio.PENDIENTE, vence_en__lte=ahora)),
+        proximas_24h=Count('id', filter=Q(
+            estado=EstadoRecordatorio.PENDIENTE, vence_en__gt=ahora, vence_en__lte=ahora + timedelta(hours=24)
+        )),
+        mas_antiguo=Min('vence_en', filter=Q(estado=EstadoRecordatorio.PENDIENTE, vence_en__lte=ahora)),
+        enviados_ultima_hora=Count('id', filter=Q(enviado_en__gte=ahora - timedelta(hours=1))),
+        fallidos=Count('id', filter=Q(estado=EstadoRecordatorio.FALLIDO)),
+    )
+    mas_antiguo = datos.pop('mas_antiguo')
+    datos['retraso_segundos'] = round((ahora - mas_antiguo).total_seconds(), 3) if mas_antiguo else 0.0
+    return datos
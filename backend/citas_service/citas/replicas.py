@@ -0,0 +1,152 @@
+"""
+Lecturas en réplicas con read-your-writes.
+
+Las réplicas se declaran con DATABASE_REPLICA_URLS (alias replica_0, replica_1...).
+Solo se leen de una réplica las acciones marcadas en `acciones_replica` de los
+viewsets que usan LecturaEnReplicaMixin y las lecturas asíncronas (LecturaAsyncView),
+y solo si:
+
+- el método es seguro (GET/HEAD/OPTIONS),
+- no hay una transacción abierta en la BD principal (select_for_update, el
+  auto-finalizado de citas y cualquier escritura leen siempre del primario),
+- el cliente no escribió hace poco: tras cada petición de escritura se envía la
+  cookie y la cabecera X-Citas-Primario-Hasta con el instante (epoch) hasta el
+  que sus lecturas van al primario. Los clientes que no guardan cookies pueden
+  reenviar esa cabecera; X-Leer-Primario: 1 fuerza el primario en una petición.
+
+Sin réplicas configuradas el router no cambia nada.
+"""
+import random
+import time
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+SEGURAS = ('GET', 'HEAD', 'OPTIONS')
+COOKIE = 'citas_primario_hasta'
+CABECERA_RESPUESTA = 'X-Citas-Primario-Hasta'
+CABECERA_PEGADO = 'HTTP_X_CITAS_PRIMARIO_HASTA'
+CABECERA_FORZAR = 'HTTP_X_LEER_PRIMARIO'
+
+CONFIG_POR_DEFECTO = {
+    # Segundos durante los que un cliente lee del primario tras escribir
+    'PEGADO_SEGUNDOS': 5,
+}
+
+
+def config():
+    return {**CONFIG_POR_DEFECTO, **getattr(settings, 'CITAS_REPLICAS', {})}
+
+
+def alias_replicas():
+    return [alias for alias in settings.DATABASES if alias.startswith('replica')]
+
+
+class _EstadoPeticion:
+    """Decisión de enrutado de la petición en curso."""
+
+    def __init__(self, pegado):
+        self.pegado = pegado
+        self.usar_replica = False
+
+
+_estado = ContextVar('citas_replicas_estado', default=None)
+
+
+def permitir_replica(permitir=True):
+    """Marca la petición en curso como apta para leer de una réplica (si no está pegada al primario)."""
+    estado = _estado.get()
+    if estado is not None:
+        estado.usar_replica = permitir and not estado.pegado
+
+
+def _pegado(request):
+    if request.META.get(CABECERA_FORZAR) == '1':
+        return True
+    for valor in (request.COOKIES.get(COOKIE), request.META.get(CABECERA_PEGADO)):
+        try:
+            if valor and float(valor) > time.time():
+                return True
+        except ValueError:
+            continue
+    return False
+
+
+class LecturaReplicaMiddleware:
+    """
+    Abre el estado de enrutado de cada petición y fija la stickiness tras escribir.
+    Soporta sync y async para no forzar a las vistas asíncronas a pasar por un hilo.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.asincrono = iscoroutinefunction(get_response)
+        if self.asincrono:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.asincrono:
+            return self.__acall__(request)
+        token = _estado.set(_EstadoPeticion(_pegado(request)))
+        try:
+            response = self.get_response(request)
+        finally:
+            _estado.reset(token)
+        return self._pegar_tras_escritura(request, response)
+
+    async def __acall__(self, request):
+        token = _estado.set(_EstadoPeticion(_pegado(request)))
+        try:
+            response = await self.get_response(request)
+        finally:
+            _estado.reset(token)
+        return self._pegar_tras_escritura(request, response)
+
+    @staticmethod
+    def _pegar_tras_escritura(request, response):
+        if request.method not in SEGURAS and response.status_code < 500:
+            segundos = config()['PEGADO_SEGUNDOS']
+            hasta = f"{time.time() + segundos:.3f}"
+            response.set_cookie(COOKIE, hasta, max_age=segundos, httponly=True, samesite='Lax')
+            response[CABECERA_RESPUESTA] = hasta
+        return response
+
+
+class LecturaEnReplicaMixin:
+    """
+    Para viewsets DRF: las acciones listadas en `acciones_replica` leen de una
+    réplica cuando la petición lo permite.
+    """
+    acciones_replica = ('list', 'retrieve')
+
+    def initial(self, request, *args, **kwargs):
+        permitir_replica(request.method in SEGURAS and self.action in self.acciones_replica)
+        super().initial(request, *args, **kwargs)
+
+
+class ReplicaRouter:
+    """Escrituras y migraciones al primario; lecturas permitidas a una réplica al azar."""
+
+    def db_for_read(self, model, **hints):
+        estado = _estado.get()
+        if estado is None or not estado.usar_replica:
+            return DEFAULT_DB_ALIAS
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        replicas = alias_replicas()
+        return random.choice(replicas) if replicas else DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Primario y réplicas contienen los mismos datos
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == DEFAULT_DB_ALIAS
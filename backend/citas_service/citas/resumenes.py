@@ -0,0 +1,156 @@
+"""
+Mantenimiento incremental de ResumenCita.
+
+Cada cita aporta +1 (y su duración en minutos) a la fila
+(fecha, peluquero_id, servicio_id, estado) que le corresponde. En cada alta,
+transición o cambio de horario se resta de la clave anterior y se suma a la
+nueva dentro de la misma transacción que modifica la cita, de modo que las
+estadísticas nunca tienen que recorrer la tabla de citas.
+"""
+from collections import Counter
+from datetime import datetime
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F
+
+from .models import Cita, CitaHistorica, ResumenCita
+
+# Columnas de Cita necesarias para calcular la clave y la duración
+CAMPOS = ('id', 'fecha', 'peluquero_id', 'servicio_id', 'estado', 'hora_inicio', 'hora_fin')
+TAMANO_LOTE = 500
+
+
+def duracion_minutos(hora_inicio, hora_fin):
+    """Minutos entre dos horas del mismo día (0 si el rango es inválido)."""
+    inicio = datetime.combine(datetime.min, hora_inicio)
+    fin = datetime.combine(datetime.min, hora_fin)
+    return max(int((fin - inicio).total_seconds() // 60), 0)
+
+
+def fila(cita):
+    """Representa una instancia de Cita con las mismas claves que values(*CAMPOS)."""
+    return {campo: getattr(cita, campo) for campo in CAMPOS}
+
+
+def fila_actual(pk):
+    """Lee de la BD el estado vigente de una cita (None si no existe)."""
+    return Cita.objects.filter(pk=pk).values(*CAMPOS).first()
+
+
+def _clave(datos):
+    return (datos['fecha'], datos['peluquero_id'], datos['servicio_id'], datos['estado'])
+
+
+def _aportes(filas, signo):
+    """Agrupa filas de citas en {clave: (cantidad, minutos)} con el signo dado."""
+    cantidades = Counter()
+    minutos = Counter()
+    for datos in filas:
+        clave = _clave(datos)
+        cantidades[clave] += signo
+        minutos[clave] += signo * duracion_minutos(datos['hora_inicio'], datos['hora_fin'])
+    return cantidades, minutos
+
+
+def _ajustar(clave, cantidad, minutos):
+    """Suma (cantidad, minutos) a la fila de la clave, creándola si no existe."""
+    fecha, peluquero_id, servicio_id, estado = clave
+    filtro = ResumenCita.objects.filter(
+        fecha=fecha, peluquero_id=peluquero_id, servicio_id=servicio_id, estado=estado
+    )
+    if filtro.update(cantidad=F('cantidad') + cantidad, minutos=F('minutos') + minutos):
+        return
+    try:
+        with transaction.atomic():
+            ResumenCita.objects.create(
+                fecha=fecha, peluquero_id=peluquero_id, servicio_id=servicio_id,
+                estado=estado, cantidad=cantidad, minutos=minutos,
+            )
+    except IntegrityError:
+        # Otra transacción creó la fila entre el UPDATE y el INSERT
+        filtro.update(cantidad=F('cantidad') + cantidad, minutos=F('minutos') + minutos)
+
+
+def _aplicar(cantidades, minutos):
+    for clave in cantidades.keys() | minutos.keys():
+        if cantidades[clave] or minutos[clave]:
+            _ajustar(clave, cantidades[clave], minutos[clave])
+
+
+def registrar_cambio(anterior, actual):
+    """
+    Mueve el aporte de una cita de su clave anterior a la actual.
+    anterior/actual son dicts con CAMPOS (o None en altas y bajas).
+    """
+    registrar_cambios([(anterior, actual)])
+
+
+def registrar_cambios(pares):
+    """
+    Como registrar_cambio para varias citas a la vez (altas o reagendados en
+    bloque): una sola actualización por clave afectada en lugar de una por cita.
+    """
+    cantidades, minutos = Counter(), Counter()
+    for anterior, actual in pares:
+        for datos, signo in ((anterior, -1), (actual, 1)):
+            if datos is None:
+                continue
+            c, m = _aportes([datos], signo)
+            cantidades.update(c)
+            minutos.update(m)
+    _aplicar(cantidades, minutos)
+
+
+def registrar_lote(filas, estado_nuevo):
+    """Registra una transición masiva: todas las filas pasan a estado_nuevo."""
+    cantidades, minutos = _aportes(filas, -1)
+    c, m = _aportes(({**datos, 'estado': estado_nuevo} for datos in filas), 1)
+    cantidades.update(c)
+    minutos.update(m)
+    _aplicar(cantidades, minutos)
+
+
+@transaction.atomic
+def recalcular(desde=None, hasta=None):
+    """
+    Reconstruye los resúmenes a partir de las citas (backfill / corrección),
+    incluidas las archivadas en CitaHistorica.
+    Agrupa en SQL por clave y franja horaria para que la duración se calcule
+    una vez por combinación distinta y no por cita.
+    Retorna el número de filas de resumen generadas.
+    """
+    origenes = [Cita.objects.all(), CitaHistorica.objects.all()]
+    resumenes = ResumenCita.objects.all()
+    if desde:
+        origenes = [citas.filter(fecha__gte=desde) for citas in origenes]
+        resumenes = resumenes.filter(fecha__gte=desde)
+    if hasta:
+        origenes = [citas.filter(fecha__lte=hasta) for citas in origenes]
+        resumenes = resumenes.filter(fecha__lte=hasta)
+
+    cantidades = Counter()
+    minutos = Counter()
+    for citas in origenes:
+        grupos = (
+            citas.order_by()
+            .values('fecha', 'peluquero_id', 'servicio_id', 'estado', 'hora_inicio', 'hora_fin')
+            .annotate(total=Count('id'))
+        )
+        for grupo in grupos.iterator(chunk_size=2000):
+            clave = _clave(grupo)
+            cantidades[clave] += grupo['total']
+            minutos[clave] += grupo['total'] * duracion_minutos(grupo['hora_inicio'], grupo['hora_fin'])
+
+    resumenes.delete()
+    ResumenCita.objects.bulk_create(
+        (
+            ResumenCita(
+                fecha=fecha, peluquero_id=peluquero_id, servicio_id=servicio_id,
+                estado=estado, cantidad=cantidades[(fecha, peluquero_id, servicio_id, estado)],
+                minutos=minutos[(fecha, peluquero_id, servicio_id, estado)],
+            )
+            for fecha, peluquero_id, servicio_id, estado in cantidades
+        ),
+        batch_size=TAMANO_LOTE,
+    )
+    return len(cantidades)
@@ -1,8 +1,12 @@
-from rest_framework import serializers
-from .models import Cita, Horario, Mascota, EstadoCita, Servicio
 from datetime import datetime, timedelta
+
 import requests
 from django.conf import settings
+from django.db import transaction
+from rest_framework import serializers
+
+from . import agenda, horarios, huecos, metricas, transiciones
+from .models import Cita, CitaHistorica, Horario, HorarioExcepcion, Mascota, Servicio, TipoExcepcion
 
 
 class ServicioSerializer(serializers.ModelSerializer):
@@ -10,7 +14,7 @@ class ServicioSerializer(serializers.ModelSerializer):
     
     class Meta:
         model = Servicio
-        fields = ['id', 'nombre', 'descripcion', 'duracion_minutos', 'precio', 'imagen_url', 'activo', 'creado_en', 'actualizado_en']
+        fields = ['id', 'nombre', 'descripcion', 'duracion_minutos', 'margen_minutos', 'precio', 'imagen_url', 'activo', 'creado_en', 'actualizado_en']
         read_only_fields = ['creado_en', 'actualizado_en']
 
 
@@ -52,9 +56,127 @@ class HorarioSerializer(serializers.ModelSerializer):
                     "dia_semana": "El día de la semana debe estar entre 0 (Lunes) y 6 (Domingo)"
                 })
         
+        # Rechazar turnos solapados del mismo peluquero y día (contarían dos veces
+        # en la disponibilidad); los contiguos se fusionan al compilar la semana
+        # (ver citas/horarios.py)
+        datos = {
+            campo: getattr(self.instance, campo, None)
+            for campo in ('peluquero_id', 'dia_semana', 'hora_inicio', 'hora_fin', 'activo')
+        }
+        datos.update(attrs)
+        completo = None not in (datos['peluquero_id'], datos['dia_semana'], datos['hora_inicio'], datos['hora_fin'])
+        if completo and datos['activo'] is not False:
+            solapado = (
+                Horario.objects.filter(
+                    peluquero_id=datos['peluquero_id'], dia_semana=datos['dia_semana'], activo=True,
+                    hora_inicio__lt=datos['hora_fin'], hora_fin__gt=datos['hora_inicio'],
+                )
+                .exclude(pk=getattr(self.instance, 'pk', None))
+                .order_by('hora_inicio')
+                .first()
+            )
+            if solapado:
+                raise serializers.ValidationError({
+                    "hora_inicio": (
+                        f"Se solapa con el turno de {solapado.hora_inicio:%H:%M} a {solapado.hora_fin:%H:%M}"
+                    )
+                })
+        
+        return attrs
+
+
+class HorarioExcepcionSerializer(serializers.ModelSerializer):
+    """Cierres y turnos extra sobre el horario semanal (ver citas/horarios.py)."""
+
+    class Meta:
+        model = HorarioExcepcion
+        fields = ['id', 'peluquero_id', 'tipo', 'desde', 'hasta', 'hora_inicio', 'hora_fin', 'motivo', 'creada_en']
+        read_only_fields = ['creada_en']
+
+    def validate(self, attrs):
+        # En PATCH, los campos que no llegan conservan el valor guardado
+        datos = {
+            campo: getattr(self.instance, campo, None)
+            for campo in ('tipo', 'desde', 'hasta', 'hora_inicio', 'hora_fin')
+        }
+        datos.update(attrs)
+        if datos['hasta'] < datos['desde']:
+            raise serializers.ValidationError({"hasta": "La fecha de fin debe ser igual o posterior a la de inicio"})
+        if (datos['hasta'] - datos['desde']).days > 366:
+            raise serializers.ValidationError({"hasta": "El rango no puede superar un año"})
+        if (datos['hora_inicio'] is None) != (datos['hora_fin'] is None):
+            raise serializers.ValidationError(
+                {"hora_fin": "Indica hora de inicio y de fin, o ninguna para el día completo"}
+            )
+        if datos['hora_inicio'] is not None and datos['hora_inicio'] >= datos['hora_fin']:
+            raise serializers.ValidationError({"hora_fin": "La hora de fin debe ser posterior a la hora de inicio"})
+        if datos['tipo'] == TipoExcepcion.TURNO_EXTRA and datos['hora_inicio'] is None:
+            raise serializers.ValidationError({"hora_inicio": "Un turno extra necesita hora de inicio y de fin"})
         return attrs
 
 
+def validar_franja(hora_inicio, hora_fin):
+    """Reglas de la franja horaria de una cita: hora_fin posterior y duración mínima."""
+    # Validar que hora_fin > hora_inicio
+    if hora_inicio >= hora_fin:
+        raise serializers.ValidationError({
+            "hora_fin": "La hora de fin debe ser posterior a la hora de inicio"
+        })
+
+    # Validar duración mínima (30 minutos en lugar de 1 hora)
+    duracion = datetime.combine(datetime.today(), hora_fin) - datetime.combine(datetime.today(), hora_inicio)
+    if duracion < timedelta(minutes=30):
+        raise serializers.ValidationError({
+            "hora_fin": "La cita debe durar al menos 30 minutos"
+        })
+
+
+def completar_hora_fin(attrs, servicio):
+    """
+    Con servicio, hora_fin se calcula: hora_inicio más la duración y el margen
+    del servicio (ver citas/huecos.py), y la que envíe el cliente se ignora.
+    Sin servicio, hora_fin es obligatoria y se aplica validar_franja().
+    """
+    if servicio is None:
+        if attrs.get('hora_fin') is None:
+            raise serializers.ValidationError({"hora_fin": "Debe indicar hora_fin o un servicio"})
+        validar_franja(attrs['hora_inicio'], attrs['hora_fin'])
+        return
+    hora_fin = huecos.hora_fin(servicio, attrs['hora_inicio'])
+    if hora_fin is None:
+        raise serializers.ValidationError({"hora_inicio": "El servicio terminaría después de medianoche"})
+    attrs['hora_fin'] = hora_fin
+
+
+def comprobar_horario(peluquero_id, fecha, hora_inicio, hora_fin):
+    """
+    Rechaza la franja si no cabe en el horario efectivo del peluquero esa fecha:
+    la plantilla de su dia_semana con cierres y turnos extra (ver citas/horarios.py).
+    Se resuelve desde la copia local del proceso, sin consultas mientras no
+    cambien los horarios.
+    """
+    intervalos = horarios.del_dia(peluquero_id, fecha)
+    if horarios.contiene(intervalos, horarios.minutos(hora_inicio), horarios.minutos(hora_fin)):
+        return
+    metricas.conflicto('fuera_de_horario')
+    if not intervalos:
+        dia = dict(Horario._meta.get_field('dia_semana').choices)[fecha.weekday()]
+        raise serializers.ValidationError({
+            "fecha": f"El peluquero no trabaja el {dia.lower()} {fecha:%d/%m/%Y}"
+        })
+    raise serializers.ValidationError({"hora_inicio": agenda.MENSAJES['fuera_de_horario']})
+
+
+def comprobar_agenda(peluquero_id, fecha, hora_inicio, hora_fin, mascota_id, excluir=None):
+    """
+    Bloquea la agenda (peluquero, fecha) y rechaza la franja si choca con otra
+    cita activa. Debe llamarse dentro de la transacción que escribe la cita.
+    """
+    motivo = agenda.reservar(peluquero_id, fecha, hora_inicio, hora_fin, mascota_id, excluir=excluir)
+    if motivo:
+        raise serializers.ValidationError({agenda.CAMPOS[motivo]: agenda.MENSAJES[motivo]})
+
+
 class CitaSerializer(serializers.ModelSerializer):
     """Serializer base para Cita."""
     estado_display = serializers.CharField(source='get_estado_display', read_only=True)
@@ -70,15 +192,37 @@ class CitaSerializer(serializers.ModelSerializer):
         fields = [
             'id', 'mascota', 'mascota_nombre', 'servicio', 'servicio_nombre', 'cliente_id', 'peluquero_id', 'fecha', 
             'hora_inicio', 'hora_fin', 'estado', 'estado_display',
-            'notas', 'creada_en', 'actualizada_en'
+            'notas', 'serie', 'version', 'creada_en', 'actualizada_en'
         ]
-        read_only_fields = ['creada_en', 'actualizada_en']
+        read_only_fields = ['serie', 'version', 'creada_en', 'actualizada_en']
+
+
+class CitaHistoricaSerializer(serializers.ModelSerializer):
+    """Cita archivada, con la misma forma que CitaSerializer más la fecha de archivo."""
+    estado_display = serializers.CharField(source='get_estado_display', read_only=True)
+    cliente_id = serializers.IntegerField(source='mascota.dueno_id', read_only=True)
+    mascota_nombre = serializers.CharField(source='mascota.nombre', read_only=True)
+    servicio_nombre = serializers.CharField(source='servicio.nombre', read_only=True, allow_null=True)
+    archivada = serializers.BooleanField(default=True, read_only=True)
+    # Las citas archivadas ya no se gestionan por serie ni se modifican
+    serie = serializers.UUIDField(default=None, read_only=True)
+    version = serializers.IntegerField(default=None, read_only=True)
+
+    class Meta:
+        model = CitaHistorica
+        fields = [
+            'id', 'mascota', 'mascota_nombre', 'servicio', 'servicio_nombre', 'cliente_id', 'peluquero_id', 'fecha',
+            'hora_inicio', 'hora_fin', 'estado', 'estado_display',
+            'notas', 'serie', 'version', 'creada_en', 'actualizada_en', 'archivada', 'archivada_en'
+        ]
+        read_only_fields = fields
 
 
 class CitaCreateSerializer(serializers.ModelSerializer):
     """
     Serializer para crear citas con validaciones de disponibilidad.
     Valida que el peluquero exista, tenga horario disponible y que la mascota pertenezca al cliente.
+    Con servicio, hora_fin se calcula a partir de su duración (ver completar_hora_fin()).
     """
     
     class Meta:
@@ -87,6 +231,7 @@ class CitaCreateSerializer(serializers.ModelSerializer):
             'mascota', 'servicio', 'peluquero_id', 'fecha', 
             'hora_inicio', 'hora_fin', 'notas'
         ]
+        extra_kwargs = {'hora_fin': {'required': False}}
     
     def validate_mascota(self, value):
         """Validar que la mascota existe."""
@@ -134,94 +279,157 @@ class CitaCreateSerializer(serializers.ModelSerializer):
     
     def validate(self, attrs):
         """Validaciones adicionales de negocio."""
-        # Debug logging
-        import logging
-        logger = logging.getLogger(__name__)
-        logger.info(f"CitaCreateSerializer.validate() - attrs received: {attrs}")
-        
+        completar_hora_fin(attrs, attrs.get('servicio'))
         hora_inicio = attrs.get('hora_inicio')
         hora_fin = attrs.get('hora_fin')
         fecha = attrs.get('fecha')
         peluquero_id = attrs.get('peluquero_id')
-        mascota = attrs.get('mascota')
-        
-        # Validar que hora_fin > hora_inicio
-        if hora_inicio >= hora_fin:
-            raise serializers.ValidationError({
-                "hora_fin": "La hora de fin debe ser posterior a la hora de inicio"
-            })
-        
-        # Validar duración mínima (30 minutos en lugar de 1 hora)
-        duracion = datetime.combine(datetime.today(), hora_fin) - datetime.combine(datetime.today(), hora_inicio)
-        if duracion < timedelta(minutes=30):
-            raise serializers.ValidationError({
-                "hora_fin": "La cita debe durar al menos 30 minutos"
-            })
         
-        # Validar disponibilidad del peluquero en ese horario
+        # Validar que la franja esté dentro del horario del peluquero ese día
         if fecha and peluquero_id:
-            dia_nombre = fecha.strftime('%A')  # Nombre del día en inglés
-            dias_es = {
-                'Monday': 'Lunes', 'Tuesday': 'Martes', 'Wednesday': 'Miércoles',
-                'Thursday': 'Jueves', 'Friday': 'Viernes', 'Saturday': 'Sábado', 'Sunday': 'Domingo'
-            }
-            dia_es = dias_es.get(dia_nombre, dia_nombre)
-            
-            # TODO: Descomentar validación de horarios cuando estén configurados
-            # # Buscar horario del peluquero para ese día
-            # horarios = Horario.objects.filter(
-            #     peluquero_id=peluquero_id,
-            #     dia=dia_es,
-            #     activo=True
-            # )
-            # 
-            # if not horarios.exists():
-            #     raise serializers.ValidationError({
-            #         "fecha": f"El peluquero no trabaja los {dia_es}"
-            #     })
-            # 
-            # # Validar que la hora esté dentro del horario laboral
-            # horario_valido = False
-            # for horario in horarios:
-            #     if horario.hora_inicio <= hora_inicio and hora_fin <= horario.hora_fin:
-            #         horario_valido = True
-            #         break
-            # 
-            # if not horario_valido:
-            #     raise serializers.ValidationError({
-            #         "hora_inicio": "La hora solicitada no está dentro del horario laboral del peluquero"
-            #     })
-            
-            # Validar que no haya conflicto con otras citas confirmadas
-            citas_conflicto = Cita.objects.filter(
-                peluquero_id=peluquero_id,
-                fecha=fecha,
-                estado__in=[EstadoCita.PENDIENTE, EstadoCita.CONFIRMADA]
-            ).exclude(pk=self.instance.pk if self.instance else None)
+            comprobar_horario(peluquero_id, fecha, hora_inicio, hora_fin)
             
-            for cita in citas_conflicto:
-                # Verificar solapamiento de horarios
-                if not (hora_fin <= cita.hora_inicio or hora_inicio >= cita.hora_fin):
-                    raise serializers.ValidationError({
-                        "hora_inicio": "El peluquero ya tiene una cita en ese horario"
-                    })
-
-        # Regla: una misma mascota no puede tener más de una cita (pendiente o confirmada) en el MISMO horario con el MISMO peluquero
-        # Pero SÍ puede tener múltiples citas con diferentes peluqueros en el mismo día
-        if fecha and mascota and peluquero_id:
-            existe_cita_conflicto = Cita.objects.filter(
-                mascota=mascota,
-                peluquero_id=peluquero_id,
-                fecha=fecha,
-                estado__in=[EstadoCita.PENDIENTE, EstadoCita.CONFIRMADA]
-            ).exclude(pk=self.instance.pk if self.instance else None).exists()
-            if existe_cita_conflicto:
-                raise serializers.ValidationError({
-                    "fecha": f"La mascota ya tiene una cita con este peluquero para este día"
-                })
+        # Los conflictos con otras citas (solape del peluquero y la regla de una
+        # cita por mascota, peluquero y día) se comprueban en create(), dentro de
+        # la transacción que inserta la cita y con la agenda bloqueada.
         
         return attrs
 
+    def create(self, validated_data):
+        """
+        Inserta la cita con la agenda del peluquero ese día bloqueada (ver
+        citas/agenda.py): dos reservas concurrentes de la misma franja no
+        pueden pasar ambas la comprobación.
+        """
+        with transaction.atomic():
+            comprobar_agenda(
+                validated_data['peluquero_id'], validated_data['fecha'],
+                validated_data['hora_inicio'], validated_data['hora_fin'], validated_data['mascota'].id,
+            )
+            return super().create(validated_data)
+
+
+class ReagendarSerializer(serializers.Serializer):
+    """
+    Nueva fecha y franja de una cita, con las mismas reglas que al agendarla.
+    El servicio de la cita llega en el contexto ('servicio'): con servicio,
+    hora_fin se calcula.
+    """
+    fecha = serializers.DateField()
+    hora_inicio = serializers.TimeField()
+    hora_fin = serializers.TimeField(required=False)
+
+    validate_fecha = CitaCreateSerializer.validate_fecha
+
+    def validate(self, attrs):
+        completar_hora_fin(attrs, self.context.get('servicio'))
+        return attrs
+
+
+class SerieCitaSerializer(CitaCreateSerializer):
+    """
+    Datos de una serie de citas recurrentes: la primera cita más la regla de
+    repetición (cada `cada_semanas` semanas, `ocurrencias` veces).
+    Solo valida la plantilla; los conflictos de cada ocurrencia los resuelve
+    citas/series.py con una consulta por peluquero.
+    """
+    cada_semanas = serializers.IntegerField(min_value=1, max_value=12, default=4)
+    ocurrencias = serializers.IntegerField(min_value=2, max_value=52)
+    todas_o_ninguna = serializers.BooleanField(
+        default=False, help_text="Si alguna ocurrencia está en conflicto, no crear ninguna"
+    )
+
+    class Meta(CitaCreateSerializer.Meta):
+        fields = CitaCreateSerializer.Meta.fields + ['cada_semanas', 'ocurrencias', 'todas_o_ninguna']
+
+    def validate_mascota(self, value):
+        """La mascota debe ser del cliente que agenda."""
+        request = self.context.get('request')
+        if request is not None and value.dueno_id != request.user.id:
+            raise serializers.ValidationError("La mascota no pertenece al cliente")
+        return value
+
+    def validate(self, attrs):
+        completar_hora_fin(attrs, attrs.get('servicio'))
+        return attrs
+
+
+class SerieCancelarSerializer(serializers.Serializer):
+    """Citas de una serie afectadas por un cambio en bloque: las de `desde` en adelante (por defecto hoy)."""
+    desde = serializers.DateField(required=False)
+
+
+class SerieReagendarSerializer(SerieCancelarSerializer):
+    """
+    Cambio en bloque de las citas pendientes de una serie: `dias` días y/o una
+    nueva hora_inicio. La hora_fin de cada cita se calcula con su servicio
+    (ver series.reagendar()); hora_fin solo se usa para las citas sin servicio.
+    """
+    dias = serializers.IntegerField(default=0, min_value=-365, max_value=365)
+    hora_inicio = serializers.TimeField(required=False)
+    hora_fin = serializers.TimeField(required=False)
+
+    def validate(self, attrs):
+        if 'hora_fin' in attrs and 'hora_inicio' not in attrs:
+            raise serializers.ValidationError({"hora_inicio": "hora_fin requiere hora_inicio"})
+        if 'hora_fin' in attrs:
+            validar_franja(attrs['hora_inicio'], attrs['hora_fin'])
+        elif 'hora_inicio' not in attrs and not attrs['dias']:
+            raise serializers.ValidationError("Debe proporcionar dias o una nueva hora_inicio")
+        return attrs
+
+
+class TransicionSerializer(serializers.Serializer):
+    id = serializers.IntegerField(min_value=1)
+    estado = serializers.ChoiceField(choices=transiciones.ESTADOS_DESTINO)
+
+
+class EstadoLoteSerializer(serializers.Serializer):
+    """
+    Transiciones en bloque. Acepta el mismo estado para varias citas
+    ({"estado": "CONFIRMADA", "ids": [1, 2]}) o una lista de
+    {"id", "estado"} en "transiciones".
+    """
+    estado = serializers.ChoiceField(choices=transiciones.ESTADOS_DESTINO, required=False)
+    ids = serializers.ListField(
+        child=serializers.IntegerField(min_value=1), required=False, max_length=transiciones.MAX_CITAS
+    )
+    transiciones = TransicionSerializer(many=True, required=False, max_length=transiciones.MAX_CITAS)
+
+    def validate(self, attrs):
+        if 'transiciones' in attrs:
+            if 'ids' in attrs or 'estado' in attrs:
+                raise serializers.ValidationError("Use estado e ids, o transiciones, pero no ambos")
+            pares = [(transicion['id'], transicion['estado']) for transicion in attrs['transiciones']]
+        elif 'ids' in attrs and 'estado' in attrs:
+            pares = [(cita_id, attrs['estado']) for cita_id in attrs['ids']]
+        else:
+            raise serializers.ValidationError("Debe proporcionar estado e ids, o transiciones")
+        if not pares:
+            raise serializers.ValidationError("El lote está vacío")
+        return {'transiciones': pares}
+
+
+class AusenciaSerializer(serializers.Serializer):
+    """Ausencia de un peluquero: sus citas en [desde, hasta] se reasignan (ver citas/reasignacion.py)."""
+    peluquero_id = serializers.IntegerField(min_value=1)
+    desde = serializers.DateField()
+    hasta = serializers.DateField()
+    aplicar = serializers.BooleanField(default=False, help_text="false: solo previsualizar el plan")
+
+    def validate_desde(self, value):
+        from django.utils import timezone
+        if value < timezone.localdate():
+            raise serializers.ValidationError("No se pueden reasignar citas pasadas")
+        return value
+
+    def validate(self, attrs):
+        if attrs['hasta'] < attrs['desde']:
+            raise serializers.ValidationError({"hasta": "Debe ser igual o posterior a desde"})
+        if (attrs['hasta'] - attrs['desde']).days > 60:
+            raise serializers.ValidationError({"hasta": "El rango no puede superar 60 días"})
+        return attrs
+
 
 class CitaDetailSerializer(serializers.ModelSerializer):
     """
@@ -238,8 +446,9 @@ class CitaDetailSerializer(serializers.ModelSerializer):
         fields = [
             'id', 'mascota', 'mascota_info', 'servicio', 'servicio_info', 'cliente_id', 'peluquero_id', 'fecha', 
             'hora_inicio', 'hora_fin', 'estado', 'estado_display',
-            'notas', 'creada_en', 'actualizada_en', 'peluquero_info'
+            'notas', 'serie', 'version', 'creada_en', 'actualizada_en', 'peluquero_info'
         ]
+        read_only_fields = ['serie', 'version', 'creada_en', 'actualizada_en']
     
     def get_peluquero_info(self, obj):
         """Obtener info básica del peluquero desde usuario_service."""
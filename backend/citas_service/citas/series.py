@@ -0,0 +1,141 @@
+"""
+Citas recurrentes (series).
+
+Una serie repite la misma franja (mascota, peluquero, hora) cada N semanas
+durante M ocurrencias, como una RRULE FREQ=WEEKLY;INTERVAL=N;COUNT=M. Las
+citas de la serie comparten el UUID de Cita.serie, que permite cancelarlas o
+reagendarlas en bloque.
+
+En lugar de validar cada ocurrencia por separado, agenda.conflictos() lee de
+una vez las citas activas del peluquero en las fechas pedidas y aplica en
+memoria las mismas reglas que al agendar una cita; el horario efectivo de
+cada fecha se comprueba con agenda.fuera_de_horario(). Las ocurrencias aceptadas
+se insertan con bulk_create y sus efectos de Cita.save() (ResumenCita,
+recordatorios, outbox y bus de eventos) se registran en bloque en la misma
+transacción.
+"""
+import uuid
+from datetime import timedelta
+
+from django.db import transaction
+from django.utils import timezone
+
+from . import agenda, huecos, metricas, resumenes, transiciones
+from .models import Cita, EstadoCita
+
+
+def fechas(inicio, cada_semanas, ocurrencias):
+    """Fechas de la serie: `ocurrencias` fechas desde `inicio`, cada `cada_semanas` semanas."""
+    paso = timedelta(weeks=cada_semanas)
+    return [inicio + paso * i for i in range(ocurrencias)]
+
+
+def crear(mascota, peluquero_id, fecha, hora_inicio, hora_fin, cada_semanas, ocurrencias,
+          servicio=None, notas='', todas_o_ninguna=False):
+    """
+    Crea una serie. Las ocurrencias en conflicto se omiten (o, con
+    todas_o_ninguna, no se crea ninguna).
+    Retorna (serie, citas creadas, [(fecha, motivo)] rechazadas); serie es None
+    si no se creó ninguna cita.
+    """
+    franjas = [
+        {'fecha': dia, 'hora_inicio': hora_inicio, 'hora_fin': hora_fin,
+         'peluquero_id': peluquero_id, 'mascota_id': mascota.id}
+        for dia in fechas(fecha, cada_semanas, ocurrencias)
+    ]
+    with transaction.atomic():
+        agenda.bloquear((peluquero_id, franja['fecha']) for franja in franjas)
+        rechazadas = agenda.conflictos(franjas)
+        rechazadas.update(agenda.fuera_de_horario(franjas))
+        for motivo in rechazadas.values():
+            metricas.conflicto(motivo)
+        rechazadas_por_fecha = [(franjas[i]['fecha'], motivo) for i, motivo in sorted(rechazadas.items())]
+        if len(rechazadas) == len(franjas) or (todas_o_ninguna and rechazadas):
+            return None, [], rechazadas_por_fecha
+
+        serie = uuid.uuid4()
+        citas = Cita.objects.bulk_create(
+            [
+                Cita(
+                    mascota=mascota, servicio=servicio, peluquero_id=peluquero_id, fecha=franja['fecha'],
+                    hora_inicio=hora_inicio, hora_fin=hora_fin, notas=notas, serie=serie,
+                )
+                for i, franja in enumerate(franjas)
+                if i not in rechazadas
+            ],
+            batch_size=resumenes.TAMANO_LOTE,
+        )
+        transiciones.registrar_cambios([(None, resumenes.fila(cita)) for cita in citas])
+    return serie, citas, rechazadas_por_fecha
+
+
+def pendientes(serie, desde):
+    """Citas de la serie que aún se pueden modificar, desde la fecha dada."""
+    return Cita.objects.filter(serie=serie, fecha__gte=desde, estado__in=agenda.ESTADOS_ACTIVOS)
+
+
+def cancelar(serie, desde):
+    """Cancela en bloque las citas activas de la serie desde `desde`. Retorna las filas canceladas."""
+    return pendientes(serie, desde).transicionar(EstadoCita.CANCELADA, timezone.now())
+
+
+def _nueva_hora_fin(cita, hora_inicio, hora_fin):
+    """
+    hora_fin de la cita movida a hora_inicio: con servicio se calcula (ver
+    huecos.hora_fin()) y sin servicio es la indicada. Retorna (hora_fin, motivo).
+    """
+    if cita.servicio is not None:
+        fin = huecos.hora_fin(cita.servicio, hora_inicio)
+        return (fin, None) if fin is not None else (None, 'pasa_medianoche')
+    return (hora_fin, None) if hora_fin is not None else (None, 'sin_hora_fin')
+
+
+def reagendar(serie, desde, dias=0, hora_inicio=None, hora_fin=None):
+    """
+    Mueve en bloque las citas PENDIENTE de la serie desde `desde`: `dias` días
+    y/o a la nueva hora_inicio. La hora_fin de cada cita sale de su servicio;
+    `hora_fin` solo se usa para las citas sin servicio. Es todo o nada: si
+    alguna nueva franja está en conflicto no se mueve ninguna.
+    Retorna (citas movidas, [(cita_id, fecha, motivo)] rechazadas).
+    """
+    hoy = timezone.localdate()
+    with transaction.atomic():
+        citas = list(
+            pendientes(serie, desde).filter(estado=EstadoCita.PENDIENTE)
+            .select_related('mascota', 'servicio').select_for_update(of=('self',)).order_by('fecha')
+        )
+        franjas = []
+        invalidas = {}
+        for i, cita in enumerate(citas):
+            inicio, fin = cita.hora_inicio, cita.hora_fin
+            if hora_inicio is not None:
+                inicio = hora_inicio
+                fin, motivo = _nueva_hora_fin(cita, hora_inicio, hora_fin)
+                if motivo:
+                    invalidas[i] = motivo
+                    fin = cita.hora_fin
+            franjas.append({'fecha': cita.fecha + timedelta(days=dias), 'hora_inicio': inicio, 'hora_fin': fin,
+                            'peluquero_id': cita.peluquero_id, 'mascota_id': cita.mascota_id})
+        agenda.bloquear((franja['peluquero_id'], franja['fecha']) for franja in franjas)
+        rechazadas = agenda.conflictos(franjas, excluir=[cita.id for cita in citas])
+        rechazadas.update(agenda.fuera_de_horario(franjas))
+        rechazadas.update({i: 'fecha_pasada' for i, franja in enumerate(franjas) if franja['fecha'] < hoy})
+        rechazadas.update(invalidas)
+        if rechazadas:
+            for motivo in rechazadas.values():
+                metricas.conflicto(motivo)
+            return [], [(citas[i].id, franjas[i]['fecha'], motivo) for i, motivo in sorted(rechazadas.items())]
+
+        ahora = timezone.now()
+        anteriores = [resumenes.fila(cita) for cita in citas]
+        for cita, franja in zip(citas, franjas):
+            cita.fecha = franja['fecha']
+            cita.hora_inicio = franja['hora_inicio']
+            cita.hora_fin = franja['hora_fin']
+            cita.actualizada_en = ahora
+            cita.version += 1
+        Cita.objects.bulk_update(
+            citas, ['fecha', 'hora_inicio', 'hora_fin', 'actualizada_en', 'version'], batch_size=resumenes.TAMANO_LOTE
+        )
+        transiciones.registrar_cambios([(anterior, resumenes.fila(cita)) for anterior, cita in zip(anteriores, citas)])
+    return citas, []
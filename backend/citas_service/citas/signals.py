@@ -0,0 +1,52 @@
+"""
+Señales de los modelos Cita y Horario.
+Los borrados de citas (incluidos los que llegan en cascada al eliminar una Mascota o un
+Servicio) no pasan por Cita.delete(), por eso aquí se resta su aporte a
+ResumenCita, se escribe el evento en el outbox y se publica en el bus de eventos.
+Los borrados del archivado (citas/archivo.py) no son bajas y se ignoran.
+Los cambios de Horario recompilan la semana del peluquero (HorarioCompilado)
+en la misma transacción e invalidan su copia en caché (ver citas/horarios.py);
+los de HorarioExcepcion, las excepciones vigentes que guarda cada proceso.
+"""
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from . import archivo, eventos, horarios, outbox, resumenes
+from .models import Cita, Horario, HorarioExcepcion
+
+
+@receiver(post_delete, sender=Cita)
+def cita_eliminada(sender, instance, **kwargs):
+    if archivo.archivando():
+        return
+    anterior = resumenes.fila(instance)
+    resumenes.registrar_cambio(anterior, None)
+    cambios = eventos.eventos_de_cambio(anterior, None)
+    outbox.registrar(cambios)
+    eventos.publicar_al_confirmar(cambios)
+
+
+@receiver(pre_save, sender=Horario)
+def horario_por_guardar(sender, instance, **kwargs):
+    # Si el horario cambia de peluquero, también hay que recompilar la semana del anterior
+    instance._peluquero_anterior = (
+        None if instance._state.adding
+        else Horario.objects.filter(pk=instance.pk).values_list('peluquero_id', flat=True).first()
+    )
+
+
+@receiver(post_save, sender=Horario)
+@receiver(post_delete, sender=Horario)
+def horario_cambiado(sender, instance, **kwargs):
+    peluqueros = {instance.peluquero_id, getattr(instance, '_peluquero_anterior', None)} - {None}
+    horarios.recompilar(*peluqueros)
+    # Otra vez al confirmar: otro proceso pudo cachear la semana anterior mientras tanto
+    transaction.on_commit(lambda: horarios.invalidar(*peluqueros))
+
+
+@receiver(post_save, sender=HorarioExcepcion)
+@receiver(post_delete, sender=HorarioExcepcion)
+def excepcion_cambiada(sender, instance, **kwargs):
+    horarios.invalidar()
+    transaction.on_commit(horarios.invalidar)
@@ -1,3 +1,1816 @@
-from django.test import TestCase
+import json
+import logging
+import os
+import queue
+import re
+import sys
+import threading
+import uuid
+from datetime import date, time as dt_time, timedelta
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from django.core import signing
+from django.core.cache import caches
+from django.core.management import CommandError, call_command
+from django.db import connection, connections, router, transaction
+from django.test import Client, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from prometheus_client import REGISTRY
+from prometheus_client.parser import text_string_to_metric_families
+from rest_framework_simplejwt.tokens import AccessToken
+
+from comun import bitacora, regresion_consultas, rendimiento, trazas
+from comun.regresion_consultas import Caso
+
+from . import analitica, calendario, checks, eventos, horarios, huecos, outbox, recordatorios, replicas, resumenes, transiciones, urls
+from .models import (
+    Cita, CitaHistorica, CitaModificada, EstadoCita, EstadoRecordatorio, EventoOutbox, Horario, HorarioCompilado, HorarioExcepcion,
+    Mascota, Recordatorio, ResumenCita, Servicio,
+)
+
+CLIENTE_ID = 7001
+PELUQUERO_ID = 7101
+ADMIN_ID = 7201
+
+
+def _autorizacion(usuario_id, rol):
+    token = AccessToken()
+    token['user_id'] = usuario_id
+    token['rol'] = rol
+    return {'Authorization': f'Bearer {token}'}
+
+
+def _cliente():
+    return _autorizacion(CLIENTE_ID, 'CLIENTE')
+
+
+def _peluquero():
+    return _autorizacion(PELUQUERO_ID, 'PELUQUERO')
+
+
+def _admin():
+    return _autorizacion(ADMIN_ID, 'ADMIN')
+
+
+def _fecha():
+    return date.today() + timedelta(days=7)
+
+
+def _servicios(n):
+    return Servicio.objects.bulk_create(
+        Servicio(nombre=f'Servicio {i}', duracion_minutos=30, precio=10 + i) for i in range(n)
+    )
+
+
+def _mascotas(n, dueno_id=CLIENTE_ID):
+    return Mascota.objects.bulk_create(
+        Mascota(dueno_id=dueno_id, nombre=f'Mascota {i}', raza='Mestizo', edad=3) for i in range(n)
+    )
+
+
+def _citas(n, estado=EstadoCita.PENDIENTE):
+    """n citas del cliente con el peluquero el mismo día, cada una con su mascota y su servicio (06:00, cada 15 min)."""
+    mascotas = _mascotas(n)
+    servicios = _servicios(n)
+    citas = Cita.objects.bulk_create(
+        Cita(
+            mascota=mascota, servicio=servicio, peluquero_id=PELUQUERO_ID, fecha=_fecha(),
+            hora_inicio=dt_time(6 + i // 4, i % 4 * 15), hora_fin=dt_time(6 + (i + 1) // 4, (i + 1) % 4 * 15),
+            estado=estado,
+        )
+        for i, (mascota, servicio) in enumerate(zip(mascotas, servicios))
+    )
+    resumenes.recalcular()
+    return citas
+
+
+def _horarios(n):
+    creados = Horario.objects.bulk_create(
+        Horario(peluquero_id=PELUQUERO_ID + i % 3, dia_semana=i % 7, hora_inicio=dt_time(9, 0), hora_fin=dt_time(13, 0))
+        for i in range(n)
+    )
+    horarios.recompilar(*{horario.peluquero_id for horario in creados})
+    return creados
+
+
+def _jornada(peluquero_id=PELUQUERO_ID):
+    """Horario de 06:00 a 21:00 todos los días: cubre las franjas de las citas de prueba."""
+    creados = Horario.objects.bulk_create(
+        Horario(peluquero_id=peluquero_id, dia_semana=dia, hora_inicio=dt_time(6, 0), hora_fin=dt_time(21, 0))
+        for dia in range(7)
+    )
+    horarios.recompilar(peluquero_id)
+    return creados
+
+
+def _excepciones(n):
+    """n cierres de un día, uno por semana desde _fecha(), alternando entre el peluquero y todo el local."""
+    creadas = HorarioExcepcion.objects.bulk_create(
+        HorarioExcepcion(peluquero_id=PELUQUERO_ID if i % 2 else None, desde=_fecha() + timedelta(weeks=i),
+                         hasta=_fecha() + timedelta(weeks=i))
+        for i in range(n)
+    )
+    horarios.invalidar()
+    return creadas
+
+
+def _accion(nombre, **datos):
+    """POST a una acción de detalle sobre la primera de n citas pendientes, como el peluquero."""
+    def preparar(test, n):
+        cita = _citas(n)[0]
+        return {'path': reverse(f'cita-{nombre}', args=[cita.id]), 'cabeceras': _peluquero(), 'datos': datos}
+    return preparar
+
+
+# Las operaciones en bloque (series, estado-lote) actualizan una fila de ResumenCita por
+# fecha o servicio afectado: su tamaño es fijo y lo que crece con n es el resto de la agenda
+LOTE = 4
+
+
+def _serie(n):
+    """Serie semanal de LOTE citas pendientes de la mascota de la primera de n citas."""
+    citas = _citas(n)
+    serie = uuid.uuid4()
+    Cita.objects.bulk_create(
+        Cita(mascota=citas[0].mascota, peluquero_id=PELUQUERO_ID, fecha=_fecha() + timedelta(weeks=i),
+             hora_inicio=dt_time(18, 0), hora_fin=dt_time(18, 30), serie=serie)
+        for i in range(1, LOTE + 1)
+    )
+    resumenes.recalcular()
+    return serie
+
+
+class ConsultasPorEndpointTest(regresion_consultas.RegresionConsultasTestCase):
+    """El número de consultas de cada ruta de citas/urls.py no crece con los datos (ver regresion_consultas)."""
+
+    urlpatterns = urls.urlpatterns
+    archivo_base = os.path.join(os.path.dirname(__file__), 'consultas_base.json')
+    excluidas = {
+        'cita-eventos': 'stream SSE abierto indefinidamente; sus consultas son por evento, no por petición',
+    }
+    casos = [
+        Caso('api-root GET', 'api-root', lambda test, n: {'path': reverse('api-root')}),
+        Caso('servicios GET anónimo', 'servicio-lista-async',
+             lambda test, n: _servicios(n) and {'path': reverse('servicio-lista-async')}),
+        Caso('servicios POST admin', 'servicio-list',
+             lambda test, n: _servicios(n) and {
+                 'path': reverse('servicio-list'), 'cabeceras': _admin(),
+                 'datos': {'nombre': 'Nuevo', 'duracion_minutos': 30, 'precio': '12.00'},
+             }, metodo='post', estado=201),
+        Caso('servicio-detail GET anónimo', 'servicio-detail',
+             lambda test, n: {'path': reverse('servicio-detail', args=[_servicios(n)[0].id])}),
+        Caso('mascota-list GET cliente', 'mascota-list',
+             lambda test, n: _mascotas(n) and {'path': reverse('mascota-list'), 'cabeceras': _cliente()}),
+        Caso('mascota-list POST cliente', 'mascota-list',
+             lambda test, n: _mascotas(n) and {
+                 'path': reverse('mascota-list'), 'cabeceras': _cliente(),
+                 'datos': {'nombre': 'Nueva', 'raza': 'Caniche', 'edad': 2},
+             }, metodo='post', estado=201),
+        Caso('mascota-detail GET cliente', 'mascota-detail',
+             lambda test, n: {'path': reverse('mascota-detail', args=[_mascotas(n)[0].id]), 'cabeceras': _cliente()}),
+        Caso('horario-list GET cliente', 'horario-list',
+             lambda test, n: _horarios(n) and {'path': reverse('horario-list'), 'cabeceras': _cliente()}),
+        Caso('horario-list POST admin', 'horario-list',
+             lambda test, n: _horarios(n) and {
+                 'path': reverse('horario-list'), 'cabeceras': _admin(),
+                 'datos': {'peluquero_id': PELUQUERO_ID, 'dia_semana': 0, 'hora_inicio': '15:00', 'hora_fin': '19:00'},
+             }, metodo='post', estado=201),
+        Caso('horario-detail GET cliente', 'horario-detail',
+             lambda test, n: {'path': reverse('horario-detail', args=[_horarios(n)[0].id]), 'cabeceras': _cliente()}),
+        Caso('horario-excepcion-list GET cliente', 'horario-excepcion-list',
+             lambda test, n: _excepciones(n) and {
+                 'path': f"{reverse('horario-excepcion-list')}?peluquero_id={PELUQUERO_ID}", 'cabeceras': _cliente(),
+             }),
+        Caso('horario-excepcion-list POST admin', 'horario-excepcion-list',
+             lambda test, n: _excepciones(n) and {
+                 'path': reverse('horario-excepcion-list'), 'cabeceras': _admin(),
+                 'datos': {'peluquero_id': PELUQUERO_ID, 'desde': _fecha().isoformat(), 'hasta': _fecha().isoformat(),
+                           'motivo': 'Vacaciones'},
+             }, metodo='post', estado=201),
+        Caso('horario-excepcion-detail GET cliente', 'horario-excepcion-detail',
+             lambda test, n: {'path': reverse('horario-excepcion-detail', args=[_excepciones(n)[0].id]),
+                              'cabeceras': _cliente()}),
+        Caso('cita-list GET cliente', 'cita-list',
+             lambda test, n: _citas(n) and {'path': reverse('cita-list'), 'cabeceras': _cliente()}),
+        Caso('cita-list GET peluquero', 'cita-list',
+             lambda test, n: _citas(n) and {'path': reverse('cita-list'), 'cabeceras': _peluquero()}),
+        Caso('cita-list POST cliente', 'cita-list',
+             lambda test, n: {
+                 'path': reverse('cita-list'), 'cabeceras': _cliente(),
+                 'datos': {
+                     'mascota': _citas(n) and _jornada() and _mascotas(1)[0].id, 'peluquero_id': PELUQUERO_ID,
+                     'fecha': _fecha().isoformat(), 'hora_inicio': '20:00', 'hora_fin': '20:30',
+                 },
+             }, metodo='post', estado=201),
+        Caso('cita-detail GET cliente', 'cita-detail',
+             lambda test, n: {'path': reverse('cita-detail', args=[_citas(n)[0].id]), 'cabeceras': _cliente()}),
+        Caso('cita-detail PATCH admin', 'cita-detail',
+             lambda test, n: {
+                 'path': reverse('cita-detail', args=[_citas(n)[0].id]), 'cabeceras': _admin(),
+                 'datos': {'notas': 'Traer correa'},
+             }, metodo='patch'),
+        Caso('cita-detail DELETE admin', 'cita-detail',
+             lambda test, n: {'path': reverse('cita-detail', args=[_citas(n)[0].id]), 'cabeceras': _admin()},
+             metodo='delete', estado=204),
+        Caso('cita-cancelar POST peluquero', 'cita-cancelar', _accion('cancelar'), metodo='post'),
+        Caso('cita-confirmar POST peluquero', 'cita-confirmar', _accion('confirmar'), metodo='post'),
+        Caso('cita-marcar-no-asistio POST peluquero', 'cita-marcar-no-asistio', _accion('marcar-no-asistio'),
+             metodo='post'),
+        # La cita es futura: la regla de negocio la rechaza, pero se mide igual la ruta completa
+        Caso('cita-finalizar POST peluquero', 'cita-finalizar', _accion('finalizar'), metodo='post', estado=400),
+        Caso('cita-cambiar-estado POST peluquero', 'cita-cambiar-estado',
+             _accion('cambiar-estado', estado='CONFIRMADA'), metodo='post'),
+        Caso('cita-reagendar POST cliente', 'cita-reagendar',
+             lambda test, n: {
+                 'path': reverse('cita-reagendar', args=[_citas(n)[0].id]), 'cabeceras': _jornada() and _cliente(),
+                 'datos': {'fecha': (_fecha() + timedelta(days=1)).isoformat(), 'hora_inicio': '10:00', 'hora_fin': '10:30'},
+             }, metodo='post'),
+        Caso('cita-estado-lote POST peluquero', 'cita-estado-lote',
+             lambda test, n: {
+                 'path': reverse('cita-estado-lote'), 'cabeceras': _peluquero(),
+                 'datos': {'estado': 'CONFIRMADA', 'ids': [cita.id for cita in _citas(n)[:LOTE]]},
+             }, metodo='post'),
+        Caso('cita-ausencia POST admin vista previa', 'cita-ausencia',
+             lambda test, n: _citas(n) and _horarios(n) and _excepciones(n) and {
+                 'path': reverse('cita-ausencia'), 'cabeceras': _admin(),
+                 'datos': {'peluquero_id': PELUQUERO_ID, 'desde': _fecha().isoformat(), 'hasta': _fecha().isoformat()},
+             }, metodo='post'),
+        Caso('cita-crear-serie POST cliente', 'cita-crear-serie',
+             lambda test, n: {
+                 'path': reverse('cita-crear-serie'), 'cabeceras': _cliente(),
+                 'datos': {
+                     'mascota': _citas(n) and _jornada() and _mascotas(1)[0].id, 'peluquero_id': PELUQUERO_ID,
+                     'fecha': _fecha().isoformat(), 'hora_inicio': '20:00', 'hora_fin': '20:30',
+                     'cada_semanas': 1, 'ocurrencias': LOTE,
+                 },
+             }, metodo='post', estado=201),
+        Caso('cita-cancelar-serie POST peluquero', 'cita-cancelar-serie',
+             lambda test, n: {
+                 'path': reverse('cita-cancelar-serie', args=[_serie(n)]), 'cabeceras': _peluquero(), 'datos': {},
+             }, metodo='post'),
+        Caso('cita-reagendar-serie POST cliente', 'cita-reagendar-serie',
+             lambda test, n: {
+                 'path': reverse('cita-reagendar-serie', args=[_serie(n)]), 'cabeceras': _jornada() and _cliente(),
+                 'datos': {'hora_inicio': '19:00', 'hora_fin': '19:30'},
+             }, metodo='post'),
+        Caso('cita-feed-calendario GET cliente', 'cita-feed-calendario',
+             lambda test, n: _citas(n) and {'path': reverse('cita-feed-calendario'), 'cabeceras': _cliente()}),
+        Caso('cita-rotar-calendario POST cliente', 'cita-rotar-calendario',
+             lambda test, n: _citas(n) and {'path': reverse('cita-rotar-calendario'), 'cabeceras': _cliente()},
+             metodo='post'),
+        Caso('cita-mis-citas GET cliente', 'cita-mis-citas',
+             lambda test, n: _citas(n) and {'path': reverse('cita-mis-citas'), 'cabeceras': _cliente()}),
+        Caso('cita-mis-citas GET peluquero historial', 'cita-mis-citas',
+             lambda test, n: _citas(n) and {'path': reverse('cita-mis-citas') + '?historial=true', 'cabeceras': _peluquero()}),
+        Caso('cita-citas-del-dia GET peluquero', 'cita-citas-del-dia',
+             lambda test, n: _citas(n) and {
+                 'path': f"{reverse('cita-citas-del-dia')}?fecha={_fecha().isoformat()}", 'cabeceras': _peluquero(),
+             }),
+        Caso('cita-disponibilidad GET cliente', 'cita-disponibilidad',
+             lambda test, n: _citas(n) and _horarios(n) and _excepciones(n) and {
+                 'path': f"{reverse('cita-disponibilidad')}?peluquero_id={PELUQUERO_ID}&fecha={_fecha().isoformat()}",
+                 'cabeceras': _cliente(),
+             }),
+        Caso('cita-disponibilidad GET cliente huecos compactos', 'cita-disponibilidad',
+             lambda test, n: _jornada() and {
+                 'path': f"{reverse('cita-disponibilidad')}?peluquero_id={PELUQUERO_ID}&fecha={_fecha().isoformat()}"
+                         f"&servicio_id={_citas(n)[0].servicio_id}&modo=compacto",
+                 'cabeceras': _cliente(),
+             }),
+        Caso('calendario-feed GET cliente', 'calendario-feed',
+             lambda test, n: _citas(n) and {
+                 'path': reverse('calendario-feed', args=[calendario.generar_token(calendario.TIPO_CLIENTE, CLIENTE_ID)]),
+             }),
+        Caso('estadisticas GET admin', 'estadisticas',
+             lambda test, n: _citas(n) and {'path': reverse('estadisticas'), 'cabeceras': _admin()}),
+        Caso('analitica-ocupacion GET admin', 'analitica-ocupacion',
+             lambda test, n: _citas(n) and _horarios(n) and {
+                 'path': f"{reverse('analitica-ocupacion')}?hasta={(_fecha() + timedelta(days=1)).isoformat()}",
+                 'cabeceras': _admin(),
+             }),
+    ]
+
+
+def _en_paralelo(peticiones):
+    """Lanza cada petición (función que recibe un Client) en su hilo a la vez. Retorna los códigos HTTP."""
+    barrera = threading.Barrier(len(peticiones))
+    estados = [None] * len(peticiones)
+
+    def ejecutar(indice, peticion):
+        try:
+            cliente = Client()
+            barrera.wait()
+            estados[indice] = peticion(cliente).status_code
+        finally:
+            connection.close()
+
+    hilos = [threading.Thread(target=ejecutar, args=(i, peticion)) for i, peticion in enumerate(peticiones)]
+    for hilo in hilos:
+        hilo.start()
+    for hilo in hilos:
+        hilo.join()
+    return estados
+
+
+class ReagendarConcurrenteTest(TransactionTestCase):
+    """Reagendados y reservas simultáneos hacia la misma franja: solo uno puede ocuparla."""
+
+    HILOS = 8
+    FRANJA = {'hora_inicio': '18:00', 'hora_fin': '18:30'}
+
+    def setUp(self):
+        _jornada()
+
+    def _citas(self):
+        return [
+            Cita.objects.create(
+                mascota=mascota, peluquero_id=PELUQUERO_ID, fecha=_fecha(),
+                hora_inicio=dt_time(8 + i), hora_fin=dt_time(8 + i, 30),
+            )
+            for i, mascota in enumerate(_mascotas(self.HILOS))
+        ]
+
+    def _reagendar(self, cita):
+        return lambda cliente: cliente.post(
+            reverse('cita-reagendar', args=[cita.id]), {'fecha': _fecha().isoformat(), **self.FRANJA},
+            content_type='application/json', headers=_cliente(),
+        )
+
+    def _en_franja(self):
+        return Cita.objects.filter(fecha=_fecha(), hora_inicio=dt_time(18, 0))
+
+    def test_reagendados_concurrentes_a_la_misma_franja(self):
+        estados = _en_paralelo([self._reagendar(cita) for cita in self._citas()])
+
+        self.assertEqual(sorted(estados), [200] + [400] * (self.HILOS - 1))
+        self.assertEqual(self._en_franja().count(), 1)
+        # Las rechazadas no se movieron
+        self.assertEqual(Cita.objects.filter(hora_inicio__lt=dt_time(18, 0)).count(), self.HILOS - 1)
+
+    def test_reserva_y_reagendados_concurrentes_a_la_misma_franja(self):
+        mascota = _mascotas(1)[0]
+
+        def reservar(cliente):
+            return cliente.post(
+                reverse('cita-list'),
+                {'mascota': mascota.id, 'peluquero_id': PELUQUERO_ID, 'fecha': _fecha().isoformat(), **self.FRANJA},
+                content_type='application/json', headers=_cliente(),
+            )
+
+        estados = _en_paralelo([reservar] + [self._reagendar(cita) for cita in self._citas()[1:]])
+
+        self.assertEqual(len([estado for estado in estados if estado in (200, 201)]), 1)
+        self.assertEqual(estados.count(400), self.HILOS - 1)
+        self.assertEqual(self._en_franja().count(), 1)
+
+
+def _cambiar_estado(cita, estado, cabeceras, **extra):
+    return {'path': reverse('cita-cambiar-estado', args=[cita.id]), 'data': {'estado': estado},
+            'content_type': 'application/json', 'headers': {**cabeceras, **extra}}
+
+
+class VersionCitaTest(TestCase):
+    """Pérdida de actualizaciones: una escritura sobre una versión obsoleta de la cita no pisa a otra."""
+
+    def setUp(self):
+        _jornada()
+        self.cita = _citas(1)[0]
+
+    def _reagendar(self, cabeceras, **extra):
+        return self.client.post(
+            reverse('cita-reagendar', args=[self.cita.id]),
+            {'fecha': _fecha().isoformat(), 'hora_inicio': '18:00', 'hora_fin': '18:30'},
+            content_type='application/json', headers={**cabeceras, **extra},
+        )
+
+    def test_detalle_devuelve_etag_con_la_version(self):
+        respuesta = self.client.get(reverse('cita-detail', args=[self.cita.id]), headers=_cliente())
+
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertEqual(respuesta['ETag'], '"1"')
+        self.assertEqual(respuesta.json()['version'], 1)
+
+    def test_if_match_obsoleto_no_pisa_el_reagendado(self):
+        # Cliente y tablet del peluquero leyeron la versión 1
+        reagendado = self._reagendar(_cliente(), **{'If-Match': '"1"'})
+        cancelado = self.client.post(**_cambiar_estado(self.cita, 'CANCELADA', _peluquero(), **{'If-Match': '"1"'}))
+
+        self.assertEqual(reagendado.status_code, 200)
+        self.assertEqual(reagendado['ETag'], '"2"')
+        self.assertEqual(cancelado.status_code, 412)
+        self.cita.refresh_from_db()
+        self.assertEqual((self.cita.estado, self.cita.hora_inicio, self.cita.version),
+                         (EstadoCita.PENDIENTE, dt_time(18, 0), 2))
+
+    def test_if_match_vigente_o_comodin(self):
+        confirmada = self.client.post(**_cambiar_estado(self.cita, 'CONFIRMADA', _peluquero(), **{'If-Match': '"1"'}))
+        cancelada = self.client.post(**_cambiar_estado(self.cita, 'CANCELADA', _peluquero(), **{'If-Match': '*'}))
+
+        self.assertEqual((confirmada.status_code, cancelada.status_code), (200, 200))
+        self.assertEqual(cancelada['ETag'], '"3"')
+
+    def test_cambio_en_bloque_invalida_el_etag(self):
+        self.client.post(reverse('cita-estado-lote'), {'estado': 'CONFIRMADA', 'ids': [self.cita.id]},
+                         content_type='application/json', headers=_peluquero())
+
+        respuesta = self._reagendar(_cliente(), **{'If-Match': '"1"'})
+
+        self.assertEqual(respuesta.status_code, 412)
+        self.assertEqual(Cita.objects.get(pk=self.cita.pk).version, 2)
+
+    def test_guardado_sobre_una_instancia_obsoleta(self):
+        tablet = Cita.objects.get(pk=self.cita.pk)
+        panel = Cita.objects.get(pk=self.cita.pk)
+        panel.hora_inicio, panel.hora_fin = dt_time(18, 0), dt_time(18, 30)
+        panel.save()
+
+        with self.assertRaises(CitaModificada):
+            tablet.cancelar()
+
+        tablet.refresh_from_db()
+        self.assertEqual((tablet.estado, tablet.hora_inicio, tablet.version), (EstadoCita.PENDIENTE, dt_time(18, 0), 2))
+
+    @override_settings(CITAS_CONCURRENCIA={'IF_MATCH_OBLIGATORIO': True})
+    def test_if_match_obligatorio(self):
+        sin_cabecera = self.client.post(**_cambiar_estado(self.cita, 'CONFIRMADA', _peluquero()))
+        con_cabecera = self.client.post(**_cambiar_estado(self.cita, 'CONFIRMADA', _peluquero(), **{'If-Match': '"1"'}))
+
+        self.assertEqual((sin_cabecera.status_code, con_cabecera.status_code), (428, 200))
+
+
+class VersionCitaConcurrenteTest(TransactionTestCase):
+    """Escrituras simultáneas sobre la misma versión de una cita: solo una se aplica."""
+
+    HILOS = 8
+
+    def test_modificaciones_concurrentes_con_el_mismo_if_match(self):
+        _jornada()
+        cita = _citas(1)[0]
+
+        def reagendar(cliente, hora):
+            return cliente.post(
+                reverse('cita-reagendar', args=[cita.id]),
+                {'fecha': _fecha().isoformat(), 'hora_inicio': f'{hora}:00', 'hora_fin': f'{hora}:30'},
+                content_type='application/json', headers={**_cliente(), 'If-Match': '"1"'},
+            )
+
+        def cancelar(cliente):
+            return cliente.post(**_cambiar_estado(cita, 'CANCELADA', _peluquero(), **{'If-Match': '"1"'}))
+
+        estados = _en_paralelo([
+            cancelar if i % 2 else (lambda cliente, hora=10 + i: reagendar(cliente, hora))
+            for i in range(self.HILOS)
+        ])
+
+        self.assertEqual(sorted(estados), [200] + [412] * (self.HILOS - 1))
+        self.assertEqual(Cita.objects.get(pk=cita.pk).version, 2)
+
+
+class HorarioReservaTest(TestCase):
+    """Al agendar, la franja debe caber en el horario efectivo del peluquero ese día."""
+
+    def setUp(self):
+        Horario.objects.create(peluquero_id=PELUQUERO_ID, dia_semana=_fecha().weekday(),
+                               hora_inicio=dt_time(9, 0), hora_fin=dt_time(13, 0))
+        self.mascotas = _mascotas(2)
+
+    def _reservar(self, hora_inicio, hora_fin, fecha=None, mascota=0):
+        return self.client.post(
+            reverse('cita-list'),
+            {'mascota': self.mascotas[mascota].id, 'peluquero_id': PELUQUERO_ID,
+             'fecha': (fecha or _fecha()).isoformat(), 'hora_inicio': hora_inicio, 'hora_fin': hora_fin},
+            content_type='application/json', headers=_cliente(),
+        )
+
+    def test_rechaza_franjas_fuera_del_horario(self):
+        fuera = self._reservar('12:30', '13:30')
+        otro_dia = self._reservar('10:00', '10:30', fecha=_fecha() + timedelta(days=1))
+        HorarioExcepcion.objects.create(peluquero_id=PELUQUERO_ID, desde=_fecha(), hasta=_fecha())
+        cerrado = self._reservar('10:00', '10:30')
+
+        self.assertEqual(fuera.status_code, 400)
+        self.assertIn('hora_inicio', fuera.json())
+        self.assertEqual((otro_dia.status_code, cerrado.status_code), (400, 400))
+        self.assertIn('fecha', cerrado.json())
+        self.assertFalse(Cita.objects.exists())
+
+    def test_horario_en_memoria_tras_la_primera_reserva(self):
+        self.assertEqual(self._reservar('09:00', '09:30').status_code, 201)
+
+        with self.assertNumQueries(0):
+            self.assertEqual(horarios.del_dia(PELUQUERO_ID, _fecha()), ((9 * 60, 13 * 60),))
+        # Cambiar el horario invalida la copia local
+        Horario.objects.filter(peluquero_id=PELUQUERO_ID).get().delete()
+        self.assertEqual(self._reservar('10:00', '10:30', mascota=1).status_code, 400)
+
+    def test_invalidar_desde_otro_proceso(self):
+        tarde = [[] for _ in range(horarios.DIAS_SEMANA)]
+        tarde[_fecha().weekday()] = [[15 * 60, 19 * 60]]
+        self.assertEqual(horarios.del_dia(PELUQUERO_ID, _fecha()), ((9 * 60, 13 * 60),))
+        # Cambio sin señales: esta copia local no se entera hasta que alguien invalida
+        HorarioCompilado.objects.filter(peluquero_id=PELUQUERO_ID).update(dias=tarde)
+        self.assertEqual(horarios.del_dia(PELUQUERO_ID, _fecha()), ((9 * 60, 13 * 60),))
+
+        # Otra instancia de la caché compartida, como la de otro worker
+        with mock.patch.object(horarios, 'cache', caches.create_connection('default')):
+            horarios.invalidar(PELUQUERO_ID)
+
+        self.assertEqual(horarios.del_dia(PELUQUERO_ID, _fecha()), ((15 * 60, 19 * 60),))
+
+    @override_settings(CITAS_HORARIOS={'CACHE': False})
+    def test_sin_cache_compartida_lee_la_bd(self):
+        horarios.del_dia(PELUQUERO_ID, _fecha())
+        HorarioCompilado.objects.filter(peluquero_id=PELUQUERO_ID).update(dias=[[]] * horarios.DIAS_SEMANA)
+        HorarioExcepcion.objects.bulk_create([HorarioExcepcion(peluquero_id=PELUQUERO_ID, desde=_fecha(), hasta=_fecha())])
+
+        with self.assertNumQueries(2):
+            self.assertEqual(horarios.del_dia(PELUQUERO_ID, _fecha()), ())
+
+
+class HuecosTest(TestCase):
+    """hora_fin se calcula a partir del servicio y los huecos compactos no fragmentan el día."""
+
+    def setUp(self):
+        Horario.objects.create(peluquero_id=PELUQUERO_ID, dia_semana=_fecha().weekday(),
+                               hora_inicio=dt_time(9, 0), hora_fin=dt_time(13, 0))
+        self.servicio = Servicio.objects.create(nombre='Baño', duracion_minutos=45, margen_minutos=15, precio=20)
+
+    def test_reserva_calcula_hora_fin_del_servicio(self):
+        respuesta = self.client.post(
+            reverse('cita-list'),
+            {'mascota': _mascotas(1)[0].id, 'servicio': self.servicio.id, 'peluquero_id': PELUQUERO_ID,
+             'fecha': _fecha().isoformat(), 'hora_inicio': '09:00', 'hora_fin': '09:30'},
+            content_type='application/json', headers=_cliente(),
+        )
+
+        self.assertEqual(respuesta.status_code, 201)
+        self.assertEqual(Cita.objects.get().hora_fin, dt_time(10, 0))
+
+    def test_huecos_compactos_se_pegan_a_las_citas(self):
+        # Libre de 09:00 a 10:00 y de 10:30 a 13:00
+        intervalos, ocupadas = ((9 * 60, 13 * 60),), [(10 * 60, 10 * 60 + 30)]
+
+        self.assertEqual(huecos.huecos(intervalos, ocupadas, 60)[:2], [9 * 60, 10 * 60 + 30])
+        # El hueco de una hora entre 09:00 y 10:00 se llena entero; 09:15 dejaría restos inservibles
+        self.assertEqual(huecos.huecos(intervalos, ocupadas, 60, modo=huecos.COMPACTO)[0], 9 * 60)
+        self.assertEqual(huecos.huecos(intervalos, ocupadas, 45, modo=huecos.COMPACTO)[0], 10 * 60 + 30)
+
+    def test_disponibilidad_con_servicio(self):
+        respuesta = self.client.get(
+            reverse('cita-disponibilidad'),
+            {'peluquero_id': PELUQUERO_ID, 'fecha': _fecha().isoformat(), 'servicio_id': self.servicio.id},
+            headers=_cliente(),
+        )
+
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertEqual(respuesta.json()['huecos'][0], {'hora_inicio': '09:00:00', 'hora_fin': '10:00:00'})
+        self.assertEqual(respuesta.json()['huecos'][-1], {'hora_inicio': '12:00:00', 'hora_fin': '13:00:00'})
+
+
+class ResumenCitaTest(TestCase):
+    """ResumenCita se mantiene al día en cada cambio de la cita y coincide con recalcular()."""
+
+    def setUp(self):
+        _jornada()
+        self.mascotas = _mascotas(2)
+        self.servicios = _servicios(2)
+
+    def _reservar(self, mascota, servicio, hora_inicio):
+        respuesta = self.client.post(
+            reverse('cita-list'),
+            {'mascota': mascota.id, 'servicio': servicio.id, 'peluquero_id': PELUQUERO_ID,
+             'fecha': _fecha().isoformat(), 'hora_inicio': hora_inicio},
+            content_type='application/json', headers=_cliente(),
+        )
+        self.assertEqual(respuesta.status_code, 201, respuesta.content)
+        return Cita.objects.latest('pk')
+
+    def _post(self, nombre, cita, cabeceras, datos=None):
+        respuesta = self.client.post(reverse(f'cita-{nombre}', args=[cita.id]), datos or {},
+                                     content_type='application/json', headers=cabeceras)
+        self.assertEqual(respuesta.status_code, 200, respuesta.content)
+
+    def assertResumenCuadra(self):
+        """El resumen incremental es el mismo que reconstruye recalcular() (sin las filas a cero)."""
+        def filas():
+            return sorted(
+                ResumenCita.objects.exclude(cantidad=0, minutos=0)
+                .values_list('fecha', 'peluquero_id', 'servicio_id', 'estado', 'cantidad', 'minutos')
+            )
+        incremental = filas()
+        resumenes.recalcular()
+        self.assertEqual(incremental, filas())
+
+    def test_ciclo_de_vida_de_las_citas(self):
+        ayer = date.today() - timedelta(days=1)
+        a = self._reservar(self.mascotas[0], self.servicios[0], '10:00')
+        b = self._reservar(self.mascotas[1], self.servicios[1], '11:00')
+        self.assertResumenCuadra()
+
+        self._post('confirmar', a, _peluquero())
+        self.assertResumenCuadra()
+        self._post('reagendar', b, _cliente(), {'fecha': (_fecha() + timedelta(days=1)).isoformat(),
+                                                'hora_inicio': '12:00'})
+        self.assertResumenCuadra()
+        self._post('marcar-no-asistio', a, _peluquero())
+        self.assertResumenCuadra()
+        respuesta = self.client.delete(reverse('cita-detail', args=[b.id]), headers=_admin())
+        self.assertEqual(respuesta.status_code, 204)
+        self.assertResumenCuadra()
+
+        # Citas de ayer: una se finaliza a mano y la otra al vencer (cualquier lectura
+        # de la API finalizaría las dos, por eso no se pasa por ella)
+        confirmada, pendiente = (
+            Cita.objects.create(mascota=mascota, servicio=servicio, peluquero_id=PELUQUERO_ID, fecha=ayer,
+                                hora_inicio=dt_time(9 + i, 0), hora_fin=dt_time(9 + i, 30), estado=estado)
+            for i, (mascota, servicio, estado) in enumerate(zip(
+                self.mascotas, reversed(self.servicios), (EstadoCita.CONFIRMADA, EstadoCita.PENDIENTE),
+            ))
+        )
+        confirmada.finalizar()
+        self.assertResumenCuadra()
+        self.assertEqual(Cita.objects.finalizar_vencidas(timezone.now()), 1)
+        pendiente.refresh_from_db()
+        self.assertEqual(pendiente.estado, EstadoCita.FINALIZADA)
+        self.assertResumenCuadra()
+
+        respuesta = self.client.get(reverse('estadisticas'), headers=_admin())
+
+        self.assertEqual(respuesta.status_code, 200)
+        datos = respuesta.json()
+        # Finalizadas: Servicio 1 (11) y Servicio 0 (10); no asistió: a
+        self.assertEqual(float(datos['ingresos_totales']), 21)
+        self.assertEqual(datos['tasa_no_asistencia'], round(1 / 3, 4))
+        peluquero, = datos['por_peluquero']
+        self.assertEqual(peluquero['minutos_reservados'], 3 * 30)
+        self.assertEqual(peluquero['por_estado'][EstadoCita.FINALIZADA], 2)
+        self.assertEqual(peluquero['por_estado'][EstadoCita.NO_ASISTIO], 1)
+        self.assertEqual(peluquero['citas'], 3)
+        self.assertEqual(
+            {item['nombre']: (item['citas'], item['finalizadas']) for item in datos['por_servicio']},
+            {'Servicio 0': (2, 1), 'Servicio 1': (1, 1)},
+        )
+
+
+@override_settings(TRAZAS={'ACTIVO': True, 'MUESTREO': 1.0})
+class TrazasTest(TestCase):
+    """Cada petición continúa la traza W3C entrante y devuelve sus identificadores."""
+
+    TRACE_ID = '4bf92f3577b34da6a3ce929d0e0e4736'
+    PADRE_ID = '00f067aa0ba902b7'
+
+    def test_continua_traceparent_y_devuelve_identificadores(self):
+        with self.assertLogs('trazas', 'INFO') as registro:
+            respuesta = self.client.get(reverse('cita-list'), headers={
+                **_cliente(), 'traceparent': f'00-{self.TRACE_ID}-{self.PADRE_ID}-01', 'X-Request-ID': 'kong-123',
+            })
+
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertEqual((respuesta['X-Trace-Id'], respuesta['X-Request-ID']), (self.TRACE_ID, 'kong-123'))
+        spans = [json.loads(linea.getMessage()) for linea in registro.records]
+        self.assertEqual({span['trace_id'] for span in spans}, {self.TRACE_ID})
+        raiz = next(span for span in spans if span['padre_id'] == self.PADRE_ID)
+        self.assertEqual((raiz['request_id'], raiz['atributos']['estado']), ('kong-123', 200))
+        # Las consultas y la verificación del JWT cuelgan de la traza de la petición
+        nombres = {span['nombre'] for span in spans}
+        self.assertIn('jwt.verificar', nombres)
+        self.assertIn('db', nombres)
+
+    def test_sin_traceparent_empieza_una_traza(self):
+        respuesta = self.client.get(reverse('cita-list'), headers=_cliente())
+
+        self.assertRegex(respuesta['X-Trace-Id'], r'^[0-9a-f]{32}$')
+        self.assertNotEqual(respuesta['X-Trace-Id'], self.TRACE_ID)
+        self.assertEqual(respuesta['X-Request-ID'], respuesta['X-Trace-Id'])
+
+
+    async def test_consultas_en_la_vista_asincrona(self):
+        # Conexión abierta antes de la petición y sin el execute_wrapper (connection_created ya pasó)
+        await sync_to_async(self._quitar_wrapper)()
+
+        with self.assertLogs('trazas', 'INFO') as registro:
+            respuesta = await self.async_client.get(reverse('cita-mis-citas'), headers=_cliente())
+
+        self.assertEqual(respuesta.status_code, 200)
+        spans = [json.loads(linea.getMessage()) for linea in registro.records]
+        self.assertIn('db', {span['nombre'] for span in spans})
+
+    @staticmethod
+    def _quitar_wrapper():
+        connection.ensure_connection()
+        connection.execute_wrappers[:] = [
+            wrapper for wrapper in connection.execute_wrappers if wrapper is not trazas._trazar_consulta
+        ]
+
+
+class EstadoCompartidoCheckTest(TestCase):
+    """Con varios workers, `manage.py check` avisa del estado que sigue siendo de cada proceso."""
+
+    def _avisos(self, procesos):
+        with mock.patch.dict(os.environ, {'WEB_CONCURRENCY': str(procesos)}):
+            return [aviso.id for aviso in checks.estado_compartido(None)]
+
+    @override_settings(CACHE_URL=None, CITAS_EVENTOS={'BACKEND': 'citas.eventos.MemoriaBackend'})
+    def test_avisa_con_varios_procesos_sin_estado_compartido(self):
+        self.assertEqual(self._avisos(1), [])
+        self.assertEqual(self._avisos(2), ['citas.W001', 'citas.W002'])
+
+    @override_settings(CACHE_URL='redis://redis:6379/0',
+                       CITAS_EVENTOS={'BACKEND': 'citas.eventos.RedisBackend', 'REDIS_URL': 'redis://redis:6379/1'})
+    def test_sin_avisos_con_redis(self):
+        self.assertEqual(self._avisos(2), [])
+
+
+_ENTREGAS = []
+
+
+def _manejador_outbox(eventos):
+    """Manejador de OutboxTest: falla con cualquier lote que incluya un evento de una cita negativa."""
+    if any(evento.cita_id < 0 for evento in eventos):
+        raise RuntimeError('destino caído')
+    _ENTREGAS.append([evento.id for evento in eventos])
+
+
+@override_settings(CITAS_OUTBOX={'MANEJADORES': ['citas.tests._manejador_outbox'], 'TAMANO_LOTE': 10,
+                                 'LEASE_SEGUNDOS': 60, 'MAX_INTENTOS': 2})
+class OutboxTest(TestCase):
+    """despachar_lote reclama con lease y solo cobra un intento a los eventos que fallan."""
+
+    def setUp(self):
+        _ENTREGAS.clear()
+
+    def _eventos(self, *cita_ids):
+        return EventoOutbox.objects.bulk_create(
+            EventoOutbox(tipo='cita_creada', cita_id=cita_id, peluquero_id=PELUQUERO_ID) for cita_id in cita_ids
+        )
+
+    def test_despacha_el_lote_en_orden(self):
+        eventos = self._eventos(1, 2, 3)
+
+        self.assertEqual(outbox.despachar_lote(), (3, 0))
+        self.assertEqual(_ENTREGAS, [[evento.id for evento in eventos]])
+        self.assertFalse(outbox.pendientes().exists())
+        self.assertEqual(set(EventoOutbox.objects.values_list('intentos', 'bloqueado_hasta')), {(1, None)})
+        self.assertEqual(outbox.despachar_lote(), (0, 0))
+
+    def test_solo_cuenta_el_intento_de_los_que_fallan(self):
+        bueno, malo, otro = self._eventos(1, -2, 3)
+
+        self.assertEqual(outbox.despachar_lote(), (2, 1))
+        # Primero el lote entero (falla) y después evento a evento
+        self.assertEqual(_ENTREGAS, [[bueno.id], [otro.id]])
+        malo.refresh_from_db()
+        self.assertEqual((malo.intentos, malo.despachado_en, malo.bloqueado_hasta), (1, None, None))
+        self.assertIn('destino caído', malo.ultimo_error)
+        self.assertEqual(list(outbox.pendientes().values_list('id', flat=True)), [malo.id])
+
+    def test_agota_los_intentos(self):
+        malo, = self._eventos(-1)
+
+        self.assertEqual(outbox.despachar_lote(), (0, 1))
+        self.assertEqual(outbox.despachar_lote(), (0, 1))
+        self.assertEqual(outbox.despachar_lote(), (0, 0))
+        self.assertEqual(outbox.metricas(), {
+            'pendientes': 0, 'agotados': 1, 'despachados_ultimo_minuto': 0, 'retraso_segundos': 0.0,
+        })
+        self.assertEqual(outbox.despachar()['fallidos'], 0)
+
+    def test_lease_de_otro_despachador(self):
+        self._eventos(1, 2)
+        _, reclamados = outbox.reclamar(10, 60)
+        self.assertEqual(len(reclamados), 2)
+
+        self.assertEqual(outbox.despachar_lote(), (0, 0))
+        # Despachador caído: al caducar su lease los eventos vuelven a estar disponibles
+        EventoOutbox.objects.update(bloqueado_hasta=timezone.now() - timedelta(seconds=1))
+        self.assertEqual(outbox.despachar_lote(), (2, 0))
+
+
+class _EntregaFalsa:
+    """Backend de entrega de RecordatoriosTest: guarda los mensajes o falla si se le pide."""
+
+    def __init__(self, fallar=False):
+        self.fallar = fallar
+        self.mensajes = []
+
+    def enviar(self, mensaje):
+        if self.fallar:
+            raise RuntimeError('proveedor caído')
+        self.mensajes.append(mensaje)
+
+
+@override_settings(CITAS_RECORDATORIOS={'TAMANO_LOTE': 10, 'LEASE_SEGUNDOS': 60, 'MAX_INTENTOS': 2})
+class RecordatoriosTest(TestCase):
+    """La cola de recordatorios sigue a la cita y procesar_lote entrega, omite o reintenta."""
+
+    def setUp(self):
+        _jornada()
+        self.mascotas = _mascotas(2)
+
+    def _cita(self, estado=EstadoCita.PENDIENTE, mascota=0, hora=10):
+        return Cita.objects.create(mascota=self.mascotas[mascota], peluquero_id=PELUQUERO_ID, fecha=_fecha(),
+                                   hora_inicio=dt_time(hora, 0), hora_fin=dt_time(hora, 30), estado=estado)
+
+    @staticmethod
+    def _vencer():
+        Recordatorio.objects.update(vence_en=timezone.now() - timedelta(minutes=1))
+
+    @staticmethod
+    def _estados(cita):
+        return sorted(cita.recordatorios.values_list('tipo', 'estado'))
+
+    def test_alta_programa_los_recordatorios(self):
+        cita = self._cita()
+
+        inicio = recordatorios.inicio_cita(cita.fecha, cita.hora_inicio)
+        self.assertEqual(
+            sorted(cita.recordatorios.values_list('tipo', 'vence_en', 'estado')),
+            [('24H', inicio - timedelta(hours=24), EstadoRecordatorio.PENDIENTE),
+             ('2H', inicio - timedelta(hours=2), EstadoRecordatorio.PENDIENTE)],
+        )
+
+    def test_envia_las_confirmadas_y_omite_el_resto(self):
+        confirmada = self._cita(EstadoCita.CONFIRMADA)
+        pendiente = self._cita(mascota=1, hora=11)
+        self._vencer()
+        entrega = _EntregaFalsa()
+
+        self.assertEqual(recordatorios.procesar_lote(entrega=entrega),
+                         {'reclamados': 4, 'enviados': 2, 'omitidos': 2, 'fallidos': 0})
+        self.assertEqual(sorted((m['cita_id'], m['tipo']) for m in entrega.mensajes),
+                         [(confirmada.id, '24H'), (confirmada.id, '2H')])
+        self.assertEqual({estado for _, estado in self._estados(confirmada)}, {EstadoRecordatorio.ENVIADO})
+        self.assertEqual({estado for _, estado in self._estados(pendiente)}, {EstadoRecordatorio.OMITIDO})
+        self.assertEqual(recordatorios.procesar_lote(entrega=entrega)['reclamados'], 0)
+
+    def test_lease_de_otro_worker(self):
+        self._cita(EstadoCita.CONFIRMADA)
+        self._vencer()
+        _, reclamados = recordatorios.reclamar(10, 60)
+        self.assertEqual(len(reclamados), 2)
+
+        self.assertEqual(recordatorios.procesar_lote(entrega=_EntregaFalsa())['reclamados'], 0)
+        # Worker caído: al caducar su lease los recordatorios vuelven a estar disponibles
+        Recordatorio.objects.update(bloqueado_hasta=timezone.now() - timedelta(seconds=1))
+        self.assertEqual(recordatorios.procesar_lote(entrega=_EntregaFalsa())['enviados'], 2)
+
+    def test_reintenta_con_espera_y_queda_fallido(self):
+        cita = self._cita(EstadoCita.CONFIRMADA)
+        self._vencer()
+        entrega = _EntregaFalsa(fallar=True)
+
+        antes = timezone.now()
+        with self.assertLogs('citas.recordatorios', logging.ERROR):
+            self.assertEqual(recordatorios.procesar_lote(entrega=entrega)['fallidos'], 2)
+        for intentos, bloqueado_hasta, estado, error in cita.recordatorios.values_list(
+                'intentos', 'bloqueado_hasta', 'estado', 'ultimo_error'):
+            self.assertEqual((intentos, estado), (1, EstadoRecordatorio.PENDIENTE))
+            # Espera de 30 s * 2^intentos antes del siguiente intento
+            self.assertGreaterEqual(bloqueado_hasta, antes + timedelta(seconds=60))
+            self.assertIn('proveedor caído', error)
+        self.assertEqual(recordatorios.procesar_lote(entrega=entrega)['reclamados'], 0)
+
+        Recordatorio.objects.update(bloqueado_hasta=timezone.now() - timedelta(seconds=1))
+        with self.assertLogs('citas.recordatorios', logging.ERROR):
+            self.assertEqual(recordatorios.procesar_lote(entrega=entrega)['fallidos'], 2)
+        self.assertEqual(set(cita.recordatorios.values_list('intentos', 'estado')), {(2, EstadoRecordatorio.FALLIDO)})
+        self.assertEqual(recordatorios.procesar_lote(entrega=entrega)['reclamados'], 0)
+
+    def test_reagendar_y_cancelar(self):
+        cita = self._cita()
+
+        respuesta = self.client.post(
+            reverse('cita-reagendar', args=[cita.id]),
+            {'fecha': _fecha().isoformat(), 'hora_inicio': '12:00', 'hora_fin': '12:30'},
+            content_type='application/json', headers=_cliente(),
+        )
+
+        self.assertEqual(respuesta.status_code, 200)
+        inicio = recordatorios.inicio_cita(_fecha(), dt_time(12, 0))
+        self.assertEqual(
+            sorted(cita.recordatorios.filter(estado=EstadoRecordatorio.PENDIENTE).values_list('tipo', 'vence_en')),
+            [('24H', inicio - timedelta(hours=24)), ('2H', inicio - timedelta(hours=2))],
+        )
+        self.assertEqual(cita.recordatorios.filter(estado=EstadoRecordatorio.CANCELADO).count(), 2)
+
+        respuesta = self.client.post(reverse('cita-cancelar', args=[cita.id]), headers=_peluquero())
+
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertEqual(set(cita.recordatorios.values_list('estado', flat=True)), {EstadoRecordatorio.CANCELADO})
+
+
+class SerieTest(TestCase):
+    """Series: conflictos por fecha, todo o nada y cambios en bloque de las citas que quedan."""
+
+    def setUp(self):
+        _jornada()
+        self.mascotas = _mascotas(2)
+
+    def _crear(self, **extra):
+        return self.client.post(
+            reverse('cita-crear-serie'),
+            {'mascota': self.mascotas[0].id, 'peluquero_id': PELUQUERO_ID, 'fecha': _fecha().isoformat(),
+             'hora_inicio': '10:00', 'hora_fin': '10:30', 'cada_semanas': 1, 'ocurrencias': 4, **extra},
+            content_type='application/json', headers=_cliente(),
+        )
+
+    def _conflictos(self):
+        """Otra cita del peluquero en la tercera semana y un cierre en la cuarta."""
+        Cita.objects.create(mascota=self.mascotas[1], peluquero_id=PELUQUERO_ID, fecha=_fecha() + timedelta(weeks=2),
+                            hora_inicio=dt_time(10, 0), hora_fin=dt_time(10, 30))
+        HorarioExcepcion.objects.create(peluquero_id=PELUQUERO_ID, desde=_fecha() + timedelta(weeks=3),
+                                        hasta=_fecha() + timedelta(weeks=3))
+
+    def test_omite_las_ocurrencias_en_conflicto(self):
+        self._conflictos()
+
+        respuesta = self._crear()
+
+        self.assertEqual(respuesta.status_code, 201)
+        self.assertEqual([cita['fecha'] for cita in respuesta.json()['citas']],
+                         [(_fecha() + timedelta(weeks=i)).isoformat() for i in (0, 1)])
+        self.assertEqual(
+            [(conflicto['fecha'], conflicto['motivo']) for conflicto in respuesta.json()['conflictos']],
+            [((_fecha() + timedelta(weeks=2)).isoformat(), 'solape_peluquero'),
+             ((_fecha() + timedelta(weeks=3)).isoformat(), 'fuera_de_horario')],
+        )
+        self.assertEqual(Cita.objects.filter(serie=respuesta.json()['serie']).count(), 2)
+
+    def test_todas_o_ninguna(self):
+        self._conflictos()
+
+        respuesta = self._crear(todas_o_ninguna=True)
+
+        self.assertEqual(respuesta.status_code, 409)
+        self.assertEqual(len(respuesta.json()['conflictos']), 2)
+        self.assertFalse(Cita.objects.filter(serie__isnull=False).exists())
+
+    def test_reagendar_y_cancelar_las_que_quedan(self):
+        serie = self._crear().json()['serie']
+        citas = list(Cita.objects.filter(serie=serie).order_by('fecha'))
+        ruta = reverse('cita-reagendar-serie', args=[serie])
+        # La nueva franja de la segunda semana choca con otra cita: no se mueve ninguna
+        otra = Cita.objects.create(mascota=self.mascotas[1], peluquero_id=PELUQUERO_ID,
+                                   fecha=_fecha() + timedelta(weeks=1), hora_inicio=dt_time(12, 0),
+                                   hora_fin=dt_time(12, 30))
+
+        rechazado = self.client.post(
+            ruta, {'desde': citas[1].fecha.isoformat(), 'hora_inicio': '12:00', 'hora_fin': '12:30'},
+            content_type='application/json', headers=_cliente(),
+        )
+
+        self.assertEqual(rechazado.status_code, 409)
+        self.assertEqual([(c['cita_id'], c['motivo']) for c in rechazado.json()['conflictos']],
+                         [(citas[1].id, 'solape_peluquero')])
+        self.assertEqual(set(Cita.objects.filter(serie=serie).values_list('hora_inicio', flat=True)), {dt_time(10, 0)})
+
+        otra.delete()
+        reagendado = self.client.post(
+            ruta, {'desde': citas[1].fecha.isoformat(), 'hora_inicio': '12:00', 'hora_fin': '12:30'},
+            content_type='application/json', headers=_cliente(),
+        )
+        cancelado = self.client.post(reverse('cita-cancelar-serie', args=[serie]),
+                                     {'desde': citas[2].fecha.isoformat()},
+                                     content_type='application/json', headers=_peluquero())
+
+        self.assertEqual(reagendado.status_code, 200)
+        self.assertEqual([cita['id'] for cita in reagendado.json()], [cita.id for cita in citas[1:]])
+        self.assertEqual(sorted(cancelado.json()['canceladas']), [cita.id for cita in citas[2:]])
+        self.assertEqual(
+            list(Cita.objects.filter(serie=serie).order_by('fecha').values_list('hora_inicio', 'estado')),
+            [(dt_time(10, 0), EstadoCita.PENDIENTE), (dt_time(12, 0), EstadoCita.PENDIENTE),
+             (dt_time(12, 0), EstadoCita.CANCELADA), (dt_time(12, 0), EstadoCita.CANCELADA)],
+        )
+
+
+    def test_reagendar_calcula_hora_fin_con_el_servicio(self):
+        servicio = Servicio.objects.create(nombre='Baño', duracion_minutos=45, margen_minutos=15, precio=20)
+        serie = self._crear(servicio=servicio.id).json()['serie']
+        sin_servicio = Cita.objects.filter(serie=serie).order_by('fecha').last()
+        Cita.objects.filter(pk=sin_servicio.pk).update(servicio=None)
+        ruta = reverse('cita-reagendar-serie', args=[serie])
+
+        # Sin hora_fin, la cita sin servicio no se puede mover: no se mueve ninguna
+        rechazado = self.client.post(ruta, {'hora_inicio': '12:00'}, content_type='application/json',
+                                     headers=_cliente())
+        # La hora_fin enviada solo vale para la cita sin servicio
+        reagendado = self.client.post(ruta, {'hora_inicio': '12:00', 'hora_fin': '12:30'},
+                                      content_type='application/json', headers=_cliente())
+
+        self.assertEqual(rechazado.status_code, 409)
+        self.assertEqual([(c['cita_id'], c['motivo']) for c in rechazado.json()['conflictos']],
+                         [(sin_servicio.id, 'sin_hora_fin')])
+        self.assertEqual(reagendado.status_code, 200)
+        self.assertEqual(
+            list(Cita.objects.filter(serie=serie).order_by('fecha').values_list('hora_inicio', 'hora_fin')),
+            [(dt_time(12, 0), dt_time(13, 0))] * 3 + [(dt_time(12, 0), dt_time(12, 30))],
+        )
+
+
+class EstadoLoteTest(TestCase):
+    """estado-lote responde un resultado por cita y revierte el lote si una cita cambió entretanto."""
+
+    def setUp(self):
+        self.citas = _citas(3)
+
+    def _lote(self, transiciones, cabeceras=None):
+        return self.client.post(reverse('cita-estado-lote'), {'transiciones': transiciones},
+                                content_type='application/json', headers=cabeceras or _peluquero())
+
+    def _estados(self):
+        return list(Cita.objects.order_by('pk').values_list('estado', flat=True))
+
+    def test_resultado_por_cita(self):
+        a, b, c = self.citas
+
+        respuesta = self._lote([
+            {'id': a.id, 'estado': 'CONFIRMADA'},
+            {'id': b.id, 'estado': 'FINALIZADA'},
+            {'id': c.id, 'estado': 'CANCELADA'},
+            {'id': a.id, 'estado': 'CANCELADA'},
+            {'id': 999999, 'estado': 'CONFIRMADA'},
+        ])
+
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertEqual((respuesta.json()['aplicadas'], respuesta.json()['rechazadas']), (2, 3))
+        self.assertEqual(
+            [(r['id'], r['ok'], r.get('error')) for r in respuesta.json()['resultados']],
+            [(a.id, True, None),
+             (b.id, False, 'La cita aún no ha concluido, no se puede finalizar'),
+             (c.id, True, None),
+             (a.id, False, 'Cita repetida en el lote'),
+             (999999, False, 'Cita no encontrada')],
+        )
+        self.assertEqual(self._estados(), [EstadoCita.CONFIRMADA, EstadoCita.PENDIENTE, EstadoCita.CANCELADA])
+
+    def test_transiciones_invalidas_y_citas_ajenas(self):
+        a, b, _ = self.citas
+        Cita.objects.filter(pk=a.pk).update(estado=EstadoCita.CANCELADA)
+
+        respuesta = self._lote([{'id': a.id, 'estado': 'CONFIRMADA'}, {'id': b.id, 'estado': 'CONFIRMADA'}],
+                               _autorizacion(PELUQUERO_ID + 1, 'PELUQUERO'))
+
+        self.assertEqual([r['error'] for r in respuesta.json()['resultados']],
+                         ['No tienes permiso sobre esta cita'] * 2)
+        respuesta = self._lote([{'id': a.id, 'estado': 'CONFIRMADA'}])
+        self.assertEqual(respuesta.json()['resultados'][0]['error'], 'No se puede confirmar una cita cancelada')
+        self.assertEqual(self._estados(), [EstadoCita.CANCELADA, EstadoCita.PENDIENTE, EstadoCita.PENDIENTE])
+
+    def test_cambio_concurrente_revierte_el_lote(self):
+        a, b, _ = self.citas
+        resumen = sorted(ResumenCita.objects.values_list('estado', 'cantidad'))
+        en_outbox = EventoOutbox.objects.count()
+        validar = transiciones._error
+
+        def cancelada_por_otro(datos, *args):
+            # Otra petición cancela b entre la lectura del lote y su UPDATE
+            if datos['id'] == b.id:
+                Cita.objects.filter(pk=b.pk).update(estado=EstadoCita.CANCELADA)
+            return validar(datos, *args)
+
+        with mock.patch.object(transiciones, '_error', side_effect=cancelada_por_otro):
+            respuesta = self._lote([{'id': a.id, 'estado': 'CONFIRMADA'}, {'id': b.id, 'estado': 'CONFIRMADA'}])
+
+        self.assertEqual(respuesta.status_code, 409)
+        self.assertEqual(Cita.objects.get(pk=a.pk).estado, EstadoCita.PENDIENTE)
+        self.assertEqual(sorted(ResumenCita.objects.values_list('estado', 'cantidad')), resumen)
+        self.assertEqual(EventoOutbox.objects.count(), en_outbox)
+
+
+class AusenciaTest(TestCase):
+    """Las citas de un peluquero ausente van al peluquero menos cargado, a otro hueco o quedan sin hueco."""
+
+    OTRO, TERCERO = PELUQUERO_ID + 1, PELUQUERO_ID + 2
+
+    def setUp(self):
+        self.mascotas = _mascotas(3)
+
+    def _cita(self, peluquero_id, mascota, hora):
+        return Cita.objects.create(mascota=self.mascotas[mascota], peluquero_id=peluquero_id, fecha=_fecha(),
+                                   hora_inicio=dt_time(hora, 0), hora_fin=dt_time(hora, 30))
+
+    def _ausencia(self, aplicar, hasta=None):
+        return self.client.post(
+            reverse('cita-ausencia'),
+            {'peluquero_id': PELUQUERO_ID, 'desde': _fecha().isoformat(),
+             'hasta': (hasta or _fecha()).isoformat(), 'aplicar': aplicar},
+            content_type='application/json', headers=_admin(),
+        )
+
+    def test_plan_y_aplicar(self):
+        for peluquero_id in (PELUQUERO_ID, self.OTRO, self.TERCERO):
+            _jornada(peluquero_id)
+        primera, segunda = self._cita(PELUQUERO_ID, 0, 10), self._cita(PELUQUERO_ID, 1, 11)
+        self._cita(self.OTRO, 2, 15)
+
+        plan = self._ausencia(aplicar=False)
+
+        self.assertEqual(plan.status_code, 200)
+        # La primera va al tercero (sin carga); con la misma carga, la segunda al de menor id
+        self.assertEqual(
+            [(paso['cita_id'], paso['tipo'], paso['destino']['peluquero_id']) for paso in plan.json()['plan']],
+            [(primera.id, 'otro_peluquero', self.TERCERO), (segunda.id, 'otro_peluquero', self.OTRO)],
+        )
+        self.assertEqual(Cita.objects.filter(peluquero_id=PELUQUERO_ID).count(), 2)
+
+        aplicado = self._ausencia(aplicar=True)
+
+        self.assertEqual(aplicado.status_code, 200)
+        self.assertEqual(aplicado.json()['plan'], plan.json()['plan'])
+        self.assertEqual(
+            list(Cita.objects.filter(pk__in=[primera.pk, segunda.pk]).order_by('pk')
+                 .values_list('peluquero_id', 'hora_inicio', 'version')),
+            [(self.TERCERO, dt_time(10, 0), 2), (self.OTRO, dt_time(11, 0), 2)],
+        )
+        self.assertFalse(ResumenCita.objects.filter(peluquero_id=PELUQUERO_ID).exclude(cantidad=0).exists())
+
+    def test_sin_hueco(self):
+        # Solo trabaja el ausente y la ausencia cubre todo el horizonte de búsqueda
+        _jornada()
+        cita = self._cita(PELUQUERO_ID, 0, 10)
+
+        respuesta = self._ausencia(aplicar=True, hasta=_fecha() + timedelta(days=30))
+
+        self.assertEqual((respuesta.json()['reasignadas'], respuesta.json()['sin_hueco']), (0, 1))
+        self.assertEqual((respuesta.json()['plan'][0]['tipo'], respuesta.json()['plan'][0]['destino']),
+                         ('sin_hueco', None))
+        cita.refresh_from_db()
+        self.assertEqual((cita.peluquero_id, cita.version), (PELUQUERO_ID, 1))
+
+
+class HorarioExcepcionTest(TestCase):
+    """Cierres y turnos extra sobre la plantilla semanal; un cierre prevalece sobre un turno extra."""
+
+    OTRO = PELUQUERO_ID + 1
+
+    def setUp(self):
+        for peluquero_id in (PELUQUERO_ID, self.OTRO):
+            Horario.objects.create(peluquero_id=peluquero_id, dia_semana=_fecha().weekday(),
+                                   hora_inicio=dt_time(9, 0), hora_fin=dt_time(13, 0))
+
+    def _excepcion(self, **datos):
+        respuesta = self.client.post(
+            reverse('horario-excepcion-list'),
+            {'peluquero_id': PELUQUERO_ID, 'desde': _fecha().isoformat(), 'hasta': _fecha().isoformat(), **datos},
+            content_type='application/json', headers=_admin(),
+        )
+        self.assertEqual(respuesta.status_code, 201, respuesta.content)
+
+    def test_cierres_y_turnos_extra(self):
+        semana_siguiente = _fecha() + timedelta(weeks=1)
+        self._excepcion(tipo='TURNO_EXTRA', hora_inicio='15:00', hora_fin='18:00')
+        # Cierra el final de la mañana y el principio del turno extra
+        self._excepcion(tipo='CIERRE', hora_inicio='12:00', hora_fin='16:00')
+        self._excepcion(tipo='CIERRE', desde=semana_siguiente.isoformat(), hasta=semana_siguiente.isoformat())
+        self._excepcion(tipo='TURNO_EXTRA', desde=semana_siguiente.isoformat(), hasta=semana_siguiente.isoformat(),
+                        hora_inicio='15:00', hora_fin='18:00')
+
+        self.assertEqual(horarios.del_dia(PELUQUERO_ID, _fecha()), ((9 * 60, 12 * 60), (16 * 60, 18 * 60)))
+        self.assertEqual(horarios.del_dia(PELUQUERO_ID, semana_siguiente), ())
+        # El resto de días y de peluqueros siguen con la plantilla
+        self.assertEqual(horarios.del_dia(PELUQUERO_ID, _fecha() + timedelta(weeks=2)), ((9 * 60, 13 * 60),))
+        self.assertEqual(horarios.del_dia(self.OTRO, _fecha()), ((9 * 60, 13 * 60),))
+
+    def test_cierre_del_local(self):
+        self._excepcion(peluquero_id=None, motivo='Festivo')
+
+        self.assertEqual(
+            horarios.efectivo(_fecha(), _fecha()),
+            {(PELUQUERO_ID, _fecha()): (), (self.OTRO, _fecha()): ()},
+        )
+        respuesta = self.client.post(
+            reverse('cita-list'),
+            {'mascota': _mascotas(1)[0].id, 'peluquero_id': self.OTRO, 'fecha': _fecha().isoformat(),
+             'hora_inicio': '10:00', 'hora_fin': '10:30'},
+            content_type='application/json', headers=_cliente(),
+        )
+        self.assertEqual(respuesta.status_code, 400)
+        self.assertIn('fecha', respuesta.json())
+
+
+class HorarioSolapeTest(TestCase):
+    """La API rechaza turnos solapados del mismo día y cada cambio recompila la semana afectada."""
+
+    OTRO = PELUQUERO_ID + 1
+
+    def setUp(self):
+        self.dia = _fecha().weekday()
+        self.turno = self._crear('09:00', '13:00')
+
+    def _crear(self, hora_inicio, hora_fin):
+        return self.client.post(
+            reverse('horario-list'),
+            {'peluquero_id': PELUQUERO_ID, 'dia_semana': self.dia, 'hora_inicio': hora_inicio, 'hora_fin': hora_fin},
+            content_type='application/json', headers=_admin(),
+        )
+
+    def _editar(self, horario_id, **datos):
+        return self.client.patch(reverse('horario-detail', args=[horario_id]), datos,
+                                 content_type='application/json', headers=_admin())
+
+    @staticmethod
+    def _compilado(peluquero_id, dia):
+        return HorarioCompilado.objects.get(peluquero_id=peluquero_id).dias[dia]
+
+    def test_rechaza_solapes_y_fusiona_los_contiguos(self):
+        solapado = self._crear('12:00', '14:00')
+        contiguo = self._crear('13:00', '15:00')
+
+        self.assertEqual(solapado.status_code, 400)
+        self.assertEqual(solapado.json()['hora_inicio'], ['Se solapa con el turno de 09:00 a 13:00'])
+        self.assertEqual(contiguo.status_code, 201)
+        self.assertEqual(self._compilado(PELUQUERO_ID, self.dia), [[9 * 60, 15 * 60]])
+        self.assertEqual(horarios.del_dia(PELUQUERO_ID, _fecha()), ((9 * 60, 15 * 60),))
+
+        # Al editar, el propio turno no cuenta como solape y otro turno sí
+        self.assertEqual(self._editar(self.turno.json()['id'], hora_inicio='08:00').status_code, 200)
+        respuesta = self._editar(contiguo.json()['id'], hora_inicio='12:30')
+        self.assertEqual(respuesta.status_code, 400)
+        self.assertIn('hora_inicio', respuesta.json())
+        self.assertEqual(horarios.del_dia(PELUQUERO_ID, _fecha()), ((8 * 60, 15 * 60),))
+
+    def test_cambio_de_peluquero_recompila_los_dos(self):
+        self.assertEqual(horarios.del_dia(PELUQUERO_ID, _fecha()), ((9 * 60, 13 * 60),))
+
+        respuesta = self._editar(self.turno.json()['id'], peluquero_id=self.OTRO)
+
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertEqual(self._compilado(PELUQUERO_ID, self.dia), [])
+        self.assertEqual(self._compilado(self.OTRO, self.dia), [[9 * 60, 13 * 60]])
+        self.assertEqual(horarios.del_dia(PELUQUERO_ID, _fecha()), ())
+        self.assertEqual(horarios.del_dia(self.OTRO, _fecha()), ((9 * 60, 13 * 60),))
+
+
+class ArchivoTest(TestCase):
+    """archivar_citas mueve solo las citas cerradas antiguas, sin tocar estadísticas ni eventos."""
+
+    def setUp(self):
+        hace = [date.today() - timedelta(days=dias) for dias in (400, 400, 400, 400, 10)]
+        estados = [EstadoCita.FINALIZADA, EstadoCita.CANCELADA, EstadoCita.NO_ASISTIO, EstadoCita.PENDIENTE,
+                   EstadoCita.FINALIZADA]
+        citas = Cita.objects.bulk_create(
+            Cita(mascota=mascota, peluquero_id=PELUQUERO_ID, fecha=fecha, hora_inicio=dt_time(10, 0),
+                 hora_fin=dt_time(10, 30), estado=estado)
+            for mascota, fecha, estado in zip(_mascotas(5), hace, estados)
+        )
+        resumenes.recalcular()
+        self.archivables = [cita.id for cita in citas[:3]]
+        self.vivas = [cita.id for cita in citas[3:]]
+
+    @staticmethod
+    def _resumen():
+        return sorted(ResumenCita.objects.values_list('fecha', 'estado', 'cantidad', 'minutos'))
+
+    def test_archiva_las_cerradas_antiguas(self):
+        resumen, en_outbox = self._resumen(), EventoOutbox.objects.count()
+
+        with mock.patch('citas.eventos.publicar_al_confirmar') as publicar:
+            call_command('archivar_citas', stdout=StringIO())
+
+        self.assertEqual(sorted(CitaHistorica.objects.values_list('id', flat=True)), self.archivables)
+        self.assertEqual(sorted(Cita.objects.values_list('id', flat=True)), self.vivas)
+        self.assertEqual(self._resumen(), resumen)
+        self.assertEqual(EventoOutbox.objects.count(), en_outbox)
+        publicar.assert_not_called()
+        # El historial sigue contando en las estadísticas
+        resumenes.recalcular()
+        self.assertEqual(self._resumen(), resumen)
+        # Relanzar no encuentra nada más que mover
+        salida = StringIO()
+        call_command('archivar_citas', stdout=salida)
+        self.assertIn('Archivadas: 0', salida.getvalue())
+
+    def test_mis_citas_con_historial(self):
+        call_command('archivar_citas', stdout=StringIO())
+        ruta = reverse('cita-mis-citas')
+
+        actuales = self.client.get(ruta, headers=_cliente()).json()
+        completas = self.client.get(ruta, {'historial': 'true'}, headers=_cliente()).json()
+
+        self.assertEqual(sorted(cita['id'] for cita in actuales), self.vivas)
+        self.assertEqual(sorted(cita['id'] for cita in completas), sorted(self.archivables + self.vivas))
+        self.assertEqual(sorted(cita['id'] for cita in completas if cita.get('archivada')), self.archivables)
+
+
+class OcupacionTest(TestCase):
+    """Mapa hora x día de la semana sobre un caso pequeño calculado a mano."""
+
+    LUNES = date(2025, 1, 6)
+
+    def setUp(self):
+        # Lunes de 09:00 a 11:00: 8 slots de 15 min por lunes, 16 en las dos semanas del rango
+        Horario.objects.create(peluquero_id=PELUQUERO_ID, dia_semana=0, hora_inicio=dt_time(9, 0),
+                               hora_fin=dt_time(11, 0))
+        franjas = [
+            (self.LUNES, (9, 0), (10, 0), EstadoCita.FINALIZADA),  # 4 slots a las 9
+            (self.LUNES, (10, 5), (10, 20), EstadoCita.FINALIZADA),  # toca 2 slots a las 10
+            (self.LUNES + timedelta(weeks=1), (9, 30), (10, 0), EstadoCita.NO_ASISTIO),  # 2 slots a las 9
+            (self.LUNES + timedelta(weeks=1), (18, 0), (18, 30), EstadoCita.FINALIZADA),  # fuera de horario
+            (self.LUNES + timedelta(weeks=1), (10, 0), (11, 0), EstadoCita.CANCELADA),  # no ocupa
+        ]
+        Cita.objects.bulk_create(
+            Cita(mascota=mascota, peluquero_id=PELUQUERO_ID, fecha=fecha, hora_inicio=dt_time(*inicio),
+                 hora_fin=dt_time(*fin), estado=estado)
+            for mascota, (fecha, inicio, fin, estado) in zip(_mascotas(len(franjas)), franjas)
+        )
+
+    def test_mapa_del_peluquero(self):
+        respuesta = self.client.get(
+            reverse('analitica-ocupacion'),
+            {'desde': self.LUNES.isoformat(), 'hasta': (self.LUNES + timedelta(days=13)).isoformat()},
+            headers=_admin(),
+        )
+
+        self.assertEqual(respuesta.status_code, 200)
+        peluquero, = respuesta.json()['peluqueros']
+        self.assertEqual(
+            {clave: peluquero[clave] for clave in ('horas_capacidad', 'horas_ocupadas', 'horas_ociosas',
+                                                   'horas_fuera_de_horario', 'utilizacion')},
+            {'horas_capacidad': 4.0, 'horas_ocupadas': 2.0, 'horas_ociosas': 2.0,
+             'horas_fuera_de_horario': 0.5, 'utilizacion': 0.5},
+        )
+        self.assertEqual(peluquero['mapa'][0][9:11], [6 / 8, 2 / 8])
+        celdas = [(dia, hora) for dia, fila in enumerate(peluquero['mapa'])
+                  for hora, valor in enumerate(fila) if valor is not None]
+        self.assertEqual(celdas, [(0, 9), (0, 10)])
+        self.assertEqual([(pico['dia'], pico['hora']) for pico in peluquero['picos']], [('Lunes', 9), ('Lunes', 10)])
+
+    def test_matrices(self):
+        datos_citas, datos_horarios = analitica.cargar_datos(self.LUNES, self.LUNES + timedelta(days=13))
+        peluqueros, ocupacion, capacidad = analitica.calcular_matrices(
+            datos_citas, datos_horarios, self.LUNES, self.LUNES + timedelta(days=13)
+        )
+
+        self.assertEqual(peluqueros.tolist(), [PELUQUERO_ID])
+        self.assertEqual(ocupacion.shape, (1, 7, analitica.SLOTS_DIA))
+        # Slots de 09:00 a 10:45 del lunes: citas y capacidad acumuladas en las dos semanas
+        self.assertEqual(ocupacion[0, 0, 36:44].tolist(), [1, 1, 2, 2, 1, 1, 0, 0])
+        self.assertEqual(capacidad[0, 0, 36:44].tolist(), [2] * 8)
+        self.assertEqual(int(capacidad.sum()), 16)
+        self.assertEqual(ocupacion[0, 0, 72:74].tolist(), [1, 1])
+
+
+class EventosSseTest(TestCase):
+    """Los cambios de cita se publican tras el commit y Last-Event-ID reanuda o pide recargar."""
+
+    def setUp(self):
+        self.bus = eventos.MemoriaBackend(capacidad_registro=3, capacidad_cola=10)
+        parche = mock.patch.object(eventos, '_bus', self.bus)
+        parche.start()
+        self.addCleanup(parche.stop)
+
+    def _publicar(self, n):
+        return [self.bus.publicar(PELUQUERO_ID, eventos.TIPO_ACTUALIZADA, {'fecha': _fecha().isoformat(), 'n': i})
+                for i in range(n)]
+
+    async def _recibir(self, ultimo_id, n):
+        suscripcion = await self.bus.suscribir(PELUQUERO_ID, ultimo_id, heartbeat=0.01)
+        recibidos = []
+        try:
+            async for evento in suscripcion:
+                if evento is not None:
+                    recibidos.append(evento)
+                if len(recibidos) == n:
+                    return recibidos
+        finally:
+            await suscripcion.aclose()
+
+    def test_publica_tras_el_commit(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            cita = Cita.objects.create(mascota=_mascotas(1)[0], peluquero_id=PELUQUERO_ID, fecha=_fecha(),
+                                       hora_inicio=dt_time(10, 0), hora_fin=dt_time(10, 30))
+            self.assertFalse(self.bus._canal(PELUQUERO_ID).registro)
+
+        for callback in callbacks:
+            callback()
+        evento, = self.bus._canal(PELUQUERO_ID).registro
+        self.assertEqual((evento.tipo, evento.datos['id'], evento.datos['hora_inicio']),
+                         (eventos.TIPO_CREADA, cita.id, '10:00'))
+
+    async def test_reanuda_desde_last_event_id(self):
+        self._publicar(5)
+
+        pendientes = await self._recibir('3', 2)
+        self.assertEqual([evento.id for evento in pendientes], ['4', '5'])
+
+        # Sin id, solo lo que se publique después de suscribirse
+        suscripcion = await self.bus.suscribir(PELUQUERO_ID, heartbeat=0.01)
+        nuevo, = self._publicar(1)
+        self.assertEqual((await anext(suscripcion)).id, nuevo.id)
+        await suscripcion.aclose()
+
+    async def test_reset_si_el_id_no_esta_en_el_registro(self):
+        self._publicar(5)
+
+        # El registro conserva 3..5: el 1 ya salió; 99 y 'abc' no son de este proceso
+        for ultimo_id, motivo in (('1', 'fuera_de_registro'), ('99', 'fuera_de_registro'), ('abc', 'id_invalido')):
+            evento, = await self._recibir(ultimo_id, 1)
+            self.assertEqual((evento.tipo, evento.datos), (eventos.TIPO_RESET, {'motivo': motivo}))
+
+    async def test_stream_con_last_event_id(self):
+        self._publicar(3)
+
+        respuesta = await self.async_client.get(
+            reverse('cita-eventos'), headers={**_peluquero(), 'Last-Event-ID': '2'}
+        )
+        flujo = respuesta.streaming_content
+
+        self.assertEqual(respuesta['Content-Type'], 'text/event-stream')
+        self.assertEqual(await anext(flujo), b'retry: 3000\n\n')
+        self.assertTrue((await anext(flujo)).startswith(b'id: 3\nevent: cita_actualizada\n'))
+        await flujo.aclose()
+
+
+class BusCaidoTest(TransactionTestCase):
+    """Con el bus de eventos caído, los cambios de cita ya confirmados responden igual."""
+
+    def test_fallo_al_publicar_no_falla_la_peticion(self):
+        _jornada()
+        cita = _citas(1)[0]
+        caido = mock.Mock(**{'publicar.side_effect': ConnectionError('redis caído')})
+
+        with mock.patch.object(eventos, '_bus', caido), self.assertLogs('citas.eventos', logging.ERROR):
+            respuesta = self.client.post(reverse('cita-confirmar', args=[cita.id]), headers=_peluquero())
+
+        self.assertEqual(respuesta.status_code, 200)
+        caido.publicar.assert_called_once()
+        self.assertEqual(Cita.objects.get(pk=cita.pk).estado, EstadoCita.CONFIRMADA)
+
+
+class SembrarDatosTest(TestCase):
+    """sembrar_datos genera citas sin solapes, dentro del horario y con sus resúmenes."""
+
+    BASE = 900_000
+
+    def _sembrar(self):
+        call_command('sembrar_datos', peluqueros=3, clientes=20, mascotas=30, citas=300, dias_futuros=10,
+                     id_base=self.BASE, lote=100, stdout=StringIO())
+
+    def test_citas_sin_solapes(self):
+        self._sembrar()
+
+        citas = list(Cita.objects.order_by('peluquero_id', 'fecha', 'hora_inicio')
+                     .values_list('peluquero_id', 'fecha', 'hora_inicio', 'hora_fin', 'mascota_id', 'estado'))
+        self.assertEqual(len(citas), 300)
+        for anterior, cita in zip(citas, citas[1:]):
+            if anterior[:2] == cita[:2]:
+                self.assertLessEqual(anterior[3], cita[2], f'Solape: {anterior} y {cita}')
+
+        fechas = [cita[1] for cita in citas]
+        horario = horarios.efectivo(min(fechas), max(fechas))
+        for peluquero_id, fecha, hora_inicio, hora_fin, _, _ in citas:
+            self.assertTrue(horarios.contiene(horario[(peluquero_id, fecha)], horarios.minutos(hora_inicio),
+                                              horarios.minutos(hora_fin)))
+
+        # Las futuras activas no repiten mascota con el mismo peluquero el mismo día
+        activas = [cita[:2] + cita[4:5] for cita in citas
+                   if cita[1] >= date.today() and cita[5] != EstadoCita.CANCELADA]
+        self.assertEqual(len(activas), len(set(activas)))
+        self.assertEqual(sum(ResumenCita.objects.values_list('cantidad', flat=True)), 300)
+
+    def test_no_siembra_dos_veces(self):
+        self._sembrar()
+
+        with self.assertRaisesMessage(CommandError, 'Ya hay datos'):
+            self._sembrar()
+
+
+REPLICA = 'replica_0'
+
+
+class ReplicaRouterTest(TransactionTestCase):
+    """
+    Con una réplica (alias replica_0: otra conexión a la BD de tests) las
+    lecturas seguras van a ella y el resto se queda en el primario.
+    """
+    # La réplica se declara en setUpClass (el runner solo prepara las BD de settings)
+    databases = '__all__'
+
+    @classmethod
+    def setUpClass(cls):
+        connections.settings[REPLICA] = {**connections['default'].settings_dict, 'TEST': {'MIRROR': 'default'}}
+        cls.enterClassContext(mock.patch.object(replicas, 'alias_replicas', return_value=[REPLICA]))
+        cls.enterClassContext(override_settings(DATABASE_ROUTERS=['citas.replicas.ReplicaRouter']))
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        connections[REPLICA].close()
+        del connections[REPLICA]
+        del connections.settings[REPLICA]
+
+    def setUp(self):
+        self.servicio = _servicios(1)[0]
+
+    def _consultas(self, peticion):
+        """(respuesta, consultas al primario, consultas a la réplica)."""
+        with CaptureQueriesContext(connections['default']) as primario, \
+                CaptureQueriesContext(connections[REPLICA]) as replica:
+            respuesta = peticion()
+        return respuesta, len(primario), len(replica)
+
+    def test_lecturas_seguras_en_la_replica(self):
+        lista, primario, replica = self._consultas(lambda: self.client.get(reverse('servicio-list')))
+        detalle, _, replica_detalle = self._consultas(
+            lambda: self.client.get(reverse('servicio-detail', args=[self.servicio.id]))
+        )
+
+        self.assertEqual([servicio['id'] for servicio in lista.json()], [self.servicio.id])
+        self.assertEqual((primario, replica), (0, 1))
+        self.assertEqual((detalle.status_code, replica_detalle), (200, 1))
+
+    def test_escrituras_en_el_primario_y_lecturas_pegadas(self):
+        alta, _, replica = self._consultas(lambda: self.client.post(
+            reverse('servicio-list'), {'nombre': 'Nuevo', 'duracion_minutos': 30, 'precio': '12.00'},
+            content_type='application/json', headers=_admin(),
+        ))
+        self.assertEqual((alta.status_code, replica), (201, 0))
+        self.assertIn(replicas.COOKIE, alta.cookies)
+        self.assertIn(replicas.CABECERA_RESPUESTA, alta)
+
+        # El cliente de pruebas reenvía la cookie: lee del primario lo que acaba de escribir
+        _, primario, replica = self._consultas(lambda: self.client.get(reverse('servicio-list')))
+        self.assertEqual((primario, replica), (1, 0))
+        # Sin cookie, pero con la cabecera del instante de pegado
+        self.client.cookies.clear()
+        _, primario, replica = self._consultas(lambda: self.client.get(
+            reverse('servicio-list'), headers={'X-Citas-Primario-Hasta': alta[replicas.CABECERA_RESPUESTA]},
+        ))
+        self.assertEqual((primario, replica), (1, 0))
+
+    def test_leer_primario_a_peticion(self):
+        _, primario, replica = self._consultas(
+            lambda: self.client.get(reverse('servicio-list'), headers={'X-Leer-Primario': '1'})
+        )
+        self.assertEqual((primario, replica), (1, 0))
+
+    def test_router_en_transacciones_y_select_for_update(self):
+        token = replicas._estado.set(replicas._EstadoPeticion(pegado=False))
+        try:
+            replicas.permitir_replica()
+            self.assertEqual(Servicio.objects.all().db, REPLICA)
+            self.assertEqual(Servicio.objects.select_for_update().db, 'default')
+            with transaction.atomic():
+                self.assertEqual(Servicio.objects.all().db, 'default')
+            self.assertEqual(router.db_for_write(Servicio), 'default')
+        finally:
+            replicas._estado.reset(token)
+
+
+class CalendarioTest(TestCase):
+    """Feed iCalendar: token con secreto rotatorio, respuestas condicionales y contenido."""
+
+    def setUp(self):
+        self.cita = _citas(1)[0]
+        self.token = calendario.generar_token(calendario.TIPO_CLIENTE, CLIENTE_ID)
+
+    def _feed(self, token=None, **cabeceras):
+        respuesta = self.client.get(reverse('calendario-feed', args=[token or self.token]), headers=cabeceras)
+        contenido = b''.join(respuesta.streaming_content).decode() if respuesta.status_code == 200 else ''
+        return respuesta, contenido
+
+    def test_token(self):
+        self.assertEqual(calendario.leer_token(self.token), (calendario.TIPO_CLIENTE, CLIENTE_ID))
+        self.assertEqual(calendario.generar_token(calendario.TIPO_CLIENTE, CLIENTE_ID), self.token)
+        self.assertIsNone(calendario.leer_token(self.token[:-1] + ('A' if self.token[-1] != 'A' else 'B')))
+        # Sin secreto (formato anterior) o firmado para otro propietario
+        self.assertIsNone(calendario.leer_token(signing.Signer(salt=calendario.SALT_CALENDARIO).sign(f'c{CLIENTE_ID}')))
+        self.assertIsNone(calendario.leer_token(calendario._firmar(calendario.TIPO_PELUQUERO, PELUQUERO_ID, 'x')))
+        self.assertEqual(self._feed(token='no-firmado')[0].status_code, 404)
+
+    def test_rotar_invalida_la_url_anterior(self):
+        respuesta = self.client.post(reverse('cita-rotar-calendario'), headers=_cliente())
+
+        nuevo = respuesta.json()['token']
+        self.assertNotEqual(nuevo, self.token)
+        self.assertTrue(respuesta.json()['url'].endswith(reverse('calendario-feed', args=[nuevo])))
+        self.assertEqual(self._feed()[0].status_code, 404)
+        self.assertEqual(self._feed(token=nuevo)[0].status_code, 200)
+        self.assertEqual(self.client.get(reverse('cita-feed-calendario'), headers=_cliente()).json()['token'], nuevo)
+        self.assertEqual(self.client.post(reverse('cita-rotar-calendario'), headers=_admin()).status_code, 400)
+
+    def test_contenido_del_feed(self):
+        respuesta, contenido = self._feed()
+
+        self.assertEqual(respuesta['Content-Type'], 'text/calendar; charset=utf-8')
+        self.assertTrue(contenido.startswith('BEGIN:VCALENDAR\r\n'))
+        self.assertIn(f'UID:cita-{self.cita.id}@citas_service\r\n', contenido)
+        self.assertIn(f'DTSTART:{_fecha():%Y%m%d}T060000\r\n', contenido)
+        self.assertIn('SUMMARY:Servicio 0 - Mascota 0\r\n', contenido)
+        self.assertIn('STATUS:TENTATIVE\r\n', contenido)
+        self.assertTrue(contenido.endswith('END:VCALENDAR\r\n'))
+
+    def test_respuestas_condicionales(self):
+        respuesta, _ = self._feed()
+
+        self.assertEqual(self._feed(**{'If-None-Match': respuesta['ETag']})[0].status_code, 304)
+        self.assertEqual(self._feed(**{'If-Modified-Since': respuesta['Last-Modified']})[0].status_code, 304)
+        self.assertEqual(self._feed(**{'If-None-Match': '"otra"'})[0].status_code, 200)
+
+    def test_renombrar_servicio_o_mascota_cambia_la_version(self):
+        etag = self._feed()[0]['ETag']
+        servicio = self.cita.servicio
+        servicio.nombre = 'Corte renombrado'
+        servicio.save()
+
+        respuesta, contenido = self._feed(**{'If-None-Match': etag})
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertIn('SUMMARY:Corte renombrado - Mascota 0\r\n', contenido)
+
+        mascota = self.cita.mascota
+        mascota.nombre = 'Toby'
+        mascota.save()
+        respuesta, contenido = self._feed(**{'If-None-Match': respuesta['ETag']})
+        self.assertIn('SUMMARY:Corte renombrado - Toby\r\n', contenido)
+
+
+
+def _muestra(nombre, **etiquetas):
+    """Valor actual de una muestra del registro Prometheus de este proceso (0 si aún no existe)."""
+    return REGISTRY.get_sample_value(nombre, etiquetas) or 0
+
+class RendimientoTest(TestCase):
+    """RendimientoMiddleware (comun/rendimiento.py): Server-Timing y log de peticiones lentas."""
+
+    def setUp(self):
+        _servicios(2)
+
+    @override_settings(RENDIMIENTO={'UMBRAL_LENTO_MS': 0, 'SERVER_TIMING': True})
+    def test_server_timing_y_peticion_lenta(self):
+        peticiones = _muestra('http_peticiones_total', ruta='ServiciosAsyncView.get', metodo='GET', estado='200')
+
+        with self.assertLogs('rendimiento', 'WARNING') as logs:
+            respuesta = self.client.get(reverse('servicio-list'))
+
+        self.assertRegex(
+            respuesta['Server-Timing'], r'^app;dur=[\d.]+, db;dur=[\d.]+;desc="1 consultas", vista;dur=[\d.]+$'
+        )
+        registro, = logs.records
+        self.assertEqual((registro.evento, registro.ruta, registro.estado, registro.consultas),
+                         ('peticion_lenta', 'ServiciosAsyncView.get', 200, 1))
+        self.assertIn('citas_servicio', registro.sql[0]['sql'])
+        self.assertGreater(registro.vista_ms, 0)
+        self.assertLessEqual(registro.vista_ms, registro.duracion_ms)
+        self.assertEqual(
+            _muestra('http_peticiones_total', ruta='ServiciosAsyncView.get', metodo='GET', estado='200'),
+            peticiones + 1,
+        )
+
+    @override_settings(RENDIMIENTO={'UMBRAL_LENTO_MS': 60_000, 'SERVER_TIMING': True})
+    async def test_tiempo_de_vista_en_asgi(self):
+        respuesta = await self.async_client.get(reverse('servicio-list'))
+
+        self.assertGreater(float(re.search(r'vista;dur=([\d.]+)', respuesta['Server-Timing']).group(1)), 0)
+
+    @override_settings(RENDIMIENTO={'UMBRAL_LENTO_MS': 60_000, 'SERVER_TIMING': False})
+    def test_sin_cabecera_ni_log_por_debajo_del_umbral(self):
+        with self.assertNoLogs('rendimiento', 'WARNING'):
+            respuesta = self.client.get(reverse('servicio-list'))
+
+        self.assertNotIn('Server-Timing', respuesta)
+
+
+def _metricas(client):
+    """Muestras de GET /metrics: {(nombre, etiquetas ordenadas): valor}."""
+    respuesta = client.get('/metrics')
+    return {
+        (muestra.name, tuple(sorted(muestra.labels.items()))): muestra.value
+        for familia in text_string_to_metric_families(respuesta.content.decode())
+        for muestra in familia.samples
+    }
+
+
+class MetricasTest(TestCase):
+    """GET /metrics (comun/metricas.py y citas/metricas.py) expone los contadores y colectores."""
+
+    def _reservar(self, mascota, hora_inicio, hora_fin):
+        return self.client.post(
+            reverse('cita-list'),
+            {'mascota': mascota.id, 'peluquero_id': PELUQUERO_ID, 'fecha': _fecha().isoformat(),
+             'hora_inicio': hora_inicio, 'hora_fin': hora_fin},
+            content_type='application/json', headers=_cliente(),
+        )
+
+    def test_contadores_de_peticiones_y_de_negocio(self):
+        Horario.objects.create(peluquero_id=PELUQUERO_ID, dia_semana=_fecha().weekday(),
+                               hora_inicio=dt_time(9, 0), hora_fin=dt_time(13, 0))
+        mascotas = _mascotas(2)
+        antes = _metricas(self.client)
+
+        self.assertEqual(self.client.get(reverse('servicio-list')).status_code, 200)
+        self.assertEqual(self._reservar(mascotas[0], '09:00', '09:30').status_code, 201)
+        self.assertEqual(self._reservar(mascotas[1], '12:30', '13:30').status_code, 400)
+        despues = _metricas(self.client)
+
+        def incremento(nombre, **etiquetas):
+            clave = (nombre, tuple(sorted(etiquetas.items())))
+            return despues.get(clave, 0) - antes.get(clave, 0)
+
+        self.assertEqual(incremento('http_peticiones_total', ruta='ServiciosAsyncView.get', metodo='GET', estado='200'), 1)
+        self.assertEqual(incremento('http_peticiones_total', ruta='CitaViewSet.create', metodo='POST', estado='201'), 1)
+        self.assertEqual(incremento('http_peticiones_total', ruta='CitaViewSet.create', metodo='POST', estado='400'), 1)
+        self.assertEqual(incremento('http_peticion_duracion_segundos_count', ruta='CitaViewSet.create', metodo='POST'), 2)
+        self.assertEqual(incremento('citas_reservas_rechazadas_total', motivo='fuera_de_horario'), 1)
+        # La segunda reserva encuentra el horario en la copia local del proceso
+        self.assertGreaterEqual(incremento('citas_cache_total', cache='horario', resultado='acierto'), 1)
+        self.assertEqual(despues[('citas_pendientes', ())], 1)
+
+    @override_settings(METRICAS={'TOKEN': 'secreto', 'IPS_PERMITIDAS': ['127.0.0.1']})
+    def test_acceso_restringido(self):
+        externa = {'REMOTE_ADDR': '172.18.0.1'}
+
+        self.assertEqual(self.client.get('/metrics').status_code, 200)
+        self.assertEqual(self.client.get('/metrics', **externa).status_code, 403)
+        self.assertEqual(
+            self.client.get('/metrics', headers={'Authorization': 'Bearer otro'}, **externa).status_code, 403
+        )
+        self.assertEqual(
+            self.client.get('/metrics', headers={'Authorization': 'Bearer secreto'}, **externa).status_code, 200
+        )
+
+
+class BitacoraTest(TestCase):
+    """Logging estructurado (comun/bitacora.py): formato JSON, cola acotada y muestreo."""
+
+    def _registro(self, mensaje='Cita %s reservada', args=(1,), nivel=logging.INFO, **extra):
+        registro = logging.LogRecord('citas.views', nivel, __file__, 1, mensaje, args, None)
+        registro.__dict__.update(extra)
+        return registro
+
+    def test_formato_json(self):
+        try:
+            raise ValueError('sin hueco')
+        except ValueError:
+            registro = self._registro(evento='cita_reservada', cita_id=1, request_id='abc', trace_id='f' * 32)
+            registro.exc_info = sys.exc_info()
+
+        datos = json.loads(bitacora.FormatoJSON().format(registro))
+
+        self.assertEqual(
+            {clave: datos[clave] for clave in ('nivel', 'logger', 'mensaje', 'evento', 'cita_id', 'request_id', 'trace_id')},
+            {'nivel': 'INFO', 'logger': 'citas.views', 'mensaje': 'Cita 1 reservada', 'evento': 'cita_reservada',
+             'cita_id': 1, 'request_id': 'abc', 'trace_id': 'f' * 32},
+        )
+        self.assertRegex(datos['fecha'], r'^\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2}\.\d{3}\+00:00$')
+        self.assertIn('ValueError: sin hueco', datos['excepcion'])
+        self.assertNotIn('args', datos)
+
+    def test_cola_llena_descarta_sin_bloquear(self):
+        # Sin hilo escritor nadie vacía la cola de un hueco
+        with mock.patch.object(bitacora.Escritor, 'start'):
+            handler = bitacora.ColaHandler(logging.NullHandler(), cola=queue.Queue(1))
+        self.addCleanup(handler.close)
+        antes = bitacora.descartados()
+        original = self._registro(args=(0,))
+        handler.emit(original)
+        for i in range(1, 3):
+            handler.emit(self._registro(args=(i,)))
+
+        self.assertEqual(bitacora.descartados() - antes, 2)
+        registro = handler.queue.get_nowait()
+        # El mensaje se fija al encolar, sobre una copia: los demás handlers reciben el original
+        self.assertEqual((registro.msg, registro.args), ('Cita 0 reservada', None))
+        self.assertEqual(original.args, (0,))
+
+    def test_cola_escribe_en_destino(self):
+        recibidos = []
+        destino = logging.Handler()
+        destino.emit = recibidos.append
+        handler = bitacora.ColaHandler(destino)
+        handler.handle(self._registro())
+        handler.close()
+
+        self.assertEqual([registro.getMessage() for registro in recibidos], ['Cita 1 reservada'])
+
+    def test_muestreo_una_decision_por_registro(self):
+        muestreo = bitacora.FiltroMuestreo({'citas': '0.5'})
+        consola, fichero = [], []
+        logger = logging.Logger('citas.views')
+        for destino in (consola, fichero):
+            handler = logging.Handler()
+            handler.emit = destino.append
+            handler.addFilter(muestreo)
+            logger.addHandler(handler)
+
+        with mock.patch.object(bitacora.random, 'random', side_effect=[0.9, 0.1]) as sorteo:
+            logger.info('descartado')
+            logger.info('conservado')
+
+        self.assertEqual(sorteo.call_count, 2)
+        self.assertEqual([registro.msg for registro in consola], ['conservado'])
+        self.assertEqual([registro.msg for registro in fichero], ['conservado'])
+
+    def test_muestreo_por_logger(self):
+        muestreo = bitacora.FiltroMuestreo({'citas': '0', 'citas.views': '1'})
+
+        self.assertTrue(muestreo.filter(self._registro()))
+        otro = self._registro()
+        otro.name = 'citas.outbox'
+        self.assertFalse(muestreo.filter(otro))
+        otro.levelno = logging.WARNING
+        self.assertTrue(muestreo.filter(otro))
@@ -0,0 +1,116 @@
+"""
+Transiciones de estado de citas en bloque (POST /api/citas/estado-lote/) y
+efectos de Cita.save() para los cambios en bloque (series, reasignaciones).
+
+Cada cita se valida con las mismas reglas que los métodos del modelo
+(Cita.error_de_transicion), pero en lugar de un get_object() y un save() por
+cita se hace una sola lectura de todas las citas del lote y un único UPDATE
+por estado destino. El UPDATE va condicionado a los estados leídos: si una cita
+cambió entre la lectura y la escritura (sin bloqueo de filas, como en SQLite)
+no se actualiza, el número de filas no cuadra y se revierte todo el lote.
+"""
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from . import eventos, outbox, recordatorios, resumenes
+from .models import Cita, EstadoCita
+
+ESTADOS_DESTINO = (EstadoCita.CONFIRMADA, EstadoCita.CANCELADA, EstadoCita.FINALIZADA, EstadoCita.NO_ASISTIO)
+MAX_CITAS = resumenes.TAMANO_LOTE
+
+
+class TransicionConcurrente(Exception):
+    """Alguna cita del lote cambió de estado durante la operación."""
+
+
+def registrar(filas, estado_nuevo):
+    """
+    Efectos de Cita.save() de una transición en bloque (filas con
+    resumenes.CAMPOS y su estado anterior): ResumenCita, recordatorios, outbox
+    y bus de eventos. Debe llamarse dentro de la transacción del cambio.
+    """
+    if not filas:
+        return
+    resumenes.registrar_lote(filas, estado_nuevo)
+    if estado_nuevo in recordatorios.ESTADOS_CERRADOS:
+        recordatorios.cancelar_de_citas([datos['id'] for datos in filas])
+    cambios = [
+        evento
+        for datos in filas
+        for evento in eventos.eventos_de_cambio(datos, {**datos, 'estado': estado_nuevo})
+    ]
+    outbox.registrar(cambios)
+    eventos.publicar_al_confirmar(cambios)
+
+
+def registrar_cambios(pares):
+    """
+    Efectos de Cita.save() para varias citas creadas o movidas a la vez:
+    pares (anterior, actual) con resumenes.CAMPOS, anterior None en las altas.
+    Los recordatorios se reprograman solo si cambió la fecha u hora de inicio.
+    """
+    if not pares:
+        return
+    resumenes.registrar_cambios(pares)
+    reprogramar = [
+        (anterior, actual) for anterior, actual in pares
+        if anterior is None or (anterior['fecha'], anterior['hora_inicio']) != (actual['fecha'], actual['hora_inicio'])
+    ]
+    movidas = [anterior['id'] for anterior, _ in reprogramar if anterior is not None]
+    if movidas:
+        recordatorios.cancelar_de_citas(movidas)
+    recordatorios.programar([actual for _, actual in reprogramar])
+    cambios = [evento for anterior, actual in pares for evento in eventos.eventos_de_cambio(anterior, actual)]
+    outbox.registrar(cambios)
+    eventos.publicar_al_confirmar(cambios)
+
+
+def _error(datos, estado_nuevo, usuario, ahora):
+    if datos is None:
+        return "Cita no encontrada"
+    if usuario.rol == 'PELUQUERO' and datos['peluquero_id'] != usuario.id:
+        return "No tienes permiso sobre esta cita"
+    return Cita.error_de_transicion(datos['estado'], estado_nuevo, datos['fecha'], datos['hora_fin'], ahora)
+
+
+def aplicar(transiciones, usuario, ahora=None):
+    """
+    Aplica [(cita_id, estado_nuevo)] en una transacción. El peluquero solo puede
+    cambiar sus citas; el admin, cualquiera. Las que no cumplen las reglas se
+    omiten y el resto se aplica.
+    Retorna un resultado por transición, en el orden recibido:
+    {"id", "ok": True, "estado_anterior", "estado"} o {"id", "ok": False, "error"}.
+    Lanza TransicionConcurrente si alguna cita cambió durante la operación.
+    """
+    ahora = ahora or timezone.now()
+    with transaction.atomic():
+        filas = {
+            datos['id']: datos
+            for datos in Cita.objects.filter(pk__in=[cita_id for cita_id, _ in transiciones])
+            .select_for_update().values(*resumenes.CAMPOS)
+        }
+        resultados = []
+        aceptadas = defaultdict(list)
+        vistas = set()
+        for cita_id, estado_nuevo in transiciones:
+            datos = filas.get(cita_id)
+            error = "Cita repetida en el lote" if cita_id in vistas else _error(datos, estado_nuevo, usuario, ahora)
+            vistas.add(cita_id)
+            if error:
+                resultados.append({"id": cita_id, "ok": False, "error": error})
+                continue
+            aceptadas[estado_nuevo].append(datos)
+            resultados.append({"id": cita_id, "ok": True, "estado_anterior": datos['estado'], "estado": estado_nuevo})
+
+        for estado_nuevo, lote in aceptadas.items():
+            actualizadas = Cita.objects.filter(
+                pk__in=[datos['id'] for datos in lote],
+                estado__in={datos['estado'] for datos in lote},
+            ).update(estado=estado_nuevo, actualizada_en=ahora, version=F('version') + 1)
+            if actualizadas != len(lote):
+                raise TransicionConcurrente()
+            registrar(lote, estado_nuevo)
+    return resultados
@@ -1,14 +1,31 @@
 from django.urls import path, include
+from django.views.decorators.csrf import csrf_exempt
 from rest_framework.routers import DefaultRouter
-from .views import CitaViewSet, HorarioViewSet, MascotaViewSet, ServicioViewSet
+from .views import (
+    CitaViewSet, HorarioExcepcionViewSet, HorarioViewSet, MascotaViewSet, ServicioViewSet, CalendarioFeedView, EstadisticasView,
+    OcupacionView, EventosCitaView, MisCitasAsyncView, CitasDelDiaAsyncView, DisponibilidadAsyncView,
+    ServiciosAsyncView,
+)
 
 router = DefaultRouter()
 router.register(r'citas', CitaViewSet, basename='cita')
 router.register(r'horarios', HorarioViewSet, basename='horario')
+router.register(r'horarios-excepciones', HorarioExcepcionViewSet, basename='horario-excepcion')
 router.register(r'mascotas', MascotaViewSet, basename='mascota')
 router.register(r'servicios', ServicioViewSet, basename='servicio')
 
 urlpatterns = [
+    # Antes del router: 'citas/eventos/' coincidiría con el detalle 'citas/<pk>/'
+    path('citas/eventos/', EventosCitaView.as_view(), name='cita-eventos'),
+    # Lecturas asíncronas (ver LecturaAsyncView)
+    path('citas/mis_citas/', MisCitasAsyncView.as_view(), name='cita-mis-citas'),
+    path('citas/dia/', CitasDelDiaAsyncView.as_view(), name='cita-citas-del-dia'),
+    path('citas/disponibilidad/', DisponibilidadAsyncView.as_view(), name='cita-disponibilidad'),
+    # Autenticación JWT sin sesión: el POST delegado en ServicioViewSet no usa CSRF, como en DRF
+    path('servicios/', csrf_exempt(ServiciosAsyncView.as_view()), name='servicio-lista-async'),
     path('', include(router.urls)),
+    path('calendario/<str:token>.ics', CalendarioFeedView.as_view(), name='calendario-feed'),
+    path('estadisticas/', EstadisticasView.as_view(), name='estadisticas'),
+    path('analitica/ocupacion/', OcupacionView.as_view(), name='analitica-ocupacion'),
 ]
 
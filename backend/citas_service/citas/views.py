@@ -1,18 +1,48 @@
+import logging
+from abc import ABCMeta, abstractmethod
+
 from rest_framework import viewsets, status
 from rest_framework.decorators import action
+from rest_framework.exceptions import APIException
 from rest_framework.response import Response
-from rest_framework.permissions import IsAuthenticated, AllowAny
+from rest_framework.permissions import SAFE_METHODS, IsAuthenticated, AllowAny
+from rest_framework.views import APIView
+from django.conf import settings
 from django.core.exceptions import ValidationError
-from .models import Cita, Horario, Mascota, EstadoCita, Servicio
+from django.db import transaction
+from django.db.models import F, Q, Sum
+from django.http import HttpResponse, HttpResponseNotModified, JsonResponse, StreamingHttpResponse
+from django.urls import reverse
+from django.views import View
+from django.utils import timezone
+from django.utils.http import http_date, parse_http_date_safe
+from . import (
+    agenda, analitica, archivo, calendario, eventos, horarios, huecos, reasignacion, replicas, series, transiciones,
+)
+from .authentication import autenticar_peticion
+from .replicas import LecturaEnReplicaMixin
+from .models import Cita, CitaModificada, Horario, HorarioExcepcion, Mascota, EstadoCita, Servicio, ResumenCita
 from .serializers import (
+    AusenciaSerializer,
     CitaSerializer,
     CitaCreateSerializer,
     CitaDetailSerializer,
+    CitaHistoricaSerializer,
+    EstadoLoteSerializer,
+    HorarioExcepcionSerializer,
     HorarioSerializer,
     MascotaSerializer,
-    ServicioSerializer
+    ReagendarSerializer,
+    SerieCancelarSerializer,
+    SerieCitaSerializer,
+    SerieReagendarSerializer,
+    ServicioSerializer,
+    comprobar_agenda,
+    comprobar_horario,
 )
 
+logger = logging.getLogger(__name__)
+
 
 class IsAdmin(IsAuthenticated):
     """Permiso: solo usuarios con rol ADMIN."""
@@ -40,7 +70,7 @@ class IsPeluquero(IsAuthenticated):
         return hasattr(request.user, 'rol') and request.user.rol == 'PELUQUERO'
 
 
-class ServicioViewSet(viewsets.ModelViewSet):
+class ServicioViewSet(LecturaEnReplicaMixin, viewsets.ModelViewSet):
     """
     ViewSet para gestionar servicios.
     - GET: Acceso público (lista servicios activos)
@@ -101,7 +131,7 @@ class MascotaViewSet(viewsets.ModelViewSet):
         return [IsAuthenticated()]
 
 
-class HorarioViewSet(viewsets.ModelViewSet):
+class HorarioViewSet(LecturaEnReplicaMixin, viewsets.ModelViewSet):
     """
     ViewSet para gestionar horarios de peluqueros.
     - Solo ADMIN puede crear/editar/eliminar horarios.
@@ -136,19 +166,66 @@ class HorarioViewSet(viewsets.ModelViewSet):
     def perform_create(self, serializer):
         """
         Al crear, el admin debe especificar el peluquero_id en el body.
+        La semana compilada del peluquero se recalcula en la misma transacción (signals.py).
         """
-        serializer.save()
+        with transaction.atomic():
+            serializer.save()
 
     def perform_update(self, serializer):
         """Solo ADMIN actualiza horarios."""
-        serializer.save()
+        with transaction.atomic():
+            serializer.save()
+
+    def perform_destroy(self, instance):
+        with transaction.atomic():
+            instance.delete()
 
     def destroy(self, request, *args, **kwargs):
         """Solo ADMIN elimina horarios; respuesta clara."""
         return super().destroy(request, *args, **kwargs)
 
 
-class CitaViewSet(viewsets.ModelViewSet):
+class HorarioExcepcionViewSet(viewsets.ModelViewSet):
+    """
+    Cierres (festivos, vacaciones) y turnos extra sobre el horario semanal.
+    - Solo ADMIN puede crear/editar/eliminar excepciones.
+    - Todos los usuarios autenticados pueden verlas.
+    Filtros: ?peluquero_id=X (incluye las de todos los peluqueros), ?desde=YYYY-MM-DD, ?hasta=YYYY-MM-DD
+    """
+    queryset = HorarioExcepcion.objects.all()
+    serializer_class = HorarioExcepcionSerializer
+
+    def get_permissions(self):
+        if self.action in ['create', 'update', 'partial_update', 'destroy']:
+            return [IsAdmin()]
+        return [IsAuthenticated()]
+
+    def get_queryset(self):
+        queryset = HorarioExcepcion.objects.all()
+        peluquero_id = self.request.query_params.get('peluquero_id')
+        if peluquero_id:
+            queryset = queryset.filter(Q(peluquero_id=peluquero_id) | Q(peluquero_id__isnull=True))
+        desde = self.request.query_params.get('desde')
+        if desde:
+            queryset = queryset.filter(hasta__gte=desde)
+        hasta = self.request.query_params.get('hasta')
+        if hasta:
+            queryset = queryset.filter(desde__lte=hasta)
+        return queryset
+
+
+def etag_cita(cita):
+    """ETag de una cita: su versión, que cambia con cada escritura."""
+    return f'"{cita.version}"'
+
+
+class PrecondicionRequerida(APIException):
+    status_code = status.HTTP_428_PRECONDITION_REQUIRED
+    default_detail = 'Envía la cabecera If-Match con el ETag de la cita'
+    default_code = 'precondicion_requerida'
+
+
+class CitaViewSet(LecturaEnReplicaMixin, viewsets.ModelViewSet):
     """
     ViewSet para gestionar citas.
     
@@ -156,8 +233,18 @@ class CitaViewSet(viewsets.ModelViewSet):
     - CLIENTE: puede agendar (create), ver sus citas (list), cancelar (cancel action)
     - PELUQUERO: puede ver sus citas asignadas, confirmar (confirm action)
     - ADMIN: acceso total
+
+    Concurrencia optimista: las respuestas de una cita llevan ETag con su versión
+    y las acciones que la modifican aceptan If-Match (obligatorio con
+    CITAS_CONCURRENCIA['IF_MATCH_OBLIGATORIO']). Un If-Match obsoleto responde 412;
+    si la cita cambia entre la lectura y la escritura de la propia petición,
+    el guardado condicionado a la versión (Cita._do_update) también falla
+    (412 con If-Match, 409 sin él).
     """
     queryset = Cita.objects.all()
+    # Listados de solo lectura que pueden servirse desde una réplica (ver citas/replicas.py).
+    # mis_citas, citas_del_dia y disponibilidad son vistas asíncronas (ver CitasAsyncView).
+    acciones_replica = ('list', 'retrieve')
     
     def get_serializer_class(self):
         """Usar serializer adecuado según la acción."""
@@ -177,6 +264,42 @@ class CitaViewSet(viewsets.ModelViewSet):
             return [IsAdmin()]
         return [IsAuthenticated()]
     
+    def get_object(self):
+        """Cita del detalle. En las acciones que la modifican, comprueba If-Match."""
+        cita = super().get_object()
+        if self.request.method not in SAFE_METHODS:
+            if_match = self.request.headers.get('If-Match')
+            if if_match is None:
+                if settings.CITAS_CONCURRENCIA['IF_MATCH_OBLIGATORIO']:
+                    raise PrecondicionRequerida()
+            else:
+                etags = [valor.strip().removeprefix('W/') for valor in if_match.split(',')]
+                if '*' not in etags and etag_cita(cita) not in etags:
+                    raise CitaModificada()
+        self.cita = cita
+        return cita
+
+    def handle_exception(self, exc):
+        if isinstance(exc, CitaModificada):
+            if 'If-Match' in self.request.headers:
+                return Response(
+                    {"error": "La cita fue modificada por otra persona, vuelve a cargarla"},
+                    status=status.HTTP_412_PRECONDITION_FAILED
+                )
+            return Response(
+                {"error": "La cita cambió durante la operación, vuelve a intentarlo"},
+                status=status.HTTP_409_CONFLICT
+            )
+        return super().handle_exception(exc)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        """Añade el ETag de la cita leída o modificada por la petición."""
+        response = super().finalize_response(request, response, *args, **kwargs)
+        cita = getattr(self, 'cita', None)
+        if cita is not None and status.is_success(response.status_code) and request.method != 'DELETE':
+            response['ETag'] = etag_cita(cita)
+        return response
+
     def get_queryset(self):
         """Filtrar citas según el rol del usuario y auto-finalizar vencidas.
 
@@ -188,24 +311,11 @@ class CitaViewSet(viewsets.ModelViewSet):
         from django.utils import timezone
         now = timezone.localtime()
 
-        # Citas vencidas por fecha pasada
-        vencidas_fecha = Cita.objects.filter(
-            estado__in=[EstadoCita.PENDIENTE, EstadoCita.CONFIRMADA],
-            fecha__lt=now.date()
-        )
-
-        # Citas de hoy que ya terminaron
-        vencidas_hoy = Cita.objects.filter(
-            estado__in=[EstadoCita.PENDIENTE, EstadoCita.CONFIRMADA],
-            fecha=now.date(),
-            hora_fin__lt=now.time()
-        )
+        # Bulk update de citas vencidas (fecha pasada o de hoy ya terminadas);
+        # también actualiza ResumenCita en la misma transacción
+        Cita.objects.finalizar_vencidas(now)
 
-        # Bulk update si hay alguna
-        if vencidas_fecha.exists() or vencidas_hoy.exists():
-            (vencidas_fecha | vencidas_hoy).update(estado=EstadoCita.FINALIZADA, actualizada_en=now)
-
-        queryset = Cita.objects.all().select_related('mascota').order_by('-fecha', '-hora_inicio')
+        queryset = Cita.objects.all().select_related('mascota', 'servicio').order_by('-fecha', '-hora_inicio')
 
         # Filtros por query params (para disponibilidad, sin limitar por dueño)
         peluquero_id_param = self.request.query_params.get('peluquero_id')
@@ -233,35 +343,23 @@ class CitaViewSet(viewsets.ModelViewSet):
         """
         Al crear cita, validar que el cliente solo pueda agendar para sus propias mascotas.
         """
-        # DEBUG: Imprimir información del request
-        print("=" * 60)
-        print("🔍 DEBUG - perform_create CitaViewSet")
-        print(f"📨 Request user: {self.request.user}")
-        print(f"🔐 Is authenticated: {self.request.user.is_authenticated}")
-        print(f"👤 User type: {type(self.request.user)}")
-        print(f"📋 Has 'rol' attr: {hasattr(self.request.user, 'rol')}")
-        if hasattr(self.request.user, 'rol'):
-            print(f"🎭 Rol value: '{self.request.user.rol}'")
-        if hasattr(self.request.user, '__dict__'):
-            print(f"📦 User attrs: {self.request.user.__dict__}")
-        print("=" * 60)
-        
         # Verificar que el usuario está autenticado
         if not self.request.user.is_authenticated:
-            print("❌ Usuario NO autenticado")
             raise ValidationError("Debes estar autenticado para agendar una cita")
         
         # Verificar que el usuario es cliente
         if not hasattr(self.request.user, 'rol'):
-            print("❌ Usuario NO tiene atributo 'rol'")
             raise ValidationError("El usuario no tiene rol asignado. Contacta al administrador.")
         
         if self.request.user.rol != 'CLIENTE':
-            print(f"❌ Rol incorrecto: '{self.request.user.rol}' (esperado: 'CLIENTE')")
             raise ValidationError(f"Solo los clientes pueden agendar citas. Tu rol es: {self.request.user.rol}")
         
-        print("✅ Validación de rol exitosa - Usuario es CLIENTE")
-        serializer.save()
+        cita = self.cita = serializer.save()
+        logger.info(
+            'Cita %s reservada', cita.id,
+            extra={'evento': 'cita_reservada', 'cita_id': cita.id, 'peluquero_id': cita.peluquero_id,
+                   'usuario_id': self.request.user.id, 'fecha_cita': cita.fecha},
+        )
     
     @action(detail=True, methods=['post'], permission_classes=[IsPeluquero])
     def cancelar(self, request, pk=None):
@@ -350,6 +448,11 @@ class CitaViewSet(viewsets.ModelViewSet):
         """
         Reagendar una cita a una nueva fecha y hora.
         El cliente puede reagendar sus propias citas.
+        Body: {"fecha": "YYYY-MM-DD", "hora_inicio": "HH:MM", "hora_fin": "HH:MM"}
+        (si la cita tiene servicio, hora_fin se calcula y se puede omitir).
+        Pasa por las mismas validaciones y el mismo bloqueo de agenda que al agendar
+        (ver citas/agenda.py), sin contar la propia cita, y mueve la franja en una
+        transacción, sobre la misma versión de la cita que se leyó.
         """
         cita = self.get_object()
         
@@ -360,44 +463,35 @@ class CitaViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_403_FORBIDDEN
             )
         
-        # Validar que la cita esté en estado PENDIENTE
-        if cita.estado not in [EstadoCita.PENDIENTE]:
-            return Response(
-                {"error": "Solo se pueden reagendar citas en estado PENDIENTE"},
-                status=status.HTTP_400_BAD_REQUEST
-            )
-        
-        # Obtener nueva fecha y hora
-        fecha = request.data.get('fecha')
-        hora_inicio = request.data.get('hora_inicio')
-        hora_fin = request.data.get('hora_fin')
-        
-        if not fecha or not hora_inicio or not hora_fin:
-            return Response(
-                {"error": "Debe proporcionar fecha, hora_inicio y hora_fin"},
-                status=status.HTTP_400_BAD_REQUEST
-            )
+        entrada = ReagendarSerializer(data=request.data, context={'servicio': cita.servicio})
+        entrada.is_valid(raise_exception=True)
+        datos = entrada.validated_data
+        comprobar_horario(cita.peluquero_id, datos['fecha'], datos['hora_inicio'], datos['hora_fin'])
         
-        # Actualizar la cita
-        try:
-            from datetime import datetime
-            cita.fecha = datetime.strptime(fecha, '%Y-%m-%d').date()
-            cita.hora_inicio = datetime.strptime(hora_inicio, '%H:%M').time()
-            cita.hora_fin = datetime.strptime(hora_fin, '%H:%M').time()
-            cita.save()
+        with transaction.atomic():
+            # Releer estado y versión con la fila bloqueada: pudo cambiar desde get_object()
+            actual = Cita.objects.select_for_update().values('estado', 'version').get(pk=cita.pk)
+            if actual['version'] != cita.version:
+                raise CitaModificada()
             
-            serializer = self.get_serializer(cita)
-            return Response(serializer.data, status=status.HTTP_200_OK)
-        except ValueError as e:
-            return Response(
-                {"error": f"Formato de fecha u hora inválido: {str(e)}"},
-                status=status.HTTP_400_BAD_REQUEST
-            )
-        except ValidationError as e:
-            return Response(
-                {"error": str(e)},
-                status=status.HTTP_400_BAD_REQUEST
+            # Validar que la cita esté en estado PENDIENTE
+            if actual['estado'] not in [EstadoCita.PENDIENTE]:
+                return Response(
+                    {"error": "Solo se pueden reagendar citas en estado PENDIENTE"},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            
+            comprobar_agenda(
+                cita.peluquero_id, datos['fecha'], datos['hora_inicio'], datos['hora_fin'], cita.mascota_id,
+                excluir=cita.pk,
             )
+            cita.fecha = datos['fecha']
+            cita.hora_inicio = datos['hora_inicio']
+            cita.hora_fin = datos['hora_fin']
+            cita.save()
+        
+        serializer = self.get_serializer(cita)
+        return Response(serializer.data, status=status.HTTP_200_OK)
 
     @action(detail=True, methods=['post'], permission_classes=[IsPeluquero])
     def finalizar(self, request, pk=None):
@@ -412,24 +506,6 @@ class CitaViewSet(viewsets.ModelViewSet):
         except ValidationError as e:
             return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
-    @action(detail=False, methods=['get'], permission_classes=[IsPeluquero], url_path='dia')
-    def citas_del_dia(self, request):
-        """Listar todas las citas del peluquero autenticado para una fecha concreta.
-        Uso: GET /api/citas/dia/?fecha=YYYY-MM-DD
-        """
-        fecha = request.query_params.get('fecha')
-        if not fecha:
-            return Response({"error": "Debe proporcionar el parámetro fecha=YYYY-MM-DD"}, status=status.HTTP_400_BAD_REQUEST)
-        try:
-            from datetime import datetime
-            fecha_obj = datetime.strptime(fecha, '%Y-%m-%d').date()
-        except ValueError:
-            return Response({"error": "Formato de fecha inválido (usar YYYY-MM-DD)"}, status=status.HTTP_400_BAD_REQUEST)
-
-        citas = Cita.objects.filter(peluquero_id=request.user.id, fecha=fecha_obj).select_related('mascota').order_by('hora_inicio')
-        serializer = self.get_serializer(citas, many=True)
-        return Response(serializer.data)
-
     @action(detail=True, methods=['post'], permission_classes=[IsPeluquero], url_path='cambiar_estado')
     def cambiar_estado(self, request, pk=None):
         """Cambiar estado de la cita (peluquero asignado).
@@ -458,69 +534,596 @@ class CitaViewSet(viewsets.ModelViewSet):
         serializer = self.get_serializer(cita)
         return Response(serializer.data, status=status.HTTP_200_OK)
     
-    @action(detail=False, methods=['get'], permission_classes=[IsAuthenticated])
-    def mis_citas(self, request):
+    @action(detail=False, methods=['post'], permission_classes=[IsAuthenticated], url_path='estado-lote')
+    def estado_lote(self, request):
         """
-        Obtener las citas del usuario autenticado.
-        - CLIENTE: citas de sus mascotas
-        - PELUQUERO: sus citas como peluquero
+        Cambiar el estado de varias citas en una transacción (peluquero asignado o admin).
+        Body: {"estado": "CONFIRMADA", "ids": [1, 2, 3]} o {"transiciones": [{"id": 1, "estado": "FINALIZADA"}, ...]}
+        Mismas reglas que confirmar/cancelar/finalizar/marcar_no_asistio; responde un resultado por cita.
         """
-        if hasattr(request.user, 'rol'):
-            if request.user.rol == 'CLIENTE':
-                citas = Cita.objects.filter(mascota__dueno_id=request.user.id).select_related('mascota').order_by('-fecha', '-hora_inicio')
-            elif request.user.rol == 'PELUQUERO':
-                citas = Cita.objects.filter(peluquero_id=request.user.id).select_related('mascota').order_by('-fecha', '-hora_inicio')
-            else:
-                citas = Cita.objects.none()
-        else:
-            citas = Cita.objects.none()
-        
-        serializer = self.get_serializer(citas, many=True)
-        return Response(serializer.data)
-    
-    @action(detail=False, methods=['get'], permission_classes=[IsAuthenticated])
-    def disponibilidad(self, request):
+        if request.user.rol not in ('PELUQUERO', 'ADMIN'):
+            return Response({"error": "Solo peluqueros o administradores pueden cambiar estados"},
+                            status=status.HTTP_403_FORBIDDEN)
+        entrada = EstadoLoteSerializer(data=request.data)
+        entrada.is_valid(raise_exception=True)
+        try:
+            resultados = transiciones.aplicar(entrada.validated_data['transiciones'], request.user)
+        except transiciones.TransicionConcurrente:
+            return Response({"error": "Alguna cita cambió durante la operación, vuelve a intentarlo"},
+                            status=status.HTTP_409_CONFLICT)
+        aplicadas = sum(resultado['ok'] for resultado in resultados)
+        logger.info(
+            'Estado de %s citas cambiado en lote', aplicadas,
+            extra={'evento': 'estado_lote', 'usuario_id': request.user.id, 'aplicadas': aplicadas,
+                   'rechazadas': len(resultados) - aplicadas},
+        )
+        return Response(
+            {"aplicadas": aplicadas, "rechazadas": len(resultados) - aplicadas, "resultados": resultados},
+            status=status.HTTP_200_OK
+        )
+
+    @action(detail=False, methods=['post'], permission_classes=[IsAdmin])
+    def ausencia(self, request):
         """
-        Consultar disponibilidad de un peluquero en una fecha específica.
-        Query params: peluquero_id, fecha
+        Reasignar las citas pendientes o confirmadas de un peluquero ausente (admin).
+        Body: {"peluquero_id": 5, "desde": "YYYY-MM-DD", "hasta": "YYYY-MM-DD", "aplicar": false}
+        Con aplicar=false solo devuelve el plan; con true lo aplica en una transacción.
         """
-        peluquero_id = request.query_params.get('peluquero_id')
-        fecha = request.query_params.get('fecha')
-        
-        if not peluquero_id or not fecha:
+        entrada = AusenciaSerializer(data=request.data)
+        entrada.is_valid(raise_exception=True)
+        datos = entrada.validated_data
+        argumentos = (datos['peluquero_id'], datos['desde'], datos['hasta'])
+        try:
+            plan = reasignacion.aplicar(*argumentos) if datos['aplicar'] else reasignacion.planificar(*argumentos)
+        except reasignacion.ReasignacionConcurrente:
+            return Response({"error": "La agenda cambió durante la reasignación, vuelve a intentarlo"},
+                            status=status.HTTP_409_CONFLICT)
+        sin_hueco = sum(paso['destino'] is None for paso in plan)
+        if datos['aplicar']:
+            logger.info(
+                'Citas del peluquero %s reasignadas por ausencia', datos['peluquero_id'],
+                extra={'evento': 'ausencia_reasignada', 'peluquero_id': datos['peluquero_id'],
+                       'usuario_id': request.user.id, 'reasignadas': len(plan) - sin_hueco, 'sin_hueco': sin_hueco},
+            )
+        return Response({
+            "peluquero_id": datos['peluquero_id'],
+            "desde": datos['desde'],
+            "hasta": datos['hasta'],
+            "aplicado": datos['aplicar'],
+            "reasignadas": len(plan) - sin_hueco,
+            "sin_hueco": sin_hueco,
+            "plan": plan,
+        }, status=status.HTTP_200_OK)
+
+    @action(detail=False, methods=['post'], permission_classes=[IsCliente], url_path='serie')
+    def crear_serie(self, request):
+        """
+        Agendar una serie de citas recurrentes (cliente).
+        Body: los campos de una cita más {"cada_semanas": 4, "ocurrencias": 6, "todas_o_ninguna": false}.
+        Crea las ocurrencias sin conflicto y reporta las rechazadas; 409 si no se creó ninguna.
+        """
+        entrada = SerieCitaSerializer(data=request.data, context=self.get_serializer_context())
+        entrada.is_valid(raise_exception=True)
+        serie, citas, rechazadas = series.crear(**entrada.validated_data)
+        conflictos = [
+            {"fecha": fecha, "motivo": motivo, "error": agenda.MENSAJES[motivo]}
+            for fecha, motivo in rechazadas
+        ]
+        if serie is None:
             return Response(
-                {"error": "Se requieren parámetros: peluquero_id y fecha"},
+                {"error": "Ninguna cita de la serie está disponible", "conflictos": conflictos},
+                status=status.HTTP_409_CONFLICT
+            )
+        logger.info(
+            'Serie %s reservada (%s citas)', serie, len(citas),
+            extra={'evento': 'serie_reservada', 'serie': str(serie), 'peluquero_id': citas[0].peluquero_id,
+                   'usuario_id': request.user.id, 'citas': len(citas), 'rechazadas': len(conflictos)},
+        )
+        return Response(
+            {"serie": serie, "citas": CitaSerializer(citas, many=True).data, "conflictos": conflictos},
+            status=status.HTTP_201_CREATED
+        )
+
+    def _serie(self, request, serie):
+        """Comprueba que la serie existe y pertenece al usuario. Retorna una Response de error o None."""
+        datos = Cita.objects.filter(serie=serie).values('mascota__dueno_id', 'peluquero_id').first()
+        if datos is None:
+            return Response({"error": "Serie no encontrada"}, status=status.HTTP_404_NOT_FOUND)
+        if (request.user.rol == 'CLIENTE' and datos['mascota__dueno_id'] != request.user.id) or \
+                (request.user.rol == 'PELUQUERO' and datos['peluquero_id'] != request.user.id):
+            return Response({"error": "No tienes permiso sobre esta serie"}, status=status.HTTP_403_FORBIDDEN)
+        return None
+
+    @action(detail=False, methods=['post'], permission_classes=[IsPeluquero],
+            url_path=r'serie/(?P<serie>[0-9a-f-]{36})/cancelar')
+    def cancelar_serie(self, request, serie=None):
+        """
+        Cancelar en bloque las citas pendientes o confirmadas de una serie (peluquero asignado).
+        Body opcional: {"desde": "YYYY-MM-DD"} (por defecto hoy).
+        """
+        error = self._serie(request, serie)
+        if error:
+            return error
+        entrada = SerieCancelarSerializer(data=request.data)
+        entrada.is_valid(raise_exception=True)
+        canceladas = series.cancelar(serie, entrada.validated_data.get('desde') or timezone.localdate())
+        return Response(
+            {"message": f"{len(canceladas)} citas de la serie canceladas",
+             "canceladas": [datos['id'] for datos in canceladas]},
+            status=status.HTTP_200_OK
+        )
+
+    @action(detail=False, methods=['post'], permission_classes=[IsAuthenticated],
+            url_path=r'serie/(?P<serie>[0-9a-f-]{36})/reagendar')
+    def reagendar_serie(self, request, serie=None):
+        """
+        Reagendar en bloque las citas PENDIENTE de una serie (dueño de la mascota, peluquero asignado o admin).
+        Body: {"desde": "YYYY-MM-DD", "dias": 7, "hora_inicio": "10:00"}
+        (desde opcional, por defecto hoy; dias y/o la nueva hora_inicio). La hora_fin de cada cita
+        sale de su servicio; "hora_fin" solo se usa en las citas sin servicio. Todo o nada: 409 con los conflictos.
+        """
+        error = self._serie(request, serie)
+        if error:
+            return error
+        entrada = SerieReagendarSerializer(data=request.data)
+        entrada.is_valid(raise_exception=True)
+        datos = entrada.validated_data
+        citas, rechazadas = series.reagendar(
+            serie, datos.get('desde') or timezone.localdate(), dias=datos['dias'],
+            hora_inicio=datos.get('hora_inicio'), hora_fin=datos.get('hora_fin'),
+        )
+        if rechazadas:
+            return Response(
+                {"error": "La serie no se puede reagendar", "conflictos": [
+                    {"cita_id": cita_id, "fecha": fecha, "motivo": motivo, "error": agenda.MENSAJES[motivo]}
+                    for cita_id, fecha, motivo in rechazadas
+                ]},
+                status=status.HTTP_409_CONFLICT
+            )
+        return Response(CitaSerializer(citas, many=True).data, status=status.HTTP_200_OK)
+
+    @action(detail=False, methods=['get'], permission_classes=[IsAuthenticated], url_path='calendario')
+    def feed_calendario(self, request):
+        """
+        Obtener la URL del feed iCalendar del usuario autenticado.
+        - PELUQUERO: su agenda
+        - CLIENTE: las citas de sus mascotas
+        """
+        return self._responder_feed(request, calendario.generar_token)
+
+    @action(detail=False, methods=['post'], permission_classes=[IsAuthenticated], url_path='calendario/rotar')
+    def rotar_calendario(self, request):
+        """
+        Renovar la URL del feed iCalendar del usuario autenticado.
+        Las URL entregadas hasta ahora dejan de funcionar (p. ej. si se filtró).
+        """
+        return self._responder_feed(request, calendario.rotar_token)
+
+    @staticmethod
+    def _responder_feed(request, obtener_token):
+        rol = getattr(request.user, 'rol', None)
+        if rol == 'PELUQUERO':
+            tipo = calendario.TIPO_PELUQUERO
+        elif rol == 'CLIENTE':
+            tipo = calendario.TIPO_CLIENTE
+        else:
+            return Response(
+                {"error": "Solo peluqueros y clientes tienen feed de calendario"},
                 status=status.HTTP_400_BAD_REQUEST
             )
-        
-        # Obtener citas ocupadas
+
+        token = obtener_token(tipo, request.user.id)
+        url = request.build_absolute_uri(reverse('calendario-feed', kwargs={'token': token}))
+        return Response({"url": url, "token": token})
+
+
+class CalendarioFeedView(View):
+    """
+    Feed iCalendar de solo lectura: GET /api/calendario/<token>.ics
+    El token firmado sustituye al JWT para que las apps de calendario puedan suscribirse.
+    Es una vista Django simple (no DRF) para no depender de la negociación de
+    contenido con clientes que envían Accept: text/calendar.
+    Soporta If-None-Match / If-Modified-Since para responder 304 sin renderizar.
+    Con ?historial=true incluye las citas archivadas.
+    """
+
+    def get(self, request, token):
+        datos = calendario.leer_token(token)
+        if datos is None:
+            return HttpResponse("Token de calendario inválido", status=status.HTTP_404_NOT_FOUND, content_type='text/plain')
+        tipo, propietario_id = datos
+
+        historial = archivo.pide_historial(request)
+        etag, ultima = calendario.version_feed(tipo, propietario_id, historial)
+        last_modified = http_date(ultima.timestamp()) if ultima else None
+
+        if self._no_modificado(request, etag, ultima):
+            respuesta = HttpResponseNotModified()
+        else:
+            respuesta = StreamingHttpResponse(
+                calendario.feed_con_cache(tipo, propietario_id, etag, historial),
+                content_type='text/calendar; charset=utf-8'
+            )
+            respuesta['Content-Disposition'] = 'inline; filename="citas.ics"'
+
+        respuesta['ETag'] = etag
+        if last_modified:
+            respuesta['Last-Modified'] = last_modified
+        respuesta['Cache-Control'] = 'private, no-cache'
+        return respuesta
+
+    @staticmethod
+    def _no_modificado(request, etag, ultima):
+        """Evalúa las cabeceras condicionales (If-None-Match tiene prioridad)."""
+        if_none_match = request.headers.get('If-None-Match')
+        if if_none_match:
+            etags = [valor.strip().removeprefix('W/') for valor in if_none_match.split(',')]
+            return etag in etags or '*' in etags
+
+        if_modified_since = parse_http_date_safe(request.headers.get('If-Modified-Since', ''))
+        if if_modified_since is not None and ultima is not None:
+            return int(ultima.timestamp()) <= if_modified_since
+        return False
+
+
+class EstadisticasView(APIView):
+    """
+    Estadísticas para ADMIN calculadas solo desde ResumenCita.
+    GET /api/estadisticas/?desde=YYYY-MM-DD&hasta=YYYY-MM-DD (ambos opcionales)
+    - Ingresos por servicio (citas FINALIZADAS x Servicio.precio)
+    - Ocupación por peluquero (minutos reservados, excluye CANCELADAS)
+    - Tasa de no asistencia (NO_ASISTIO / (FINALIZADA + NO_ASISTIO))
+    """
+    permission_classes = [IsAdmin]
+
+    def get(self, request):
+        from datetime import datetime
+
+        resumenes = ResumenCita.objects.all()
+        rango = {}
+        for param, lookup in (('desde', 'fecha__gte'), ('hasta', 'fecha__lte')):
+            valor = request.query_params.get(param)
+            if not valor:
+                continue
+            try:
+                rango[param] = datetime.strptime(valor, '%Y-%m-%d').date()
+            except ValueError:
+                return Response(
+                    {"error": f"Formato de fecha inválido en {param} (usar YYYY-MM-DD)"},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            resumenes = resumenes.filter(**{lookup: rango[param]})
+
+        por_servicio = {}
+        filas_servicio = resumenes.values('servicio_id', 'servicio__nombre', 'estado').annotate(
+            total=Sum('cantidad'),
+            ingresos=Sum(F('cantidad') * F('servicio__precio')),
+        ).order_by()
+        for fila in filas_servicio:
+            item = por_servicio.setdefault(fila['servicio_id'], {
+                "servicio_id": fila['servicio_id'],
+                "nombre": fila['servicio__nombre'],
+                "citas": 0,
+                "finalizadas": 0,
+                "ingresos": 0,
+            })
+            item['citas'] += fila['total']
+            if fila['estado'] == EstadoCita.FINALIZADA:
+                item['finalizadas'] += fila['total']
+                item['ingresos'] += fila['ingresos'] or 0
+
+        por_peluquero = {}
+        filas_peluquero = resumenes.values('peluquero_id', 'estado').annotate(
+            total=Sum('cantidad'),
+            minutos_total=Sum('minutos'),
+        ).order_by()
+        for fila in filas_peluquero:
+            item = por_peluquero.setdefault(fila['peluquero_id'], {
+                "peluquero_id": fila['peluquero_id'],
+                "citas": 0,
+                "minutos_reservados": 0,
+                "por_estado": {estado: 0 for estado in EstadoCita.values},
+            })
+            item['citas'] += fila['total']
+            item['por_estado'][fila['estado']] += fila['total']
+            if fila['estado'] != EstadoCita.CANCELADA:
+                item['minutos_reservados'] += fila['minutos_total']
+
+        finalizadas = sum(p['por_estado'][EstadoCita.FINALIZADA] for p in por_peluquero.values())
+        no_asistio = sum(p['por_estado'][EstadoCita.NO_ASISTIO] for p in por_peluquero.values())
+        for item in por_peluquero.values():
+            atendibles = item['por_estado'][EstadoCita.FINALIZADA] + item['por_estado'][EstadoCita.NO_ASISTIO]
+            item['tasa_no_asistencia'] = round(item['por_estado'][EstadoCita.NO_ASISTIO] / atendibles, 4) if atendibles else None
+
+        return Response({
+            "desde": rango.get('desde'),
+            "hasta": rango.get('hasta'),
+            "ingresos_totales": sum(item['ingresos'] for item in por_servicio.values()),
+            "tasa_no_asistencia": round(no_asistio / (finalizadas + no_asistio), 4) if (finalizadas + no_asistio) else None,
+            "por_servicio": sorted(por_servicio.values(), key=lambda item: item['ingresos'], reverse=True),
+            "por_peluquero": sorted(por_peluquero.values(), key=lambda item: item['peluquero_id']),
+        })
+
+
+class OcupacionView(APIView):
+    """
+    Mapa de ocupación hora x día de la semana por peluquero (solo ADMIN).
+    GET /api/analitica/ocupacion/?desde=YYYY-MM-DD&hasta=YYYY-MM-DD&peluquero_id=N
+    Por defecto analiza los últimos 365 días.
+    """
+    permission_classes = [IsAdmin]
+
+    def get(self, request):
+        from datetime import datetime
+
+        fechas = {}
+        for param in ('desde', 'hasta'):
+            valor = request.query_params.get(param)
+            try:
+                fechas[param] = datetime.strptime(valor, '%Y-%m-%d').date() if valor else None
+            except ValueError:
+                return Response(
+                    {"error": f"Formato de fecha inválido en {param} (usar YYYY-MM-DD)"},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+
+        peluquero_id = request.query_params.get('peluquero_id')
+        if peluquero_id is not None and not peluquero_id.isdigit():
+            return Response({"error": "peluquero_id inválido"}, status=status.HTTP_400_BAD_REQUEST)
+
+        resultado = analitica.mapa_ocupacion(
+            desde=fechas['desde'],
+            hasta=fechas['hasta'],
+            peluquero_id=int(peluquero_id) if peluquero_id else None,
+        )
+        return Response(resultado)
+
+
+class EventosCitaView(View):
+    """
+    Stream SSE con los cambios en la agenda del peluquero autenticado.
+    GET /api/citas/eventos/?fecha=YYYY-MM-DD (fecha opcional: solo eventos de ese día)
+
+    - Autenticación: cabecera Authorization: Bearer <jwt>, o ?token=<jwt> porque
+      EventSource en el navegador no permite cabeceras personalizadas.
+    - Reanudación: cabecera Last-Event-ID (o ?ultimo_id=). Si el id ya no está en
+      el registro se envía un evento "reset" y el cliente debe recargar citas_del_dia.
+    - Es una vista asíncrona: debe servirse con citas_service.asgi:application para
+      que cada conexión abierta no ocupe un hilo.
+    """
+
+    async def get(self, request):
+        usuario, _ = autenticar_peticion(request, token_en_query=True)
+        if usuario is None:
+            return JsonResponse({"error": "Token inválido o ausente"}, status=status.HTTP_401_UNAUTHORIZED)
+        if usuario.rol != 'PELUQUERO':
+            return JsonResponse({"error": "Solo los peluqueros tienen stream de agenda"}, status=status.HTTP_403_FORBIDDEN)
+
+        fecha = request.GET.get('fecha')
+        if fecha:
+            from datetime import datetime
+            try:
+                fecha = datetime.strptime(fecha, '%Y-%m-%d').date().isoformat()
+            except ValueError:
+                return JsonResponse({"error": "Formato de fecha inválido (usar YYYY-MM-DD)"}, status=status.HTTP_400_BAD_REQUEST)
+
+        ultimo_id = request.headers.get('Last-Event-ID') or request.GET.get('ultimo_id')
+        configuracion = eventos.config()
+        suscripcion = await eventos.bus().suscribir(
+            usuario.id, ultimo_id, heartbeat=configuracion['HEARTBEAT_SEGUNDOS']
+        )
+        respuesta = StreamingHttpResponse(
+            self._flujo(suscripcion, fecha),
+            content_type='text/event-stream'
+        )
+        respuesta['Cache-Control'] = 'no-cache'
+        respuesta['X-Accel-Buffering'] = 'no'
+        return respuesta
+
+    @staticmethod
+    async def _flujo(suscripcion, fecha):
+        # Indica al navegador cuánto esperar antes de reconectar
+        yield "retry: 3000\n\n"
+        async for evento in suscripcion:
+            if evento is None:
+                yield ": keep-alive\n\n"
+                continue
+            if fecha and evento.tipo != eventos.TIPO_RESET and evento.datos.get('fecha') != fecha:
+                continue
+            yield evento.sse()
+
+
+# --- Lecturas asíncronas ----------------------------------------------------
+# Endpoints de lectura más usados servidos con el ORM asíncrono. Con
+# citas_service.asgi:application una petición que espera a la BD no ocupa un
+# worker: la capacidad de conexiones concurrentes ya no depende del número de hilos.
+# Mantienen las mismas URLs y la misma forma de respuesta que las acciones DRF
+# a las que sustituyen.
+
+class LecturaAsyncView(View, metaclass=ABCMeta):
+    """
+    Base de las lecturas asíncronas: autentica el JWT sin BD, aplica los roles
+    permitidos y marca la petición como apta para réplica.
+    Las subclases implementan `leer(request, usuario)`.
+    """
+    roles = None  # None: cualquier usuario autenticado
+    publica = False  # True: también responde sin credenciales
+
+    async def get(self, request, *args, **kwargs):
+        usuario, error = autenticar_peticion(request)
+        if error:
+            return JsonResponse({"detail": error}, status=status.HTTP_401_UNAUTHORIZED)
+        if usuario is None and not self.publica:
+            return JsonResponse(
+                {"detail": "No se proporcionaron credenciales de autenticación."},
+                status=status.HTTP_401_UNAUTHORIZED
+            )
+        if self.roles is not None and getattr(usuario, 'rol', None) not in self.roles:
+            return JsonResponse(
+                {"detail": "No tiene permiso para realizar esta acción."},
+                status=status.HTTP_403_FORBIDDEN
+            )
+        replicas.permitir_replica()
+        return await self.leer(request, usuario)
+
+    @abstractmethod
+    async def leer(self, request, usuario):
+        """Respuesta de la lectura para el usuario ya autenticado (None en las vistas públicas)."""
+
+    @staticmethod
+    def _json(datos, status_code=status.HTTP_200_OK):
+        return JsonResponse(datos, status=status_code, safe=False)
+
+
+class MisCitasAsyncView(LecturaAsyncView):
+    """
+    GET /api/citas/mis_citas/
+    - CLIENTE: citas de sus mascotas
+    - PELUQUERO: sus citas como peluquero
+    Con ?historial=true incluye también las citas archivadas (campo archivada=true).
+    """
+
+    async def leer(self, request, usuario):
+        if usuario.rol == 'CLIENTE':
+            citas = Cita.objects.filter(mascota__dueno_id=usuario.id)
+        elif usuario.rol == 'PELUQUERO':
+            citas = Cita.objects.filter(peluquero_id=usuario.id)
+        else:
+            citas = Cita.objects.none()
+        citas = citas.select_related('mascota', 'servicio').order_by('-fecha', '-hora_inicio')
+        datos = CitaSerializer([cita async for cita in citas], many=True).data
+        if not archivo.pide_historial(request):
+            return self._json(datos)
+
+        historicas = archivo.historial_de_usuario(usuario).select_related('mascota', 'servicio')
+        datos = datos + CitaHistoricaSerializer([cita async for cita in historicas], many=True).data
+        datos.sort(key=lambda cita: (cita['fecha'], cita['hora_inicio']), reverse=True)
+        return self._json(datos)
+
+
+class CitasDelDiaAsyncView(LecturaAsyncView):
+    """
+    GET /api/citas/dia/?fecha=YYYY-MM-DD
+    Todas las citas del peluquero autenticado para una fecha concreta.
+    """
+    roles = ('PELUQUERO',)
+
+    async def leer(self, request, usuario):
+        fecha = request.GET.get('fecha')
+        if not fecha:
+            return self._json({"error": "Debe proporcionar el parámetro fecha=YYYY-MM-DD"}, status.HTTP_400_BAD_REQUEST)
+        try:
+            from datetime import datetime
+            fecha_obj = datetime.strptime(fecha, '%Y-%m-%d').date()
+        except ValueError:
+            return self._json({"error": "Formato de fecha inválido (usar YYYY-MM-DD)"}, status.HTTP_400_BAD_REQUEST)
+
+        citas = (
+            Cita.objects.filter(peluquero_id=usuario.id, fecha=fecha_obj)
+            .select_related('mascota', 'servicio')
+            .order_by('hora_inicio')
+        )
+        return self._json(CitaSerializer([cita async for cita in citas], many=True).data)
+
+
+class DisponibilidadAsyncView(LecturaAsyncView):
+    """
+    GET /api/citas/disponibilidad/?peluquero_id=X&fecha=YYYY-MM-DD
+    Horario efectivo del peluquero ese día (plantilla semanal con sus
+    excepciones, ver citas/horarios.py) y sus citas ocupadas.
+    Con &servicio_id=S añade los huecos donde cabe una cita de ese servicio,
+    con su hora_fin calculada, ordenados según &modo=primero|compacto (por
+    defecto CITAS_HUECOS['MODO'], ver citas/huecos.py).
+    """
+    DIAS = ['Lunes', 'Martes', 'Miércoles', 'Jueves', 'Viernes', 'Sábado', 'Domingo']
+
+    async def leer(self, request, usuario):
+        peluquero_id = request.GET.get('peluquero_id')
+        fecha = request.GET.get('fecha')
+        servicio_id = request.GET.get('servicio_id')
+        modo = request.GET.get('modo') or huecos.modo_por_defecto()
+        if not peluquero_id or not fecha:
+            return self._json({"error": "Se requieren parámetros: peluquero_id y fecha"}, status.HTTP_400_BAD_REQUEST)
+        try:
+            from datetime import datetime
+            fecha_obj = datetime.strptime(fecha, '%Y-%m-%d').date()
+            peluquero_id = int(peluquero_id)
+            servicio_id = int(servicio_id) if servicio_id else None
+        except ValueError:
+            return self._json({"error": "Parámetros inválidos (peluquero_id entero, fecha YYYY-MM-DD)"}, status.HTTP_400_BAD_REQUEST)
+        if modo not in huecos.MODOS:
+            return self._json({"error": f"modo debe ser uno de: {', '.join(huecos.MODOS)}"}, status.HTTP_400_BAD_REQUEST)
+
         citas_ocupadas = Cita.objects.filter(
             peluquero_id=peluquero_id,
-            fecha=fecha,
+            fecha=fecha_obj,
             estado__in=[EstadoCita.PENDIENTE, EstadoCita.CONFIRMADA]
-        ).values('hora_inicio', 'hora_fin')
-        
-        # Obtener horarios laborales del día
-        from datetime import datetime
-        fecha_obj = datetime.strptime(fecha, '%Y-%m-%d')
-        dia_nombre = fecha_obj.strftime('%A')
-        dias_es = {
-            'Monday': 'Lunes', 'Tuesday': 'Martes', 'Wednesday': 'Miércoles',
-            'Thursday': 'Jueves', 'Friday': 'Viernes', 'Saturday': 'Sábado', 'Sunday': 'Domingo'
-        }
-        dia_es = dias_es.get(dia_nombre, dia_nombre)
-        
-        horarios = Horario.objects.filter(
-            peluquero_id=peluquero_id,
-            dia=dia_es,
-            activo=True
-        ).values('hora_inicio', 'hora_fin')
-        
-        return Response({
+        ).order_by('hora_inicio').values('hora_inicio', 'hora_fin')
+        from asgiref.sync import sync_to_async
+
+        intervalos = await sync_to_async(horarios.del_dia)(peluquero_id, fecha_obj)
+        ocupadas = [cita async for cita in citas_ocupadas]
+        respuesta = {
             "peluquero_id": peluquero_id,
             "fecha": fecha,
-            "dia": dia_es,
-            "horarios_laborales": list(horarios),
-            "citas_ocupadas": list(citas_ocupadas)
-        })
+            "dia": self.DIAS[fecha_obj.weekday()],
+            "horarios_laborales": [
+                {"hora_inicio": horarios.hora(inicio), "hora_fin": horarios.hora(fin)} for inicio, fin in intervalos
+            ],
+            "citas_ocupadas": ocupadas,
+        }
+        if servicio_id is not None:
+            servicio = await Servicio.objects.filter(pk=servicio_id, activo=True).afirst()
+            if servicio is None:
+                return self._json({"error": "Servicio no encontrado"}, status.HTTP_404_NOT_FOUND)
+            ahora = timezone.localtime()
+            if fecha_obj < ahora.date():
+                desde = huecos.MINUTOS_DIA
+            else:
+                desde = horarios.minutos(ahora.time()) if fecha_obj == ahora.date() else 0
+            minutos = huecos.duracion(servicio)
+            inicios = huecos.huecos(
+                intervalos,
+                [(horarios.minutos(cita['hora_inicio']), horarios.minutos(cita['hora_fin'])) for cita in ocupadas],
+                minutos, modo=modo, desde=desde,
+            )
+            respuesta.update({
+                "servicio_id": servicio_id,
+                "modo": modo,
+                "huecos": [
+                    {"hora_inicio": horarios.hora(inicio), "hora_fin": horarios.hora(inicio + minutos)}
+                    for inicio in inicios
+                ],
+            })
+        return self._json(respuesta)
+
+
+class ServiciosAsyncView(LecturaAsyncView):
+    """
+    GET /api/servicios/: listado público de servicios (ADMIN ve también los inactivos).
+    El resto de métodos (alta por ADMIN) se delega en ServicioViewSet.
+    """
+    publica = True
+    _viewset = None
+
+    async def leer(self, request, usuario):
+        if getattr(usuario, 'rol', None) == 'ADMIN':
+            servicios = Servicio.objects.all().order_by('-actualizado_en')
+        else:
+            servicios = Servicio.objects.filter(activo=True).order_by('nombre')
+        return self._json(ServicioSerializer([servicio async for servicio in servicios], many=True).data)
+
+    async def post(self, request, *args, **kwargs):
+        return await self._delegar(request, *args, **kwargs)
+
+    async def options(self, request, *args, **kwargs):
+        return await self._delegar(request, *args, **kwargs)
+
+    @classmethod
+    async def _delegar(cls, request, *args, **kwargs):
+        from asgiref.sync import sync_to_async
 
+        if cls._viewset is None:
+            cls._viewset = ServicioViewSet.as_view({'get': 'list', 'post': 'create'})
+        # El handler de Django renderiza la Response de DRF al devolverla
+        return await sync_to_async(cls._viewset)(request, *args, **kwargs)
@@ -16,6 +16,7 @@ Including another URLconf
 """
 from django.contrib import admin
 from django.urls import path, include
+from comun.metricas import vista_metricas
 from drf_spectacular.views import (
     SpectacularAPIView,
     SpectacularSwaggerView,
@@ -24,6 +25,7 @@ from drf_spectacular.views import (
 
 urlpatterns = [
     path('admin/', admin.site.urls),
+    path('metrics', vista_metricas, name='metrics'),
     path('api/', include('citas.urls')),
     # OpenAPI schema y documentación
     path('api/schema/', SpectacularAPIView.as_view(), name='schema'),
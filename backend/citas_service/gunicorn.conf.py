@@ -0,0 +1,42 @@
+"""
+Configuración de gunicorn para producción.
+
+ASGI (por defecto, workers uvicorn):
+    gunicorn citas_service.asgi:application -c gunicorn.conf.py
+WSGI (hilos, para comparar con `manage.py prueba_carga`):
+    GUNICORN_WORKER_CLASS=gthread gunicorn citas_service.wsgi:application -c gunicorn.conf.py
+
+Variables de entorno: WEB_CONCURRENCY (procesos), GUNICORN_THREADS (solo gthread),
+GUNICORN_BIND, GUNICORN_TIMEOUT. Con PROMETHEUS_MULTIPROC_DIR los workers
+comparten las métricas de /metrics (ver comun/metricas.py).
+"""
+import glob
+import multiprocessing
+import os
+
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:8002')
+workers = int(os.environ.get('WEB_CONCURRENCY', multiprocessing.cpu_count()))
+# Los workers leen WEB_CONCURRENCY en settings (CITAS_HORARIOS)
+os.environ['WEB_CONCURRENCY'] = str(workers)
+worker_class = os.environ.get('GUNICORN_WORKER_CLASS', 'uvicorn.workers.UvicornWorker')
+threads = int(os.environ.get('GUNICORN_THREADS', 4))
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 30))
+graceful_timeout = 10
+keepalive = 5
+accesslog = '-'
+
+
+def on_starting(server):
+    """Vacía el directorio de métricas multiproceso: los ficheros de un arranque anterior no valen."""
+    directorio = os.environ.get('PROMETHEUS_MULTIPROC_DIR')
+    if directorio:
+        os.makedirs(directorio, exist_ok=True)
+        for fichero in glob.glob(os.path.join(directorio, '*.db')):
+            os.remove(fichero)
+
+
+def child_exit(server, worker):
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        from prometheus_client import multiprocess
+
+        multiprocess.mark_process_dead(worker.pid)
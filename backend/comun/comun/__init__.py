@@ -0,0 +1,12 @@
+"""
+Infraestructura común de los servicios (citas_service y usuario_service).
+
+- database: DATABASES['default'] a partir de DATABASE_URL.
+- bitacora: logging estructurado y no bloqueante (LOGGING_CONFIG).
+- trazas: W3C Trace Context (TrazasMiddleware).
+- rendimiento: Server-Timing, peticiones lentas y métricas por ruta (RendimientoMiddleware).
+- metricas: /metrics de Prometheus.
+- regresion_consultas: arnés de tests de consultas SQL por endpoint.
+
+Se instala en cada servicio desde su requirements.txt (-e ../comun).
+"""
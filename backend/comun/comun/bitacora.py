@@ -0,0 +1,236 @@
+"""
+Pipeline de logging del servicio (LOGGING_CONFIG apunta a `configurar`).
+
+Sobre la configuración LOGGING de settings:
+
+- Formato: FormatoJSON escribe un objeto JSON por línea con fecha, nivel,
+  logger, mensaje, request_id/trace_id de la petición (ver trazas.py), los
+  campos pasados en `extra=` y la excepción. LOG_FORMATO=texto vuelve al
+  formato legible para desarrollo.
+- Escritura no bloqueante: cada handler se sustituye por un ColaHandler
+  (logging.handlers.QueueHandler) que solo encola el registro; un
+  QueueListener lo escribe en el handler real (consola, fichero) desde su
+  propio hilo. La cola es acotada: si se llena se descartan registros en
+  lugar de frenar las peticiones (se cuentan en `descartados()`).
+  LOG_COLA=false escribe de forma síncrona (útil al depurar).
+- Niveles por logger desde el entorno: LOG_NIVELES="citas=INFO,django.db.backends=DEBUG".
+- Muestreo por logger: LOG_MUESTREO="citas=0.1,django.request=0.5" conserva
+  esa fracción de los registros DEBUG/INFO del logger y sus hijos (gana el
+  prefijo más largo). WARNING y superiores no se muestrean nunca. La
+  decisión se toma una vez por registro: consola y fichero conservan o
+  descartan los mismos.
+"""
+import atexit
+import copy
+import json
+import logging
+import logging.config
+import logging.handlers
+import os
+import queue
+import random
+import threading
+from datetime import datetime, timezone
+
+# Atributos propios de LogRecord: el resto son campos pasados con extra=
+_ATRIBUTOS_ESTANDAR = set(vars(logging.LogRecord('', 0, '', 0, '', None, None))) | {
+    'message', 'asctime', 'request_id', 'trace_id',
+}
+
+TAMANO_COLA = 10_000
+
+
+def _pares_entorno(nombre):
+    """"a=1,b.c=2" -> {'a': '1', 'b.c': '2'} (entradas mal formadas se ignoran)."""
+    pares = {}
+    for entrada in os.environ.get(nombre, '').split(','):
+        clave, separador, valor = entrada.partition('=')
+        if separador and clave.strip() and valor.strip():
+            pares[clave.strip()] = valor.strip()
+    return pares
+
+
+def _contexto_peticion():
+    from . import trazas
+
+    actual = trazas.span_actual()
+    if actual is None:
+        return None, None
+    return trazas._request_id.get(), actual.trace_id
+
+
+class FormatoJSON(logging.Formatter):
+    def format(self, record):
+        datos = {
+            'fecha': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'nivel': record.levelname,
+            'logger': record.name,
+            'mensaje': record.getMessage(),
+        }
+        request_id = getattr(record, 'request_id', None)
+        trace_id = getattr(record, 'trace_id', None)
+        if request_id is None and trace_id is None:
+            request_id, trace_id = _contexto_peticion()
+        if request_id:
+            datos['request_id'] = request_id
+        if trace_id:
+            datos['trace_id'] = trace_id
+        for clave, valor in record.__dict__.items():
+            if clave not in _ATRIBUTOS_ESTANDAR and clave not in datos and not clave.startswith('_'):
+                datos[clave] = valor
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            datos['excepcion'] = record.exc_text
+        return json.dumps(datos, ensure_ascii=False, default=str)
+
+
+class FiltroMuestreo(logging.Filter):
+    """Conserva una fracción de los registros por debajo de WARNING según el logger de origen."""
+
+    def __init__(self, tasas):
+        super().__init__()
+        # Prefijos más largos primero: "citas.views" gana a "citas"
+        self.tasas = sorted(((nombre, float(tasa)) for nombre, tasa in tasas.items()),
+                            key=lambda par: len(par[0]), reverse=True)
+        self._por_logger = {}
+
+    def tasa(self, nombre):
+        tasa = self._por_logger.get(nombre)
+        if tasa is None:
+            tasa = 1.0
+            for prefijo, valor in self.tasas:
+                if nombre == prefijo or nombre.startswith(prefijo + '.'):
+                    tasa = valor
+                    break
+            self._por_logger[nombre] = tasa
+        return tasa
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING:
+            return True
+        # El mismo registro pasa por todos los handlers: se sortea solo en el primero
+        conservar = getattr(record, '_muestreo', None)
+        if conservar is None:
+            tasa = self.tasa(record.name)
+            conservar = record._muestreo = tasa >= 1.0 or random.random() < tasa
+        return conservar
+
+
+# --- Escritura en segundo plano ----------------------------------------------
+
+_escritores = []
+_lock_descartados = threading.Lock()
+_descartados = 0
+
+
+def descartados():
+    """Registros perdidos por cola llena desde el arranque del proceso."""
+    return _descartados
+
+
+def _contar_descartado():
+    global _descartados
+    with _lock_descartados:
+        _descartados += 1
+
+
+def vaciar(timeout=5.0):
+    """Espera a que se escriba lo encolado (al salir del proceso y en benchmarks)."""
+    colas = [escritor.queue for escritor in list(_escritores)]
+    if not colas:
+        return
+    hecho = threading.Event()
+
+    def esperar():
+        for cola in colas:
+            cola.join()
+        hecho.set()
+
+    threading.Thread(target=esperar, daemon=True).start()
+    hecho.wait(timeout)
+
+
+atexit.register(vaciar)
+
+
+class Escritor(logging.handlers.QueueListener):
+    """QueueListener que no falla al pararse con la cola llena."""
+
+    def enqueue_sentinel(self):
+        try:
+            self.queue.put(self._sentinel, timeout=1.0)
+        except queue.Full:
+            pass
+
+    def stop(self):
+        if self._thread is not None:
+            super().stop()
+        if self in _escritores:
+            _escritores.remove(self)
+
+
+class ColaHandler(logging.handlers.QueueHandler):
+    """Encola el registro para `destino` y vuelve sin esperar E/S."""
+
+    def __init__(self, destino, cola=None):
+        super().__init__(cola if cola is not None else queue.Queue(TAMANO_COLA))
+        self.setLevel(destino.level)
+        self.destino = destino
+        self.escritor = Escritor(self.queue, destino, respect_handler_level=True)
+        self.escritor.start()
+        _escritores.append(self.escritor)
+
+    def prepare(self, record):
+        # Copia: el mismo registro sigue hacia los demás handlers del logger
+        record = copy.copy(record)
+        # El contexto de la petición (ContextVars) solo es visible en el hilo que registra
+        if not hasattr(record, 'request_id') and not hasattr(record, 'trace_id'):
+            record.request_id, record.trace_id = _contexto_peticion()
+        # Los argumentos pueden mutar antes de que el hilo escriba: fijar el mensaje ya.
+        # A diferencia de QueueHandler.prepare, la excepción se conserva aparte para FormatoJSON.
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            _contar_descartado()
+
+    def close(self):
+        self.escritor.stop()
+        self.destino.close()
+        super().close()
+
+
+def _loggers_configurados():
+    return [logging.getLogger()] + [
+        logger for logger in logging.Logger.manager.loggerDict.values() if isinstance(logger, logging.Logger)
+    ]
+
+
+def configurar(config):
+    """LOGGING_CONFIG: dictConfig + niveles, muestreo y cola desde el entorno."""
+    logging.config.dictConfig(config)
+
+    for nombre, nivel in _pares_entorno('LOG_NIVELES').items():
+        logging.getLogger(nombre).setLevel(nivel.upper())
+
+    muestreo = FiltroMuestreo(_pares_entorno('LOG_MUESTREO'))
+    en_cola = os.environ.get('LOG_COLA', 'true').strip().lower() not in ('0', 'false', 'no')
+    envueltos = {}
+    for logger in _loggers_configurados():
+        for indice, handler in enumerate(logger.handlers):
+            if isinstance(handler, ColaHandler):
+                continue
+            if handler not in envueltos:
+                envoltura = ColaHandler(handler) if en_cola else handler
+                if muestreo.tasas:
+                    envoltura.addFilter(muestreo)
+                envueltos[handler] = envoltura
+            logger.handlers[indice] = envueltos[handler]
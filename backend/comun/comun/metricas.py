@@ -0,0 +1,104 @@
+"""
+Métricas Prometheus del servicio (GET /metrics).
+
+Los contadores viven en el proceso y cuestan lo mismo que un incremento con lock.
+Con varios workers (gunicorn) se define PROMETHEUS_MULTIPROC_DIR antes de
+arrancar: cada proceso escribe sus valores en ficheros mmap de ese directorio y
+/metrics los agrega, sea cual sea el worker que atiende el scrape
+(gunicorn.conf.py limpia el directorio al arrancar y marca los workers muertos).
+Sin esa variable se exponen los valores del proceso actual.
+
+Métricas comunes (las alimenta RendimientoMiddleware, ver rendimiento.py):
+
+- http_peticiones_total{ruta, metodo, estado}
+- http_peticion_duracion_segundos{ruta, metodo} (histograma)
+- http_peticion_consultas_sql{ruta} (histograma)
+- http_bd_segundos_total{ruta}
+- http_vista_segundos_total{ruta} (tiempo en la vista sin la BD: serializadores y renderizado)
+
+`ruta` es "Vista.accion" (p. ej. "CitaViewSet.confirmar"), con cardinalidad acotada.
+Cada app define sus contadores de negocio con prometheus_client y puede añadir
+colectores evaluados en cada scrape (settings.METRICAS['COLECTORES']), útiles
+para valores que se leen de la BD y no deben sumarse entre procesos.
+
+/metrics no pasa por Kong (solo enruta /api/...), pero docker-compose publica el
+puerto de cada servicio en el host, así que la vista no es pública: responde a
+las IPs de settings.METRICAS['IPS_PERMITIDAS'] (por defecto solo loopback) o a
+quien envíe "Authorization: Bearer <METRICAS['TOKEN']>" (p. ej. el
+bearer_token de la configuración de scrape de Prometheus).
+"""
+import hmac
+import os
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Histogram, generate_latest, multiprocess,
+)
+
+from django.conf import settings
+from django.http import HttpResponse
+from django.utils.module_loading import import_string
+
+IPS_POR_DEFECTO = ('127.0.0.1', '::1')
+
+PETICIONES = Counter(
+    'http_peticiones', 'Peticiones HTTP atendidas', ['ruta', 'metodo', 'estado'],
+)
+DURACION = Histogram(
+    'http_peticion_duracion_segundos', 'Duración de las peticiones HTTP', ['ruta', 'metodo'],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0),
+)
+CONSULTAS = Histogram(
+    'http_peticion_consultas_sql', 'Consultas SQL por petición', ['ruta'],
+    buckets=(0, 1, 2, 5, 10, 20, 50, 100, 200),
+)
+TIEMPO_BD = Counter(
+    'http_bd_segundos', 'Tiempo total en la base de datos', ['ruta'],
+)
+TIEMPO_VISTA = Counter(
+    'http_vista_segundos', 'Tiempo total en la vista sin contar la base de datos', ['ruta'],
+)
+
+
+def observar_peticion(ruta, metodo, estado, segundos, consultas, segundos_bd, segundos_vista):
+    PETICIONES.labels(ruta, metodo, str(estado)).inc()
+    DURACION.labels(ruta, metodo).observe(segundos)
+    CONSULTAS.labels(ruta).observe(consultas)
+    TIEMPO_BD.labels(ruta).inc(segundos_bd)
+    TIEMPO_VISTA.labels(ruta).inc(segundos_vista)
+
+
+def multiproceso():
+    return bool(os.environ.get('PROMETHEUS_MULTIPROC_DIR'))
+
+
+def exportar():
+    """Texto de exposición Prometheus: contadores (de todos los workers) + colectores de scrape."""
+    if multiproceso():
+        registro = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registro)
+    else:
+        registro = REGISTRY
+    salida = generate_latest(registro)
+
+    colectores = getattr(settings, 'METRICAS', {}).get('COLECTORES', ())
+    if colectores:
+        al_scrape = CollectorRegistry()
+        for ruta in colectores:
+            al_scrape.register(import_string(ruta)())
+        salida += generate_latest(al_scrape)
+    return salida
+
+
+def autorizado(request):
+    """La petición viene de una IP permitida o trae el token de scrape."""
+    opciones = getattr(settings, 'METRICAS', {})
+    if request.META.get('REMOTE_ADDR') in opciones.get('IPS_PERMITIDAS', IPS_POR_DEFECTO):
+        return True
+    token = opciones.get('TOKEN')
+    return bool(token) and hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}')
+
+
+def vista_metricas(request):
+    if not autorizado(request):
+        return HttpResponse('No autorizado', status=403, content_type='text/plain')
+    return HttpResponse(exportar(), content_type=CONTENT_TYPE_LATEST)
@@ -0,0 +1,171 @@
+"""
+Arnés de regresión de consultas SQL por endpoint (lo usan los tests de cada app).
+
+Cada `Caso` describe una petición a una ruta con nombre y cómo sembrar `n`
+filas antes de hacerla. El arnés la ejecuta con N y 10N filas, a través de la
+pila completa de middlewares (test Client), y comprueba:
+
+- que el número de consultas no depende del volumen: un N+1 (p. ej. un campo
+  nuevo del serializador que lee una FK sin select_related) lo hace crecer,
+- que no supera el de la línea base del repositorio más TOLERANCIA_CONSULTAS.
+
+El tiempo con 10N filas también se guarda en la línea base, pero depende de la
+máquina: si supera TOLERANCIA_TIEMPO veces el de la base más MARGEN_MS se
+emite un TiempoRegresionWarning y el test no falla. Con
+CONSULTAS_TIEMPO_ESTRICTO=1 (p. ej. en una máquina dedicada) falla.
+
+Además exige que cada ruta con nombre del urls.py de la app tenga al menos un
+caso o figure en `excluidas` con el motivo, para que una ruta nueva no quede
+fuera del arnés.
+
+La línea base es un JSON por app junto a sus tests (consultas y ms por caso).
+Tras un cambio intencionado se regenera y se sube con el cambio:
+
+    ACTUALIZAR_CONSULTAS_BASE=1 python manage.py test <app>
+
+CONSULTAS_N cambia N (por defecto 5).
+"""
+import json
+import os
+import re
+import time
+import warnings
+from collections import Counter
+
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import URLResolver
+
+N = int(os.environ.get('CONSULTAS_N', 5))
+TOLERANCIA_CONSULTAS = 0
+TOLERANCIA_TIEMPO = 3.0
+MARGEN_MS = 50.0
+VARIABLE_ACTUALIZAR = 'ACTUALIZAR_CONSULTAS_BASE'
+VARIABLE_TIEMPO_ESTRICTO = 'CONSULTAS_TIEMPO_ESTRICTO'
+
+
+class TiempoRegresionWarning(UserWarning):
+    """Un caso tarda bastante más que en la línea base (solo falla con CONSULTAS_TIEMPO_ESTRICTO)."""
+
+
+class Caso:
+    """
+    Petición medida por el arnés.
+
+    - nombre: clave en la línea base ("cita-list GET cliente").
+    - ruta: nombre de la URL cubierta (para la comprobación de cobertura).
+    - preparar(test, n): siembra `n` filas y retorna la petición como dict con
+      'path' y, opcionalmente, 'datos' (cuerpo JSON) y 'cabeceras'.
+    - estado: código HTTP esperado.
+    """
+
+    def __init__(self, nombre, ruta, preparar, metodo='get', estado=200):
+        self.nombre = nombre
+        self.ruta = ruta
+        self.preparar = preparar
+        self.metodo = metodo
+        self.estado = estado
+
+
+def nombres_de_rutas(patrones):
+    for patron in patrones:
+        if isinstance(patron, URLResolver):
+            yield from nombres_de_rutas(patron.url_patterns)
+        elif patron.name:
+            yield patron.name
+
+
+_LITERALES = re.compile(r"'(?:[^']|'')*'|\d+")
+
+
+def _normalizar(sql):
+    """SQL sin valores literales, para agrupar las consultas repetidas de un N+1."""
+    return ' '.join(_LITERALES.sub('?', sql).split())[:300]
+
+
+class RegresionConsultasTestCase(TestCase):
+    """Base de los tests de la app: define `casos`, `urlpatterns`, `excluidas` y `archivo_base`."""
+
+    casos = ()
+    urlpatterns = ()
+    # nombre de ruta -> motivo por el que no se mide
+    excluidas = {}
+    archivo_base = None
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls._resultados = {}
+
+    @classmethod
+    def tearDownClass(cls):
+        if os.environ.get(VARIABLE_ACTUALIZAR) and cls._resultados:
+            base = {'N': N, 'casos': dict(sorted(cls._resultados.items()))}
+            with open(cls.archivo_base, 'w', encoding='utf-8') as archivo:
+                json.dump(base, archivo, ensure_ascii=False, indent=2)
+                archivo.write('\n')
+        super().tearDownClass()
+
+    @classmethod
+    def _leer_base(cls):
+        if not os.path.exists(cls.archivo_base):
+            return {}
+        with open(cls.archivo_base, encoding='utf-8') as archivo:
+            return json.load(archivo)
+
+    def test_todas_las_rutas_tienen_caso(self):
+        cubiertas = {caso.ruta for caso in self.casos} | set(self.excluidas)
+        sin_caso = sorted(set(nombres_de_rutas(self.urlpatterns)) - cubiertas)
+        self.assertFalse(sin_caso, f'Rutas sin caso en el arnés de consultas: {", ".join(sin_caso)}')
+
+    def test_consultas_por_endpoint(self):
+        base = self._leer_base().get('casos', {})
+        actualizar = bool(os.environ.get(VARIABLE_ACTUALIZAR))
+        for caso in self.casos:
+            with self.subTest(caso.nombre):
+                consultas_n, _, sql_n = self._medir(caso, N)
+                consultas_10n, ms, sql_10n = self._medir(caso, 10 * N)
+                self._resultados[caso.nombre] = {'consultas': consultas_10n, 'ms': round(ms, 2)}
+                if consultas_n != consultas_10n:
+                    crecen = Counter(map(_normalizar, sql_10n)) - Counter(map(_normalizar, sql_n))
+                    self.fail(
+                        f'{caso.nombre}: {consultas_n} consultas con {N} filas y {consultas_10n} con {10 * N}. '
+                        f'Repetidas: {crecen.most_common(3)}'
+                    )
+                if actualizar:
+                    continue
+                esperado = base.get(caso.nombre)
+                if esperado is None:
+                    self.fail(f'{caso.nombre}: sin línea base (regenerar con {VARIABLE_ACTUALIZAR}=1)')
+                self.assertLessEqual(
+                    consultas_10n, esperado['consultas'] + TOLERANCIA_CONSULTAS,
+                    f'{caso.nombre}: {consultas_10n} consultas, línea base {esperado["consultas"]}',
+                )
+                if ms > esperado['ms'] * TOLERANCIA_TIEMPO + MARGEN_MS:
+                    mensaje = f'{caso.nombre}: {ms:.1f} ms, línea base {esperado["ms"]} ms'
+                    if os.environ.get(VARIABLE_TIEMPO_ESTRICTO):
+                        self.fail(mensaje)
+                    warnings.warn(mensaje, TiempoRegresionWarning)
+
+    def _medir(self, caso, n):
+        """Siembra n filas, hace la petición y deshace todo. Retorna (consultas, ms, sql)."""
+        with transaction.atomic():
+            cache.clear()
+            peticion = caso.preparar(self, n)
+            argumentos = {'headers': peticion.get('cabeceras', {})}
+            if 'datos' in peticion:
+                argumentos.update(data=peticion['datos'], content_type='application/json')
+            with CaptureQueriesContext(connection) as capturadas:
+                inicio = time.perf_counter()
+                respuesta = getattr(self.client, caso.metodo)(peticion['path'], **argumentos)
+                if respuesta.streaming:
+                    b''.join(respuesta.streaming_content)
+                ms = (time.perf_counter() - inicio) * 1000
+            self.assertEqual(
+                respuesta.status_code, caso.estado,
+                f'{caso.nombre} con {n} filas: {getattr(respuesta, "content", b"")[:300]}',
+            )
+            transaction.set_rollback(True)
+        return len(capturadas), ms, [consulta['sql'] for consulta in capturadas.captured_queries]
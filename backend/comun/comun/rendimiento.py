@@ -0,0 +1,223 @@
+"""
+Instrumentación de rendimiento por petición (compartida por los servicios).
+
+RendimientoMiddleware mide en cada petición:
+
+- el tiempo total (desde que entra en la pila de middlewares hasta la respuesta),
+- el número de consultas SQL y el tiempo total en la BD (execute_wrapper en
+  cada conexión, también las abiertas en hilos de sync_to_async),
+- el tiempo de la vista sin contar la BD (serializadores, lógica y renderizado
+  de la respuesta): desde process_view, justo antes de llamar a la vista, hasta
+  que la respuesta vuelve a este middleware,
+- el tamaño de la respuesta (no disponible en respuestas en streaming).
+
+Con esos datos:
+
+- añade la cabecera Server-Timing (visible en las devtools del navegador),
+- registra en el logger "rendimiento" cada petición que supera UMBRAL_LENTO_MS,
+  con los datos y las consultas más lentas (SQL sin parámetros) como campos
+  estructurados (ver bitacora.py),
+- alimenta las métricas Prometheus por ruta ("CitaViewSet.list",
+  "MisCitasAsyncView.get"...) de metricas.py, agregadas entre workers en /metrics.
+
+Configuración en settings.RENDIMIENTO (ver CONFIG_POR_DEFECTO). Debe ir al principio
+de MIDDLEWARE (solo detrás de TrazasMiddleware) para medir también al resto de middlewares.
+"""
+import logging
+import time
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+
+from . import metricas
+
+logger = logging.getLogger('rendimiento')
+
+CONFIG_POR_DEFECTO = {
+    'UMBRAL_LENTO_MS': 500,
+    'SERVER_TIMING': True,
+    # Consultas incluidas en el log de peticiones lentas (las más lentas primero)
+    'MAX_SQL_LOG': 10,
+}
+
+# Consultas guardadas por petición para el log; el conteo y el tiempo no tienen límite
+MAX_SQL_CAPTURADAS = 200
+
+
+def config():
+    return {**CONFIG_POR_DEFECTO, **getattr(settings, 'RENDIMIENTO', {})}
+
+
+class _Medicion:
+    """Acumuladores de la petición en curso."""
+
+    __slots__ = ('consultas', 'tiempo_bd', 'inicio_vista', 'bd_antes_de_vista', 'sql')
+
+    def __init__(self):
+        self.consultas = 0
+        self.tiempo_bd = 0.0
+        self.inicio_vista = None
+        self.bd_antes_de_vista = 0.0
+        self.sql = []
+
+    def tiempo_vista(self, fin):
+        """Segundos entre process_view y `fin` que no se pasaron en la BD (0 si no se llegó a la vista)."""
+        if self.inicio_vista is None:
+            return 0.0
+        return max(0.0, fin - self.inicio_vista - (self.tiempo_bd - self.bd_antes_de_vista))
+
+
+_medicion = ContextVar('rendimiento_medicion', default=None)
+
+
+# --- Base de datos -----------------------------------------------------------
+
+def _medir_consulta(execute, sql, params, many, context):
+    medicion = _medicion.get()
+    if medicion is None:
+        return execute(sql, params, many, context)
+    inicio = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        duracion = time.perf_counter() - inicio
+        medicion.consultas += 1
+        medicion.tiempo_bd += duracion
+        if len(medicion.sql) < MAX_SQL_CAPTURADAS:
+            medicion.sql.append((duracion, sql))
+
+
+def _instalar_en_conexion(connection, **kwargs):
+    if _medir_consulta not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_medir_consulta)
+
+
+# Conexiones que se abran a partir de ahora (en cualquier hilo)
+connection_created.connect(_instalar_en_conexion, dispatch_uid='rendimiento_execute_wrapper')
+
+
+def _instalar_en_conexiones_abiertas():
+    """Cubre las conexiones del hilo actual abiertas antes de importar este módulo."""
+    for connection in connections.all(initialized_only=True):
+        _instalar_en_conexion(connection)
+
+
+# --- Ruta --------------------------------------------------------------------
+
+def nombre_ruta(request):
+    """
+    "Vista.accion" para viewsets DRF, "Vista.metodo" para el resto y el patrón de URL
+    como último recurso; "sin_ruta" para los 404 (acota la cardinalidad).
+    """
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return 'sin_ruta'
+    vista = getattr(match.func, 'cls', None) or getattr(match.func, 'view_class', None)
+    if vista is None:
+        return match.route or match.view_name or 'sin_ruta'
+    metodo = request.method.lower()
+    acciones = getattr(match.func, 'actions', None)
+    if acciones:
+        accion = acciones.get(metodo) or ('options' if metodo == 'options' else metodo)
+    else:
+        accion = metodo
+    return f'{vista.__name__}.{accion}'
+
+
+# --- Middleware --------------------------------------------------------------
+
+def _marcar_inicio_vista():
+    medicion = _medicion.get()
+    if medicion is not None:
+        medicion.inicio_vista = time.perf_counter()
+        medicion.bd_antes_de_vista = medicion.tiempo_bd
+
+
+class RendimientoMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.asincrono = iscoroutinefunction(get_response)
+        if self.asincrono:
+            markcoroutinefunction(self)
+            # Django adapta process_view al modo de la pila: síncrono obligaría a saltar de hilo
+            self.process_view = self._aprocess_view
+
+    def __call__(self, request):
+        if self.asincrono:
+            return self.__acall__(request)
+        _instalar_en_conexiones_abiertas()
+        medicion = _Medicion()
+        token = _medicion.set(medicion)
+        inicio = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _medicion.reset(token)
+        return self._procesar(request, response, medicion, inicio, time.perf_counter())
+
+    async def __acall__(self, request):
+        medicion = _Medicion()
+        token = _medicion.set(medicion)
+        inicio = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _medicion.reset(token)
+        return self._procesar(request, response, medicion, inicio, time.perf_counter())
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        """Marca el inicio de la vista; el resto de middlewares ya ha procesado la petición."""
+        _marcar_inicio_vista()
+
+    async def _aprocess_view(self, request, view_func, view_args, view_kwargs):
+        _marcar_inicio_vista()
+
+    def _procesar(self, request, response, medicion, inicio, fin):
+        opciones = config()
+        duracion = fin - inicio
+        total_ms = duracion * 1000
+        bd_ms = medicion.tiempo_bd * 1000
+        vista = medicion.tiempo_vista(fin)
+        vista_ms = vista * 1000
+        tamano = None if getattr(response, 'streaming', False) else len(response.content)
+        ruta = nombre_ruta(request)
+
+        metricas.observar_peticion(ruta, request.method, response.status_code, duracion,
+                                   medicion.consultas, medicion.tiempo_bd, vista)
+
+        if opciones['SERVER_TIMING']:
+            response['Server-Timing'] = (
+                f'app;dur={total_ms:.1f}, '
+                f'db;dur={bd_ms:.1f};desc="{medicion.consultas} consultas", '
+                f'vista;dur={vista_ms:.1f}'
+            )
+
+        if total_ms >= opciones['UMBRAL_LENTO_MS']:
+            lentas = sorted(medicion.sql, key=lambda consulta: consulta[0], reverse=True)[:opciones['MAX_SQL_LOG']]
+            logger.warning(
+                'Petición lenta %s %s: %.0f ms, %s consultas', request.method, request.path, total_ms,
+                medicion.consultas,
+                extra={
+                    'evento': 'peticion_lenta',
+                    'metodo': request.method,
+                    'path': request.path,
+                    'ruta': ruta,
+                    'estado': response.status_code,
+                    'duracion_ms': round(total_ms, 1),
+                    'consultas': medicion.consultas,
+                    'bd_ms': round(bd_ms, 1),
+                    'vista_ms': round(vista_ms, 1),
+                    'bytes': tamano,
+                    'request_id': getattr(request, 'request_id', None),
+                    'trace_id': getattr(request, 'trace_id', None),
+                    'sql': [{'ms': round(segundos * 1000, 2), 'sql': sql} for segundos, sql in lentas],
+                },
+            )
+        return response
@@ -0,0 +1,319 @@
+"""
+Trazas distribuidas con W3C Trace Context (compartido por los servicios).
+
+TrazasMiddleware abre un span raíz por petición:
+
+- continúa la traza de la cabecera `traceparent` (la que envía el frontend, Kong
+  u otro servicio) o empieza una nueva; respeta su flag de muestreo y, si no
+  hay cabecera, muestrea con probabilidad TRAZAS['MUESTREO'],
+- toma el X-Request-ID de Kong (plugin correlation-id) o usa el trace id, y
+  devuelve ambos en X-Request-ID y X-Trace-Id.
+
+Dentro de la petición se crean spans hijos para cada consulta SQL, cada
+`is_valid()` de serializadores DRF, la verificación de JWT (simplejwt) y las
+llamadas salientes con `requests`, a las que se añade `traceparent` y
+X-Request-ID para que el otro servicio continúe la misma traza. Código propio
+puede abrir spans con `with trazas.span('nombre', clave=valor):`.
+
+Cada span muestreado terminado se exporta como una línea JSON en el logger
+"trazas"; el destino (fichero trazas.log o consola) se elige en LOGGING, sin
+infraestructura externa. Para seguir una traza: grep del trace_id.
+"""
+import functools
+import json
+import logging
+import os
+import random
+import re
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.utils.functional import SimpleLazyObject
+
+logger = logging.getLogger('trazas')
+
+CONFIG_POR_DEFECTO = {
+    'ACTIVO': True,
+    # Probabilidad de muestrear las peticiones que llegan sin traceparent
+    'MUESTREO': 1.0,
+    # Caracteres del SQL guardados en cada span de consulta
+    'MAX_SQL': 500,
+}
+
+CABECERA_REQUEST_ID = 'X-Request-ID'
+_TRACEPARENT = re.compile(r'^([0-9a-f]{2})-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})$')
+
+
+def config():
+    return {**CONFIG_POR_DEFECTO, **getattr(settings, 'TRAZAS', {})}
+
+
+def _id(bytes_):
+    return os.urandom(bytes_).hex()
+
+
+class Span:
+    __slots__ = ('trace_id', 'span_id', 'padre_id', 'nombre', 'atributos', 'muestreado',
+                 'request_id', 'inicio', 'inicio_epoch', 'error')
+
+    def __init__(self, nombre, trace_id, padre_id=None, muestreado=True, request_id=None, **atributos):
+        self.trace_id = trace_id
+        self.span_id = _id(8)
+        self.padre_id = padre_id
+        self.nombre = nombre
+        self.atributos = atributos
+        self.muestreado = muestreado
+        self.request_id = request_id
+        self.inicio = time.perf_counter()
+        self.inicio_epoch = time.time()
+        self.error = None
+
+    def traceparent(self):
+        return f"00-{self.trace_id}-{self.span_id}-{'01' if self.muestreado else '00'}"
+
+    def terminar(self):
+        if not self.muestreado:
+            return
+        registro = {
+            'trace_id': self.trace_id,
+            'span_id': self.span_id,
+            'padre_id': self.padre_id,
+            'nombre': self.nombre,
+            'inicio': round(self.inicio_epoch, 6),
+            'duracion_ms': round((time.perf_counter() - self.inicio) * 1000, 3),
+            'servicio': getattr(settings, 'ROOT_URLCONF', '').split('.')[0],
+            'atributos': self.atributos,
+        }
+        if self.request_id:
+            registro['request_id'] = self.request_id
+        if self.error:
+            registro['error'] = self.error
+        logger.info(json.dumps(registro, ensure_ascii=False, default=str))
+
+
+_actual = ContextVar('trazas_span', default=None)
+
+
+def span_actual():
+    return _actual.get()
+
+
+@contextmanager
+def span(nombre, **atributos):
+    """Span hijo del actual; no hace nada si no hay traza o no está muestreada."""
+    padre = _actual.get()
+    if padre is None or not padre.muestreado:
+        yield None
+        return
+    hijo = Span(nombre, padre.trace_id, padre.span_id, **atributos)
+    token = _actual.set(hijo)
+    try:
+        yield hijo
+    except BaseException as exc:
+        hijo.error = f'{type(exc).__name__}: {exc}'[:300]
+        raise
+    finally:
+        _actual.reset(token)
+        hijo.terminar()
+
+
+def cabeceras_propagacion():
+    """Cabeceras para continuar la traza actual en otro servicio ({} fuera de una petición)."""
+    actual = _actual.get()
+    if actual is None:
+        return {}
+    cabeceras = {'traceparent': actual.traceparent()}
+    raiz_request_id = _request_id.get()
+    if raiz_request_id:
+        cabeceras[CABECERA_REQUEST_ID] = raiz_request_id
+    return cabeceras
+
+
+_request_id = ContextVar('trazas_request_id', default=None)
+
+
+# --- Instrumentación ---------------------------------------------------------
+
+def _trazar_consulta(execute, sql, params, many, context):
+    padre = _actual.get()
+    if padre is None or not padre.muestreado:
+        return execute(sql, params, many, context)
+    with span('db', sql=sql[:config()['MAX_SQL']], bd=context['connection'].alias, many=many):
+        return execute(sql, params, many, context)
+
+
+def _instalar_en_conexion(connection, **kwargs):
+    if _trazar_consulta not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_trazar_consulta)
+
+
+connection_created.connect(_instalar_en_conexion, dispatch_uid='trazas_execute_wrapper')
+
+
+def _instalar_en_conexiones():
+    """connection_created solo cubre las conexiones nuevas: instala también en las ya abiertas."""
+    for connection in connections.all(initialized_only=True):
+        _instalar_en_conexion(connection)
+
+
+def _envolver(metodo, nombre_span):
+    """Envuelve un método en un span; functools.wraps conserva las marcas de otras instrumentaciones."""
+
+    @functools.wraps(metodo)
+    def envoltura(self, *args, **kwargs):
+        if _actual.get() is None:
+            return metodo(self, *args, **kwargs)
+        with span(nombre_span(self, *args, **kwargs)):
+            return metodo(self, *args, **kwargs)
+
+    envoltura._trazas = True
+    return envoltura
+
+
+def _instrumentar(clase, nombre, nombre_span):
+    metodo = clase.__dict__.get(nombre)
+    if metodo is not None and not getattr(metodo, '_trazas', False):
+        setattr(clase, nombre, _envolver(metodo, nombre_span))
+
+
+def _instrumentar_librerias():
+    try:
+        from rest_framework import serializers
+    except ImportError:
+        pass
+    else:
+        for clase in (serializers.BaseSerializer, serializers.ListSerializer):
+            _instrumentar(clase, 'is_valid', lambda self, *a, **k: f'{type(self).__name__}.is_valid')
+
+    try:
+        from rest_framework_simplejwt.authentication import JWTAuthentication
+    except ImportError:
+        pass
+    else:
+        _instrumentar(JWTAuthentication, 'get_validated_token', lambda self, *a, **k: 'jwt.verificar')
+
+    try:
+        import requests
+    except ImportError:
+        pass
+    else:
+        _instrumentar_requests(requests.Session)
+
+
+def _instrumentar_requests(sesion):
+    """Span por llamada saliente y propagación de traceparent / X-Request-ID al destino."""
+    original = sesion.request
+    if getattr(original, '_trazas', False):
+        return
+
+    @functools.wraps(original)
+    def request(self, method, url, *args, **kwargs):
+        if _actual.get() is None:
+            return original(self, method, url, *args, **kwargs)
+        with span(f'http {method.upper()} {url.split("?", 1)[0]}') as saliente:
+            # Con el span abierto, el servicio destino cuelga de él (si no se muestrea, de la raíz)
+            kwargs['headers'] = {**cabeceras_propagacion(), **(kwargs.get('headers') or {})}
+            respuesta = original(self, method, url, *args, **kwargs)
+            if saliente is not None:
+                saliente.atributos['estado'] = respuesta.status_code
+            return respuesta
+
+    request._trazas = True
+    sesion.request = request
+
+
+def _leer_traceparent(valor):
+    coincidencia = _TRACEPARENT.match((valor or '').strip().lower())
+    if not coincidencia:
+        return None
+    version, trace_id, padre_id, flags = coincidencia.groups()
+    if version == 'ff' or trace_id == '0' * 32 or padre_id == '0' * 16:
+        return None
+    return trace_id, padre_id, bool(int(flags, 16) & 1)
+
+
+# --- Middleware --------------------------------------------------------------
+
+class TrazasMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.asincrono = iscoroutinefunction(get_response)
+        if self.asincrono:
+            markcoroutinefunction(self)
+        _instrumentar_librerias()
+
+    def __call__(self, request):
+        if self.asincrono:
+            return self.__acall__(request)
+        if not config()['ACTIVO']:
+            return self.get_response(request)
+        _instalar_en_conexiones()
+        raiz, tokens = self._abrir(request)
+        try:
+            response = self.get_response(request)
+        except BaseException as exc:
+            raiz.error = f'{type(exc).__name__}: {exc}'[:300]
+            raise
+        finally:
+            self._cerrar(tokens)
+        return self._terminar(request, response, raiz)
+
+    async def __acall__(self, request):
+        if not config()['ACTIVO']:
+            return await self.get_response(request)
+        # Las conexiones son por hilo: las del hilo en el que sync_to_async ejecuta el ORM
+        await sync_to_async(_instalar_en_conexiones)()
+        raiz, tokens = self._abrir(request)
+        try:
+            response = await self.get_response(request)
+        except BaseException as exc:
+            raiz.error = f'{type(exc).__name__}: {exc}'[:300]
+            raise
+        finally:
+            self._cerrar(tokens)
+        return self._terminar(request, response, raiz)
+
+    @staticmethod
+    def _abrir(request):
+        entrante = _leer_traceparent(request.META.get('HTTP_TRACEPARENT'))
+        if entrante:
+            trace_id, padre_id, muestreado = entrante
+        else:
+            trace_id, padre_id, muestreado = _id(16), None, random.random() < config()['MUESTREO']
+        request_id = request.META.get('HTTP_X_REQUEST_ID', '')[:128] or trace_id
+        raiz = Span(
+            f'{request.method} {request.path}', trace_id, padre_id, muestreado, request_id,
+            metodo=request.method, path=request.path,
+        )
+        request.request_id = request_id
+        request.trace_id = trace_id
+        return raiz, (_actual.set(raiz), _request_id.set(request_id))
+
+    @staticmethod
+    def _cerrar(tokens):
+        _actual.reset(tokens[0])
+        _request_id.reset(tokens[1])
+
+    @staticmethod
+    def _terminar(request, response, raiz):
+        from .rendimiento import nombre_ruta
+
+        raiz.atributos['ruta'] = nombre_ruta(request)
+        raiz.atributos['estado'] = response.status_code
+        # Solo si ya se autenticó (DRF asigna request.user); no forzar el usuario perezoso de Django
+        usuario = request.__dict__.get('user')
+        if not isinstance(usuario, SimpleLazyObject) and getattr(usuario, 'id', None) is not None:
+            raiz.atributos['usuario_id'] = usuario.id
+        raiz.terminar()
+        response[CABECERA_REQUEST_ID] = raiz.request_id
+        response['X-Trace-Id'] = raiz.trace_id
+        return response
@@ -0,0 +1,2 @@
+-- Una base de datos por microservicio (POSTGRES_DB crea la de citas)
+CREATE DATABASE usuarios_db;
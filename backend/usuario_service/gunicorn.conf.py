@@ -0,0 +1,40 @@
+"""
+Configuración de gunicorn para producción.
+
+WSGI con hilos (gthread): usuario_service no tiene vistas asíncronas ni
+conexiones de larga duración, así que no necesita los workers uvicorn de
+citas_service.
+    gunicorn usuario_service.wsgi:application -c gunicorn.conf.py
+
+Variables de entorno: WEB_CONCURRENCY (procesos), GUNICORN_THREADS,
+GUNICORN_BIND, GUNICORN_TIMEOUT. Con PROMETHEUS_MULTIPROC_DIR los workers
+comparten las métricas de /metrics (ver comun/metricas.py).
+"""
+import glob
+import multiprocessing
+import os
+
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:8001')
+workers = int(os.environ.get('WEB_CONCURRENCY', multiprocessing.cpu_count()))
+worker_class = 'gthread'
+threads = int(os.environ.get('GUNICORN_THREADS', 4))
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 30))
+graceful_timeout = 10
+keepalive = 5
+accesslog = '-'
+
+
+def on_starting(server):
+    """Vacía el directorio de métricas multiproceso: los ficheros de un arranque anterior no valen."""
+    directorio = os.environ.get('PROMETHEUS_MULTIPROC_DIR')
+    if directorio:
+        os.makedirs(directorio, exist_ok=True)
+        for fichero in glob.glob(os.path.join(directorio, '*.db')):
+            os.remove(fichero)
+
+
+def child_exit(server, worker):
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        from prometheus_client import multiprocess
+
+        multiprocess.mark_process_dead(worker.pid)
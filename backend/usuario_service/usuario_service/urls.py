@@ -16,6 +16,7 @@ Including another URLconf
 """
 from django.contrib import admin
 from django.urls import path, include
+from comun.metricas import vista_metricas
 from rest_framework_simplejwt.views import (
     TokenObtainPairView,
     TokenRefreshView,
@@ -39,6 +40,7 @@ class HiddenTokenRefreshView(TokenRefreshView):
 
 urlpatterns = [
     path('admin/', admin.site.urls),
+    path('metrics', vista_metricas, name='metrics'),
     path('api/', include('usuarios.urls')),
     # Endpoints JWT "puros" ocultos del esquema para evitar confusión
     path('api/token/', HiddenTokenObtainPairView.as_view(), name='token_obtain_pair'),
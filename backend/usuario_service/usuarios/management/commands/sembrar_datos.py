@@ -0,0 +1,119 @@
+import random
+import time
+from datetime import date, timedelta
+from itertools import islice
+
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.core.management.color import no_style
+from django.db import connection, transaction
+
+from usuarios.models import Cliente, Cuenta, Peluquero, Persona, User
+
+# Mismo valor por defecto que `sembrar_datos` de citas_service
+ID_BASE = 100_000
+
+NOMBRES = ['Ana', 'Luis', 'María', 'José', 'Lucía', 'Carlos', 'Sofía', 'Javier', 'Elena', 'Diego',
+           'Paula', 'Andrés', 'Carmen', 'Miguel', 'Laura', 'Pablo', 'Valeria', 'Jorge', 'Daniela', 'Raúl']
+APELLIDOS = ['García', 'Rodríguez', 'López', 'Martínez', 'Sánchez', 'Pérez', 'Gómez', 'Torres',
+             'Ramírez', 'Flores', 'Vargas', 'Castro', 'Morales', 'Ortiz', 'Rojas', 'Herrera']
+ESPECIALIDADES = ['Corte y baño para todas las razas', 'Razas grandes', 'Gatos', 'Estética canina',
+                  'Deslanado y cepillado']
+
+
+class Command(BaseCommand):
+    help = (
+        'Genera usuarios sintéticos (User, Cuenta, Persona y Cliente/Peluquero) con inserciones masivas. '
+        'Ids consecutivos desde --id-base: primero los peluqueros y después los clientes, como espera '
+        '`sembrar_datos` de citas_service. Usuarios "<prefijo>.peluquero<N>" y "<prefijo>.cliente<N>" '
+        '(N desde 0), todos con la clave --clave (se hashea una sola vez).'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--peluqueros', type=int, default=50)
+        parser.add_argument('--clientes', type=int, default=100_000)
+        parser.add_argument('--id-base', type=int, default=ID_BASE)
+        parser.add_argument('--prefijo', default='carga', help='Prefijo de usernames y correos')
+        parser.add_argument('--clave', default='carga123')
+        parser.add_argument('--semilla', type=int, default=42)
+        parser.add_argument('--lote', type=int, default=5000, help='Filas por INSERT')
+
+    def handle(self, *args, **options):
+        base = options['id_base']
+        n_peluqueros = options['peluqueros']
+        total = n_peluqueros + options['clientes']
+        prefijo = options['prefijo']
+        if User.objects.filter(id__gte=base, id__lt=base + total).exists() \
+                or User.objects.filter(username__startswith=f'{prefijo}.').exists():
+            raise CommandError(
+                f'Ya hay usuarios con ids {base}..{base + total - 1} o con el prefijo "{prefijo}": '
+                'vacía la BD (manage.py flush) o usa otro --id-base / --prefijo'
+            )
+
+        aleatorio = random.Random(options['semilla'])
+        clave = make_password(options['clave'])
+        lote = options['lote']
+        inicio = time.perf_counter()
+
+        def usuarios():
+            for i in range(total):
+                peluquero = i < n_peluqueros
+                nombre = f"{prefijo}.{'peluquero' if peluquero else 'cliente'}{i if peluquero else i - n_peluqueros}"
+                yield i, nombre, peluquero
+
+        generador = usuarios()
+        creados = 0
+        while True:
+            bloque = list(islice(generador, lote))
+            if not bloque:
+                break
+            with transaction.atomic():
+                self._crear_lote(bloque, base, clave, aleatorio)
+            creados += len(bloque)
+            if creados % (lote * 10) < lote:
+                self.stdout.write(f'  {creados} usuarios ({creados / (time.perf_counter() - inicio):.0f}/s)')
+
+        # Los ids se dieron a mano: la secuencia de PostgreSQL debe continuar tras el último
+        with connection.cursor() as cursor:
+            for sql in connection.ops.sequence_reset_sql(no_style(), [User]):
+                cursor.execute(sql)
+
+        self.stdout.write(self.style.SUCCESS(
+            f'{n_peluqueros} peluqueros (ids {base}..{base + n_peluqueros - 1}) y {options["clientes"]} clientes '
+            f'(ids {base + n_peluqueros}..{base + total - 1}) en {time.perf_counter() - inicio:.1f}s'
+        ))
+        self.stdout.write(f'  Login: {prefijo}.peluquero0 / {prefijo}.cliente0, clave "{options["clave"]}"')
+
+    @staticmethod
+    def _crear_lote(bloque, base, clave, aleatorio):
+        users = []
+        cuentas = []
+        personas = []
+        for i, username, peluquero in bloque:
+            correo = f'{username}@example.com'
+            users.append(User(
+                id=base + i, username=username, email=correo, password=clave,
+                rol=User.Rol.PELUQUERO if peluquero else User.Rol.CLIENTE,
+            ))
+            cuentas.append(Cuenta(user_id=base + i, correo=correo, clave=clave))
+            personas.append(Persona(
+                user_id=base + i, nombre=aleatorio.choice(NOMBRES), apellido=aleatorio.choice(APELLIDOS),
+                fecha_nacimiento=date(1960, 1, 1) + timedelta(days=aleatorio.randrange(45 * 365)),
+                telefono=f'09{aleatorio.randrange(10 ** 8):08d}',
+            ))
+        User.objects.bulk_create(users)
+        Cuenta.objects.bulk_create(cuentas)
+        Persona.objects.bulk_create(personas)
+
+        perfiles_peluquero = []
+        perfiles_cliente = []
+        for persona, (_, _, peluquero) in zip(personas, bloque):
+            if peluquero:
+                perfiles_peluquero.append(Peluquero(
+                    persona_id=persona.id, especialidad=aleatorio.choice(ESPECIALIDADES),
+                    experiencia=f'{aleatorio.randint(1, 20)} años de experiencia',
+                ))
+            else:
+                perfiles_cliente.append(Cliente(persona_id=persona.id, direccion=f'Calle {aleatorio.randint(1, 500)}'))
+        Peluquero.objects.bulk_create(perfiles_peluquero)
+        Cliente.objects.bulk_create(perfiles_cliente)
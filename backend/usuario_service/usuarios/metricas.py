@@ -0,0 +1,13 @@
+"""
+Métricas de negocio del servicio de usuarios (se exponen en /metrics junto a las
+comunes de comun/metricas.py).
+"""
+from prometheus_client import Counter
+
+LOGINS = Counter(
+    'usuarios_login', 'Intentos de login en LoginSerializer', ['resultado'],
+)
+
+
+def login(resultado):
+    LOGINS.labels(resultado).inc()
@@ -3,6 +3,7 @@ from django.contrib.auth.password_validation import validate_password
 from django.db import transaction
 from .models import User, Cuenta, Persona, Cliente, Peluquero
 from .tokens import get_tokens_for_user
+from . import metricas
 
 
 class PersonaSerializer(serializers.ModelSerializer):
@@ -187,22 +188,26 @@ class LoginSerializer(serializers.Serializer):
                 pass
         
         if user is None:
+            metricas.login('usuario_inexistente')
             raise serializers.ValidationError({
                 "error": f"No existe ningún usuario con el identificador '{usuario}'. Verifica el email o nombre de usuario."
             })
         
         # Verificar contraseña
         if not user.check_password(clave):
+            metricas.login('clave_incorrecta')
             raise serializers.ValidationError({
                 "error": f"La contraseña es incorrecta para el usuario '{user.username}'. Intenta de nuevo."
             })
         
         # Verificar que el usuario esté activo
         if not user.is_active:
+            metricas.login('inactivo')
             raise serializers.ValidationError({
                 "error": f"La cuenta '{user.username}' está desactivada. Contacta al administrador."
             })
         
+        metricas.login('exito')
         attrs['user'] = user
         return attrs
     
@@ -1,3 +1,100 @@
-from django.test import TestCase
+import os
+from datetime import date
 
-# Create your tests here.
+from django.contrib.auth.hashers import make_password
+from django.test import override_settings
+from django.urls import reverse
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from comun import regresion_consultas
+from comun.regresion_consultas import Caso
+
+from . import urls
+from .models import Cliente, Cuenta, Peluquero, Persona, User
+from .tokens import get_tokens_for_user
+
+CLAVE = 'Clave-segura-123'
+
+
+def _usuarios(n, rol=User.Rol.CLIENTE, prefijo='usuario'):
+    """n usuarios completos (User, Cuenta, Persona y perfil según el rol) con la misma clave."""
+    clave = make_password(CLAVE)
+    usuarios = User.objects.bulk_create(
+        User(username=f'{prefijo}{i}', email=f'{prefijo}{i}@example.com', password=clave, rol=rol,
+             is_staff=rol == User.Rol.ADMIN)
+        for i in range(n)
+    )
+    Cuenta.objects.bulk_create(Cuenta(user=usuario, correo=usuario.email, clave=clave) for usuario in usuarios)
+    personas = Persona.objects.bulk_create(
+        Persona(user=usuario, nombre='Nombre', apellido='Apellido', fecha_nacimiento=date(1990, 1, 1))
+        for usuario in usuarios
+    )
+    if rol == User.Rol.CLIENTE:
+        Cliente.objects.bulk_create(Cliente(persona=persona, direccion='Calle 1') for persona in personas)
+    elif rol == User.Rol.PELUQUERO:
+        Peluquero.objects.bulk_create(Peluquero(persona=persona, especialidad='Corte') for persona in personas)
+    return usuarios
+
+
+def _mezcla(n):
+    """n clientes, n peluqueros y un admin; retorna el admin."""
+    _usuarios(n, User.Rol.CLIENTE, 'cliente')
+    _usuarios(n, User.Rol.PELUQUERO, 'peluquero')
+    return _usuarios(1, User.Rol.ADMIN, 'admin')[0]
+
+
+def _cliente(n):
+    _mezcla(n)
+    return User.objects.get(username='cliente0')
+
+
+def _peticion(usuario, path, **extra):
+    return {'path': path, 'cabeceras': {'Authorization': f"Bearer {get_tokens_for_user(usuario)['access']}"}, **extra}
+
+
+def _detalle(n, username, **extra):
+    """Petición del admin sobre el detalle de `username`."""
+    admin = _mezcla(n)
+    return _peticion(admin, reverse('usuario-detail', args=[User.objects.get(username=username).id]), **extra)
+
+
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class ConsultasPorEndpointTest(regresion_consultas.RegresionConsultasTestCase):
+    """El número de consultas de cada ruta de usuarios/urls.py no crece con los datos (ver regresion_consultas)."""
+
+    urlpatterns = urls.urlpatterns
+    archivo_base = os.path.join(os.path.dirname(__file__), 'consultas_base.json')
+    casos = [
+        Caso('api-root GET', 'api-root', lambda test, n: _peticion(_cliente(n), reverse('api-root'))),
+        Caso('usuario-list GET admin', 'usuario-list',
+             lambda test, n: _peticion(_mezcla(n), reverse('usuario-list'))),
+        Caso('usuario-list GET cliente rol=PELUQUERO', 'usuario-list',
+             lambda test, n: _peticion(_cliente(n), reverse('usuario-list') + '?rol=PELUQUERO')),
+        Caso('usuario-peluqueros GET cliente', 'usuario-peluqueros',
+             lambda test, n: _peticion(_cliente(n), reverse('usuario-peluqueros'))),
+        # get_permissions deja `me` solo para admin
+        Caso('usuario-me GET admin', 'usuario-me', lambda test, n: _peticion(_mezcla(n), reverse('usuario-me'))),
+        Caso('usuario-detail GET admin', 'usuario-detail', lambda test, n: _detalle(n, 'peluquero0')),
+        Caso('usuario-detail PATCH admin', 'usuario-detail',
+             lambda test, n: _detalle(n, 'peluquero0', datos={
+                 'persona': {'nombre': 'Otro'}, 'perfil': {'especialidad': 'Gatos'},
+             }), metodo='patch'),
+        Caso('usuario-detail DELETE admin', 'usuario-detail', lambda test, n: _detalle(n, 'cliente0'), metodo='delete'),
+        Caso('registro POST cliente', 'registro',
+             lambda test, n: _mezcla(n) and {'path': reverse('registro'), 'datos': {
+                 'username': 'nuevo', 'correo': 'nuevo@example.com', 'clave': CLAVE, 'clave_confirmacion': CLAVE,
+                 'nombre': 'Nuevo', 'apellido': 'Cliente', 'fecha_nacimiento': '1995-05-05',
+             }}, metodo='post', estado=201),
+        Caso('login POST', 'login',
+             lambda test, n: _mezcla(n) and {
+                 'path': reverse('login'), 'datos': {'usuario': 'cliente0@example.com', 'clave': CLAVE},
+             }, metodo='post'),
+        Caso('token_refresh POST', 'token_refresh',
+             lambda test, n: {'path': reverse('token_refresh'), 'datos': {
+                 'refresh': str(RefreshToken.for_user(_mezcla(n))),
+             }}, metodo='post'),
+        Caso('perfil GET cliente', 'perfil', lambda test, n: _peticion(_cliente(n), reverse('perfil'))),
+        Caso('perfil PUT cliente', 'perfil',
+             lambda test, n: _peticion(_cliente(n), reverse('perfil'), datos={'telefono': '0999', 'direccion': 'Calle 2'}),
+             metodo='put'),
+    ]
@@ -181,8 +181,8 @@ class UserViewSet(viewsets.ModelViewSet):
         if rol:
             qs = qs.filter(rol=rol)
 
-        # Optimización básica de relaciones
-        qs = qs.select_related('persona').all()
+        # Persona y su perfil (cliente o peluquero) en la misma consulta
+        qs = qs.select_related('persona', 'persona__cliente', 'persona__peluquero').all()
         results = [self._serialize_user(u) for u in qs]
         return Response(results, status=status.HTTP_200_OK)
 